@@ -5,33 +5,270 @@
 from __future__ import print_function
 
 import argparse
+import codecs
+import os
+import re
 import string
 import sys
-import fileinput
 
+# Size of the blocks files are copied in
+_BLOCK_SIZE = 1 << 16
+
+# Translation blanking the control characters, which the terminal shows as
+# spaces. They are all ascii, so the utf-8 sequences are left intact.
+_TABLE = bytearray(range(256))
+for _c in range(128):
+    if chr(_c) not in string.printable:
+        _TABLE[_c] = ord(" ")
+_BLANK_CONTROLS = bytes(_TABLE)
+
+# The bytes -A shows in the ^ and M- notation, and the newline shown with a $
+_NOT_SHOWN = re.compile(b"[^\x20-\x7e]")
+
+
+def _notation(c):
+    """
+    How -A shows a byte.
+    :rtype: bytes
+    """
+    prefix = ""
+    if c >= 128:
+        prefix = "M-"
+        c -= 128
+    if c < 32:
+        shown = "^" + chr(c + 64)
+    elif c == 127:
+        shown = "^?"
+    else:
+        shown = chr(c)
+    return (prefix + shown).encode("ascii")
+
+
+_NOTATIONS = [_notation(c) for c in range(256)]
+_NOTATIONS[ord("\n")] = b"$\n"
+
+
+def show_all(line):
+    """
+    A line as -A shows it.
+    :type line: bytes
+    :rtype: bytes
+    """
+    return _NOT_SHOWN.sub(lambda m: _NOTATIONS[ord(m.group())], line)
+
+
+class Output(object):
+    """
+    Where the content goes. Bytes are written unchanged to a real file,
+    decoded as utf-8 for the other streams, and have the control characters
+    blanked when they go to the terminal.
+    :param stream: the standard output
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.terminal = stream.isatty()
+        self.buffer = None
+        self.fd = None
+        if not self.terminal:
+            self.buffer = getattr(stream, "buffer", None)
+            try:
+                self.fd = stream.fileno()
+            except (AttributeError, IOError, OSError, ValueError):
+                pass
+        self.decoder = codecs.getincrementaldecoder("utf-8")("replace")
+
+    def write(self, data):
+        """
+        :type data: bytes
+        """
+        if self.buffer is not None:
+            self.buffer.write(data)
+            return
+        if self.terminal:
+            data = data.translate(_BLANK_CONTROLS)
+        self.stream.write(self.decoder.decode(data))
+
+    def copy(self, f):
+        """
+        Write the rest of a binary file. From a real file to a real file,
+        the copy is done by the kernel with sendfile where it can be.
+        """
+        if self.fd is not None and self.buffer is not None and self.sendfile(f):
+            return
+        while True:
+            data = f.read(_BLOCK_SIZE)
+            if not data:
+                break
+            self.write(data)
+
+    def sendfile(self, f):
+        """
+        Copy a file with os.sendfile.
+        :return: whether the file was copied, which it is not if sendfile is
+            missing or does not handle these files
+        :rtype: bool
+        """
+        sendfile = getattr(os, "sendfile", None)
+        try:
+            fd = f.fileno()
+            offset = f.tell()
+        except (AttributeError, IOError, OSError, ValueError):
+            return False
+        if sendfile is None:
+            return False
+        self.stream.flush()
+        while True:
+            try:
+                sent = sendfile(self.fd, fd, offset, _BLOCK_SIZE * 16)
+            except OSError:
+                if offset == f.tell():
+                    # nothing was sent, e.g. the output must be a socket
+                    return False
+                raise
+            if sent == 0:
+                break
+            offset += sent
+        f.seek(offset)
+        return True
+
+    def close(self):
+        if self.buffer is None:
+            self.stream.write(self.decoder.decode(b"", True))
+        self.stream.flush()
 
-def filter_non_printable(s):
-    return "".join(
-        [c if c.isalnum() or c.isspace() or c in string.punctuation else " " for c in s]
-    )
+
+class LineFormatter(object):
+    """
+    Numbers the lines, squeezes blank ones and shows the special characters,
+    as -n, -s and -A ask. The numbers and the squeezing go on from one file
+    to the next.
+    """
+
+    def __init__(self, number=False, squeeze=False, show_all=False):
+        self.number = number
+        self.squeeze = squeeze
+        self.show_all = show_all
+        self.lineno = 0
+        self.blank = False
+
+    def format(self, line):
+        """
+        :type line: bytes
+        :return: the line to write, or None if it is left out
+        :rtype: bytes
+        """
+        if self.squeeze:
+            blank = line == b"\n"
+            if blank and self.blank:
+                return None
+            self.blank = blank
+        if self.show_all:
+            line = show_all(line)
+        if self.number:
+            self.lineno += 1
+            line = ("%6d\t" % self.lineno).encode("ascii") + line
+        return line
+
+    def copy(self, lines, output):
+        """
+        Write the formatted lines, gathered into blocks.
+        """
+        block = []
+        size = 0
+        for line in lines:
+            line = self.format(line)
+            if line is None:
+                continue
+            block.append(line)
+            size += len(line)
+            if size >= _BLOCK_SIZE:
+                output.write(b"".join(block))
+                block = []
+                size = 0
+        if block:
+            output.write(b"".join(block))
+
+
+def open_stdin():
+    """
+    The standard input as a binary file. The pipes between commands carry
+    text, which is encoded again.
+    """
+    stdin = getattr(sys.stdin, "buffer", None)
+    if stdin is not None:
+        return stdin
+    return _EncodedStream(sys.stdin)
+
+
+class _EncodedStream(object):
+    """
+    A text stream read as utf-8 bytes.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def read(self, size=-1):
+        return self.stream.read(size).encode("utf-8")
+
+    def __iter__(self):
+        for line in self.stream:
+            yield line.encode("utf-8")
+
+    def close(self):
+        pass
 
 
 def main(args):
     p = argparse.ArgumentParser(description=__doc__)
+    p.add_argument(
+        "-n", "--number", action="store_true", help="number all output lines"
+    )
+    p.add_argument(
+        "-s",
+        "--squeeze-blank",
+        action="store_true",
+        help="suppress repeated empty output lines",
+    )
+    p.add_argument(
+        "-A",
+        "--show-all",
+        action="store_true",
+        help="show the non-printing characters in ^ and M- notation, "
+        "tabs as ^I and the line ends as $",
+    )
     p.add_argument("files", action="store", nargs="*", help="files to print")
     ns = p.parse_args(args)
 
     status = 0
+    output = Output(sys.stdout)
+    if ns.number or ns.squeeze_blank or ns.show_all:
+        formatter = LineFormatter(ns.number, ns.squeeze_blank, ns.show_all)
+    else:
+        formatter = None
 
-    fileinput.close()  # in case it is not closed
     try:
-        for line in fileinput.input(ns.files, openhook=fileinput.hook_encoded("utf-8")):
-            print(filter_non_printable(line), end="")
-    except Exception as e:
-        print("cat: %s" % str(e))
-        status = 1
+        for fname in ns.files or ["-"]:
+            try:
+                f = open_stdin() if fname == "-" else open(fname, "rb")
+            except (IOError, OSError) as e:
+                print("cat: %s" % str(e), file=sys.stderr)
+                status = 1
+                continue
+            try:
+                if formatter is None:
+                    output.copy(f)
+                else:
+                    formatter.copy(f, output)
+            except (IOError, OSError) as e:
+                print("cat: %s: %s" % (fname, str(e)), file=sys.stderr)
+                status = 1
+            finally:
+                if fname != "-":
+                    f.close()
     finally:
-        fileinput.close()
+        output.close()
 
     sys.exit(status)
 
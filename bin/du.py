@@ -2,10 +2,16 @@
 """Summarize disk usage of the set of FILEs, recursively for directories."""
 
 from __future__ import print_function
+import collections
 import os
+import re
 import sys
+import threading
 from argparse import ArgumentParser
-from fnmatch import fnmatch
+from fnmatch import fnmatch, translate
+from multiprocessing.pool import ThreadPool
+
+_stash = globals()["_stash"]
 
 
 def is_excluded(path, pattern):
@@ -21,6 +27,165 @@ def is_excluded(path, pattern):
         return False
 
 
+class DiskUsage(object):
+    """
+    Sums up the sizes of directory trees. Hard linked files are counted
+    once, however many times they are found.
+    :param apparent: whether to count the sizes of the files instead of the
+        space they use on disk
+    :type apparent: bool
+    :param exclude_pattern: pattern of the names to leave out
+    :type exclude_pattern: str
+    :param max_depth: directories deeper than this are not reported
+    :type max_depth: int
+    """
+
+    def __init__(self, apparent=False, exclude_pattern=None, max_depth=sys.maxsize):
+        self.apparent = apparent
+        if exclude_pattern:
+            self.exclude = re.compile(translate(exclude_pattern)).match
+        else:
+            self.exclude = None
+        self.max_depth = max_depth
+        self.errors = []
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def size_of(self, st):
+        """
+        The size counted for a stat result.
+        :rtype: int
+        """
+        if not self.apparent:
+            blocks = getattr(st, "st_blocks", None)
+            if blocks is not None:
+                return blocks * 512
+        return st.st_size
+
+    def file_size(self, entry):
+        """
+        The size of a file or symlink, 0 if it was counted before.
+        :rtype: int
+        """
+        try:
+            st = entry.stat(follow_symlinks=False)
+        except OSError as e:
+            self.errors.append(e)
+            return 0
+        if st.st_nlink > 1:
+            key = (st.st_dev, st.st_ino)
+            with self._lock:
+                if key in self._seen:
+                    return 0
+                self._seen.add(key)
+        return self.size_of(st)
+
+    def entries(self, path):
+        """
+        The entries of a directory which are not excluded, split into the
+        subdirectories and the others.
+        :rtype: (list, list)
+        """
+        try:
+            entries = _stash.libcore.scandir_sorted(path)
+        except OSError as e:
+            self.errors.append(e)
+            return [], []
+        subdirs = []
+        files = []
+        for entry in entries:
+            if self.exclude is not None and self.exclude(entry.name):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry)
+            else:
+                files.append(entry)
+        return subdirs, files
+
+    def scan_dir(self, path):
+        """
+        Size the files directly in a directory.
+        :return: their size and the paths of the subdirectories
+        :rtype: (int, list)
+        """
+        subdirs, files = self.entries(path)
+        size = sum(self.file_size(entry) for entry in files)
+        return size, [entry.path for entry in subdirs]
+
+    def scan(self, path, pool=None, max_pending=1):
+        """
+        Size a directory tree. The tree is walked with an explicit stack, each
+        directory being scanned on its own, in the pool if one is given, so
+        that neither deep nor lopsided trees are a problem.
+        :param pool: the pool scanning the directories
+        :type pool: multiprocessing.pool.ThreadPool
+        :param max_pending: the most directories in the pool at once
+        :type max_pending: int
+        :return: the size of the tree and the (size, path) of the directories
+            not deeper than max_depth, subdirectories before their parents
+        :rtype: (int, list)
+        """
+        root = _Directory(path, 0, None)
+        todo = [root]
+        pending = collections.deque()
+        while todo or pending:
+            while todo and len(pending) < max_pending:
+                directory = todo.pop()
+                if pool is None:
+                    result = self.scan_dir(directory.path)
+                else:
+                    result = pool.apply_async(self.scan_dir, (directory.path,))
+                pending.append((directory, result))
+            directory, result = pending.popleft()
+            if pool is not None:
+                result = _stash.libcore.wait_result(result)
+            size, subdirs = result
+            directory.size += size
+            directory.pending = len(subdirs)
+            children = [
+                _Directory(subdir, directory.depth + 1, directory) for subdir in subdirs
+            ]
+            # only the directories which are reported are kept
+            if directory.depth < self.max_depth:
+                directory.children = children
+            todo.extend(reversed(children))
+            # hand the sizes of the finished directories up to their parents
+            while directory.pending == 0 and directory.parent is not None:
+                parent = directory.parent
+                parent.size += directory.size
+                parent.pending -= 1
+                directory.parent = None
+                directory = parent
+
+        reported = []
+        stack = [(root, False)]
+        while stack:
+            directory, expanded = stack.pop()
+            if expanded or not directory.children:
+                reported.append((directory.size, directory.path))
+            else:
+                stack.append((directory, True))
+                stack.extend((child, False) for child in reversed(directory.children))
+        return root.size, reported
+
+
+class _Directory(object):
+    """
+    A directory being sized by DiskUsage.scan.
+    """
+
+    __slots__ = ("path", "depth", "parent", "size", "pending", "children")
+
+    def __init__(self, path, depth, parent):
+        self.path = path
+        self.depth = depth
+        self.parent = parent
+        self.size = 0
+        # subdirectories not sized yet, unknown until the directory is scanned
+        self.pending = None
+        self.children = None
+
+
 def main(args):
     ap = ArgumentParser(
         description="Summarize disk usage of the set of FILEs, recursively for directories."
@@ -31,6 +196,34 @@ def main(args):
         action="store_true",
         help="display only a total for each argument",
     )
+    ap.add_argument(
+        "-d",
+        "--max-depth",
+        type=int,
+        default=None,
+        metavar="N",
+        help="display the total of a directory only if it is N or fewer levels "
+        "below the argument",
+    )
+    ap.add_argument(
+        "--apparent-size",
+        action="store_true",
+        help="print the sizes of the files rather than the disk space they use",
+    )
+    ap.add_argument(
+        "--top",
+        type=int,
+        default=None,
+        metavar="N",
+        help="display only the N largest directories, largest first",
+    )
+    ap.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=4,
+        help="number of directories sized in parallel (default: 4)",
+    )
     ap.add_argument(
         "--exclude",
         dest="exclude_pattern",
@@ -47,51 +240,55 @@ def main(args):
     ns = ap.parse_args(args)
 
     exclude_pattern = ns.exclude_pattern if ns.exclude_pattern else None
+    max_depth = 0 if ns.summarize else ns.max_depth
+    if max_depth is None:
+        max_depth = sys.maxsize
 
-    sizeof_fmt = globals()["_stash"].libcore.sizeof_fmt
+    sizeof_fmt = _stash.libcore.sizeof_fmt
 
-    for path in ns.FILEs:
-        path_base = os.path.dirname(path)
+    du = DiskUsage(
+        apparent=ns.apparent_size,
+        exclude_pattern=exclude_pattern,
+        max_depth=max_depth,
+    )
+    pool = ThreadPool(ns.jobs) if ns.jobs > 1 else None
+    reported = []
+    try:
+        for path in ns.FILEs:
+            path_base = os.path.dirname(path)
 
-        # Use relative path because of the following facts:
-        # du A/B --exclude="B"  -> no output
-        # du A/B --exclude="A"  -> normal output
-        if is_excluded(os.path.relpath(path, path_base), exclude_pattern):
-            continue
+            # Use relative path because of the following facts:
+            # du A/B --exclude="B"  -> no output
+            # du A/B --exclude="A"  -> normal output
+            if is_excluded(os.path.relpath(path, path_base), exclude_pattern):
+                continue
 
-        if os.path.isdir(path):
-            dirs_dict = {}
-            # We need to walk the tree from the bottom up so that a directory can have easy
-            # access to the size of its subdirectories.
-            for root, dirs, files in os.walk(path, topdown=False):
-                # This is to make sure the directory is not exclude from its ancestor
-                if is_excluded(os.path.relpath(root, path_base), exclude_pattern):
+            if os.path.isdir(path):
+                _, lines = du.scan(path, pool, 2 * ns.jobs)
+            else:
+                try:
+                    lines = [(du.size_of(os.lstat(path)), path)]
+                except OSError as e:
+                    du.errors.append(e)
                     continue
+            if ns.top is None:
+                for size, name in lines:
+                    print("%-8s %s" % (sizeof_fmt(size), name))
+            else:
+                reported.extend(lines)
+    finally:
+        if pool is not None:
+            pool.terminate()
 
-                # Loop through every non directory file in this directory and sum their sizes
-                size = sum(
-                    os.path.getsize(os.path.join(root, name))
-                    for name in files
-                    if not is_excluded(name, exclude_pattern)
-                )
-
-                # Look at all of the subdirectories and add up their sizes from the `dirs_dict`
-                subdir_size = sum(
-                    dirs_dict[os.path.join(root, d)]
-                    for d in dirs
-                    if not is_excluded(d, exclude_pattern)
-                )
-
-                # store the size of this directory (plus subdirectories) in a dict so we
-                # can access it later
-                my_size = dirs_dict[root] = size + subdir_size
-
-                if ns.summarize and root != path:
-                    continue
+    if ns.top is not None:
+        reported.sort(key=lambda line: line[0], reverse=True)
+        for size, name in reported[: ns.top]:
+            print("%-8s %s" % (sizeof_fmt(size), name))
 
-                print("%-8s %s" % (sizeof_fmt(my_size), root))
-        else:
-            print("%-8s %s" % (sizeof_fmt(os.path.getsize(path)), path))
+    for err in du.errors:
+        print("du: {!s}".format(err), file=sys.stderr)
+    if du.errors:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
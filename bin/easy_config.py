@@ -118,6 +118,12 @@ OPTIONS = {
             "type": TYPE_BOOL,
             "description": "You may or may not gain imaginary internet points if you figure out what this option does",
         },
+        {
+            "display_name": "Cache Compiled Scripts",
+            "option_name": "py_code_cache",
+            "type": TYPE_BOOL,
+            "description": "Keep compiled python scripts so they are not compiled again on every run",
+        },
         {
             "display_name": "Thread Type",
             "option_name": "thread_type",
@@ -4,89 +4,195 @@
 from __future__ import print_function
 
 import os
+import re
 import sys
 import argparse
 import time
 import fnmatch
+import operator
 from functools import partial
 
+_stash = globals()["_stash"]
+
+_SIZE = re.compile(r"^([+-]?)(\d+)([cwbkMG]?)$")
+
+# Bytes in a unit of -size
+_SIZE_UNITS = {"c": 1, "w": 2, "b": 512, "k": 1024, "M": 1024**2, "G": 1024**3}
+
+# Most results written at once, and longest time they are held back
+_BATCH_SIZE = 1024
+_BATCH_DELAY = 0.2
+
+# Options of find whose values may start with a dash
+_VALUE_OPTIONS = ("-d", "-mtime", "--mtime", "-size", "--size")
+
 
 class FilePredicate(object):
+    """
+    The tests of the command line, compiled into a single function which is
+    called once for every entry. Tests are run in the order they are added,
+    so the cheap ones should come first.
+    """
+
     def __init__(self):
         self.funclist = []
 
     def add_filter(self, func):
         self.funclist.append(func)
 
-    def run(self, paths):
-        names = []
+    def compile(self):
+        """
+        :return: a function of an os.DirEntry and its depth telling whether
+            the entry matches all tests
+        :rtype: callable
+        """
+        funcs = tuple(self.funclist)
+        if not funcs:
+            return lambda entry, depth: True
+        if len(funcs) == 1:
+            return funcs[0]
+
+        def match(entry, depth):
+            for func in funcs:
+                if not func(entry, depth):
+                    return False
+            return True
+
+        return match
+
+    def run(self, paths, maxdepth=sys.maxsize, prune=None, onerror=None):
+        """
+        Yield the matching paths below the given paths as they are found.
+        Directories end with a path separator. None is yielded for the
+        entries which do not match, so that the caller gets to run while
+        no results come.
+        """
+        match = self.compile()
         for pth in paths:
-            for root, dirs, files in os.walk(os.path.normpath(pth)):
-                for func in self.funclist:
-                    root, dirs, files = func(root, dirs, files, pth)
-                    if root is None:
-                        break
-                if root is not None:
-                    names.extend(os.path.join(root, f) for f in files)
-                    names.extend(os.path.join(root, d + os.path.sep) for d in dirs)
-
-        return names
-
-
-def filter_depth_and_type(mindepth, maxdepth, ftype, root, dirs, files, pth):
-    root_rel = os.path.relpath(root, pth)
-    if root_rel == ".":
-        level = 0
-    else:
-        level = len(root_rel.split(os.path.sep))
+            for entry, depth in walk(pth, maxdepth, prune, onerror):
+                if not match(entry, depth):
+                    yield None
+                elif entry.is_dir():
+                    yield entry.path + os.path.sep
+                else:
+                    yield entry.path
+
+
+def walk(top, maxdepth, prune=None, onerror=None):
+    """
+    Yield the entries below top with their depth, those directly in top
+    having depth 0. A directory is yielded before its content, and the
+    entries of a directory are sorted by name.
+    :param maxdepth: the depth of the deepest entries
+    :type maxdepth: int
+    :param prune: tells whether to skip a directory and its content
+    :type prune: callable
+    :param onerror: called with the OSError of an unreadable path
+    :type onerror: callable
+    """
+    top = os.path.normpath(top)
+    start = _stash.libcore.PathEntry(top)
+    try:
+        start.stat()
+    except OSError as e:
+        if onerror is not None:
+            onerror(e)
+        return
+    if not start.is_dir():
+        yield start, 0
+        return
+
+    stack = [(top, 0)]
+    while stack:
+        path, depth = stack.pop()
+        try:
+            entries = _stash.libcore.scandir_sorted(path)
+        except OSError as e:
+            if onerror is not None:
+                onerror(e)
+            continue
+        subdirs = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if prune is not None and prune(entry):
+                    continue
+                if depth < maxdepth:
+                    subdirs.append((entry.path, depth + 1))
+            yield entry, depth
+        stack.extend(reversed(subdirs))
+
 
-    if level > maxdepth:
-        return None, None, None
+def filter_depth(mindepth, entry, depth):
+    return depth >= mindepth
 
-    elif not (mindepth <= level <= maxdepth):
-        files = []
 
+def filter_type(ftype, entry, depth):
     if ftype == "f":
-        if not dirs and not files:
-            return None, None, None
-        else:
-            if level == maxdepth:
-                dirs = []
-            else:
-                return root, dirs, files
-    elif ftype == "d":
-        files = []
+        return entry.is_file()
+    return entry.is_dir()
+
 
-    return root, dirs, files
+def filter_name(match, entry, depth):
+    return match(entry.name) is not None
 
 
-def filter_name(pattern, root, dirs, files, pth):
-    files = fnmatch.filter(files, pattern)
-    dirs = fnmatch.filter(dirs, pattern)
-    if not files and not dirs and not fnmatch.fnmatch(root, pattern):
-        return None, None, None
-    return root, dirs, files
+def filter_mtime(oldest_time, newest_time, entry, depth):
+    try:
+        st_mtime = entry.stat().st_mtime
+    except OSError:
+        return False
+    return newest_time > st_mtime > oldest_time
 
 
-def filter_mtime(oldest_time, newest_time, root, dirs, files, pth):
-    fnames = []
-    for f in files:
-        st_mtime = os.stat(os.path.join(root, f)).st_mtime
-        if newest_time > st_mtime > oldest_time:
-            fnames.append(f)
+def filter_size(compare, size, unit, entry, depth):
+    try:
+        nbytes = entry.stat().st_size
+    except OSError:
+        return False
+    # sizes are rounded up to whole units
+    return compare(-(-nbytes // unit), size)
 
-    dnames = []
-    for d in dirs:
-        st_mtime = os.stat(os.path.join(root, d)).st_mtime
-        if newest_time > st_mtime > oldest_time:
-            dnames.append(d)
 
-    if not fnames and not dnames:
-        st_mtime = os.stat(root).st_mtime
-        if not (newest_time > st_mtime > oldest_time):
-            return None, None, None
+def filter_newer(reference_time, entry, depth):
+    try:
+        return entry.stat().st_mtime > reference_time
+    except OSError:
+        return False
 
-    return root, dnames, fnames
+
+def parse_size(s):
+    """
+    Parse the argument of -size, [+-]n[cwbkMG].
+    :return: the comparison, the size and the unit in bytes
+    :rtype: (callable, int, int)
+    """
+    m = _SIZE.match(s)
+    if m is None:
+        raise argparse.ArgumentTypeError("invalid size: {!r}".format(s))
+    sign, n, unit = m.groups()
+    if sign == "+":
+        compare = operator.gt
+    elif sign == "-":
+        compare = operator.lt
+    else:
+        compare = operator.eq
+    return compare, int(n), _SIZE_UNITS[unit or "b"]
+
+
+def join_values(args):
+    """
+    Attach the values of options which may start with a dash, like -size -10k,
+    to their option, so that they are not taken for options themselves.
+    """
+    joined = []
+    it = iter(args)
+    for arg in it:
+        if arg in _VALUE_OPTIONS:
+            value = next(it, None)
+            if value is not None:
+                arg = arg + "=" + value
+        joined.append(arg)
+    return joined
 
 
 def main(args):
@@ -120,6 +226,34 @@ def main(args):
         nargs="?",
         help="specify modification time range",
     )
+    ap.add_argument(
+        "-size",
+        "--size",
+        metavar="[+-]n[cwbkMG]",
+        type=parse_size,
+        help="match files of n units of space, more than n with +n, "
+        "less than n with -n (default unit: 512 byte blocks)",
+    )
+    ap.add_argument(
+        "-newer",
+        "--newer",
+        metavar="file",
+        help="match files modified more recently than file",
+    )
+    ap.add_argument(
+        "-prune",
+        "--prune",
+        metavar="pattern",
+        action="append",
+        default=[],
+        help="do not match or descend into directories matching pattern",
+    )
+    ap.add_argument(
+        "-print0",
+        "--print0",
+        action="store_true",
+        help="separate the results by null characters instead of newlines",
+    )
 
     ap.add_argument(
         "-mindepth",
@@ -128,7 +262,7 @@ def main(args):
         nargs="?",
         default=0,
         type=int,
-        help="descend at most n directory levels below command line arguments",
+        help="descend at least n directory levels below command line arguments",
     )
     ap.add_argument(
         "-maxdepth",
@@ -139,15 +273,20 @@ def main(args):
         type=int,
         help="descend at most n directory levels below command line arguments",
     )
-    ns = ap.parse_args(args)
+    ns = ap.parse_args(join_values(args))
 
     file_predicate = FilePredicate()
 
-    file_predicate.add_filter(
-        partial(filter_depth_and_type, ns.mindepth, ns.maxdepth, ns.type)
-    )
+    # the tests not needing a stat call come first
+    if ns.mindepth > 0:
+        file_predicate.add_filter(partial(filter_depth, ns.mindepth))
+
+    if ns.type != "a":
+        file_predicate.add_filter(partial(filter_type, ns.type))
 
-    file_predicate.add_filter(partial(filter_name, ns.pattern))
+    if ns.pattern != "*":
+        name_match = re.compile(fnmatch.translate(ns.pattern)).match
+        file_predicate.add_filter(partial(filter_name, name_match))
 
     if ns.mtime:
         oldest_time = 0
@@ -164,9 +303,54 @@ def main(args):
             newest_time = tnow - ndays * 86400.0
         file_predicate.add_filter(partial(filter_mtime, oldest_time, newest_time))
 
-    names = file_predicate.run(ns.paths)
+    if ns.size:
+        file_predicate.add_filter(partial(filter_size, *ns.size))
+
+    if ns.newer:
+        try:
+            reference_time = os.stat(ns.newer).st_mtime
+        except OSError as e:
+            print("find: {!s}".format(e), file=sys.stderr)
+            sys.exit(1)
+        file_predicate.add_filter(partial(filter_newer, reference_time))
+
+    prune = None
+    if ns.prune:
+        prune_match = re.compile(
+            "|".join("(?:{})".format(fnmatch.translate(p)) for p in ns.prune)
+        ).match
+
+        def prune(entry):
+            return prune_match(entry.name) is not None
+
+    errors = []
+    end = "\0" if ns.print0 else "\n"
+    write = sys.stdout.write
+    # results are written in batches, the first one right away and the
+    # others at least every few tenths of a second, so that they show up
+    # while the search goes on
+    batch = []
+    last_write = 0
+    for name in file_predicate.run(
+        ns.paths, maxdepth=ns.maxdepth, prune=prune, onerror=errors.append
+    ):
+        if name is not None:
+            batch.append(name)
+        elif not batch:
+            continue
+        if len(batch) >= _BATCH_SIZE or time.time() - last_write > _BATCH_DELAY:
+            batch.append("")
+            write(end.join(batch))
+            batch = []
+            last_write = time.time()
+    if batch:
+        batch.append("")
+        write(end.join(batch))
 
-    print("\n".join(names))
+    for err in errors:
+        print("find: {!s}".format(err), file=sys.stderr)
+    if errors:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
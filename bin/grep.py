@@ -5,10 +5,289 @@ from __future__ import print_function
 
 import argparse
 import collections
-import fileinput
 import os
 import re
 import sys
+import threading
+from multiprocessing.pool import ThreadPool
+
+from six.moves import queue
+
+# Files are read in chunks of this size
+_CHUNK_SIZE = 1 << 20
+
+# Chunks of output of a file searched ahead held at most
+_MAX_PENDING_CHUNKS = 4
+
+# Longest a wait for the output of a file lasts, so that a kill gets through
+_WAIT_SLICE = 0.1
+
+# Characters which make a pattern a regular expression
+_META_CHARS = re.compile(r"[.^$*+?{}\[\]\\|()]")
+
+
+class Matcher(object):
+    """
+    Finds the lines holding a pattern in a buffer of many lines.
+
+    Literal patterns are searched as bytes with bytes.find. Regular
+    expressions are searched as text, since their classes and '.' depend on
+    the characters, not the bytes. Either way a whole buffer is searched at
+    once and only the lines around the matches are looked at.
+    """
+
+    def __init__(self, pattern, ignore_case=False):
+        flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+        self.literal = not ignore_case and not _META_CHARS.search(pattern)
+        self.regex = re.compile(pattern, flags)
+        if self.literal:
+            self.needle = pattern.encode("utf-8")
+            self.newline = b"\n"
+        else:
+            self.needle = None
+            self.newline = "\n"
+
+    def prepare(self, data):
+        """
+        Convert the bytes of whole lines to what the matcher searches.
+        """
+        return data if self.literal else data.decode("utf-8", "replace")
+
+    def to_text(self, line):
+        return line.decode("utf-8", "replace") if self.literal else line
+
+    def find(self, buf, pos):
+        """
+        Find the first match at or after pos.
+        :return: the start and end of the match or None
+        :rtype: (int, int)
+        """
+        if self.literal:
+            i = buf.find(self.needle, pos)
+            return None if i < 0 else (i, i + len(self.needle))
+        m = self.regex.search(buf, pos)
+        return None if m is None else m.span()
+
+    def lines(self, buf):
+        """
+        Yield the start and end of every line of buf holding a match, the
+        end excluding the newline.
+        """
+        nl = self.newline
+        pos = 0
+        size = len(buf)
+        while pos < size:
+            span = self.find(buf, pos)
+            if span is None:
+                return
+            start, end = span
+            ls = buf.rfind(nl, 0, start) + 1
+            if ls == size:
+                # an empty match after the last newline
+                return
+            le = buf.find(nl, start)
+            if le < 0:
+                le = size
+            if end > le and self.regex.search(buf, ls, le) is None:
+                # the match runs over the end of the line, which itself
+                # does not match
+                pos = le + 1
+                continue
+            yield ls, le
+            pos = le + 1
+
+    def highlight(self, line, color):
+        """
+        Color all matches of a line of text.
+        """
+        return self.regex.sub(lambda m: color(m.group()), line)
+
+
+def universal_newlines(data):
+    """
+    Turn the '\\r\\n' and '\\r' line endings of data into '\\n', as reading
+    a file in text mode does, so that '$' matches at the end of every line.
+    """
+    if b"\r" in data:
+        data = data.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+    return data
+
+
+def read_chunks(path, chunk_size=_CHUNK_SIZE):
+    """
+    Yield the bytes of a file in chunks that end with a whole line, with
+    universal newlines.
+    """
+    with open(path, "rb") as ins:
+        rest = b""
+        while True:
+            chunk = ins.read(chunk_size)
+            if not chunk:
+                break
+            data = rest + chunk
+            # a '\r' at the end may be followed by the '\n' of the next chunk
+            end = len(data) - 1 if data.endswith(b"\r") else len(data)
+            end = max(data.rfind(b"\n", 0, end), data.rfind(b"\r", 0, end)) + 1
+            if end == 0:
+                rest = data
+                continue
+            rest = data[end:]
+            yield universal_newlines(data[:end])
+        if rest:
+            yield universal_newlines(rest)
+
+
+def search_file(path, matcher, ns):
+    """
+    Search a file, chunk by chunk. This runs in the threads of the pool, so
+    the matches are left for the caller to color, since the styles depend
+    on the stdout of the command.
+    :return: for each chunk, the (lineno, line) of its output, its number of
+        matching lines and the error that ended the search
+    :rtype: iterator of (list, int, Exception)
+    """
+    lineno = 0
+    nl = matcher.newline
+    try:
+        for data in read_chunks(path):
+            output = []
+            count = 0
+            buf = matcher.prepare(data)
+            counted = 0  # lines are counted up to this position of buf
+            nextline = 0  # the first line not yet printed with -v
+            for ls, le in matcher.lines(buf):
+                if ns.invert:
+                    for line in buf[nextline:ls].split(nl)[:-1]:
+                        count += 1
+                        lineno += 1
+                        if not ns.count:
+                            output.append((lineno, matcher.to_text(line)))
+                    lineno += 1  # the matching line
+                    nextline = counted = le + 1
+                    continue
+                count += 1
+                if ns.count:
+                    continue
+                lineno += buf.count(nl, counted, ls) + 1
+                counted = le + 1
+                output.append((lineno, matcher.to_text(buf[ls:le])))
+            if ns.invert:
+                lines = buf[nextline:].split(nl)
+                if lines[-1]:
+                    lines.append(lines[-1][:0])  # the last line has no newline
+                for line in lines[:-1]:
+                    count += 1
+                    lineno += 1
+                    if not ns.count:
+                        output.append((lineno, matcher.to_text(line)))
+            elif not ns.count:
+                lineno += buf.count(nl, counted)
+            yield output, count, None
+    except (IOError, OSError) as e:
+        yield [], 0, e
+
+
+class FileSearch(object):
+    """
+    The search of a file in the pool, handing its output over chunk by
+    chunk. At most _MAX_PENDING_CHUNKS chunks are held while the output of
+    the files before is printed, so that the memory used does not grow
+    with the matches.
+    """
+
+    def __init__(self, pool, path, matcher, ns, stopped):
+        self.stopped = stopped
+        self.queue = queue.Queue(_MAX_PENDING_CHUNKS)
+        pool.apply_async(self.run, (path, matcher, ns))
+
+    def _put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=_WAIT_SLICE)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run(self, path, matcher, ns):
+        try:
+            for result in search_file(path, matcher, ns):
+                if not self._put(result):
+                    return
+        except Exception as e:
+            self._put(([], 0, e))
+        self._put(None)
+
+    def __iter__(self):
+        while True:
+            try:
+                # waits in short slices, as a kill is delivered between them
+                result = self.queue.get(timeout=_WAIT_SLICE)
+            except queue.Empty:
+                continue
+            if result is None:
+                return
+            yield result
+
+
+def search_ahead(pool, files, matcher, ns, stopped, ahead):
+    """
+    Start the search of up to ahead files before the one being printed.
+    :return: the files and the output of their search, in order, None for
+        the standard input
+    :rtype: iterator of (str, FileSearch)
+    """
+    pending = collections.deque()
+    for f in files:
+        search = None if f == "-" else FileSearch(pool, f, matcher, ns, stopped)
+        pending.append((f, search))
+        if len(pending) >= ahead:
+            yield pending.popleft()
+    while pending:
+        yield pending.popleft()
+
+
+def search_stdin(matcher, ns, color):
+    """
+    Search the standard input line by line, printing as it goes.
+    :return: the number of matching lines
+    :rtype: int
+    """
+    count = 0
+    for lineno, line in enumerate(sys.stdin, 1):
+        # without its line ending, as the lines of the files are searched
+        line = line.rstrip("\r\n")
+        if bool(matcher.regex.search(line)) != ns.invert:
+            count += 1
+            if not ns.count:
+                if not ns.invert:
+                    line = matcher.highlight(line, color)
+                print(format_line(None, lineno, line.rstrip()))
+    return count
+
+
+def format_line(filename, lineno, line):
+    if filename is None:
+        return "{lineno}: {line}".format(lineno=lineno, line=line)
+    return "{filename}: {lineno}: {line}".format(
+        filename=filename, lineno=lineno, line=line.rstrip()
+    )
+
+
+def iter_files(files, recursive, errors):
+    """
+    Yield the files to search, walking directories if recursive.
+    """
+    for f in files:
+        if f == "-":
+            yield f
+        elif os.path.isdir(f):
+            # Do not try to grep directories
+            if recursive:
+                for fp in _stash.libcore.walk_files(f, onerror=errors.append):
+                    yield fp
+        else:
+            yield f
 
 
 def main(args):
@@ -28,53 +307,84 @@ def main(args):
         action="store_true",
         help="count the search results instead of normal output",
     )
+    ap.add_argument(
+        "-r",
+        "--recursive",
+        action="store_true",
+        help="search the files of directories recursively",
+    )
+    ap.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=4,
+        help="number of files searched in parallel (default: 4)",
+    )
     ns = ap.parse_args(args)
 
-    flags = 0
-    if ns.ignore_case:
-        flags |= re.IGNORECASE
-
-    pattern = re.compile(ns.pattern, flags=flags)
+    try:
+        matcher = Matcher(ns.pattern, ignore_case=ns.ignore_case)
+    except re.error as err:
+        print("grep: invalid pattern: {!s}".format(err), file=sys.stderr)
+        sys.exit(2)
 
-    # Do not try to grep directories
-    files = [f for f in ns.files if not os.path.isdir(f)]
+    def color(s):
+        return _stash.text_color(s, "red")
 
-    fileinput.close()  # in case it is not closed
+    errors = []
+    status = 0
     try:
-        counts = collections.defaultdict(int)
-        for line in fileinput.input(files, openhook=fileinput.hook_encoded("utf-8")):
-            if bool(pattern.search(line)) != ns.invert:
-                if ns.count:
-                    counts[fileinput.filename()] += 1
+        if not ns.files:
+            count = search_stdin(matcher, ns, color)
+            if ns.count and count:
+                print("{count:6} {filename}".format(filename="<stdin>", count=count))
+            return
+
+        files = iter_files(ns.files, ns.recursive, errors)
+        stopped = threading.Event()
+        if ns.jobs > 1:
+            pool = ThreadPool(ns.jobs)
+            # a few files are searched ahead of the one being printed
+            results = search_ahead(pool, files, matcher, ns, stopped, 2 * ns.jobs)
+        else:
+            pool = None
+            results = (
+                (f, None if f == "-" else search_file(f, matcher, ns)) for f in files
+            )
+        try:
+            # The results come in the order of the files, and the output of
+            # each file as it is searched
+            for filename, chunks in results:
+                if chunks is None:
+                    count = search_stdin(matcher, ns, color)
+                    filename = "<stdin>"
                 else:
-                    if ns.invert:  # optimize: if ns.invert, then no match, so no highlight color needed
-                        newline = line
-                    else:
-                        newline = re.sub(
-                            pattern, lambda m: _stash.text_color(m.group(), "red"), line
-                        )
-                    if fileinput.isstdin():
-                        fmt = "{lineno}: {line}"
-                    else:
-                        fmt = "{filename}: {lineno}: {line}"
-
-                    print(
-                        fmt.format(
-                            filename=fileinput.filename(),
-                            lineno=fileinput.filelineno(),
-                            line=newline.rstrip(),
-                        )
-                    )
-
-        if ns.count:
-            for filename, count in counts.items():
-                fmt = "{count:6} {filename}"
-                print(fmt.format(filename=filename, count=count))
+                    count = 0
+                    for output, chunk_count, err in chunks:
+                        count += chunk_count
+                        if err is not None:
+                            errors.append(err)
+                        for lineno, line in output:
+                            if not ns.invert:
+                                line = matcher.highlight(line, color)
+                            print(format_line(filename, lineno, line))
+                if ns.count and count:
+                    print("{count:6} {filename}".format(filename=filename, count=count))
+        finally:
+            # the searches waiting for their output to be taken give up
+            stopped.set()
+            if pool is not None:
+                pool.terminate()
 
     except Exception as err:
         print("grep: {}: {!s}".format(type(err).__name__, err), file=sys.stderr)
-    finally:
-        fileinput.close()
+        status = 1
+
+    for err in errors:
+        print("grep: {!s}".format(err), file=sys.stderr)
+        status = 1
+    if status:
+        sys.exit(status)
 
 
 if __name__ == "__main__":
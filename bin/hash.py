@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""Show, reset or pre-warm the table of remembered command locations."""
+
+from __future__ import print_function
+
+import argparse
+import sys
+
+
+def main(args):
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument(
+        "-r", "--reset", action="store_true", help="forget all remembered locations"
+    )
+    ap.add_argument(
+        "-d",
+        "--delete",
+        action="store_true",
+        help="forget the remembered location of each name",
+    )
+    ap.add_argument(
+        "-t",
+        "--type",
+        action="store_true",
+        help="print the remembered location of each name",
+    )
+    ap.add_argument(
+        "-a",
+        "--all",
+        action="store_true",
+        help="remember the location of every command in BIN_PATH",
+    )
+    ap.add_argument("names", nargs="*", help="command names to look up")
+    ns = ap.parse_args(args)
+
+    rt = globals()["_stash"].runtime
+    command_hash = rt.command_hash
+    _, current_state = rt.get_current_worker_and_state()
+    bin_path = current_state.environ_get("BIN_PATH")
+
+    status = 0
+
+    if ns.reset:
+        command_hash.reset()
+
+    if ns.all:
+        command_hash.warm(bin_path)
+
+    for name in ns.names:
+        if ns.delete:
+            if not command_hash.forget(name):
+                print("hash: {}: not found".format(name), file=sys.stderr)
+                status = 1
+        elif ns.type:
+            entry = command_hash.table.get(name)
+            if entry is None:
+                print("hash: {}: not found".format(name), file=sys.stderr)
+                status = 1
+            else:
+                print(entry[0])
+        else:
+            try:
+                rt.find_script_file(name)
+            except Exception as err:
+                print("hash: {}".format(err), file=sys.stderr)
+                status = 1
+
+    if not ns.names and not ns.reset and not ns.all:
+        if not command_hash.table:
+            print("hash: hash table empty")
+        else:
+            print("hits\tcommand")
+            for name in sorted(command_hash.table):
+                fname, hits = command_hash.table[name]
+                print("{:4d}\t{}".format(hits, fname))
+
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
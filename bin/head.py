@@ -4,10 +4,13 @@
 from __future__ import print_function
 
 import argparse
+import collections
 import string
 import sys
 import fileinput
 
+_stash = globals()["_stash"]
+
 
 def filter_non_printable(s):
     return "".join(
@@ -15,27 +18,6 @@ def filter_non_printable(s):
     )
 
 
-def head(f, nlines):
-    if nlines >= 0:
-        for i, line in enumerate(f):
-            if i >= nlines:
-                break
-            print(line, end="")
-    else:
-        buf = []
-        print(1)
-        line = f.readline()
-        print(2)
-        while line:
-            buf.append(line)
-            if len(buf) > -nlines:
-                del buf[0]
-            line = f.readline()
-
-        for line in buf:
-            print(line, end="")
-
-
 def main(args):
     p = argparse.ArgumentParser(description=__doc__)
     p.add_argument(
@@ -77,32 +59,32 @@ def main(args):
                 else:
                     print(header_fmt.format(fname), end="")
 
-            fileinput.close()
-            inp = fileinput.input(fname, openhook=fileinput.hook_encoded("utf-8"))
-            if ns.lines >= 0:
-                buf = []
-                for i, line in enumerate(inp):
-                    if i >= ns.lines:
-                        break
-                    buf.append(line)
-                for line in buf:
-                    print(line, end="")
-            else:
-                buf = []
-                for line in fileinput.input(
-                    inp, openhook=fileinput.hook_encoded("utf-8")
-                ):
-                    buf.append(line)
-                    if len(buf) > -ns.lines:
-                        del buf[0]
-                for line in buf:
-                    print(line, end="")
+            if ns.lines < 0 and fname != "-":
+                # only the end of the file is read
+                with open(fname, "rb") as f:
+                    data = _stash.libcore.last_lines(f, -ns.lines)
+                print(data.decode("utf-8", "replace"), end="")
+                continue
+
+            inp = fileinput.FileInput(fname, openhook=fileinput.hook_encoded("utf-8"))
+            try:
+                if ns.lines >= 0:
+                    buf = []
+                    for i, line in enumerate(inp):
+                        if i >= ns.lines:
+                            break
+                        buf.append(line)
+                    for line in buf:
+                        print(line, end="")
+                else:
+                    for line in collections.deque(inp, maxlen=-ns.lines):
+                        print(line, end="")
+            finally:
+                inp.close()
 
     except Exception as e:
         print("head :%s" % str(e))
         status = 1
-    finally:
-        fileinput.close()
 
     sys.exit(status)
 
@@ -24,16 +24,9 @@ def main(args):
         print(_stash.text_color("Error: libdist not loaded.", "red"))
         sys.exit(1)
 
-    fileinput.close()  # in case it is not closed
+    inp = fileinput.FileInput(ns.file, openhook=fileinput.hook_encoded("utf-8"))
     try:
-        _stash.libdist.clipboard_set(
-            "".join(
-                line
-                for line in fileinput.input(
-                    ns.file, openhook=fileinput.hook_encoded("utf-8")
-                )
-            )
-        )
+        _stash.libdist.clipboard_set("".join(line for line in inp))
     except Exception as err:
         print(
             _stash.text_color(
@@ -43,7 +36,7 @@ def main(args):
         )
         sys.exit(1)
     finally:
-        fileinput.close()
+        inp.close()
 
 
 if __name__ == "__main__":
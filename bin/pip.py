@@ -31,16 +31,28 @@ import operator
 import traceback
 import platform
 import json
+import collections
+import re
+import tempfile
 
 import six
 from distutils.util import convert_path
 from fnmatch import fnmatchcase
+from multiprocessing.pool import ThreadPool
 
 # noinspection PyUnresolvedReferences
 from six.moves import filterfalse
 
 from stashutils.extensions import create_command
-from stashutils.wheels import Wheel, wheel_is_compatible
+from stashutils.wheels import Wheel, wheel_is_compatible, filter_requirements
+from stashutils import pipdb
+from stashutils.pipcache import (
+    ArtifactCache,
+    CacheMiss,
+    HashMismatch,
+    MetadataCache,
+    download_file,
+)
 
 _stash = globals()["_stash"]
 VersionSpecifier = _stash.libversion.VersionSpecifier  # alias for readability
@@ -50,8 +62,6 @@ BUNDLED_MODULES = _stash.libdist.BUNDLED_MODULES
 BLOCKLIST_PATH = os.path.join(
     os.path.expandvars("$STASH_ROOT"), "data", "pip_blocklist.json"
 )
-PIP_INDEX_FILE = os.path.join(SITE_PACKAGES_FOLDER, "pip_index.json")
-PIP_INFO_FILE = os.path.join(SITE_PACKAGES_FOLDER, ".package_info", "%s.json")
 
 # Some packages use wrong name for their dependencies
 PACKAGE_NAME_FIXER = {
@@ -60,6 +70,30 @@ PACKAGE_NAME_FIXER = {
 
 NO_OVERWRITE = False
 
+# The JSON API of the package index
+PYPI_URL = "https://pypi.python.org/pypi"
+
+# Packages whose metadata is fetched at once while resolving an install, and
+# archives downloaded at once
+RESOLVE_JOBS = 8
+DOWNLOAD_JOBS = 4
+# Files of a large wheel written at once
+INSTALL_JOBS = 4
+
+# Size of the chunks archives are downloaded in
+DOWNLOAD_CHUNK_SIZE = 1 << 16
+
+# The directory of the caches, None for no caching, and whether to use the
+# cached metadata only. Both are set from the command line.
+CACHE_DIR = None
+OFFLINE = False
+
+# Seconds the cached metadata is used without asking the index
+METADATA_TTL = 600
+
+# Most bytes the cached archives may use
+ARTIFACT_CACHE_SIZE = 512 * 1024 * 1024
+
 # Utility constants
 FLAG_DIST_ALLOW_SRC = 1
 FLAG_DIST_ALLOW_WHL = 2
@@ -223,60 +257,10 @@ class SetuptoolsStub(types.ModuleType):
         return OmniClass()
 
 
-def get_requires(package, index_file=PIP_INDEX_FILE):
-    """
-    get require of the package
-    :param package: package name
-    :type package: str
-    :return: a list of requires package
-    :rtype: list
-    """
-    if os.path.exists(index_file):
-        with open(index_file) as f:
-            index = json.load(f)
-            try:
-                return index[package]
-            except KeyError:  # no such package in index file
-                raise PipError(
-                    "Cannot find packages in index file. Try to using 'pip dev update-index' to update index file"
-                )
-
-    else:
-        raise PipError(
-            "Cannot find index file. Try to using 'pip dev update-index' to update index file"
-        )
-
-
-def get_req_by(package, index_file=PIP_INDEX_FILE):
-    """
-    get the packages that require this package
-    :param package: package name
-    :type package: str
-    :return: a list of packages that require this package
-    :rtype: list
-    """
-    if os.path.exists(index_file):
-        with open(index_file) as f:
-            index = json.load(f)
-            required_by = []
-            for pkg, req in index.items():
-                if package in req:
-                    required_by.append(pkg)
-    else:
-        raise PipError(
-            "Cannot find index file. Try to using 'pip dev update-index' to update index file"
-        )
-
-    return required_by
-
-
-def print_info(
-    package, pip_info_file=PIP_INFO_FILE, site_packages=SITE_PACKAGES_FOLDER
-):
-    info_file = pip_info_file % package
-    if os.path.exists(info_file):
-        with open(info_file) as f:
-            info = json.load(f)
+def print_info(package, site_packages=SITE_PACKAGES_FOLDER):
+    config = PackageConfigHandler(site_packages=site_packages)
+    info = config.get_package_info(package)
+    if info is not None:
         print("Name: {}".format(info["name"]))
         print("Version: {}".format(info["version"]))
         print("Summary: {}".format(info["summary"]))
@@ -286,66 +270,25 @@ def print_info(
         print("License: {}".format(info["license"]))
         print("Location: {}".format(site_packages))
 
-        requires = get_requires(package)
-        required_by = get_req_by(package)
+        requires = config.get_requires(package)
+        required_by = config.get_required_by(package)
         print("requires: {}".format(", ".join(requires)))
         print("required-by: {}".format(", ".join(required_by)))
-    else:  # no info_file
+    else:  # no info
         print(_stash.text_color("Package not found: {}".format(package), "yellow"))
 
 
-def download_info(
-    pkg_name, pip_info_file=PIP_INFO_FILE, site_packages=SITE_PACKAGES_FOLDER
-):
-    info_file = pip_info_file % pkg_name
-    r = requests.get("https://pypi.python.org/pypi/{}/json".format(pkg_name))
-    info = r.json()["info"]
-    info_folder = os.path.split(info_file)[0]
-    if not os.path.exists(info_folder):
-        os.mkdir(info_folder)
-    with open(info_file, "w") as f:
-        json.dump(info, f)
-    update_req_index()
-
-
-def update_req_index(
-    pip_info_file=PIP_INFO_FILE,
-    site_packages=SITE_PACKAGES_FOLDER,
-    index_file=PIP_INDEX_FILE,
-):
-    """
-    update package requires index file
-    """
-    repository = get_repository("pypi", site_packages=site_packages)
-    info_list = repository.list()
-
-    req_index = {}  # a dict of {package:requires_list}  type:dict of {str:list of str}
-    for package, info in info_list:
-        info_file = pip_info_file % package
-        if os.path.exists(info_file):
-            # load info
-            with open(info_file) as f:
-                info = json.load(f)
-            # filte requires
-            requires = []
-            try:
-                for req in info["requires_dist"]:
-                    if ";" not in req:
-                        # Remove package version
-                        requires.append(req.split(" ")[0])
-            except TypeError:  # some package may have no require
-                pass
-            req_index[package] = requires
+def download_info(pkg_name, site_packages=SITE_PACKAGES_FOLDER):
+    repository = PyPIRepository(site_packages=site_packages)
+    info = repository._package_info(repository._package_data(pkg_name))
+    repository.config.set_package_info(pkg_name, info)
 
-        else:  # info file not exists
-            print(
-                _stash.text_color(
-                    "Info file of Package {} not found".format(package), "yellow"
-                )
-            )
 
-    with open(index_file, "w") as f:
-        json.dump(req_index, f)
+def update_req_index(site_packages=SITE_PACKAGES_FOLDER):
+    """
+    update the requirements of the packages from their info
+    """
+    PackageConfigHandler(site_packages=site_packages).rebuild_index()
 
 
 def fake_module(new_module):
@@ -479,130 +422,91 @@ def save_current_sys_modules():
         sys.modules[k] = v
 
 
-# warning: the ConfigParser may refer to a different class depening on the used py version
-# though I believe that pip does not use interpolation, so we *should* be safe
-# noinspection PyUnresolvedReferences
-from six.moves.configparser import ConfigParser, NoSectionError
-
-
-class CIConfigParer(ConfigParser):
-    """
-    This config parser is case insensitive for section names so that
-    the behaviour matches pypi queries.
-    """
-
-    def _get_section_name(self, name):
-        for section_name in self.sections():
-            if section_name.lower() == name.lower():
-                return section_name
-        else:
-            raise NoSectionError(name)
-
-    def has_section(self, name):
-        names = [n.lower() for n in self.sections()]
-        return name.lower() in names
-
-    def has_option(self, name, option_name):
-        section_name = self._get_section_name(name)
-        return ConfigParser.has_option(self, section_name, option_name)
-
-    def items(self, name):
-        section_name = self._get_section_name(name)
-        return ConfigParser.items(self, section_name)
-
-    def get(self, name, option_name, *args, **kwargs):
-        section_name = self._get_section_name(name)
-        return ConfigParser.get(self, section_name, option_name, *args, **kwargs)
-
-    def set(self, name, option_name, value):
-        section_name = self._get_section_name(name)
-        return ConfigParser.set(
-            self, section_name, option_name, value.replace("%", "%%")
-        )
-
-    def remove_section(self, name):
-        section_name = self._get_section_name(name)
-        return ConfigParser.remove_section(self, section_name)
-
-
 class PackageConfigHandler(object):
     """
-    Manager class for packages files for tracking installation of modules
+    Manager class for tracking installation of modules. The packages are
+    kept in a database in the site-packages, read from the former package
+    files when it is created.
     """
 
     def __init__(self, site_packages=SITE_PACKAGES_FOLDER, verbose=False):
         self.verbose = verbose
         self.site_packages = site_packages
-        self.package_cfg = os.path.join(site_packages, ".pypi_packages")
-        if not os.path.isfile(self.package_cfg):
-            if self.verbose:
-                print("Creating package file...")
-            with open(self.package_cfg, "w") as outs:
-                outs.close()
-        self.parser = CIConfigParer()
-        self.parser.read(self.package_cfg)
+        if self.verbose and not os.path.isfile(
+            os.path.join(site_packages, pipdb.DATABASE_NAME)
+        ):
+            print("Creating package database...")
+        self.db = pipdb.PackageDatabase(site_packages)
 
     def save(self):
-        with open(self.package_cfg, "w") as outs:
-            self.parser.write(outs)
+        """
+        Changes are saved as they are made, this is left for compatibility.
+        """
+        pass
 
     def add_module(self, pkg_info):
         """
 
-        :param pkg_info: A dict that has name, url, version, summary
+        :param pkg_info: A dict that has name, url, version, summary, files
+            and dependency, the latter two joined by commas
         :return:
         """
-        if not self.parser.has_section(pkg_info["name"]):
-            self.parser.add_section(pkg_info["name"])
-        self.parser.set(pkg_info["name"], "url", pkg_info["url"])
-        self.parser.set(pkg_info["name"], "version", pkg_info["version"])
-        self.parser.set(pkg_info["name"], "summary", pkg_info["summary"])
-        self.parser.set(pkg_info["name"], "files", pkg_info["files"])
-        self.parser.set(pkg_info["name"], "dependency", pkg_info["dependency"])
-        self.save()
+        self.db.add(
+            pkg_info["name"],
+            pkg_info["url"],
+            pkg_info["version"],
+            pkg_info["summary"],
+            [f for f in pkg_info["files"].split(",") if f],
+            [d for d in pkg_info["dependency"].split(",") if d],
+        )
 
     def list_modules(self):
-        return [module for module in self.parser.sections()]
+        return self.db.names()
 
     def module_exists(self, name):
-        return self.parser.has_section(name)
+        return self.db.exists(name)
 
     def get_info(self, name):
-        if self.parser.has_section(name):
-            tbl = {}
-            for opt, value in self.parser.items(name):
-                tbl[opt] = value
-            return tbl
+        tbl = self.db.get(name)
+        if tbl is not None:
+            tbl["files"] = ",".join(self.db.files(name))
+            dependencies = self.db.dependencies(name)
+            if dependencies is not None:
+                tbl["dependency"] = ",".join(sorted(dependencies))
+        return tbl
 
     def remove_module(self, name):
-        self.parser.remove_section(name)
-        self.save()
+        self.db.remove(name)
 
     def get_files_installed(self, section_name):
-        if self.parser.has_option(section_name, "files"):
-            files = self.parser.get(section_name, "files").strip()
-            return files.split(",")
-        else:
-            return None
+        return self.db.files(section_name) or None
+
+    def get_file_owners(self, path):
+        return self.db.owners(path)
 
     def get_dependencies(self, section_name):
-        if self.parser.has_option(section_name, "dependency"):
-            dependencies = self.parser.get(section_name, "dependency").strip()
-            return set(dependencies.split(",")) if dependencies != "" else set()
-        else:
-            return None
+        return self.db.dependencies(section_name)
+
+    def get_dependents(self, name):
+        return self.db.dependents(name)
 
     def get_all_dependencies(self, exclude_module=()):
-        all_dependencies = set()
-        for section_name in self.parser.sections():
-            if section_name not in exclude_module and self.parser.has_option(
-                section_name, "dependency"
-            ):
-                dependencies = self.parser.get(section_name, "dependency").strip()
-                if dependencies != "":
-                    for dep in dependencies.split(","):
-                        all_dependencies.add(dep)
-        return all_dependencies
+        return self.db.all_dependencies(exclude=exclude_module)
+
+    def get_package_info(self, name):
+        return self.db.get_info(name)
+
+    def set_package_info(self, name, info):
+        self.db.set_info(name, info)
+
+    def get_requires(self, name):
+        return self.db.requirements(name)
+
+    def get_required_by(self, name):
+        return self.db.required_by(name)
+
+    def rebuild_index(self):
+        self.db.rebuild_requirements()
 
 
 # noinspection PyPep8Naming,PyProtectedMember
@@ -993,6 +897,29 @@ if __name__ == "__main__":
 # archive_file_installer = ArchiveFileInstaller()
 
 
+def default_cache_dir():
+    """
+    The directory of the caches of pip, ~/.cache/stash/pip, or one below
+    $TMPDIR if the home directory can not be written to.
+    :rtype: str
+    """
+    home = os.path.expanduser("~")
+    if os.access(home, os.W_OK):
+        return os.path.join(home, ".cache", "stash", "pip")
+    return os.path.join(os.getenv("TMPDIR", tempfile.gettempdir()), "stash-pip-cache")
+
+
+def canonical_name(pkg_name):
+    """
+    The name a package is known by whatever its case and separators, as
+    PyPI compares names.
+    :param pkg_name: name of the package
+    :type pkg_name: str
+    :rtype: str
+    """
+    return re.sub(r"[-_.]+", "-", pkg_name).lower()
+
+
 class PackageRepository(object):
     """
     A Package Repository is a manager class to perform various actions
@@ -1029,7 +956,12 @@ class PackageRepository(object):
     ):
         if archive_filename.endswith(".whl"):
             print("Installing wheel: {}...".format(os.path.basename(archive_filename)))
-            wheel = Wheel(archive_filename, verbose=self.verbose, extras=extras)
+            wheel = Wheel(
+                archive_filename,
+                verbose=self.verbose,
+                extras=extras,
+                jobs=INSTALL_JOBS,
+            )
             files_installed, dependencies = wheel.install(self.site_packages)
         else:
             files_installed, dependencies = self.installer.run(
@@ -1066,7 +998,10 @@ class PackageRepository(object):
 
             # If this dependency is installed before, skipping
             # TODO: should we NOT skip if extras are specified?
-            if dep_name in sys.modules["setuptools"]._installed_requirements_:
+            if canonical_name(dep_name) in set(
+                canonical_name(name)
+                for name in sys.modules["setuptools"]._installed_requirements_
+            ):
                 print("Dependency already installed: {}".format(dep_name))
                 continue
 
@@ -1099,13 +1034,13 @@ class PackageRepository(object):
     def remove(self, pkg_name):
         if self.config.module_exists(pkg_name):
             dependencies = self.config.get_dependencies(pkg_name)
-            other_dependencies = self.config.get_all_dependencies(
-                exclude_module=(pkg_name,)
-            )
             files_installed = self.config.get_files_installed(pkg_name)
 
             if files_installed:
                 for f in files_installed:
+                    if self.config.get_file_owners(f) - set([pkg_name]):
+                        # installed by another package as well
+                        continue
                     if os.path.isdir(f):
                         shutil.rmtree(f)
                     elif os.path.isfile(f):
@@ -1146,7 +1081,7 @@ class PackageRepository(object):
             if dependencies:
                 for dependency in dependencies:
                     # If not other packages depend on it, it may be subject to removal
-                    if dependency not in other_dependencies:
+                    if not self.config.get_dependents(dependency):
                         # Only remove the module if it exists in the registry. Otherwise
                         # it is possibly a builtin module.
                         # For backwards compatibility, we do not remove any entries
@@ -1184,6 +1119,21 @@ class PyPIRepository(PackageRepository):
         # DO NOT USE self.pypi, it's there just for search, it's obsolete/legacy
         self.pypi = xmlrpclib.ServerProxy("https://pypi.python.org/pypi")
         self.standard_package_names = {}
+        self.package_data = {}
+        # shared by the threads fetching metadata and archives
+        self.session = requests.Session()
+        if CACHE_DIR is not None:
+            self.metadata_cache = MetadataCache(
+                os.path.join(CACHE_DIR, "metadata"), ttl=METADATA_TTL, offline=OFFLINE
+            )
+            self.artifact_cache = ArtifactCache(
+                os.path.join(CACHE_DIR, "artifacts"),
+                max_size=ARTIFACT_CACHE_SIZE,
+                offline=OFFLINE,
+            )
+        else:
+            self.metadata_cache = None
+            self.artifact_cache = None
 
     def _check_blocklist(self, pkg_name):
         """
@@ -1215,11 +1165,9 @@ class PyPIRepository(PackageRepository):
     def get_standard_package_name(self, pkg_name):
         if pkg_name not in self.standard_package_names:
             try:
-                r = requests.get(
-                    "https://pypi.python.org/pypi/{}/json".format(pkg_name)
-                )
-                self.standard_package_names[pkg_name] = r.json()["info"]["name"]
-            except:
+                pkg_data = self._package_data(pkg_name)
+                self.standard_package_names[pkg_name] = pkg_data["info"]["name"]
+            except Exception:
                 return pkg_name
 
         return self.standard_package_names[pkg_name]
@@ -1237,10 +1185,53 @@ class PyPIRepository(PackageRepository):
         return hits
 
     def _package_data(self, pkg_name):
-        r = requests.get("https://pypi.python.org/pypi/{}/json".format(pkg_name))
-        if not r.status_code == requests.codes.ok:
-            raise PipError("Failed to fetch package release urls")
+        """
+        The metadata of a package, which is fetched once for each name.
+        This is safe to call from several threads at once.
+        :param pkg_name: name of the package
+        :type pkg_name: str
+        :return: the package data, as given by the JSON API
+        :rtype: dict
+        """
+        pkg_data = self.package_data.get(pkg_name)
+        if pkg_data is None:
+            pkg_data = self._get_json("{}/{}/json".format(PYPI_URL, pkg_name))
+            if pkg_data is None:
+                raise PipError("Failed to fetch package release urls")
+            self.package_data[pkg_name] = pkg_data
+        return pkg_data
+
+    def _release_data(self, pkg_name, release):
+        """
+        The metadata of a release of a package, whose info tells the
+        dependencies of this release rather than those of the latest one.
+        :param pkg_name: name of the package
+        :type pkg_name: str
+        :param release: the release
+        :type release: str
+        :return: the release data, or None if it is not available
+        :rtype: dict or None
+        """
+        return self._get_json("{}/{}/{}/json".format(PYPI_URL, pkg_name, release))
 
+    def _get_json(self, url):
+        """
+        Fetch a JSON document of the index, through the metadata cache.
+        :param url: the URL of the document
+        :type url: str
+        :return: the document, or None if the index does not have it
+        :rtype: dict or None
+        """
+        if self.metadata_cache is not None:
+            try:
+                return self.metadata_cache.get_json(self.session, url)
+            except CacheMiss as e:
+                raise PipError("{}, and pip is offline".format(e))
+        if OFFLINE:
+            raise PipError("{} can not be fetched, pip is offline".format(url))
+        r = self.session.get(url)
+        if not r.status_code == requests.codes.ok:
+            return None
         return r.json()
 
     def _package_releases(self, pkg_data):
@@ -1270,7 +1261,29 @@ class PyPIRepository(PackageRepository):
         pkg_name = self.get_standard_package_name(pkg_name)
         pkg_data = self._package_data(pkg_name)
         hit = self._determin_hit(pkg_data, ver_spec, flags=flags)
+        target = self._select_download(pkg_name, pkg_data, hit, flags)
+
+        pkg_info = self._package_info(pkg_data)
+        pkg_info["url"] = "pypi"
+
+        self._announce_download(target)
+        return self._fetch_archive(target), pkg_info
 
+    def _select_download(self, pkg_name, pkg_data, hit, flags=DEFAULT_FLAGS):
+        """
+        Choose the archive of a release to install, its source distribution
+        or a compatible wheel, as the flags allow and prefer.
+        :param pkg_name: name of the package
+        :type pkg_name: str
+        :param pkg_data: the package information
+        :type pkg_data: dict
+        :param hit: the release
+        :type hit: str
+        :param flags: (distribution) options
+        :type flags: int
+        :return: the download of the archive, as listed by the JSON API
+        :rtype: dict
+        """
         if self.verbose:
             print("Using {n}=={v}...".format(n=pkg_name, v=hit))
 
@@ -1330,27 +1343,140 @@ class PyPIRepository(PackageRepository):
             raise PipError(
                 "No allowed distribution found for '{}': {}!".format(pkg_name, hit)
             )
+        return target
 
-        pkg_info = self._package_info(pkg_data)
-        pkg_info["url"] = "pypi"
-
-        print("Downloading package ...")
+    def _announce_download(self, target):
+        """
+        Tell whether an archive is downloaded or taken from the cache.
+        :param target: the download, as listed by the JSON API
+        :type target: dict
+        """
+        if self.artifact_cache is not None and (
+            self.artifact_cache.lookup(target["url"], self._target_sha256(target))
+            is not None
+        ):
+            print("Using cached package {}".format(target["filename"]))
+        else:
+            print("Downloading package {} ...".format(target["filename"]))
 
-        worker = _stash(
-            "wget {} -o $TMPDIR/{}".format(target["url"], target["filename"])
-        )
+    @staticmethod
+    def _target_sha256(target):
+        """
+        The sha256 of a download which the index lists.
+        :rtype: str or None
+        """
+        return (target.get("digests") or {}).get("sha256")
 
-        if worker.state.return_value != 0:
-            raise PipError("failed to download package from {}".format(target["url"]))
+    def _fetch_archive(self, target):
+        """
+        Save an archive into $TMPDIR, from the artifact cache or else
+        downloaded. Its sha256 is checked against the one the index lists
+        as it is downloaded, and it is only found in $TMPDIR once complete
+        and verified. Nothing is printed, since this runs in the threads of
+        the downloads.
+        :param target: the download, as listed by the JSON API
+        :type target: dict
+        :return: the path of the archive
+        :rtype: str
+        """
+        archive_filename = os.path.join(os.getenv("TMPDIR"), target["filename"])
+        sha256 = self._target_sha256(target)
+        try:
+            if self.artifact_cache is not None:
+                self.artifact_cache.fetch(
+                    self.session,
+                    target["url"],
+                    archive_filename,
+                    sha256=sha256,
+                    chunk_size=DOWNLOAD_CHUNK_SIZE,
+                )
+            elif OFFLINE:
+                raise CacheMiss("{} is not cached".format(target["url"]))
+            else:
+                download_file(
+                    self.session,
+                    target["url"],
+                    archive_filename,
+                    sha256=sha256,
+                    chunk_size=DOWNLOAD_CHUNK_SIZE,
+                )
+        except CacheMiss as e:
+            raise PipError("{}, and pip is offline".format(e))
+        except HashMismatch as e:
+            raise PipError("corrupted download of {}".format(e))
+        except requests.RequestException as e:
+            raise PipError(
+                "failed to download package from {}: {}".format(target["url"], e)
+            )
+        return archive_filename
 
-        return os.path.join(os.getenv("TMPDIR"), target["filename"]), pkg_info
+    def _apply_blocklist(self, pkg_name, ver_spec, extras, flags=DEFAULT_FLAGS):
+        """
+        Check a requirement against the blocklist.
+        :param pkg_name: the standard name of the package
+        :type pkg_name: str
+        :param ver_spec: the version specification
+        :type ver_spec: VersionSpecifier
+        :param extras: the extras wanted
+        :type extras: list of str
+        :param flags: (distribution) options
+        :type flags: int
+        :return: the requirement to install instead, which is the same one
+            unless an alternative package is known, or None if the package
+            is not installed
+        :rtype: (str, VersionSpecifier, list) or None
+        :raises PackageBlocklisted: if the package must not be installed
+        """
+        blocklisted, reason, fatal, alt = self._check_blocklist(pkg_name)
+        if not blocklisted or (flags & FLAG_IGNORE_BLOCKLIST > 0):
+            return pkg_name, ver_spec, extras
+        if fatal:
+            # raise an exception.
+            print(
+                _stash.text_color(
+                    "Package {} is blocklisted and marked fatal. Failing install.".format(
+                        pkg_name
+                    ),
+                    "red",
+                )
+            )
+            print(_stash.text_color("Reason: " + reason, "red"))
+            raise PackageBlocklisted(pkg_name, reason)
+        elif alt is not None:
+            # an alternative package exposing the same functionality
+            #  and API is known. Print a warning and use this instead.
+            print(
+                _stash.text_color(
+                    "Warning: Using {} instead of {}".format(alt, pkg_name),
+                    "yellow",
+                )
+            )
+            print("Reason: " + reason)
+            # use an empty VersionSpecifier to mark any version as acceptable
+            # do not use extras. We can not be sure that the package provide the same extras.
+            return alt, _stash.libversion.VersionSpecifier(), []
+        else:
+            # this package is probably bundled with pythonista
+            # we should print a warning, but continue anyway
+            print(
+                _stash.text_color(
+                    "Warning: package '{}' is blocklisted, but marked as non-fatal.".format(
+                        pkg_name
+                    ),
+                    "yellow",
+                )
+            )
+            print(
+                "This probably means that the dependency can not be installed, but pythonista ships with the package preinstalled."
+            )
+            print("Reason for blocklisting: " + reason)
+            return None
 
     def install(
         self,
         pkg_name,
         ver_spec,
         flags=DEFAULT_FLAGS,
-        pip_info_file=PIP_INFO_FILE,
         extras=[],
     ):
         pkg_name = self.get_standard_package_name(pkg_name)
@@ -1359,71 +1485,49 @@ class PyPIRepository(PackageRepository):
         # we only do this for PyPI installs, since non-PyPI installs
         # may have the same pkg name for a different package.
         # TODO: should this be changed?
-        blocklisted, reason, fatal, alt = self._check_blocklist(pkg_name)
-        if blocklisted and not (flags & FLAG_IGNORE_BLOCKLIST > 0):
-            if fatal:
-                # raise an exception.
-                print(
-                    _stash.text_color(
-                        "Package {} is blocklisted and marked fatal. Failing install.".format(
-                            pkg_name
-                        ),
-                        "red",
-                    )
-                )
-                print(_stash.text_color("Reason: " + reason, "red"))
-                raise PackageBlocklisted(pkg_name, reason)
-            elif alt is not None:
-                # an alternative package exposing the same functionality
-                #  and API is known. Print a warning and use this instead.
-                print(
-                    _stash.text_color(
-                        "Warning: Using {} instead of {}".format(alt, pkg_name),
-                        "yellow",
-                    )
+        requirement = self._apply_blocklist(pkg_name, ver_spec, extras, flags=flags)
+        if requirement is None:
+            return
+        pkg_name, ver_spec, extras = requirement
+
+        if self.config.module_exists(pkg_name):
+            # todo: maybe update package?
+            raise PackageAlreadyInstalled("Package already installed")
+
+        # the whole dependency graph is known before anything is downloaded
+        print("Querying PyPI ... ")
+        packages = Resolver(self, flags=flags).resolve(pkg_name, ver_spec, extras)
+        for package in packages:
+            self._announce_download(package.target)
+        pool = ThreadPool(DOWNLOAD_JOBS)
+        try:
+            archive_filenames = list(
+                _stash.libcore.imap_interruptible(
+                    pool,
+                    self._fetch_archive,
+                    [package.target for package in packages],
+                    DOWNLOAD_JOBS,
                 )
-                print("Reason: " + reason)
-                pkg_name = alt
-                # use an empty VersionSpecifier to mark any version as acceptable
-                ver_spec = _stash.libversion.VersionSpecifier()
-                # do not use extras. We can not be sure that the package provide the same extras.
-                extras = []
-            else:
-                # this package is probably bundled with pythonista
-                # we should print a warning, but continue anyway
+            )
+        finally:
+            pool.terminate()
+
+        # dependencies are installed before the packages requiring them
+        for package, archive_filename in zip(packages, archive_filenames):
+            if package.required_by is not None:
                 print(
-                    _stash.text_color(
-                        "Warning: package '{}' is blocklisted, but marked as non-fatal.".format(
-                            pkg_name
-                        ),
-                        "yellow",
+                    "Installing dependency: {} (required by: {})".format(
+                        package.name, package.required_by
                     )
                 )
-                print(
-                    "This probably means that the dependency can not be installed, but pythonista ships with the package preinstalled."
-                )
-                print("Reason for blocklisting: " + reason)
-                return
-
-        if not self.config.module_exists(pkg_name):
-            archive_filename, pkg_info = self.download(pkg_name, ver_spec, flags=flags)
             self._install(
-                pkg_name,
-                pkg_info,
+                package.name,
+                package.pkg_info,
                 archive_filename,
                 dependency_flags=flags,
-                extras=extras,
+                extras=package.extras,
             )
-            # save json file of info
-            info_file = pip_info_file % pkg_name
-            info_folder = os.path.split(info_file)[0]
-            if not os.path.exists(info_folder):
-                os.mkdir(info_folder)
-            with open(info_file, "w") as f:
-                json.dump(pkg_info, f)
-        else:
-            # todo: maybe update package?
-            raise PackageAlreadyInstalled("Package already installed")
+            self.config.set_package_info(package.name, package.pkg_info)
 
     def update(self, pkg_name):
         pkg_name = self.get_standard_package_name(pkg_name)
@@ -1563,6 +1667,180 @@ class PyPIRepository(PackageRepository):
         return False
 
 
+class ResolvedPackage(object):
+    """
+    A package of the dependency graph of an install.
+    :param name: name of the package, its standard one once resolved
+    :type name: str
+    :param ver_spec: the version specification
+    :type ver_spec: VersionSpecifier
+    :param extras: the extras wanted
+    :type extras: list of str
+    :param required_by: name of the package which first required this one,
+        None for the package installed
+    :type required_by: str or None
+    """
+
+    def __init__(self, name, ver_spec, extras, required_by=None):
+        self.name = name
+        self.ver_spec = ver_spec
+        self.extras = extras
+        self.required_by = required_by
+        # set once resolved
+        self.version = None
+        self.target = None
+        self.pkg_info = None
+        self.requires = []
+        # whether the package is left out, as the blocklist says
+        self.skipped = False
+
+
+class Resolver(object):
+    """
+    Works out all the packages an install needs from the metadata of the
+    index, before anything is downloaded. The metadata is fetched in a
+    thread pool, the dependencies of a package being queued as soon as it is
+    resolved, so that only the depth of the dependency graph costs round
+    trips. The threads only fetch; what is printed and decided is done by
+    the calling thread.
+    Dependencies which the metadata does not list, as for many source
+    distributions, are found by PackageRepository._install, as before.
+    :param repository: the repository the packages come from
+    :type repository: PyPIRepository
+    :param flags: (distribution) options
+    :type flags: int
+    :param jobs: most packages whose metadata is fetched at once
+    :type jobs: int
+    """
+
+    def __init__(self, repository, flags=DEFAULT_FLAGS, jobs=RESOLVE_JOBS):
+        self.repository = repository
+        self.flags = flags
+        self.jobs = jobs
+
+    def _fetch(self, requirement):
+        """
+        Fetch the metadata of a requirement and choose its release.
+        :param requirement: the name and version specification
+        :type requirement: (str, VersionSpecifier)
+        :return: the package data, the release and its requirements, None if
+            the metadata does not tell them
+        :rtype: (dict, str, list or None)
+        """
+        pkg_name, ver_spec = requirement
+        repository = self.repository
+        pkg_data = repository._package_data(pkg_name)
+        hit = repository._determin_hit(pkg_data, ver_spec, flags=self.flags)
+        info = repository._package_info(pkg_data)
+        if hit != repository._package_latest_release(pkg_data):
+            # the info of the package data is about the latest release
+            release_data = repository._release_data(info["name"], hit)
+            info = release_data["info"] if release_data is not None else {}
+        return pkg_data, hit, info.get("requires_dist")
+
+    def resolve(self, pkg_name, ver_spec, extras=()):
+        """
+        Resolve a requirement and its dependencies. Packages installed
+        already, bundled or blocklisted as non-fatal are left out. The first
+        version specification of a package found wins.
+        :param pkg_name: the standard name of the package
+        :type pkg_name: str
+        :param ver_spec: the version specification
+        :type ver_spec: VersionSpecifier
+        :param extras: the extras wanted
+        :type extras: list of str
+        :return: the packages to install, each after its dependencies
+        :rtype: list of ResolvedPackage
+        """
+        installed = set(
+            canonical_name(name)
+            for name in sys.modules["setuptools"]._installed_requirements_
+        )
+        root = ResolvedPackage(pkg_name, ver_spec, list(extras))
+        seen = {canonical_name(pkg_name): root}
+        todo = [root]
+        pending = collections.deque()
+        pool = ThreadPool(self.jobs)
+        try:
+            while todo or pending:
+                while todo and len(pending) < self.jobs:
+                    package = todo.pop()
+                    result = pool.apply_async(
+                        self._fetch, ((package.name, package.ver_spec),)
+                    )
+                    pending.append((package, result))
+                package, result = pending.popleft()
+                pkg_data, hit, requires = _stash.libcore.wait_result(result)
+                name = self.repository._package_info(pkg_data)["name"]
+                if package.required_by is not None:
+                    requirement = self.repository._apply_blocklist(
+                        name, package.ver_spec, package.extras, flags=self.flags
+                    )
+                    if requirement is None:
+                        package.skipped = True
+                        continue
+                    if requirement[0] != name:
+                        # an alternative package is resolved instead
+                        package.name, package.ver_spec, package.extras = requirement
+                        todo.append(package)
+                        continue
+                package.name = name
+                package.version = hit
+                package.target = self.repository._select_download(
+                    name, pkg_data, hit, self.flags
+                )
+                package.pkg_info = self.repository._package_info(pkg_data)
+                package.pkg_info["url"] = "pypi"
+                for dependency in filter_requirements(
+                    requires or [], package.extras, self.repository.verbose
+                ):
+                    dep_name, dep_spec, dep_extras = VersionSpecifier.parse_requirement(
+                        dependency
+                    )
+                    if dep_name is None or dep_name == "setuptools":
+                        continue
+                    # Some packages have error on dependency names
+                    dep_name = PACKAGE_NAME_FIXER.get(dep_name, dep_name)
+                    key = canonical_name(dep_name)
+                    if key in installed or dep_name in BUNDLED_MODULES:
+                        continue
+                    required = seen.get(key)
+                    if required is None:
+                        required = seen[key] = ResolvedPackage(
+                            dep_name, dep_spec, dep_extras, required_by=name
+                        )
+                        todo.append(required)
+                    package.requires.append(required)
+        finally:
+            pool.terminate()
+        return self._install_order(root)
+
+    @staticmethod
+    def _install_order(root):
+        """
+        Order the packages of the graph for installation, dependencies
+        first. A cycle is broken where it is entered.
+        :param root: the package installed
+        :type root: ResolvedPackage
+        :rtype: list of ResolvedPackage
+        """
+        order = []
+        visited = set()
+        stack = [(root, False)]
+        while stack:
+            package, expanded = stack.pop()
+            if expanded:
+                if not package.skipped:
+                    order.append(package)
+                continue
+            if id(package) in visited:
+                continue
+            visited.add(id(package))
+            stack.append((package, True))
+            stack.extend((required, False) for required in reversed(package.requires))
+        return order
+
+
 class GitHubRepository(PackageRepository):
     """
     This repository performs actions using GitHub as a backend store.
@@ -1723,6 +2001,29 @@ if __name__ == "__main__":
     ap = argparse.ArgumentParser()
 
     ap.add_argument("--verbose", action="store_true", help="be more chatty")
+    ap.add_argument(
+        "-i",
+        "--index-url",
+        default=PYPI_URL,
+        help="base URL of the JSON API of the package index (default: {})".format(
+            PYPI_URL
+        ),
+    )
+    ap.add_argument(
+        "--cache-dir",
+        default=default_cache_dir(),
+        help="directory of the caches of pip (default: %(default)s)",
+    )
+    ap.add_argument(
+        "--no-cache-dir",
+        action="store_true",
+        help="do not use the caches",
+    )
+    ap.add_argument(
+        "--offline",
+        action="store_true",
+        help="do not ask the package index, use the cached metadata only",
+    )
     ap.add_argument(
         "-6",
         action="store_const",
@@ -1793,6 +2094,11 @@ if __name__ == "__main__":
         help="Ignore blocklist",
         dest="ignoreblocklist",
     )
+    install_parser.add_argument(
+        "--cache-dir",
+        default=argparse.SUPPRESS,
+        help="directory of the caches of pip",
+    )
 
     download_parser = subparsers.add_parser("download", help="download packages")
     download_parser.add_argument(
@@ -1805,6 +2111,11 @@ if __name__ == "__main__":
         "--directory",
         help="the directory to save the downloaded file",
     )
+    download_parser.add_argument(
+        "--cache-dir",
+        default=argparse.SUPPRESS,
+        help="directory of the caches of pip",
+    )
 
     search_parser = subparsers.add_parser(
         "search", help="search with the given word fragment"
@@ -1832,6 +2143,10 @@ if __name__ == "__main__":
 
     ns = ap.parse_args()
 
+    PYPI_URL = ns.index_url.rstrip("/")
+    CACHE_DIR = None if ns.no_cache_dir else ns.cache_dir
+    OFFLINE = ns.offline
+
     if ns.site_packages is None:
         # choosen site-packages dir may be unavailable on this platform, fallback to default
         print(
@@ -1914,7 +2229,6 @@ if __name__ == "__main__":
                         "setuptools"
                     ]._installed_requirements_ = repository.config.list_modules()
                     repository.install(pkg_name, ver_spec, flags=flags, extras=extras)
-                    update_req_index()
 
         elif ns.sub_command == "download":
             for requirement in ns.requirements:
@@ -1956,7 +2270,6 @@ if __name__ == "__main__":
                     "pypi", site_packages=ns.site_packages, verbose=ns.verbose
                 )
                 repository.remove(package_name)
-                update_req_index()
 
         elif ns.sub_command == "update":
             for package_name in ns.packages:
@@ -1980,8 +2293,8 @@ if __name__ == "__main__":
 
         elif ns.sub_command == "dev":
             if ns.opt == "update-index":
-                update_req_index()
-                print("index file updated")
+                update_req_index(site_packages=ns.site_packages)
+                print("index updated")
             else:
                 raise PipError("unknow dev option: {}".format(ns.opt))
                 sys.exit(1)
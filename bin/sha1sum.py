@@ -2,7 +2,7 @@
 """
 Get sha1 hash of a file or string.
 
-usage: sha1sum.py [-h] [-c] [file [file ...]]
+usage: sha1sum.py [-h] [-c] [-r] [-a ALGORITHMS] [-j JOBS] [file [file ...]]
 
 positional arguments:
   file         String or file to hash.
@@ -14,91 +14,19 @@ optional arguments:
                sha1_hash filename
                sha1_hash filename
                etc.
+  -r, --recursive
+               hash the files in directories recursively
+  -a ALGORITHMS, --algorithms ALGORITHMS
+               comma separated algorithms to compute in one pass
+  -j JOBS, --jobs JOBS
+               number of files hashed at the same time
 """
 
 from __future__ import print_function
 
-import argparse
-import os
-import re
 import sys
 
-import six
+_stash = globals()["_stash"]
 
-from Crypto.Hash import SHA
-
-
-def get_hash(fileobj):
-    h = SHA.new()
-    chunk_size = 8192
-    while True:
-        chunk = fileobj.read(chunk_size)
-        if len(chunk) == 0:
-            break
-        h.update(chunk)
-    return h.hexdigest()
-
-
-def check_list(fileobj):
-    correct = True
-    for line in fileobj:
-        match = re.match(r"(\w+)[ \t]+(.+)", line)
-        try:
-            with open(match.group(2), "rb") as f1:
-                if match.group(1) == get_hash(f1):
-                    print(match.group(2) + ": Pass")
-                else:
-                    print(match.group(2) + ": Fail")
-                    correct = False
-        except Exception:
-            print("Invalid format.")
-            correct = False
-    return correct
-
-
-def make_file(txt):
-    f = six.BytesIO()
-    if isinstance(txt, six.binary_type):
-        f.write(txt)
-    else:
-        f.write(txt.encode("utf-8"))
-    f.seek(0)
-    return f
-
-
-ap = argparse.ArgumentParser()
-ap.add_argument(
-    "-c",
-    "--check",
-    action="store_true",
-    default=False,
-    help="""Check a file with sha1 hashes and file names for a match. format: hash filename""",
-)
-ap.add_argument("file", action="store", nargs="*", help="String or file to hash.")
-args = ap.parse_args(sys.argv[1:])
-
-if args.check:
-    if args.file:
-        s = True
-        for arg in args.file:
-            if os.path.isfile(arg):
-                s = s and check_list(open(arg))
-    else:
-        s = check_list(make_file(sys.stdin.read()))
-    if s:
-        sys.exit(0)
-    else:
-        sys.exit(1)
-
-else:
-    if args.file:
-        for arg in args.file:
-            if os.path.isfile(arg):
-                with open(arg, "rb") as f:
-                    print(get_hash(f) + " " + arg)
-            elif arg == "-":
-                print(get_hash(make_file(sys.stdin.read())))
-            else:
-                print(get_hash(make_file(arg)))
-    else:
-        print(get_hash(make_file(sys.stdin.read())))
+if __name__ == "__main__":
+    _stash.libhash.main(sys.argv[1:], "sha1")
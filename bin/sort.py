@@ -2,10 +2,364 @@
 """Sort standard input or given files to standard output"""
 
 from __future__ import print_function
+
+import argparse
+import heapq
+import io
+import itertools
 import os
+import re
 import sys
-import fileinput
-import argparse
+import tempfile
+from multiprocessing.pool import ThreadPool
+
+_stash = globals()["_stash"]
+
+# Estimated memory used by a line besides its characters
+_LINE_OVERHEAD = 64
+
+# Number of runs merged at once
+_MERGE_FAN_IN = 32
+
+_NUMBER = re.compile(r"\s*(-?(?:\d+(?:\.\d*)?|\.\d+))")
+_FIELD = re.compile(r"\s*\S+")
+_SIZE = re.compile(r"^(\d+)([bKMGT]?)$")
+
+
+def parse_size(s):
+    """
+    Parse a memory size like 64M. A number without suffix is in KiB.
+    :rtype: int
+    """
+    m = _SIZE.match(s)
+    if m is None:
+        raise argparse.ArgumentTypeError("invalid size: {!r}".format(s))
+    n, suffix = m.groups()
+    return int(n) * 1024 ** "bKMGT".index(suffix or "K")
+
+
+def numeric_value(s):
+    """
+    The number at the start of a string, 0 if there is none.
+    """
+    m = _NUMBER.match(s)
+    return float(m.group(1)) if m else 0.0
+
+
+class KeyDef(object):
+    """
+    A sort key of the form F[.C][OPTS][,F[.C][OPTS]], with fields and
+    characters counted from 1.
+    """
+
+    def __init__(self, spec, ns):
+        start, _, end = spec.partition(",")
+        self.start_field, self.start_char, opts = self._parse_pos(spec, start)
+        if end:
+            self.end_field, self.end_char, end_opts = self._parse_pos(spec, end)
+            opts += end_opts
+        else:
+            self.end_field, self.end_char = None, 0
+        if self.start_field < 1 or self.start_char == 0:
+            raise argparse.ArgumentTypeError("invalid key: {!r}".format(spec))
+        # a key without options uses the global ones
+        if not opts:
+            opts = ("n" if ns.numeric else "") + ("r" if ns.reverse else "")
+        self.numeric = "n" in opts
+        self.reverse = "r" in opts
+        self.skip_blanks = "b" in opts
+        self.separator = ns.separator
+        # Whole fields are cut out by str.split, which is much faster than
+        # finding the field spans. Blanks only matter when comparing text
+        # split on blanks, since fields then start with their blanks.
+        self.whole_fields = (
+            self.start_char is None
+            and not self.end_char
+            and (self.separator is not None or self.numeric)
+        )
+
+    @staticmethod
+    def _parse_pos(spec, pos):
+        m = re.match(r"^(\d+)(?:\.(\d+))?([bnr]*)$", pos)
+        if m is None:
+            raise argparse.ArgumentTypeError("invalid key: {!r}".format(spec))
+        field, char, opts = m.groups()
+        return int(field), int(char) if char is not None else None, opts
+
+    def field_spans(self, line):
+        if self.separator is None:
+            return [m.span() for m in _FIELD.finditer(line)]
+        spans = []
+        start = 0
+        for field in line.split(self.separator):
+            spans.append((start, start + len(field)))
+            start += len(field) + len(self.separator)
+        return spans
+
+    def extract(self, line):
+        """
+        The text of the key in a line.
+        """
+        if self.whole_fields:
+            fields = line.split(self.separator)
+            if self.numeric:
+                # only the start of the first field counts
+                return (
+                    fields[self.start_field - 1]
+                    if len(fields) >= self.start_field
+                    else ""
+                )
+            text = self.separator.join(fields[self.start_field - 1 : self.end_field])
+            return text.lstrip() if self.skip_blanks else text
+        spans = self.field_spans(line)
+        if self.start_field > len(spans):
+            return ""
+        fstart, fend = spans[self.start_field - 1]
+        start = min(fstart + (self.start_char or 1) - 1, fend)
+        if self.end_field is None or self.end_field > len(spans):
+            end = len(line)
+        else:
+            fstart, fend = spans[self.end_field - 1]
+            end = fend if not self.end_char else min(fstart + self.end_char, fend)
+        text = line[start:end]
+        return text.lstrip() if self.skip_blanks else text
+
+    def value(self, line):
+        text = self.extract(line)
+        return numeric_value(text) if self.numeric else text
+
+
+class Reversed(object):
+    """
+    Reverses the order of a string in a key of mixed directions.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+def make_keys(ns):
+    """
+    Build the sort key and the key deciding which lines are equal for -u.
+    :return: the sort key (None to compare whole lines), the uniqueness key
+        and whether to sort in reverse
+    :rtype: (callable, callable, bool)
+    """
+    keydefs = [KeyDef(spec, ns) for spec in ns.keys]
+    if not keydefs and not ns.numeric:
+        return None, None, ns.reverse
+
+    if not keydefs:
+        # -n compares the number at the start of the line
+        def primary(line):
+            return (numeric_value(line),)
+
+        directions = [ns.reverse]
+    elif len(keydefs) == 1:
+        value = keydefs[0].value
+
+        def primary(line):
+            return (value(line),)
+
+        directions = [keydefs[0].reverse]
+    else:
+
+        def primary(line):
+            return tuple(k.value(line) for k in keydefs)
+
+        directions = [k.reverse for k in keydefs]
+
+    if ns.unique:
+        # lines with equal keys are equal, the first of them is kept
+        last_resort = []
+    else:
+        # lines with equal keys are compared as a whole
+        last_resort = [ns.reverse]
+
+    if all(d == ns.reverse for d in directions + last_resort):
+        if ns.unique:
+            return primary, primary, ns.reverse
+        return (lambda line: primary(line) + (line,)), primary, ns.reverse
+
+    # mixed directions, reverse the components one by one
+    numeric = [k.numeric for k in keydefs] or [True]
+
+    def key(line):
+        values = []
+        for value, reverse, is_number in zip(primary(line), directions, numeric):
+            if reverse:
+                value = -value if is_number else Reversed(value)
+            values.append(value)
+        if last_resort:
+            values.append(Reversed(line) if ns.reverse else line)
+        return tuple(values)
+
+    return key, primary, False
+
+
+def read_lines(files, errors):
+    """
+    Yield the lines of all files without their newlines.
+    """
+    for f in files or ["-"]:
+        if f == "-":
+            ins = sys.stdin
+        else:
+            try:
+                ins = io.open(f, encoding="utf-8", errors="replace")
+            except (IOError, OSError) as e:
+                errors.append(e)
+                continue
+        try:
+            for line in ins:
+                yield line[:-1] if line.endswith("\n") else line
+        finally:
+            if ins is not sys.stdin:
+                ins.close()
+
+
+def read_chunks(lines, budget):
+    """
+    Group lines into chunks that fit in the memory budget.
+    """
+    chunk = []
+    size = 0
+    for line in lines:
+        chunk.append(line)
+        size += len(line) + _LINE_OVERHEAD
+        if size >= budget:
+            yield chunk
+            chunk = []
+            size = 0
+    if chunk:
+        yield chunk
+
+
+class RunWriter(object):
+    """
+    Sorts chunks and spills them as runs to temporary files.
+    """
+
+    def __init__(self, key, reverse, tmpdir):
+        self.key = key
+        self.reverse = reverse
+        self.tmpdir = tmpdir
+        self.paths = []
+
+    def new_path(self):
+        fd, path = tempfile.mkstemp(prefix="sort", suffix=".run", dir=self.tmpdir)
+        os.close(fd)
+        self.paths.append(path)
+        return path
+
+    def write(self, lines, path):
+        with io.open(path, "w", encoding="utf-8", newline="\n") as outs:
+            for line in lines:
+                outs.write(line)
+                outs.write("\n")
+        return path
+
+    def spill(self, chunk):
+        chunk.sort(key=self.key, reverse=self.reverse)
+        path = self.write(chunk, self.new_path())
+        del chunk[:]  # free the memory right away
+        return path
+
+    def merge(self, paths):
+        """
+        Merge runs, in several passes if there are many of them.
+        :return: an iterator over the merged lines
+        """
+        while len(paths) > _MERGE_FAN_IN:
+            merged = []
+            for i in range(0, len(paths), _MERGE_FAN_IN):
+                group = paths[i : i + _MERGE_FAN_IN]
+                merged.append(self.write(self.merge_runs(group), self.new_path()))
+                for path in group:
+                    self.remove(path)
+            paths = merged
+        return self.merge_runs(paths)
+
+    def merge_runs(self, paths):
+        files = [io.open(p, encoding="utf-8", newline="\n") for p in paths]
+        try:
+            runs = [(line[:-1] for line in f) for f in files]
+            for line in heapq.merge(*runs, key=self.key, reverse=self.reverse):
+                yield line
+        finally:
+            for f in files:
+                f.close()
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        self.paths.remove(path)
+
+    def cleanup(self):
+        for path in list(self.paths):
+            self.remove(path)
+
+
+def sort_lines(lines, key, reverse, ns):
+    """
+    Sort lines within the memory budget.
+    :return: an iterator over the sorted lines
+    """
+    wait_result = _stash.libcore.wait_result
+    writer = RunWriter(key, reverse, ns.tmpdir)
+    # one more chunk is read while the others are sorted
+    chunks = read_chunks(lines, max(ns.buffer_size // (max(ns.parallel, 1) + 1), 1))
+    first = next(chunks, [])
+    second = next(chunks, None)
+    if second is None:
+        # everything fits in memory
+        first.sort(key=key, reverse=reverse)
+        for line in first:
+            yield line
+        return
+
+    pool = ThreadPool(ns.parallel) if ns.parallel > 1 else None
+    try:
+        runs = []
+        pending = []
+        for chunk in itertools.chain([first, second], chunks):
+            if pool is None:
+                runs.append(writer.spill(chunk))
+                continue
+            # keep at most one chunk per worker in memory
+            while len(pending) >= ns.parallel:
+                runs.append(wait_result(pending.pop(0)))
+            pending.append(pool.apply_async(writer.spill, (chunk,)))
+        for result in pending:
+            runs.append(wait_result(result))
+        for line in writer.merge(runs):
+            yield line
+    finally:
+        if pool is not None:
+            pool.terminate()
+        writer.cleanup()
+
+
+def unique(lines, key):
+    """
+    Drop the lines equal to the line before them.
+    """
+    prev = missing = object()
+    for line in lines:
+        k = line if key is None else key(line)
+        if prev is missing or k != prev:
+            yield line
+        prev = k
 
 
 def main(args):
@@ -18,28 +372,83 @@ def main(args):
         default=False,
         help="reverse the result of comparisons",
     )
+    ap.add_argument(
+        "-n",
+        "--numeric-sort",
+        dest="numeric",
+        action="store_true",
+        help="compare according to the numerical value",
+    )
+    ap.add_argument(
+        "-u",
+        "--unique",
+        action="store_true",
+        help="output only the first of lines with equal keys",
+    )
+    ap.add_argument(
+        "-k",
+        "--key",
+        dest="keys",
+        action="append",
+        default=[],
+        metavar="KEYDEF",
+        help="sort by the fields F1[.C1][OPTS][,F2[.C2][OPTS]], OPTS being b, n or r",
+    )
+    ap.add_argument(
+        "-t",
+        "--field-separator",
+        dest="separator",
+        help="use SEP instead of blanks to separate fields",
+    )
+    ap.add_argument(
+        "-S",
+        "--buffer-size",
+        type=parse_size,
+        default=parse_size("64M"),
+        help="memory used for sorting, e.g. 500K or 1G (default: 64M)",
+    )
+    ap.add_argument(
+        "-T",
+        "--temporary-directory",
+        dest="tmpdir",
+        default=None,
+        help="directory for the temporary files",
+    )
+    ap.add_argument(
+        "-P",
+        "--parallel",
+        type=int,
+        default=1,
+        help="number of chunks sorted and written at the same time",
+    )
     ns = ap.parse_args(args)
 
-    def _print(lines):
-        if lines is not None:
-            lines = sorted(lines)
-            if ns.reverse:
-                lines = lines[::-1]
-            print("".join(lines))
-
-    fileinput.close()  # in case it is not closed
     try:
-        lines = None
-        for line in fileinput.input(ns.files, openhook=fileinput.hook_encoded("utf-8")):
-            if fileinput.isfirstline():
-                _print(lines)
-                lines = []
-            lines.append(line)
+        key, unique_key, reverse = make_keys(ns)
+    except argparse.ArgumentTypeError as e:
+        print("sort: {!s}".format(e), file=sys.stderr)
+        sys.exit(2)
 
-        _print(lines)
+    errors = []
+    lines = sort_lines(read_lines(ns.files, errors), key, reverse, ns)
+    if ns.unique:
+        lines = unique(lines, unique_key)
+    write = sys.stdout.write
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= 1024:
+            batch.append("")
+            write("\n".join(batch))
+            batch = []
+    if batch:
+        batch.append("")
+        write("\n".join(batch))
 
-    finally:
-        fileinput.close()
+    for err in errors:
+        print("sort: {!s}".format(err), file=sys.stderr)
+    if errors:
+        sys.exit(2)
 
 
 if __name__ == "__main__":
@@ -34,8 +34,8 @@ def main(args):
     # The special thing about source is it persists any environmental changes
     # in the sub-shell to the parent shell.
     try:
-        with open(ns.file) as ins:
-            _stash(ins.readlines(), persistent_level=1)
+        # The parsed lines of the script are cached until the file changes
+        _stash(_stash.runtime.parser.parse_script(ns.file), persistent_level=1)
 
     except IOError as e:
         print("%s: %s" % (e.filename, e.strerror))
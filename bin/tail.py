@@ -4,29 +4,309 @@
 from __future__ import print_function
 
 import argparse
-import time
+import codecs
+import collections
+import ctypes
+import os
+import select
 import sys
-import fileinput
+import time
+
+_stash = globals()["_stash"]
+
+# Size of the chunks files are copied in
+_CHUNK_SIZE = 1 << 16
+
+# Longest a wait lasts, so that a kill of the command gets through
+_WAIT_SLICE = 0.1
+
+# Shortest interval between two polls of the followed files
+_MIN_POLL_INTERVAL = 0.05
+
+# Events of inotify(7) waking up tail -f, for the files in a directory
+_IN_MODIFY = 0x002
+_IN_ATTRIB = 0x004
+_IN_MOVED_FROM = 0x040
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_MASK = (
+    _IN_MODIFY | _IN_ATTRIB | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+)
+
+
+class Output(object):
+    """
+    Writes the content of the files, decoded as utf-8, with a header before
+    the content of each file if wanted.
+    """
+
+    def __init__(self, headers):
+        self.headers = headers
+        self.current = None
+        self.first = True
+        self.decoders = {}
+
+    def header(self, fname):
+        header_fmt = "{}==> {} <==\n"
+        print(header_fmt.format("" if self.first else "\n", fname), end="")
+        self.first = False
+        self.current = fname
+
+    def write(self, fname, data):
+        if not data:
+            return
+        if self.headers and fname != self.current:
+            self.header(fname)
+        decoder = self.decoders.get(fname)
+        if decoder is None:
+            decoder = self.decoders[fname] = codecs.getincrementaldecoder("utf-8")(
+                "replace"
+            )
+        sys.stdout.write(decoder.decode(data))
 
 
-def tail_f(f, wait_sec):
+def skip_lines(f, count):
+    """
+    Skip the first lines of a binary file.
+    :return: what was read past these lines
+    :rtype: bytes
+    """
+    while count > 0:
+        chunk = f.read(_CHUNK_SIZE)
+        if not chunk:
+            break
+        newlines = chunk.count(b"\n")
+        if newlines < count:
+            count -= newlines
+            continue
+        pos = -1
+        for _ in range(count):
+            pos = chunk.find(b"\n", pos + 1)
+        return chunk[pos + 1 :]
+    return b""
+
+
+def copy(f, fname, output):
+    """
+    Write the rest of a binary file.
+    :return: whether anything was written
+    :rtype: bool
+    """
+    written = False
     while True:
-        line = f.readline()
-        if line:
-            yield line
+        chunk = f.read(_CHUNK_SIZE)
+        if not chunk:
+            return written
+        output.write(fname, chunk)
+        written = True
+
+
+def tail_file(f, fname, count, use_bytes, from_start, output):
+    """
+    Write the end of a binary file. Only the end of the file is read,
+    unless the output starts at a given line.
+    """
+    if use_bytes:
+        if from_start:
+            f.seek(max(count - 1, 0))
+        else:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(f.tell() - count, 0))
+    elif from_start:
+        output.write(fname, skip_lines(f, count - 1))
+    else:
+        output.write(fname, _stash.libcore.last_lines(f, count))
+    copy(f, fname, output)
+
+
+def tail_stdin(count, use_bytes, from_start):
+    """
+    Write the end of the standard input, which is read as text.
+    """
+    if use_bytes:
+        data = sys.stdin.read()
+        if from_start:
+            sys.stdout.write(data[max(count - 1, 0) :])
+        elif count > 0:
+            # data[-0:] would be all of it
+            sys.stdout.write(data[-count:])
+    elif from_start:
+        for i, line in enumerate(sys.stdin):
+            if i >= count - 1:
+                sys.stdout.write(line)
+    elif count > 0:
+        for line in collections.deque(sys.stdin, maxlen=count):
+            sys.stdout.write(line)
+
+
+class FollowedFile(object):
+    """
+    A file printed as it grows. If it is followed by name, it is reopened
+    when another file takes its name, as log rotation does.
+    """
+
+    def __init__(self, fname, f, by_name):
+        self.fname = fname
+        self.f = f
+        self.by_name = by_name
+        self.stat = os.fstat(f.fileno()) if f is not None else None
+
+    def warn(self, message):
+        print("tail: {}".format(message), file=sys.stderr)
+
+    def read(self, output):
+        """
+        Write what was appended since the last read.
+        :return: whether anything was written
+        :rtype: bool
+        """
+        written = False
+        if self.f is not None:
+            try:
+                if os.fstat(self.f.fileno()).st_size < self.f.tell():
+                    self.warn("{}: file truncated".format(self.fname))
+                    self.f.seek(0)
+                written = copy(self.f, self.fname, output)
+            except (IOError, OSError) as e:
+                self.warn("{}: {!s}".format(self.fname, e))
+        if not self.by_name:
+            return written
+
+        try:
+            st = os.stat(self.fname)
+        except OSError:
+            if self.f is not None:
+                self.warn("'{}' has become inaccessible".format(self.fname))
+                self.close()
+            return written
+        if self.f is not None and (st.st_dev, st.st_ino) == (
+            self.stat.st_dev,
+            self.stat.st_ino,
+        ):
+            return written
+        # the file has (re)appeared, all of it is new
+        try:
+            f = open(self.fname, "rb")
+        except (IOError, OSError):
+            return written
+        if self.f is None:
+            self.warn("'{}' has appeared;  following new file".format(self.fname))
         else:
-            # print('!!READ NOTHING!!')
-            time.sleep(wait_sec)
+            self.warn("'{}' has been replaced;  following new file".format(self.fname))
+            self.close()
+        self.f = f
+        self.stat = os.fstat(f.fileno())
+        return copy(f, self.fname, output) or written
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+
+class InotifyWatcher(object):
+    """
+    Waits for changes of files with the inotify API of Linux, called through
+    ctypes. The directories of the files are watched, so that new files
+    taking the names are noticed as well.
+    :raises OSError: if inotify is not available
+    """
+
+    def __init__(self, fnames, interval):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is not available")
+        libc = ctypes.CDLL(None, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available")
+        self.fd = libc.inotify_init1(os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        add_watch = libc.inotify_add_watch
+        add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        for dirname in set(os.path.dirname(os.path.abspath(f)) for f in fnames):
+            path = dirname.encode(sys.getfilesystemencoding())
+            if add_watch(self.fd, path, _IN_MASK) < 0:
+                err = ctypes.get_errno()
+                self.close()
+                raise OSError(err, "cannot watch", dirname)
+        self.interval = interval
+        self.last_wakeup = time.time()
+
+    def wait(self):
+        """
+        Wait until a file may have changed. The files are checked every
+        interval anyway, since some file systems send no events.
+        """
+        while True:
+            if select.select([self.fd], [], [], _WAIT_SLICE)[0]:
+                try:
+                    while os.read(self.fd, 4096):
+                        pass
+                except OSError:
+                    pass  # all events are read
+                break
+            if time.time() - self.last_wakeup >= self.interval:
+                break
+        self.last_wakeup = time.time()
+
+    def done(self, active):
+        pass
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollWatcher(object):
+    """
+    Polls the files, often while they change and less and less often, up to
+    every interval, while they do not.
+    """
 
+    def __init__(self, interval):
+        self.interval = interval
+        self.delay = min(_MIN_POLL_INTERVAL, interval)
 
-_first_file = True
+    def wait(self):
+        end = time.time() + self.delay
+        while True:
+            left = end - time.time()
+            if left <= 0:
+                break
+            time.sleep(min(left, _WAIT_SLICE))
+
+    def done(self, active):
+        if active:
+            self.delay = min(_MIN_POLL_INTERVAL, self.interval)
+        else:
+            self.delay = min(self.delay * 2, self.interval)
+
+    def close(self):
+        pass
 
 
-def write_header(fname):
-    global _first_file
-    header_fmt = "{}==> {} <==\n"
-    print(header_fmt.format("" if _first_file else "\n", fname), end="")
-    _first_file = False
+def follow(followed, output, interval):
+    """
+    Write what is appended to the files until the command is killed.
+    """
+    try:
+        watcher = InotifyWatcher([tf.fname for tf in followed], interval)
+    except (OSError, AttributeError):
+        watcher = PollWatcher(interval)
+    try:
+        while True:
+            watcher.wait()
+            active = False
+            for tf in followed:
+                if tf.read(output):
+                    active = True
+            if active:
+                sys.stdout.flush()
+            watcher.done(active)
+    finally:
+        watcher.close()
+        for tf in followed:
+            tf.close()
 
 
 def main(args):
@@ -42,6 +322,13 @@ def main(args):
     p.add_argument(
         "-f", "--follow", action="store_true", help="""follow specified files"""
     )
+    p.add_argument(
+        "-F",
+        dest="follow_name",
+        action="store_true",
+        help="""follow specified files by name, reopening them when they are
+                   replaced or appear""",
+    )
     p.add_argument(
         "-n",
         "--lines",
@@ -69,7 +356,7 @@ def main(args):
         "--sleep-interval",
         type=float,
         default=1.0,
-        help="with -f, sleep for approximately N seconds (default 1.0) between iterations.",
+        help="with -f, check the files at least every N seconds (default 1.0).",
     )
     p.add_argument("files", action="store", nargs="*", help="files to print")
     ns = p.parse_args(args)
@@ -79,6 +366,7 @@ def main(args):
     if len(ns.files) == 0:
         ns.files = ["-"]
 
+    ns.follow = ns.follow or ns.follow_name
     if ns.follow and "-" in ns.files:
         print("tail: warning: following stdin indefinitely is ineffective")
 
@@ -97,51 +385,41 @@ def main(args):
             from_start = False
         count = abs(int(ns.lines))  # '-n -3' is equivalent to '-n 3'
 
+    output = Output(ns.verbose or (len(ns.files) > 1 and not ns.quiet))
+    followed = []
     try:
-        for i, fname in enumerate(ns.files):
-            if ns.verbose or (len(ns.files) > 1 and not ns.quiet):
-                write_header(fname if fname != "-" else "standard input")
-
+        for fname in ns.files:
+            if fname == "-":
+                if output.headers:
+                    output.header("standard input")
+                tail_stdin(count, use_bytes, from_start)
+                continue
+            if output.headers:
+                output.header(fname)
+            try:
+                f = open(fname, "rb")
+            except (IOError, OSError) as e:
+                print("tail: cannot open '{}': {!s}".format(fname, e), file=sys.stderr)
+                status = 1
+                if ns.follow_name:
+                    followed.append(FollowedFile(fname, None, True))
+                continue
             try:
-                if fname == "-":
-                    f = sys.stdin
-                else:
-                    f = open(fname)
-
-                buf = []
-                j = -1
-                while True:
-                    j += 1
-                    if use_bytes:
-                        line = f.read(1)
-                    else:
-                        line = f.readline()
-                    if not line:
-                        break
-
-                    buf.append(line)
-                    if from_start:
-                        if j >= count - 1:
-                            break
-                    elif len(buf) > count:
-                        del buf[0]
-
-                for item in buf:
-                    print(item, end="")
-
-                if i == len(ns.files) - 1 and ns.follow:
-                    for line in tail_f(f, ns.sleep_interval):
-                        print(line, end="")
-                        sys.stdout.flush()
-            finally:
-                if fname != "-":
-                    f.close()
-
-    except Exception as e:
-        print("tail :%s" % str(e))
-        status = 1
+                tail_file(f, fname, count, use_bytes, from_start, output)
+            except (IOError, OSError) as e:
+                print("tail: {}: {!s}".format(fname, e), file=sys.stderr)
+                status = 1
+            if ns.follow:
+                followed.append(FollowedFile(fname, f, ns.follow_name))
+            else:
+                f.close()
+
+        if followed:
+            sys.stdout.flush()
+            follow(followed, output, ns.sleep_interval)
     finally:
-        fileinput.close()
+        for tf in followed:
+            tf.close()
 
     sys.exit(status)
 
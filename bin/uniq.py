@@ -3,38 +3,214 @@
 
 from __future__ import print_function
 
-import os
-import sys
-import fileinput
 import argparse
+import io
+import re
+import sys
+
+_SIZE = re.compile(r"^(\d+)([bKMG]?)$")
+
+# Bits set for every line in the filter of --approximate
+_BLOOM_HASHES = 4
+
+
+def parse_size(s):
+    """
+    Parse a memory size like 16M, in bytes without suffix.
+    :rtype: int
+    """
+    m = _SIZE.match(s)
+    if m is None or int(m.group(1)) == 0:
+        raise argparse.ArgumentTypeError("invalid size: {!r}".format(s))
+    n, suffix = m.groups()
+    return int(n) * 1024 ** "bKMG".index(suffix or "b")
+
+
+class BloomFilter(object):
+    """
+    A set of fixed size that may wrongly claim to hold a line, but never
+    misses one it holds.
+    :param size: the size in bytes
+    :type size: int
+    """
+
+    def __init__(self, size):
+        self.bits = bytearray(size)
+        self.nbits = size * 8
+
+    def add(self, item):
+        """
+        Add an item.
+        :return: whether the item was (probably) there already
+        :rtype: bool
+        """
+        h = hash(item)
+        step = (h >> 32) | 1
+        bits = self.bits
+        present = True
+        for i in range(_BLOOM_HASHES):
+            n = (h + i * step) % self.nbits
+            byte, mask = n >> 3, 1 << (n & 7)
+            if not bits[byte] & mask:
+                present = False
+                bits[byte] |= mask
+        return present
+
+
+def read_lines(files, errors):
+    """
+    Yield the lines of all files without their newlines.
+    """
+    for f in files or ["-"]:
+        if f == "-":
+            ins = sys.stdin
+        else:
+            try:
+                ins = io.open(f, encoding="utf-8", errors="replace")
+            except (IOError, OSError) as e:
+                errors.append(e)
+                continue
+        try:
+            for line in ins:
+                yield line[:-1] if line.endswith("\n") else line
+        finally:
+            if ins is not sys.stdin:
+                ins.close()
+
+
+def selected(count, ns):
+    """
+    Whether a line seen count times is printed with -d and -u.
+    """
+    if ns.repeated and count < 2:
+        return False
+    if ns.unique and count > 1:
+        return False
+    return True
+
+
+def format_line(line, count, ns):
+    if ns.count:
+        return "{:7d} {}\n".format(count, line)
+    return line + "\n"
+
+
+def uniq_adjacent(lines, ns, write):
+    """
+    Collapse runs of equal lines. A plain line is printed as soon as it
+    differs from the one before, with -c, -d or -u once its run ends.
+    """
+    eager = not (ns.count or ns.repeated or ns.unique)
+    prev = None
+    count = 0
+    for line in lines:
+        if count and line == prev:
+            count += 1
+            continue
+        if count and not eager and selected(count, ns):
+            write(format_line(prev, count, ns))
+        if eager:
+            write(line + "\n")
+        prev, count = line, 1
+    if count and not eager and selected(count, ns):
+        write(format_line(prev, count, ns))
+
+
+def uniq_hashed(lines, ns, write):
+    """
+    Remove repeated lines anywhere in the input. A line is printed as soon
+    as it is seen first, with -d as soon as it is seen again. With -c and
+    -u the lines can only be printed at the end, in the order they were
+    first seen.
+    """
+    if ns.count or ns.unique:
+        counts = {}
+        for line in lines:
+            counts[line] = counts.get(line, 0) + 1
+        for line, count in counts.items():
+            if selected(count, ns):
+                write(format_line(line, count, ns))
+        return
+
+    if ns.approximate:
+        seen = BloomFilter(ns.approximate)
+        # lines may wrongly count as seen, in which case they are dropped
+        is_seen = seen.add
+        if ns.repeated:
+            printed = BloomFilter(ns.approximate)
+            is_printed = printed.add
+    else:
+        seen = set()
+        printed = set()
+
+        def is_seen(line):
+            if line in seen:
+                return True
+            seen.add(line)
+            return False
+
+        def is_printed(line):
+            if line in printed:
+                return True
+            printed.add(line)
+            return False
+
+    for line in lines:
+        if not is_seen(line):
+            if not ns.repeated:
+                write(line + "\n")
+        elif ns.repeated and not is_printed(line):
+            write(line + "\n")
 
 
 def main(args):
     ap = argparse.ArgumentParser()
-    ap.add_argument("files", nargs="*", help="files to unique (must be sorted first)")
+    ap.add_argument(
+        "files",
+        nargs="*",
+        help="files to unique (must be sorted first, unless --hash is given)",
+    )
+    ap.add_argument(
+        "-c", "--count", action="store_true", help="prefix lines by their number"
+    )
+    ap.add_argument(
+        "-d", "--repeated", action="store_true", help="only print repeated lines"
+    )
+    ap.add_argument(
+        "-u", "--unique", action="store_true", help="only print lines not repeated"
+    )
+    ap.add_argument(
+        "-H",
+        "--hash",
+        action="store_true",
+        help="remove repeated lines anywhere in the input, which need not be sorted",
+    )
+    ap.add_argument(
+        "-a",
+        "--approximate",
+        type=parse_size,
+        metavar="SIZE",
+        help="with --hash, remember the lines in a filter of SIZE bytes (e.g. 16M), "
+        "which may drop a few distinct lines",
+    )
     ns = ap.parse_args(args)
 
-    def _print(lines):
-        if lines is not None:
-            print("".join(lines))
-
-    fileinput.close()  # in case it is not closed
-    try:
-        prev_line = None
-        lines = None
-        for line in fileinput.input(ns.files, openhook=fileinput.hook_encoded("utf-8")):
-            if fileinput.isfirstline():
-                _print(lines)
-                lines = []
-                prev_line = None
-            if prev_line is None or line != prev_line:
-                lines.append(line)
-            prev_line = line
-
-        _print(lines)
-
-    finally:
-        fileinput.close()
+    if ns.approximate and not ns.hash:
+        ap.error("--approximate requires --hash")
+    if ns.approximate and (ns.count or ns.unique):
+        ap.error("--approximate does not support -c and -u")
+
+    errors = []
+    lines = read_lines(ns.files, errors)
+    if ns.hash:
+        uniq_hashed(lines, ns, sys.stdout.write)
+    else:
+        uniq_adjacent(lines, ns, sys.stdout.write)
+
+    for err in errors:
+        print("uniq: {!s}".format(err), file=sys.stderr)
+    if errors:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
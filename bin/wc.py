@@ -4,12 +4,100 @@ more than one FILE is specified.
 """
 
 from __future__ import print_function
+import argparse
 import os
 import sys
-import argparse
+from multiprocessing.pool import ThreadPool
 
 _stash = globals()["_stash"]
 
+# Size of the buffer files are read into
+_BUFFER_SIZE = 1 << 20
+
+# All bytes except the continuation bytes of UTF-8 sequences
+_NOT_CONTINUATION = bytes(bytearray(range(0x80)) + bytearray(range(0xC0, 0x100)))
+
+# Maps whitespace to b" " and everything else to b"x", so that words start
+# wherever b" x" is found
+_WORD_TABLE = bytes(
+    bytearray(
+        0x20 if c in bytearray(b" \t\n\r\x0b\x0c") else 0x78 for c in range(0x100)
+    )
+)
+
+
+class Counts(object):
+    """
+    The counts of a file.
+    """
+
+    __slots__ = ("lines", "words", "chars", "bytes")
+
+    def __init__(self, lines=0, words=0, chars=0, bytes=0):
+        self.lines = lines
+        self.words = words
+        self.chars = chars
+        self.bytes = bytes
+
+    def add(self, other):
+        self.lines += other.lines
+        self.words += other.words
+        self.chars += other.chars
+        self.bytes += other.bytes
+
+
+def count_file(path, ns):
+    """
+    Count a file by reading it into a reused buffer.
+    :rtype: Counts
+    """
+    counts = Counts()
+    if not (ns.lines or ns.words or ns.chars):
+        # the size is all that is needed
+        st = os.stat(path)
+        if os.path.isdir(path):
+            raise IOError("Is a directory")
+        if os.path.isfile(path):
+            counts.bytes = st.st_size
+            return counts
+
+    buf = bytearray(_BUFFER_SIZE)
+    in_word = False
+    with open(path, "rb") as ins:
+        while True:
+            n = ins.readinto(buf)
+            if not n:
+                break
+            counts.bytes += n
+            if ns.lines:
+                counts.lines += buf.count(b"\n", 0, n)
+            if ns.words or ns.chars:
+                data = buf if n == len(buf) else buf[:n]
+                if ns.chars:
+                    # every byte but the continuation bytes starts a character
+                    counts.chars += n - len(data.translate(None, _NOT_CONTINUATION))
+                if ns.words:
+                    marks = data.translate(_WORD_TABLE)
+                    counts.words += marks.count(b" x")
+                    if not in_word and marks[:1] == b"x":
+                        counts.words += 1
+                    in_word = marks[-1:] == b"x"
+    return counts
+
+
+def count_stdin(ns):
+    """
+    Count the standard input, which is read as text.
+    :rtype: Counts
+    """
+    counts = Counts()
+    for line in sys.stdin:
+        counts.lines += line.count("\n")
+        counts.words += len(line.split())
+        counts.chars += len(line)
+        counts.bytes += len(line.encode("utf-8"))
+    return counts
+
 
 def main(args):
     ap = argparse.ArgumentParser()
@@ -21,59 +109,83 @@ def main(args):
         default=False,
         help="print the newline counts",
     )
+    ap.add_argument(
+        "-w",
+        "--words",
+        action="store_true",
+        default=False,
+        help="print the word counts",
+    )
+    ap.add_argument(
+        "-m",
+        "--chars",
+        action="store_true",
+        default=False,
+        help="print the character counts",
+    )
+    ap.add_argument(
+        "-c",
+        "--bytes",
+        action="store_true",
+        default=False,
+        help="print the byte counts",
+    )
+    ap.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=4,
+        help="number of files counted in parallel (default: 4)",
+    )
     ap.add_argument("files", nargs="*", help="files to count")
     ns = ap.parse_args(args)
 
-    if ns.lines:
-
-        def _print_res(res):
-            print("%6d %s" % (res[0], res[-1]))
+    if not (ns.lines or ns.words or ns.chars or ns.bytes):
+        ns.lines = ns.words = ns.bytes = True
+    columns = [
+        name for name in ("lines", "words", "chars", "bytes") if getattr(ns, name)
+    ]
+    fmt = " ".join(["%6d"] + ["%8d"] * (len(columns) - 1)) + " %s"
+
+    def _print_res(counts, filename):
+        print(fmt % (tuple(getattr(counts, c) for c in columns) + (filename,)))
+
+    def count(f):
+        try:
+            if f == "-":
+                return f, None, None
+            return f, count_file(f, ns), None
+        except (IOError, OSError) as e:
+            return f, None, e
+
+    files = ns.files or ["-"]
+    if ns.jobs > 1 and len(files) > 1:
+        pool = ThreadPool(min(ns.jobs, len(files)))
+        results = _stash.libcore.imap_interruptible(pool, count, files, 2 * ns.jobs)
     else:
-
-        def _print_res(res):
-            print("%6d %8d %8d %s" % res)
-
-    results = []
-    nl_count = 0
-    wd_count = 0
-    bt_count = 0
-    filename_old = None
-    for infields in _stash.libcore.input_stream(ns.files):
-        if filename_old is None:
-            filename_old = infields[1]
-
-        if infields[0] is None:
-            _, filename, e = infields
-            print("%s: %s" % (filename, repr(e)))
-            filename_old = None
-        else:
-            line, filename, lineno = infields
-            if filename != filename_old:
-                results.append((nl_count, wd_count, bt_count, filename_old))
-                nl_count = 0
-                wd_count = 0
-                bt_count = 0
-                filename_old = filename
-
-            nl_count += 1
-            # TODO: This is not a very accurate for words
-            wd_count += len(line.split())
-            bt_count += len(line)
-
-    # last file
-    results.append((nl_count, wd_count, bt_count, filename_old))
-
-    tot_nl_count = 0
-    tot_wd_count = 0
-    tot_bt_count = 0
-    for res in results:
-        _print_res(res)
-        tot_nl_count += res[0]
-        tot_wd_count += res[1]
-        tot_bt_count += res[2]
-
-    if len(results) > 1:
-        _print_res((tot_nl_count, tot_wd_count, tot_bt_count, "total"))
+        pool = None
+        results = (count(f) for f in files)
+
+    total = Counts()
+    status = 0
+    try:
+        for filename, counts, err in results:
+            if err is not None:
+                print("wc: %s: %s" % (filename, err), file=sys.stderr)
+                status = 1
+                continue
+            if counts is None:
+                counts = count_stdin(ns)
+                filename = "" if not ns.files else filename
+            _print_res(counts, filename)
+            total.add(counts)
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+    if len(files) > 1:
+        _print_res(total, "total")
+    sys.exit(status)
 
 
 if __name__ == "__main__":
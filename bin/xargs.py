@@ -1,12 +1,198 @@
 # -*- coding: utf-8 -*-
 """Construct argument list(s) and execute utility"""
 
-import os
+from __future__ import print_function
+
 import sys
 import argparse
+import shlex
+
+from six import StringIO
+
+from stash.system.shparsers import ShPipeSequence, ShSimpleCommand
 
 _stash = globals()["_stash"]
 
+# Longest command line built by default, in characters
+_MAX_CHARS = 131072
+
+# Characters read at once with -0
+_CHUNK_SIZE = 4096
+
+# Longest a wait for the running commands lasts, so that a kill gets through
+_WAIT_SLICE = 0.1
+
+
+def split_line(line, whole_line):
+    """
+    The items of a line, with the quotes and backslashes of the shell
+    taken out. Quotes do not run over the end of a line.
+    :param whole_line: whether the line is an item, else each word is
+    :type whole_line: bool
+    :rtype: list of str
+    :raises ValueError: if a quote is not closed
+    """
+    lexer = shlex.shlex(line, posix=True)
+    lexer.whitespace_split = True
+    lexer.commenters = ""
+    if whole_line:
+        # blanks are part of the item
+        lexer.whitespace = "\r\n"
+    try:
+        return list(lexer)
+    except ValueError as e:
+        raise ValueError("{!s} in: {}".format(e, line.strip()))
+
+
+def read_items(stdin, null, whole_lines):
+    """
+    Yield the items of the standard input as they are read.
+    :param null: whether the items end with null characters
+    :type null: bool
+    :param whole_lines: whether each line is an item, else each word is
+    :type whole_lines: bool
+    """
+    if null:
+        rest = ""
+        while True:
+            chunk = stdin.read(_CHUNK_SIZE)
+            if not chunk:
+                break
+            items = (rest + chunk).split("\0")
+            rest = items.pop()
+            for item in items:
+                yield item
+        if rest:
+            yield rest
+    else:
+        for line in stdin:
+            if whole_lines:
+                line = line.strip()
+            for item in split_line(line, whole_lines):
+                yield item
+
+
+def make_batches(items, max_args, max_chars, base_size):
+    """
+    Gather the items into the argument lists of the commands.
+    :param max_args: most items in a list, None for no limit
+    :type max_args: int
+    :param max_chars: longest command line
+    :type max_chars: int
+    :param base_size: length of the command line without the items
+    :type base_size: int
+    :raises ValueError: if an item does not fit on a command line
+    """
+    batch = []
+    size = base_size
+    for item in items:
+        item_size = len(item) + 1
+        if base_size + item_size > max_chars:
+            raise ValueError("argument line too long")
+        if batch and (
+            size + item_size > max_chars
+            or (max_args is not None and len(batch) >= max_args)
+        ):
+            yield batch
+            batch = []
+            size = base_size
+        batch.append(item)
+        size += item_size
+    if batch:
+        yield batch
+
+
+def command_for(utility, args):
+    """
+    A pipe sequence running utility with args as they are, so that the
+    items are neither parsed nor expanded again.
+    :rtype: ShPipeSequence
+    """
+    simple_command = ShSimpleCommand()
+    simple_command.cmd_word = utility
+    simple_command.args = list(args)
+    pipe_sequence = ShPipeSequence()
+    pipe_sequence.lst.append(simple_command)
+    return pipe_sequence
+
+
+class _Unclosed(object):
+    """
+    A stream of xargs lent to a command, which the runtime closes when the
+    command is done. The stream is used by the next commands, so it is not
+    closed.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def __getattr__(self, item):
+        return getattr(self._stream, item)
+
+    def close(self):
+        pass
+
+
+class Job(object):
+    """
+    A run of the utility. The output of a job run next to others is held
+    back until it is done, so that the outputs are not mixed.
+    """
+
+    def __init__(self, pipe_sequence, buffered):
+        self.buffered = buffered
+        if buffered:
+            outs = StringIO()
+            errs = StringIO()
+        else:
+            # the streams of xargs itself, which its workers do not inherit
+            _, current_state = _stash.runtime.get_current_worker_and_state()
+            outs = _Unclosed(current_state.sys_stdout)
+            errs = _Unclosed(current_state.sys_stderr)
+        self.outs = outs
+        self.errs = errs
+        self.worker = _stash.runtime.run(
+            pipe_sequence,
+            final_ins=StringIO(),
+            final_outs=outs,
+            final_errs=errs,
+            add_to_history=False,
+            add_new_inp_line=False,
+            is_background=buffered,
+        )
+
+    def is_alive(self):
+        return self.worker.is_alive()
+
+    def finish(self):
+        """
+        Write the output held back.
+        :return: the exit status
+        :rtype: int
+        """
+        if self.buffered:
+            sys.stdout.write(self.outs.getvalue())
+            sys.stderr.write(self.errs.getvalue())
+            sys.stdout.flush()
+        return self.worker.state.return_value or 0
+
+    def kill(self):
+        if self.is_alive():
+            self.worker.kill()
+
+
+def wait_any(jobs):
+    """
+    Wait until one of the jobs is done.
+    :return: the job
+    :rtype: Job
+    """
+    while True:
+        for job in jobs:
+            if not job.is_alive():
+                return job
+        jobs[0].worker.join(_WAIT_SLICE)
+
 
 def main(args):
     ap = argparse.ArgumentParser()
@@ -20,6 +206,33 @@ def main(args):
 
     ap.add_argument("-I", dest="replstr", nargs="?", help="replacement string")
 
+    ap.add_argument(
+        "-0",
+        "--null",
+        dest="null",
+        action="store_true",
+        help="items are terminated by a null character instead of by whitespace",
+    )
+    ap.add_argument(
+        "-P",
+        "--max-procs",
+        dest="jobs",
+        metavar="N",
+        type=int,
+        default=1,
+        help="run up to N invocations of utility at a time (default: 1)",
+    )
+    ap.add_argument(
+        "-s",
+        "--max-chars",
+        dest="max_chars",
+        metavar="size",
+        type=int,
+        default=_MAX_CHARS,
+        help="maximum number of characters of the command line of each invocation "
+        "(default: {})".format(_MAX_CHARS),
+    )
+
     ap.add_argument("utility", nargs="?", default="echo", help="utility to invoke")
 
     ap.add_argument(
@@ -31,24 +244,44 @@ def main(args):
 
     ns = ap.parse_args(args)
 
-    lines = [line.strip() for line in sys.stdin.readlines()]
-    n = ns.n if ns.n else len(lines)
+    items = read_items(sys.stdin, ns.null, ns.replstr is not None)
     if ns.replstr:
-        n = 1
-
-    while lines:
-        rest = " ".join(lines[:n])
-        lines = lines[n:]
-        args_to_pass = " ".join(ns.args_to_pass)
-
-        if rest.strip():
-            if ns.replstr:
-                args_to_pass = args_to_pass.replace(ns.replstr, rest)
-                rest = ""
+        # a command for every item, which replaces replstr in the arguments
+        argument_lists = (
+            [arg.replace(ns.replstr, item) for arg in ns.args_to_pass] for item in items
+        )
+    else:
+        base_size = sum(len(arg) + 1 for arg in [ns.utility] + ns.args_to_pass)
+        argument_lists = (
+            ns.args_to_pass + batch
+            for batch in make_batches(items, ns.n, ns.max_chars, base_size)
+        )
 
-            cmdline = "%s %s %s" % (ns.utility, args_to_pass, rest)
+    status = 0
+    jobs = []
+    try:
+        try:
+            for argument_list in argument_lists:
+                if len(jobs) >= max(ns.jobs, 1):
+                    job = wait_any(jobs)
+                    jobs.remove(job)
+                    if job.finish() != 0:
+                        status = 123
+                jobs.append(Job(command_for(ns.utility, argument_list), ns.jobs > 1))
+        except ValueError as e:
+            print("xargs: {!s}".format(e), file=sys.stderr)
+            status = 1
+        # the commands already started are let to finish
+        while jobs:
+            job = wait_any(jobs)
+            jobs.remove(job)
+            if job.finish() != 0 and status == 0:
+                status = 123
+    finally:
+        for job in jobs:
+            job.kill()
 
-            _stash(cmdline)
+    sys.exit(status)
 
 
 if __name__ == "__main__":
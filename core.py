@@ -7,12 +7,14 @@ https://github.com/ywangd/stash
 
 __version__ = "0.7.5"
 
+import functools
 import imp as pyimp  # rename to avoid name conflict with objc_util
 import logging
 import logging.handlers
 import os
 import platform
 import sys
+import time
 from io import IOBase
 
 import six
@@ -27,6 +29,7 @@ from .system.shcommon import (
     _SYS_STDOUT,
     IN_PYTHONISTA,
     ON_IPAD,
+    ShLazyModule,
 )
 from .system.shcommon import Control as ctrl
 from .system.shcommon import Escape as esc
@@ -35,6 +38,7 @@ from .system.shio import ShIO
 from .system.shiowrapper import disable as disable_io_wrapper
 from .system.shiowrapper import enable as enable_io_wrapper
 from .system.shparsers import ShCompleter, ShExpander, ShParser
+from .system.shpipes import ShPipeWriter
 from .system.shruntime import ShRuntime
 from .system.shscreens import ShSequentialScreen
 from .system.shstreams import ShMiniBuffer, ShStream
@@ -65,6 +69,9 @@ py_traceback=0
 py_pdb=0
 input_encoding_utf8=1
 thread_type=ctypes
+py_code_cache=1
+py_code_cache_dir=
+py_code_cache_size=16
 
 [display]
 TEXT_FONT_SIZE={font_size}
@@ -120,12 +127,18 @@ class StaSh(object):
     ):
         self.__version__ = __version__
 
+        # Seconds taken by each phase of the startup
+        self.startup_times = []
+        self._startup_last = time.time()
+        self._libs = {}
+
         # Intercept IO
         enable_io_wrapper()
 
         self.config = self._load_config(no_cfgfile=no_cfgfile)
         self.logger = self._config_logging(log_setting)
         self.enable_styles = self.config.getboolean("style", "enable_styles")
+        self._startup_phase("config")
 
         self.user_action_proxy = ShUserActionProxy(self)
 
@@ -146,6 +159,7 @@ class StaSh(object):
         self.stream = ShStream(self, self.main_screen, debug=_DEBUG_STREAM in debug)
 
         self.io = ShIO(self, debug=_DEBUG_IO in debug)
+        self._startup_phase("screens")
 
         ShUI, ShSequentialRenderer = get_ui_implementation()
         self.terminal = None  # will be set during UI initialisation
@@ -155,6 +169,7 @@ class StaSh(object):
         self.renderer = ShSequentialRenderer(
             self, self.main_screen, self.terminal, debug=_DEBUG_RENDERER in debug
         )
+        self._startup_phase("ui")
 
         parser = ShParser(debug=_DEBUG_PARSER in debug)
         expander = ShExpander(self, debug=_DEBUG_EXPANDER in debug)
@@ -166,11 +181,13 @@ class StaSh(object):
             debug=_DEBUG_RUNTIME in debug,
         )
         self.completer = ShCompleter(self, debug=_DEBUG_COMPLETER in debug)
+        self._startup_phase("runtime")
 
         # Navigate to the startup folder
         if IN_PYTHONISTA:
             os.chdir(self.runtime.state.environ_get("HOME2"))
         self.runtime.load_rcfile(no_rcfile=no_rcfile)
+        self._startup_phase("rcfile")
         self.io.write(
             self.text_style(
                 "StaSh v%s on python %s\n"
@@ -200,6 +217,7 @@ class StaSh(object):
             )
         # Load shared libraries
         self._load_lib()
+        self._startup_phase("libs")
 
         # run command (this calls script_will_end)
         if command is None:
@@ -210,6 +228,7 @@ class StaSh(object):
             if self.runtime.debug:
                 self.logger.debug("Running command: {!r}".format(command))
             self(command, add_to_history=False, persistent_level=0)
+            self._startup_phase("command")
 
     def __call__(self, input_, persistent_level=2, *args, **kwargs):
         """This function is to be called by external script for
@@ -276,30 +295,73 @@ class StaSh(object):
 
         return logger
 
+    def __getattr__(self, name):
+        # Libraries are loaded on first access
+        libs = self.__dict__.get("_libs", {})
+        if name in libs:
+            return libs[name].sh_load()
+        raise AttributeError(
+            "'{}' object has no attribute '{}'".format(type(self).__name__, name)
+        )
+
+    def __dir__(self):
+        return sorted(set(dir(type(self))) | set(self.__dict__) | set(self._libs))
+
+    def _startup_phase(self, name):
+        """
+        Record the time taken by a phase of the startup.
+        :param name: name of the phase that just finished
+        :type name: str
+        """
+        now = time.time()
+        self.startup_times.append((name, now - self._startup_last))
+        self._startup_last = now
+
     def _load_lib(self):
         """
-        Load library files as modules and save each of them as attributes
+        Find the library files and make each of them available as a module
+        attribute and in sys.modules. A library is only loaded on first access.
         """
         lib_path = os.path.join(_STASH_ROOT, "lib")
-        os.environ["STASH_ROOT"] = _STASH_ROOT  # libcompleter needs this value
+        for f in sorted(os.listdir(lib_path)):
+            fp = os.path.join(lib_path, f)
+            if f.startswith("lib") and f.endswith(".py") and os.path.isfile(fp):
+                name, _ = os.path.splitext(f)
+                module = ShLazyModule(name, functools.partial(self._exec_lib, name, fp))
+                self._libs[name] = module
+                sys.modules[name] = module
+
+    def _exec_lib(self, name, fp):
+        """
+        Load a library file as a module and save it as an attribute.
+        :param name: name of the library
+        :type name: str
+        :param fp: path of the library file
+        :type fp: str
+        :return: the loaded module
+        :rtype: module
+        """
+        if self.runtime.debug:
+            self.logger.debug("Attempting to load library '{}'...".format(name))
+        if sys.modules.get(name) is self._libs[name]:
+            # load the module afresh instead of into the placeholder
+            del sys.modules[name]
+        set_root = "STASH_ROOT" not in os.environ  # libcompleter needs this value
+        if set_root:
+            os.environ["STASH_ROOT"] = _STASH_ROOT
         try:
-            for f in os.listdir(lib_path):
-                fp = os.path.join(lib_path, f)
-                if f.startswith("lib") and f.endswith(".py") and os.path.isfile(fp):
-                    name, _ = os.path.splitext(f)
-                    if self.runtime.debug:
-                        self.logger.debug(
-                            "Attempting to load library '{}'...".format(name)
-                        )
-                    try:
-                        self.__dict__[name] = pyimp.load_source(name, fp)
-                    except Exception as e:
-                        self.write_message(
-                            "%s: failed to load library file (%s)" % (f, repr(e)),
-                            error=True,
-                        )
+            module = pyimp.load_source(name, fp)
+        except Exception as e:
+            self.write_message(
+                "%s.py: failed to load library file (%s)" % (name, repr(e)),
+                error=True,
+            )
+            raise ImportError("{}: {!r}".format(name, e))
         finally:  # do not modify environ permanently
-            os.environ.pop("STASH_ROOT")
+            if set_root:
+                os.environ.pop("STASH_ROOT", None)
+        self.__dict__[name] = module
+        return module
 
     def write_message(self, s, error=False, prefix="stash: "):
         """
@@ -374,7 +436,7 @@ class StaSh(object):
             not always
             and (
                 isinstance(
-                    sys.stdout, (StringIO, IOBase)
+                    sys.stdout, (StringIO, IOBase, ShPipeWriter)
                 )  # or sys.stdout.write.im_self is _SYS_STDOUT
                 or sys.stdout is _SYS_STDOUT
             )
@@ -22,12 +22,79 @@ module_names = (
     "system.shhistory",
 )
 
+
+class ImportTimer(object):
+    """
+    Time the first import of every module by hooking __import__.
+    """
+
+    def __init__(self):
+        self.times = {}  # name -> (cumulative, self) seconds
+        self._stack = []
+        self._import = None
+
+    def install(self):
+        self._import = builtins.__import__
+        builtins.__import__ = self._timed_import
+
+    def uninstall(self):
+        builtins.__import__ = self._import
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level > 0 and globals:
+            # resolve relative imports against the importing package
+            package = globals.get("__package__") or globals.get("__name__", "")
+            base = package.rsplit(".", level - 1)[0] if level > 1 else package
+            fullname = "{}.{}".format(base, name) if name else base
+        else:
+            fullname = name
+        if fullname in sys.modules or fullname in self.times:
+            return self._import(name, globals, locals, fromlist, level)
+        self.times[fullname] = None
+        self._stack.append(0.0)
+        start = time.time()
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.time() - start
+            children = self._stack.pop()
+            self.times[fullname] = (elapsed, elapsed - children)
+            if self._stack:
+                self._stack[-1] += elapsed
+
+    def report(self, n):
+        """
+        The n slowest imports.
+        :return: lines of (cumulative, self, name)
+        :rtype: list
+        """
+        times = [(c, s, name) for name, (c, s) in self.times.items() if c]
+        times.sort(reverse=True)
+        return times[:n]
+
+
+PROFILE_STARTUP = "--profile-startup" in sys.argv
+if PROFILE_STARTUP:
+    import time
+
+    try:
+        import builtins
+    except ImportError:
+        import __builtin__ as builtins
+
+    _import_timer = ImportTimer()
+    _startup = time.time()
+    _import_timer.install()
+
 # Attempt to reload modules when startup, does not seem to work
 if "stash.stash" in sys.modules:
     for name in module_names:
         sys.modules.pop("stash." + name)
 from stash import stash
 
+if PROFILE_STARTUP:
+    _import_time = time.time() - _startup
+
 ap = argparse.ArgumentParser()
 ap.add_argument(
     "--no-cfgfile", action="store_true", help="do not load external config files"
@@ -53,6 +120,11 @@ ap.add_argument(
     help="a comma separate list to turn on debug switch for components",
 )
 ap.add_argument("-c", "--command", default=None, dest="command", help="command to run")
+ap.add_argument(
+    "--profile-startup",
+    action="store_true",
+    help="report the time taken by each startup phase and the slowest imports",
+)
 ap.add_argument(
     "args",  # the editor shortcuts may pass additional arguments
     nargs="*",
@@ -111,6 +183,21 @@ _stash = stash.StaSh(
     command=ctp,
 )
 
+if ns.profile_startup:
+    _import_timer.uninstall()
+    print("startup phases:")
+    print("  {:>8.1f} ms  {}".format(_import_time * 1000, "import"))
+    for phase, seconds in _stash.startup_times:
+        print("  {:>8.1f} ms  {}".format(seconds * 1000, phase))
+    print("  {:>8.1f} ms  {}".format((time.time() - _startup) * 1000, "total"))
+    print("slowest imports (cumulative, self):")
+    for cumulative, self_time, name in _import_timer.report(15):
+        print(
+            "  {:>8.1f} ms {:>8.1f} ms  {}".format(
+                cumulative * 1000, self_time * 1000, name
+            )
+        )
+
 _stash.launch(ns.command)
 if ns.command is not None:
     # TODO: _stash.launch() may block, which prevents this from being executed
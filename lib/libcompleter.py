@@ -82,6 +82,7 @@ _subcmd_cfg = {
             "candidates": [
                 "input_encoding_utf8",
                 "ipython_style_history_search",
+                "py_code_cache",
                 "py_pdb",
                 "py_traceback",
                 "enable_styles",
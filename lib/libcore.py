@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
+import collections
+import multiprocessing
 import os
+import stat
 import fileinput
 
 try:
@@ -7,6 +10,11 @@ try:
 except NameError:
     unicode = str
 
+try:
+    from os import scandir
+except ImportError:
+    scandir = None
+
 
 def collapseuser(path):
     """Reverse of os.path.expanduser: return path relative to ~, if
@@ -53,22 +61,28 @@ def input_stream(files=()):
     The advantage of this function is it recovers from errors if one
     file is invalid and proceed with the next file
     """
-    fileinput.close()
+    # Private FileInput objects, the module level one is shared by all threads
+    inp = None
     try:
         if not files:
-            for line in fileinput.input(files):
-                yield line, "", fileinput.filelineno()
+            inp = fileinput.FileInput(files)
+            for line in inp:
+                yield line, "", inp.filelineno()
 
         else:
             while files:
                 thefile = files.pop(0)
+                inp = fileinput.FileInput(thefile)
                 try:
-                    for line in fileinput.input(thefile):
-                        yield line, fileinput.filename(), fileinput.filelineno()
+                    for line in inp:
+                        yield line, inp.filename(), inp.filelineno()
                 except IOError as e:
-                    yield None, fileinput.filename(), e
+                    yield None, inp.filename(), e
+                finally:
+                    inp.close()
     finally:
-        fileinput.close()
+        if inp is not None:
+            inp.close()
 
 
 def sizeof_fmt(num):
@@ -86,3 +100,206 @@ def sizeof_fmt(num):
             return "%3.1f%s" % (num, unit)
         num /= 1024.0
     return "%3.1f%s" % (num, "Ti")
+
+
+def walk_files(top, follow_links=False, onerror=None):
+    """
+    Yield the paths of all files below a directory, depth-first and sorted
+    by name so that the order is deterministic.
+    :param top: the directory to walk
+    :type top: str
+    :param follow_links: whether to descend into symlinked directories
+    :type follow_links: bool
+    :param onerror: called with the OSError of an unreadable directory
+    :type onerror: callable
+    """
+    stack = [top]
+    while stack:
+        path = stack.pop()
+        try:
+            entries = _sorted_entries(path, follow_links)
+        except OSError as e:
+            if onerror is not None:
+                onerror(e)
+            continue
+        subdirs = []
+        for name, is_dir in entries:
+            fp = os.path.join(path, name)
+            if is_dir:
+                subdirs.append(fp)
+            else:
+                yield fp
+        # files of a directory come before its subdirectories
+        stack.extend(reversed(subdirs))
+
+
+def _sorted_entries(path, follow_links):
+    """
+    The (name, is_dir) pairs of the entries of a directory, sorted by name.
+    """
+    if scandir is not None:
+        it = scandir(path)
+        try:
+            return sorted((e.name, e.is_dir(follow_symlinks=follow_links)) for e in it)
+        finally:
+            if hasattr(it, "close"):
+                it.close()
+    return sorted(
+        (
+            name,
+            os.path.isdir(os.path.join(path, name))
+            and (follow_links or not os.path.islink(os.path.join(path, name))),
+        )
+        for name in os.listdir(path)
+    )
+
+
+class PathEntry(object):
+    """
+    An os.DirEntry for a path, used where os.scandir is missing and for the
+    paths given on the command line. Its stat results are cached like those
+    of os.DirEntry.
+    :param path: the path of the entry
+    :type path: str
+    """
+
+    __slots__ = ("name", "path", "_stat", "_lstat")
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path.rstrip(os.sep)) or path
+        self._stat = None
+        self._lstat = None
+
+    def stat(self, follow_symlinks=True):
+        if not follow_symlinks:
+            if self._lstat is None:
+                self._lstat = os.lstat(self.path)
+            return self._lstat
+        if self._stat is None:
+            self._stat = os.stat(self.path)
+        return self._stat
+
+    def inode(self):
+        return self.stat(follow_symlinks=False).st_ino
+
+    def _test_mode(self, test, follow_symlinks):
+        try:
+            return test(self.stat(follow_symlinks=follow_symlinks).st_mode)
+        except OSError:
+            return False
+
+    def is_dir(self, follow_symlinks=True):
+        return self._test_mode(stat.S_ISDIR, follow_symlinks)
+
+    def is_file(self, follow_symlinks=True):
+        return self._test_mode(stat.S_ISREG, follow_symlinks)
+
+    def is_symlink(self):
+        return self._test_mode(stat.S_ISLNK, False)
+
+
+def scandir_sorted(path):
+    """
+    The entries of a directory, sorted by name. The entries are os.DirEntry
+    objects, which know their type without a stat call on most systems and
+    cache their stat results.
+    :param path: the directory
+    :type path: str
+    :rtype: list
+    """
+    if scandir is None:
+        return [
+            PathEntry(os.path.join(path, name)) for name in sorted(os.listdir(path))
+        ]
+    it = scandir(path)
+    try:
+        entries = list(it)
+    finally:
+        if hasattr(it, "close"):
+            it.close()
+    entries.sort(key=lambda e: e.name)
+    return entries
+
+
+def wait_result(result, interval=0.1):
+    """
+    Get the result of an AsyncResult of a pool. The wait is done in short
+    slices, since a kill of the command is only delivered between them.
+    :param result: the result to wait for
+    :type result: multiprocessing.pool.AsyncResult
+    :param interval: the longest slice
+    :type interval: float
+    """
+    while True:
+        try:
+            return result.get(timeout=interval)
+        except multiprocessing.TimeoutError:
+            continue
+
+
+def imap_interruptible(pool, func, iterable, max_pending):
+    """
+    Like pool.imap, the results coming in the order of iterable, but waiting
+    with wait_result. Unlike pool.imap, iterable is consumed as the results
+    are, with at most max_pending items in the pool, so that neither the
+    items nor their results pile up in memory.
+    :param pool: the pool running func
+    :type pool: multiprocessing.pool.Pool
+    :param max_pending: most items handed to the pool and not consumed yet
+    :type max_pending: int
+    """
+    pending = collections.deque()
+    for item in iterable:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= max_pending:
+            yield wait_result(pending.popleft())
+    while pending:
+        yield wait_result(pending.popleft())
+
+
+def last_lines(f, count, block_size=1 << 16):
+    """
+    The last lines of a binary file. A seekable file is read backwards from
+    its end, block by block, until enough newlines are found, so the time
+    taken depends on the lines returned and not on the size of the file.
+    The file is left at the end of the returned lines.
+    :param f: binary file object
+    :param count: number of lines
+    :type count: int
+    :param block_size: bytes read at once
+    :type block_size: int
+    :return: the lines, with their newlines
+    :rtype: bytes
+    """
+    try:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+    except (IOError, OSError, ValueError):
+        # pipes and other streams are read through
+        return b"".join(collections.deque(f, maxlen=max(count, 0)))
+    if count <= 0:
+        return b""
+
+    blocks = []
+    newlines = 0
+    pos = end
+    # the newline before the first line returned is needed too
+    while pos > 0 and newlines <= count:
+        size = min(block_size, pos)
+        pos -= size
+        f.seek(pos)
+        block = f.read(size)
+        if not blocks and block.endswith(b"\n"):
+            newlines -= 1  # the newline ending the last line
+        newlines += block.count(b"\n")
+        blocks.append(block)
+    f.seek(end)
+
+    data = b"".join(reversed(blocks))
+    start = len(data) - 1 if data.endswith(b"\n") else len(data)
+    for _ in range(count):
+        start = data.rfind(b"\n", 0, start)
+        if start < 0:
+            return data
+    return data[start + 1 :]
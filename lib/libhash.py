@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+"""
+Hashing of files for md5sum, sha1sum and sha256sum.
+
+Files are read in large chunks and every chunk is fed to all requested
+algorithms, so a file is read once however many digests are needed.
+hashlib releases the GIL while hashing large chunks, so many files are
+hashed at the same time by a thread pool.
+"""
+
+from __future__ import print_function
+
+import argparse
+import hashlib
+import multiprocessing
+import os
+import re
+import sys
+from multiprocessing.pool import ThreadPool
+
+from libcore import imap_interruptible, walk_files
+
+# Files are read in chunks of this size
+CHUNK_SIZE = 1 << 20
+
+# Names of the algorithms as written in tagged checksum lines
+_TAGS = {"md5": "MD5", "sha1": "SHA1", "sha256": "SHA256"}
+
+_UNTAGGED = re.compile(r"^([0-9a-fA-F]+)[ \t]+\*?(.+)$")
+_TAGGED = re.compile(r"^(\w+) \((.+)\) = ([0-9a-fA-F]+)$")
+
+
+def check_algorithm(name):
+    """
+    Make sure an algorithm can be used for checksums.
+    :param name: the name of the hashlib algorithm
+    :type name: str
+    :raises ValueError: if hashlib does not know the algorithm, or if its
+        digests have no fixed length, like those of shake_128
+    """
+    if name not in hashlib.algorithms_available:
+        raise ValueError("unknown algorithm: {}".format(name))
+    if name.startswith("shake"):
+        raise ValueError(
+            "unsupported algorithm: {} (digests of variable length)".format(name)
+        )
+
+
+def default_jobs():
+    """
+    The number of files hashed at the same time.
+    :rtype: int
+    """
+    try:
+        return max(2, multiprocessing.cpu_count())
+    except NotImplementedError:
+        return 2
+
+
+def hash_stream(fileobj, algorithms, chunk_size=CHUNK_SIZE):
+    """
+    Hash the content of a binary file object with several algorithms.
+    :param fileobj: file object to read
+    :param algorithms: names of the hashlib algorithms
+    :type algorithms: list of str
+    :return: the hex digest of each algorithm
+    :rtype: dict
+    """
+    hashes = [(name, hashlib.new(name)) for name in algorithms]
+    updates = [h.update for _, h in hashes]
+    readinto = getattr(fileobj, "readinto", None)
+    if readinto is not None:
+        buf = bytearray(chunk_size)
+        view = memoryview(buf)
+        while True:
+            n = readinto(buf)
+            if not n:
+                break
+            chunk = view if n == chunk_size else view[:n]
+            for update in updates:
+                update(chunk)
+    else:
+        while True:
+            chunk = fileobj.read(chunk_size)
+            if not chunk:
+                break
+            for update in updates:
+                update(chunk)
+    return dict((name, h.hexdigest()) for name, h in hashes)
+
+
+def hash_file(path, algorithms, chunk_size=CHUNK_SIZE):
+    """
+    Hash a file with several algorithms.
+    :param path: path of the file
+    :type path: str
+    :param algorithms: names of the hashlib algorithms
+    :type algorithms: list of str
+    :return: the hex digest of each algorithm
+    :rtype: dict
+    """
+    with open(path, "rb") as f:
+        return hash_stream(f, algorithms, chunk_size=chunk_size)
+
+
+def hash_string(s, algorithms):
+    """
+    Hash a string, encoded as utf-8 if it is text.
+    :rtype: dict
+    """
+    if not isinstance(s, bytes):
+        s = s.encode("utf-8")
+    return dict((name, hashlib.new(name, s).hexdigest()) for name in algorithms)
+
+
+def hash_files(jobs, jobs_count=None):
+    """
+    Hash files in a thread pool.
+    :param jobs: (path, algorithms) pairs, jobs with algorithms None are
+        passed through without reading anything
+    :type jobs: iterable
+    :param jobs_count: number of threads, default_jobs() if None
+    :type jobs_count: int
+    :return: (path, digests, error) triples in the order of the jobs, with
+        digests None if the file could not be read
+    :rtype: iterator
+    """
+
+    def run(job):
+        path, algorithms = job
+        if algorithms is None:
+            return path, None, None
+        try:
+            return path, hash_file(path, algorithms), None
+        except (IOError, OSError) as e:
+            return path, None, e
+
+    jobs_count = jobs_count or default_jobs()
+    if jobs_count < 2:
+        for job in jobs:
+            yield run(job)
+        return
+
+    pool = ThreadPool(jobs_count)
+    try:
+        for result in imap_interruptible(pool, run, jobs, 2 * jobs_count):
+            yield result
+    finally:
+        pool.terminate()
+
+
+def parse_check_line(line, default_algorithm):
+    """
+    Parse a line of a checksum file, either "hash  filename" or the tagged
+    "ALGORITHM (filename) = hash".
+    :return: (filename, algorithm, hash), or None if the line is invalid
+    :rtype: tuple
+    :raises ValueError: if the algorithm of a tagged line cannot be used
+    """
+    line = line.rstrip("\r\n")
+    m = _TAGGED.match(line)
+    if m is not None:
+        tag, filename, digest = m.groups()
+        algorithm = tag.lower()
+        check_algorithm(algorithm)
+        return filename, algorithm, digest.lower()
+    m = _UNTAGGED.match(line)
+    if m is not None:
+        digest, filename = m.groups()
+        return filename, default_algorithm, digest.lower()
+    return None
+
+
+def check(lines, default_algorithm, jobs_count=None):
+    """
+    Verify the hashes of a checksum file. Each file is read once, for all
+    the hashes listed for it.
+    :return: whether all hashes match
+    :rtype: bool
+    """
+    expected = {}  # filename -> [(algorithm, hash)]
+    order = []
+    correct = True
+    for line in lines:
+        if line.strip() == "":
+            continue
+        try:
+            parsed = parse_check_line(line, default_algorithm)
+        except ValueError as e:
+            print("{}.".format(e))
+            correct = False
+            continue
+        if parsed is None:
+            print("Invalid format.")
+            correct = False
+            continue
+        filename, algorithm, digest = parsed
+        if filename not in expected:
+            expected[filename] = []
+            order.append(filename)
+        expected[filename].append((algorithm, digest))
+
+    jobs = ((f, sorted(set(a for a, _ in expected[f]))) for f in order)
+    for filename, digests, err in hash_files(jobs, jobs_count):
+        if digests is not None and all(digests[a] == d for a, d in expected[filename]):
+            print(filename + ": Pass")
+        else:
+            print(filename + ": Fail")
+            correct = False
+    return correct
+
+
+def iter_targets(args, recursive, errors):
+    """
+    Yield the files to hash, walking directories if recursive. Other
+    arguments are yielded as they are.
+    """
+    for arg in args:
+        if recursive and os.path.isdir(arg):
+            for path in walk_files(arg, onerror=errors.append):
+                yield path
+        else:
+            yield arg
+
+
+def main(args, algorithm):
+    """
+    The command line interface of md5sum, sha1sum and sha256sum.
+    :param args: the command line arguments
+    :type args: list of str
+    :param algorithm: the algorithm of the command
+    :type algorithm: str
+    """
+    name = algorithm + "sum"
+    ap = argparse.ArgumentParser(
+        prog=name, description="Get {} hash of a file or string.".format(algorithm)
+    )
+    ap.add_argument(
+        "-c",
+        "--check",
+        action="store_true",
+        default=False,
+        help="Check a file with {} hashes and file names for a match. "
+        "format: hash filename".format(algorithm),
+    )
+    ap.add_argument(
+        "-r",
+        "--recursive",
+        action="store_true",
+        default=False,
+        help="hash the files in directories recursively",
+    )
+    ap.add_argument(
+        "-a",
+        "--algorithms",
+        default=algorithm,
+        help="comma separated algorithms to compute in one pass, e.g. md5,sha256. "
+        "With more than one, lines are written as ALGORITHM (file) = hash",
+    )
+    ap.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="number of files hashed at the same time (default: number of cores)",
+    )
+    ap.add_argument("file", action="store", nargs="*", help="String or file to hash.")
+    ns = ap.parse_args(args)
+
+    algorithms = [a.strip().lower() for a in ns.algorithms.split(",") if a.strip()]
+    for a in algorithms:
+        try:
+            check_algorithm(a)
+        except ValueError as e:
+            print("{}: {!s}".format(name, e), file=sys.stderr)
+            sys.exit(2)
+
+    if ns.check:
+        if ns.file:
+            correct = True
+            for arg in ns.file:
+                if os.path.isfile(arg):
+                    with open(arg) as f:
+                        correct = check(f, algorithm, ns.jobs) and correct
+        else:
+            correct = check(sys.stdin.read().splitlines(), algorithm, ns.jobs)
+        sys.exit(0 if correct else 1)
+
+    def output(digests, label):
+        if len(algorithms) == 1:
+            d = digests[algorithms[0]]
+            print(d if label is None else d + " " + label)
+        else:
+            for a in algorithms:
+                print(
+                    "{} ({}) = {}".format(
+                        _TAGS.get(a, a.upper()),
+                        "-" if label is None else label,
+                        digests[a],
+                    )
+                )
+
+    if not ns.file:
+        output(hash_string(sys.stdin.read(), algorithms), None)
+        return
+
+    errors = []
+
+    def jobs():
+        for arg in iter_targets(ns.file, ns.recursive, errors):
+            yield arg, (algorithms if os.path.isfile(arg) else None)
+
+    for arg, digests, err in hash_files(jobs(), ns.jobs):
+        if err is not None:
+            errors.append(err)
+        elif digests is not None:
+            output(digests, arg)
+        elif arg == "-":
+            # read from stdin
+            output(hash_string(sys.stdin.read(), algorithms), None)
+        else:
+            # hash the argument itself
+            output(hash_string(arg, algorithms), None)
+
+    for err in errors:
+        print("{}: {!s}".format(name, err), file=sys.stderr)
+    if errors:
+        sys.exit(1)
@@ -0,0 +1,403 @@
+# -*- coding: utf-8 -*-
+"""
+Caches of the pip command.
+
+The metadata of the package index is kept on disk, one file per URL, and is
+used without asking the index while it is younger than a TTL. Older entries
+are revalidated with the ETag and Last-Modified headers the index sent, so
+that an unchanged answer costs a 304 and no body.
+
+The archives are kept by the sha256 of their content, which PyPI lists for
+every file, so that a file is downloaded once whatever URL or package asks
+for it again. The hash is checked as the download streams in.
+
+The least recently used entries of both caches are evicted when the cache
+grows past its size limit.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+import requests
+
+
+class CacheMiss(Exception):
+    """
+    Raised when something is not cached and may not be fetched.
+    """
+
+    pass
+
+
+class HashMismatch(Exception):
+    """
+    Raised when a download does not have the sha256 it should.
+    """
+
+    pass
+
+
+def _replace(src, dest):
+    """
+    Rename a file over another one. The rename is atomic, so a concurrent
+    reader never sees a partial file.
+    """
+    if hasattr(os, "replace"):
+        os.replace(src, dest)
+    else:
+        if os.path.exists(dest):
+            os.remove(dest)
+        os.rename(src, dest)
+
+
+def _temp_name(path):
+    """
+    A name to write a file under before it is renamed to path, unique to
+    this thread.
+    :rtype: str
+    """
+    return "%s.%d.%d.tmp" % (path, os.getpid(), threading.current_thread().ident)
+
+
+def evict(cache_dir, max_size, suffix):
+    """
+    Remove the least recently used files of a cache, as told by their
+    modification times, until the files are at most max_size bytes.
+    :param cache_dir: the directory of the cache
+    :type cache_dir: str
+    :param max_size: most bytes the files may use
+    :type max_size: int
+    :param suffix: the suffix of the files of the cache
+    :type suffix: str
+    """
+    entries = []
+    total = 0
+    try:
+        names = os.listdir(cache_dir)
+    except OSError:
+        return
+    for name in names:
+        if not name.endswith(suffix):
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+        total += st.st_size
+    if total <= max_size:
+        return
+    entries.sort()
+    for _, size, path in entries:
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        if total <= max_size:
+            break
+
+
+def download_file(session, url, dest, sha256=None, chunk_size=1 << 16):
+    """
+    Download a file, hashing it as it streams in. It is written under a
+    temporary name until it is complete and verified, so that neither an
+    interrupted nor a corrupted download is ever found at dest.
+    :param session: the session downloading the file
+    :type session: requests.Session
+    :param url: the URL of the file
+    :type url: str
+    :param dest: the path to save the file to
+    :type dest: str
+    :param sha256: the hex sha256 the file should have, None to not check
+    :type sha256: str or None
+    :param chunk_size: bytes read at once
+    :type chunk_size: int
+    :return: the hex sha256 of the file
+    :rtype: str
+    :raises HashMismatch: if the file does not have the sha256 given
+    :raises requests.RequestException: if the download fails
+    """
+    tmp_file = _temp_name(dest)
+    digest = hashlib.sha256()
+    try:
+        r = session.get(url, stream=True)
+        r.raise_for_status()
+        with open(tmp_file, "wb") as f:
+            for chunk in r.iter_content(chunk_size):
+                digest.update(chunk)
+                f.write(chunk)
+        hexdigest = digest.hexdigest()
+        if sha256 is not None and hexdigest != sha256.lower():
+            raise HashMismatch(
+                "{}: expected sha256 {}, got {}".format(url, sha256, hexdigest)
+            )
+        _replace(tmp_file, dest)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+    return hexdigest
+
+
+class MetadataCache(object):
+    """
+    An on-disk cache of the JSON documents of the package index.
+    This is safe to use from several threads at once.
+    :param cache_dir: the directory of the cache
+    :type cache_dir: str
+    :param ttl: seconds an entry is used without revalidating it
+    :type ttl: float
+    :param max_size: most bytes the entries may use
+    :type max_size: int
+    :param offline: whether to answer from the cache only, however old the
+        entries are
+    :type offline: bool
+    """
+
+    suffix = ".json"
+
+    def __init__(self, cache_dir, ttl=600, max_size=64 * 1024 * 1024, offline=False):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_size = max_size
+        self.offline = offline
+
+    def cache_file(self, url):
+        """
+        Path of the entry of a URL.
+        :type url: str
+        :rtype: str
+        """
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest + self.suffix)
+
+    def get_json(self, session, url):
+        """
+        Get a JSON document, from the cache if it is fresh, else from the
+        index. A stale entry is used if the index can not be reached.
+        :param session: the session fetching the document
+        :type session: requests.Session
+        :param url: the URL of the document
+        :type url: str
+        :return: the document, or None if the index does not have it
+        :rtype: dict or None
+        :raises CacheMiss: if the document is not cached and the cache is
+            offline
+        """
+        cache_file = self.cache_file(url)
+        headers, body = self._load(cache_file)
+        if body is not None and (
+            self.offline or time.time() - headers.get("fetched", 0) < self.ttl
+        ):
+            self._touch(cache_file)
+            return json.loads(body)
+        if self.offline:
+            raise CacheMiss("{} is not cached".format(url))
+
+        request_headers = {}
+        if body is not None:
+            if headers.get("etag"):
+                request_headers["If-None-Match"] = headers["etag"]
+            if headers.get("last_modified"):
+                request_headers["If-Modified-Since"] = headers["last_modified"]
+        try:
+            r = session.get(url, headers=request_headers)
+        except requests.ConnectionError:
+            if body is None:
+                raise
+            return json.loads(body)
+
+        if r.status_code == 304 and body is not None:
+            headers["fetched"] = time.time()
+            self._dump(cache_file, headers, body)
+            return json.loads(body)
+        if not r.status_code == requests.codes.ok:
+            return None
+        body = r.content.decode("utf-8")
+        headers = {
+            "url": url,
+            "fetched": time.time(),
+            "etag": r.headers.get("ETag"),
+            "last_modified": r.headers.get("Last-Modified"),
+        }
+        self._dump(cache_file, headers, body)
+        evict(self.cache_dir, self.max_size, self.suffix)
+        return json.loads(body)
+
+    def _load(self, cache_file):
+        """
+        Read an entry, whose first line holds the headers and the rest the
+        document.
+        :return: the headers and the document, ({}, None) if not cached
+        :rtype: (dict, str or None)
+        """
+        try:
+            with open(cache_file, "rb") as f:
+                headers = json.loads(f.readline().decode("utf-8"))
+                body = f.read().decode("utf-8")
+        except (IOError, OSError, ValueError):
+            return {}, None
+        return headers, body
+
+    def _dump(self, cache_file, headers, body):
+        tmp_file = _temp_name(cache_file)
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            with open(tmp_file, "wb") as f:
+                f.write(json.dumps(headers).encode("utf-8") + b"\n")
+                f.write(body.encode("utf-8"))
+            _replace(tmp_file, cache_file)
+        except (IOError, OSError):
+            # the cache is an optimisation only
+            try:
+                os.remove(tmp_file)
+            except OSError:
+                pass
+
+    def _touch(self, cache_file):
+        """
+        Mark an entry as used, so that it is evicted last.
+        """
+        try:
+            os.utime(cache_file, None)
+        except OSError:
+            pass
+
+    def clear(self):
+        """
+        Remove all entries.
+        """
+        evict(self.cache_dir, 0, self.suffix)
+
+
+class ArtifactCache(object):
+    """
+    An on-disk cache of the archives of packages, kept by the sha256 of
+    their content. The sha256 of the archive of a URL is remembered as well,
+    for the URLs whose sha256 is not known beforehand.
+    This is safe to use from several threads at once.
+    :param cache_dir: the directory of the cache
+    :type cache_dir: str
+    :param max_size: most bytes the archives may use
+    :type max_size: int
+    :param offline: whether to use the cached archives only
+    :type offline: bool
+    """
+
+    suffix = ".archive"
+    url_suffix = ".url"
+
+    def __init__(self, cache_dir, max_size=512 * 1024 * 1024, offline=False):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.offline = offline
+
+    def archive_file(self, sha256):
+        """
+        Path of the archive with a sha256.
+        :type sha256: str
+        :rtype: str
+        """
+        return os.path.join(self.cache_dir, sha256.lower() + self.suffix)
+
+    def url_file(self, url):
+        """
+        Path of the file holding the sha256 of the archive of a URL.
+        :type url: str
+        :rtype: str
+        """
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest + self.url_suffix)
+
+    def lookup(self, url, sha256=None):
+        """
+        Find a cached archive.
+        :param url: the URL of the archive
+        :type url: str
+        :param sha256: the hex sha256 of the archive, if known
+        :type sha256: str or None
+        :return: the path of the archive, or None if it is not cached
+        :rtype: str or None
+        """
+        if sha256 is None:
+            try:
+                with open(self.url_file(url), "r") as f:
+                    sha256 = f.read().strip()
+            except (IOError, OSError):
+                return None
+        archive_file = self.archive_file(sha256)
+        try:
+            # mark the archive as used, so that it is evicted last
+            os.utime(archive_file, None)
+        except OSError:
+            return None
+        return archive_file
+
+    def fetch(self, session, url, dest, sha256=None, chunk_size=1 << 16):
+        """
+        Save an archive to dest, downloading it only if it is not cached.
+        The cached archive is hard linked to dest where possible.
+        :param session: the session downloading the archive
+        :type session: requests.Session
+        :param url: the URL of the archive
+        :type url: str
+        :param dest: the path to save the archive to
+        :type dest: str
+        :param sha256: the hex sha256 the archive should have, if known
+        :type sha256: str or None
+        :param chunk_size: bytes read at once
+        :type chunk_size: int
+        :return: whether the archive was cached
+        :rtype: bool
+        :raises CacheMiss: if the archive is not cached and the cache is
+            offline
+        :raises HashMismatch: if the download does not have the sha256 given
+        """
+        archive_file = self.lookup(url, sha256)
+        cached = archive_file is not None
+        if not cached:
+            if self.offline:
+                raise CacheMiss("{} is not cached".format(url))
+            if not os.path.isdir(self.cache_dir):
+                try:
+                    os.makedirs(self.cache_dir)
+                except OSError:
+                    # made by another thread meanwhile
+                    pass
+            url_file = self.url_file(url)
+            # the name is unique to this thread, as is the download
+            part_file = _temp_name(url_file) + ".part"
+            try:
+                sha256 = download_file(session, url, part_file, sha256, chunk_size)
+                archive_file = self.archive_file(sha256)
+                _replace(part_file, archive_file)
+            finally:
+                if os.path.exists(part_file):
+                    os.remove(part_file)
+            tmp_file = _temp_name(url_file)
+            with open(tmp_file, "w") as f:
+                f.write(sha256)
+            _replace(tmp_file, url_file)
+        self._copy(archive_file, dest)
+        if not cached:
+            evict(self.cache_dir, self.max_size, self.suffix)
+        return cached
+
+    def _copy(self, archive_file, dest):
+        tmp_file = _temp_name(dest)
+        try:
+            try:
+                os.link(archive_file, tmp_file)
+            except (AttributeError, OSError):
+                # no hard links here, or not across these file systems
+                shutil.copyfile(archive_file, tmp_file)
+            _replace(tmp_file, dest)
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
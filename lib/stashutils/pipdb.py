@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+"""
+The database of the packages pip installed into a site-packages directory.
+
+The packages, their dependencies, the requirements their metadata lists and
+the files they installed are kept in sqlite, with indexes both ways, so
+that a package, its dependents or the owners of a file are found without
+reading all the others. Each change is a transaction of its own.
+
+The database replaces the .pypi_packages INI file, the pip_index.json file
+and the .package_info directory, which are read into it when it is first
+created.
+"""
+
+import json
+import os
+import sqlite3
+
+# noinspection PyUnresolvedReferences
+from six.moves.configparser import ConfigParser, Error, InterpolationError
+
+# The name of the database in the site-packages directory
+DATABASE_NAME = ".pypi_packages.db"
+
+# Files of the former package registry
+LEGACY_CONFIG_NAME = ".pypi_packages"
+LEGACY_INFO_DIR = ".package_info"
+
+# Bumped with each change of the schema
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS packages (
+    name TEXT NOT NULL PRIMARY KEY COLLATE NOCASE,
+    url TEXT,
+    version TEXT,
+    summary TEXT,
+    dependencies_known INTEGER NOT NULL,
+    info TEXT
+);
+CREATE TABLE IF NOT EXISTS dependencies (
+    package TEXT NOT NULL COLLATE NOCASE,
+    dependency TEXT NOT NULL COLLATE NOCASE,
+    PRIMARY KEY (package, dependency)
+);
+CREATE INDEX IF NOT EXISTS dependencies_by_dependency
+    ON dependencies (dependency);
+CREATE TABLE IF NOT EXISTS requirements (
+    package TEXT NOT NULL COLLATE NOCASE,
+    requirement TEXT NOT NULL COLLATE NOCASE,
+    PRIMARY KEY (package, requirement)
+);
+CREATE INDEX IF NOT EXISTS requirements_by_requirement
+    ON requirements (requirement);
+CREATE TABLE IF NOT EXISTS files (
+    package TEXT NOT NULL COLLATE NOCASE,
+    path TEXT NOT NULL,
+    PRIMARY KEY (package, path)
+);
+CREATE INDEX IF NOT EXISTS files_by_path ON files (path);
+"""
+
+
+def requirement_names(requires_dist):
+    """
+    The names of the packages a package always requires, as listed by the
+    requires_dist of its metadata. The requirements with environment
+    markers are left out.
+    :param requires_dist: the requirements, None if there are none
+    :type requires_dist: list of str or None
+    :rtype: list of str
+    """
+    names = []
+    for requirement in requires_dist or ():
+        if ";" not in requirement:
+            # Remove package version
+            names.append(requirement.split(" ")[0])
+    return names
+
+
+class PackageDatabase(object):
+    """
+    The packages installed into a site-packages directory. Names of
+    packages are compared without regard to case, as PyPI does.
+    :param site_packages: the site-packages directory
+    :type site_packages: str
+    """
+
+    def __init__(self, site_packages):
+        self.site_packages = site_packages
+        self.path = os.path.join(site_packages, DATABASE_NAME)
+        self.connection = sqlite3.connect(self.path)
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version < SCHEMA_VERSION:
+            with self.connection:
+                self.connection.executescript(_SCHEMA)
+                if version == 0:
+                    self._migrate()
+                self.connection.execute("PRAGMA user_version = %d" % SCHEMA_VERSION)
+
+    def close(self):
+        self.connection.close()
+
+    def _migrate(self):
+        """
+        Read the packages of the former INI file and their info files.
+        """
+        config_file = os.path.join(self.site_packages, LEGACY_CONFIG_NAME)
+        if not os.path.isfile(config_file):
+            return
+        parser = ConfigParser()
+        try:
+            parser.read(config_file)
+        except Error:
+            # an unreadable registry is started afresh
+            return
+        for name in parser.sections():
+            try:
+                options = dict(parser.items(name))
+            except InterpolationError:
+                # written before '%' was escaped
+                options = dict(parser.items(name, raw=True))
+            dependencies = options.get("dependency")
+            if dependencies is not None:
+                dependencies = [d for d in dependencies.strip().split(",") if d]
+            self._add(
+                name,
+                options.get("url"),
+                options.get("version"),
+                options.get("summary"),
+                [f for f in options.get("files", "").strip().split(",") if f],
+                dependencies,
+            )
+            info_file = os.path.join(
+                self.site_packages, LEGACY_INFO_DIR, name + ".json"
+            )
+            if os.path.isfile(info_file):
+                try:
+                    with open(info_file) as f:
+                        info = json.load(f)
+                except ValueError:
+                    continue
+                self._set_info(name, info)
+
+    def add(self, name, url, version, summary, files, dependencies):
+        """
+        Add a package, replacing what was known of it.
+        :param name: name of the package
+        :type name: str
+        :param url: where the package comes from, 'pypi' for PyPI
+        :type url: str
+        :param version: the version installed
+        :type version: str
+        :param summary: the summary of the package
+        :type summary: str
+        :param files: paths of the files installed
+        :type files: list of str
+        :param dependencies: names of the packages installed for it, None if
+            they are not known
+        :type dependencies: list of str or None
+        """
+        with self.connection:
+            self._add(name, url, version, summary, files, dependencies)
+
+    def _add(self, name, url, version, summary, files, dependencies):
+        self._delete(name)
+        self.connection.execute(
+            "INSERT INTO packages (name, url, version, summary, dependencies_known)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (name, url, version, summary, dependencies is not None),
+        )
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO dependencies (package, dependency) VALUES (?, ?)",
+            [(name, dependency) for dependency in dependencies or ()],
+        )
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO files (package, path) VALUES (?, ?)",
+            [(name, path) for path in files],
+        )
+
+    def set_info(self, name, info):
+        """
+        Keep the metadata of an installed package, as given by the index,
+        and the packages it requires.
+        :param name: name of the package
+        :type name: str
+        :param info: the info of the package
+        :type info: dict
+        """
+        with self.connection:
+            self._set_info(name, info)
+
+    def _set_info(self, name, info):
+        self.connection.execute(
+            "UPDATE packages SET info = ? WHERE name = ?", (json.dumps(info), name)
+        )
+        self.connection.execute("DELETE FROM requirements WHERE package = ?", (name,))
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO requirements (package, requirement) VALUES (?, ?)",
+            [
+                (name, requirement)
+                for requirement in requirement_names(info.get("requires_dist"))
+            ],
+        )
+
+    def remove(self, name):
+        """
+        Forget a package.
+        :param name: name of the package
+        :type name: str
+        """
+        with self.connection:
+            self._delete(name)
+
+    def _delete(self, name):
+        for table in ("dependencies", "requirements", "files"):
+            self.connection.execute("DELETE FROM %s WHERE package = ?" % table, (name,))
+        self.connection.execute("DELETE FROM packages WHERE name = ?", (name,))
+
+    def names(self):
+        """
+        The names of the packages, in the order they were installed.
+        :rtype: list of str
+        """
+        return [
+            row[0]
+            for row in self.connection.execute(
+                "SELECT name FROM packages ORDER BY rowid"
+            )
+        ]
+
+    def exists(self, name):
+        """
+        :rtype: bool
+        """
+        row = self.connection.execute(
+            "SELECT 1 FROM packages WHERE name = ?", (name,)
+        ).fetchone()
+        return row is not None
+
+    def get(self, name):
+        """
+        What is known of a package.
+        :return: the url, version and summary of the package, None if it is
+            not installed
+        :rtype: dict or None
+        """
+        row = self.connection.execute(
+            "SELECT url, version, summary FROM packages WHERE name = ?", (name,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"url": row[0], "version": row[1], "summary": row[2]}
+
+    def get_info(self, name):
+        """
+        The metadata of a package kept with set_info.
+        :rtype: dict or None
+        """
+        row = self.connection.execute(
+            "SELECT info FROM packages WHERE name = ?", (name,)
+        ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return json.loads(row[0])
+
+    def files(self, name):
+        """
+        The files a package installed.
+        :rtype: list of str
+        """
+        return [
+            row[0]
+            for row in self.connection.execute(
+                "SELECT path FROM files WHERE package = ? ORDER BY rowid", (name,)
+            )
+        ]
+
+    def owners(self, path):
+        """
+        The packages which installed a file.
+        :rtype: set of str
+        """
+        return set(
+            row[0]
+            for row in self.connection.execute(
+                "SELECT package FROM files WHERE path = ?", (path,)
+            )
+        )
+
+    def dependencies(self, name):
+        """
+        The packages installed for a package.
+        :return: their names, None if they are not known
+        :rtype: set of str or None
+        """
+        row = self.connection.execute(
+            "SELECT dependencies_known FROM packages WHERE name = ?", (name,)
+        ).fetchone()
+        if row is None or not row[0]:
+            return None
+        return set(
+            row[0]
+            for row in self.connection.execute(
+                "SELECT dependency FROM dependencies WHERE package = ?", (name,)
+            )
+        )
+
+    def dependents(self, name):
+        """
+        The packages a package was installed for.
+        :rtype: set of str
+        """
+        return set(
+            row[0]
+            for row in self.connection.execute(
+                "SELECT package FROM dependencies WHERE dependency = ?", (name,)
+            )
+        )
+
+    def all_dependencies(self, exclude=()):
+        """
+        The packages installed for any package.
+        :param exclude: names of the packages whose dependencies are left out
+        :type exclude: list of str
+        :rtype: set of str
+        """
+        exclude = list(exclude)
+        query = "SELECT DISTINCT dependency FROM dependencies"
+        if exclude:
+            query += " WHERE package NOT IN (%s)" % ", ".join("?" * len(exclude))
+        return set(row[0] for row in self.connection.execute(query, exclude))
+
+    def requirements(self, name):
+        """
+        The packages a package requires, as told by its metadata.
+        :rtype: list of str
+        """
+        return [
+            row[0]
+            for row in self.connection.execute(
+                "SELECT requirement FROM requirements WHERE package = ? ORDER BY rowid",
+                (name,),
+            )
+        ]
+
+    def required_by(self, name):
+        """
+        The packages requiring a package, as told by their metadata.
+        :rtype: list of str
+        """
+        return [
+            row[0]
+            for row in self.connection.execute(
+                "SELECT package FROM requirements WHERE requirement = ? ORDER BY rowid",
+                (name,),
+            )
+        ]
+
+    def rebuild_requirements(self):
+        """
+        Work the requirements out again from the metadata kept.
+        """
+        with self.connection:
+            rows = self.connection.execute(
+                "SELECT name, info FROM packages WHERE info IS NOT NULL"
+            ).fetchall()
+            for name, info in rows:
+                self._set_info(name, json.loads(info))
@@ -2,13 +2,16 @@
 """functions and classes related to wheels."""
 
 import os
+import sys
 import shutil
-import tempfile
 import json
 import re
 import zipfile
 import platform
-from io import open
+import base64
+import hashlib
+from io import open, StringIO
+from multiprocessing.pool import ThreadPool
 
 import six
 from six.moves import configparser
@@ -27,6 +30,14 @@ class WheelError(Exception):
     pass
 
 
+# bytes read from a member of a wheel at once
+CHUNK_SIZE = 1 << 16
+
+# the files of a wheel are written by several threads only if they are at
+# least this many bytes, below which the threads do not pay off
+PARALLEL_EXTRACT_SIZE = 1 << 20
+
+
 def parse_wheel_name(filename):
     """
     Parse the filename of a wheel and return the information as dict.
@@ -118,6 +129,293 @@ def wheel_is_compatible(filename):
     return True
 
 
+def filter_requirements(requirements, extras=(), verbose=False):
+    """
+    The requirements, as given by Requires-Dist, which are needed here,
+    judging by their environment markers.
+    :param requirements: the requirements, with their markers
+    :type requirements: list of str
+    :param extras: the extras wanted
+    :type extras: list of str
+    :return: the requirements needed, without their markers
+    :rtype: list of str
+    """
+    dependencies = []
+    for t in requirements:
+        if ";" in t:
+            es = t[t.find(";") + 1 :].replace('"', "").replace("'", "")
+            t = t[: t.find(";")].strip()
+            for sub_es in es.split(" and "):
+                if VersionSpecifier is None:
+                    # libversion not found
+                    print(
+                        "Warning: could not import libversion.VersionSpecifier! Ignoring version and extra dependencies."
+                    )
+                    rq, v, _ = "<libversion not found>", "???", []
+                else:
+                    rq, v, _ = VersionSpecifier.parse_requirement(sub_es)
+
+                if rq == "python_version":
+                    # handle python version dependencies
+                    if not v.match(platform.python_version()):
+                        # dependency NOT required
+                        break
+                elif rq == "extra":
+                    # handle extra dependencies
+                    if not any([v.match(e) for e in extras]):
+                        # dependency NOT required
+                        break
+                elif rq == "platform_python_implementation":
+                    if not v.match(platform.python_implementation()):
+                        break
+                elif rq == "platform_system":
+                    if not v.match(platform.system()):
+                        break
+                elif rq == "sys_platform":
+                    if not v.match(sys.platform):
+                        break
+                else:
+                    # unknown requirement for dependency
+                    # warn user and register the dependency
+                    print("Warning: unknown dependency requirement: '{}'".format(rq))
+                    print(
+                        "Warning: Adding dependency '{}', ignoring requirements for dependency.".format(
+                            t
+                        )
+                    )
+                    # do not do anything here- As long as we dont use 'continue', 'break', ... the dependency will be added.
+            else:
+                # no 'break' happens
+                dependencies.append(t)
+            # a 'break' happens, don't add the dependency
+            continue
+
+        dependencies.append(t)
+    return dependencies
+
+
+class WheelArchive(object):
+    """
+    The content of a wheel, read from the zip file as it is. The central
+    directory is read once, the members are then written straight beside
+    where they are installed, and renamed into place once all of them are
+    written and checked.
+    :param path: path of the wheel
+    :type path: str
+    :param jobs: most threads writing the members of a large wheel
+    :type jobs: int
+    """
+
+    def __init__(self, path, jobs=1):
+        self.path = path
+        self.jobs = jobs
+        self.zf = zipfile.ZipFile(path, mode="r")
+        self.members = {}
+        for info in self.zf.infolist():
+            if not info.filename.endswith("/"):
+                self.members[info.filename] = info
+        self.record = {}
+        # the temporary paths extracted to and the paths to install them to
+        self.staged = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.zf.close()
+
+    def exists(self, name):
+        """
+        Whether the wheel has a file.
+        :param name: the path of the file in the wheel
+        :type name: str
+        :rtype: bool
+        """
+        return name in self.members
+
+    def isdir(self, name):
+        """
+        Whether the wheel has files in a directory.
+        :param name: the path of the directory in the wheel
+        :type name: str
+        :rtype: bool
+        """
+        prefix = name.rstrip("/") + "/"
+        return any(member.startswith(prefix) for member in self.members)
+
+    def toplevel(self):
+        """
+        The names at the root of the wheel.
+        :rtype: list of str
+        """
+        return sorted(set(member.split("/")[0] for member in self.members))
+
+    def read_text(self, name):
+        """
+        Read a file of the wheel.
+        :param name: the path of the file in the wheel
+        :type name: str
+        :rtype: str
+        """
+        return self.zf.read(self.members[name]).decode("utf-8")
+
+    def read_record(self, distinfo_name):
+        """
+        Read the hashes of the RECORD of the wheel, which the files are
+        checked against as they are extracted.
+        :param distinfo_name: the name of the *.dist-info directory
+        :type distinfo_name: str
+        """
+        name = distinfo_name + "/RECORD"
+        if not self.exists(name):
+            return
+        for line in self.read_text(name).splitlines():
+            # path,algorithm=digest,size where the path may hold commas
+            path, _, _ = line.rpartition(",")
+            path, _, hash_ = path.rpartition(",")
+            if "=" not in hash_:
+                continue
+            algorithm, digest = hash_.split("=", 1)
+            if path.startswith('"') and path.endswith('"'):
+                path = path[1:-1].replace('""', '"')
+            self.record[path] = (algorithm, digest)
+
+    def extract(self, name, dest, remove=False):
+        """
+        Extract a file or a directory of the wheel beside where it is
+        installed. Nothing is installed until commit() is called, so that a
+        wheel is either installed whole or not at all.
+        :param name: the path of the file or directory in the wheel
+        :type name: str
+        :param dest: the directory to extract it into
+        :type dest: str
+        :param remove: whether to replace a directory installed there before
+        :type remove: bool
+        :return: the path the file or directory is installed to
+        :rtype: str
+        :raises WheelError: if a file does not have the hash its RECORD says
+        """
+        name = name.rstrip("/")
+        target = os.path.join(dest, *name.split("/"))
+        if self.exists(name):
+            prefix = None
+            names = [name]
+        else:
+            if os.path.isdir(target) and not remove:
+                raise WheelError("Directory already installed: {}".format(target))
+            prefix = name + "/"
+            names = [member for member in self.members if member.startswith(prefix)]
+        staging = self._temp_name(target)
+        self.staged.append((staging, target))
+        jobs = []
+        size = 0
+        for member in names:
+            parts = member.split("/")
+            if member.startswith("/") or ".." in parts:
+                raise WheelError("Unsafe path in wheel: {}".format(member))
+            if prefix is None:
+                jobs.append((member, staging))
+            else:
+                jobs.append(
+                    (member, os.path.join(staging, *parts[name.count("/") + 1 :]))
+                )
+            size += self.members[member].file_size
+        for directory in sorted(set(os.path.dirname(path) for _, path in jobs)):
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+        # the members of a zip file can be read by several threads on py3 only
+        if six.PY3 and self.jobs > 1 and size >= PARALLEL_EXTRACT_SIZE:
+            pool = ThreadPool(min(self.jobs, len(jobs)))
+            try:
+                pool.map(self._write, jobs)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for job in jobs:
+                self._write(job)
+        return target
+
+    def commit(self):
+        """
+        Install what was extracted, replacing what was installed there.
+        """
+        staged, self.staged = self.staged, []
+        for staging, target in staged:
+            if os.path.isdir(staging) and os.path.lexists(target):
+                # moved aside until the new directory is in place
+                old = self._temp_name(target) + ".old"
+                os.rename(target, old)
+                try:
+                    os.rename(staging, target)
+                except OSError:
+                    os.rename(old, target)
+                    raise
+                if os.path.isdir(old) and not os.path.islink(old):
+                    shutil.rmtree(old)
+                else:
+                    os.remove(old)
+            elif hasattr(os, "replace"):
+                os.replace(staging, target)
+            else:
+                if os.path.exists(target):
+                    os.remove(target)
+                os.rename(staging, target)
+
+    def discard(self):
+        """
+        Remove what was extracted and not installed.
+        """
+        staged, self.staged = self.staged, []
+        for staging, _ in staged:
+            if os.path.isdir(staging):
+                shutil.rmtree(staging)
+            elif os.path.exists(staging):
+                os.remove(staging)
+
+    def _temp_name(self, target):
+        return "{}.{}.tmp".format(target, os.getpid())
+
+    def _write(self, job):
+        """
+        Write a member of the wheel, hashing it as it is written.
+        :param job: the path of the member and the path to write it to
+        :type job: (str, str)
+        :raises WheelError: if the member does not have the hash its RECORD
+            says
+        """
+        member, path = job
+        expected = self.record.get(member)
+        digest = None
+        if expected is not None:
+            try:
+                digest = hashlib.new(expected[0])
+            except ValueError:
+                # an algorithm not available here
+                pass
+        with self.zf.open(self.members[member]) as fin:
+            with open(path, "wb") as fout:
+                while True:
+                    chunk = fin.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if digest is not None:
+                        digest.update(chunk)
+                    fout.write(chunk)
+        if digest is not None:
+            found = base64.urlsafe_b64encode(digest.digest()).decode("ascii")
+            if found.rstrip("=") != expected[1].rstrip("="):
+                raise WheelError(
+                    "Hash mismatch for '{m}' in {w}!".format(
+                        m=member, w=os.path.basename(self.path)
+                    )
+                )
+
+
 class BaseHandler(object):
     """
     Baseclass for installation handlers.
@@ -129,37 +427,24 @@ class BaseHandler(object):
         self.wheel = wheel
         self.verbose = verbose
 
-    def copytree(self, packagepath, src, dest, remove=False):
+    def extract(self, archive, packagepath, dest, remove=False):
         """
-        Copies a package directory tree.
-        :param packagepath: relative path of the (sub-)package, e.g. 'package/subpackage/'
+        Installs a file or a package directory tree of the wheel.
+        :param archive: the wheel
+        :type archive: WheelArchive
+        :param packagepath: relative path of the file or (sub-)package, e.g. 'package/subpackage/'
         :type packagepath: str
-        :param src: path to the actual source of the root package
-        :type src: str
-        :param dest: path to copy to
+        :param dest: path to install to
         :type dest: str
-        :return: the path to which the directories have been copied.
+        :param remove: whether to replace what is installed there
+        :type remove: bool
+        :return: the path to which it will be installed.
         :trype: str
         """
+        target = os.path.join(dest, packagepath.rstrip("/"))
         if self.verbose:
-            print("Copying {s} -> {d}".format(s=src, d=dest))
-        if os.path.isfile(src):
-            if os.path.isdir(dest):
-                dest = os.path.join(dest, os.path.basename(src))
-            if os.path.exists(dest) and remove:
-                os.remove(dest)
-            shutil.copy(src, dest)
-            return dest
-        else:
-            target = os.path.join(
-                dest,
-                # os.path.basename(os.path.normpath(src)),
-                packagepath,
-            )
-            if os.path.exists(target) and remove:
-                shutil.rmtree(target)
-            shutil.copytree(src, target)
-            return target
+            print("Extracting {s} -> {d}".format(s=packagepath, d=target))
+        return archive.extract(packagepath, dest, remove=remove)
 
     @property
     def distinfo_name(self):
@@ -177,23 +462,23 @@ class TopLevelHandler(BaseHandler):
     name = "top_level.txt installer"
 
     def handle_install(self, src, dest):
-        tltxtp = os.path.join(src, self.distinfo_name, "top_level.txt")
+        tltxtp = self.distinfo_name + "/top_level.txt"
         files_installed = []
-        if not os.path.exists(tltxtp):
-            files = os.listdir(src)
-            fin = [file_name for file_name in files if file_name != self.distinfo_name]
+        if not src.exists(tltxtp):
+            fin = [
+                file_name
+                for file_name in src.toplevel()
+                if file_name != self.distinfo_name
+            ]
             print("No top_level.txt, try to fix this.", fin)
         else:
-            with open(tltxtp, "r") as f:
-                fin = f.readlines()
+            fin = src.read_text(tltxtp).splitlines()
         for pkg_name in fin:
             pure = pkg_name.replace("\r", "").replace("\n", "")
-            sp = os.path.join(src, pure)
-            if os.path.exists(sp):
-                p = self.copytree(pure, sp, dest, remove=True)
-            elif os.path.exists(sp + ".py"):
-                dp = os.path.join(dest, pure + ".py")
-                p = self.copytree(pure, sp + ".py", dp, remove=True)
+            if src.exists(pure) or src.isdir(pure):
+                p = self.extract(src, pure, dest, remove=True)
+            elif src.exists(pure + ".py"):
+                p = self.extract(src, pure + ".py", dest, remove=True)
             else:
                 raise WheelError(
                     "top_level.txt entry '{e}' not found in toplevel directory!".format(
@@ -210,14 +495,17 @@ class ConsoleScriptsHandler(BaseHandler):
     name = "console_scripts installer"
 
     def handle_install(self, src, dest):
-        eptxtp = os.path.join(src, self.distinfo_name, "entry_points.txt")
-        if not os.path.exists(eptxtp):
+        eptxtp = self.distinfo_name + "/entry_points.txt"
+        if not src.exists(eptxtp):
             if self.verbose:
                 print("No entry_points.txt found, skipping.")
             return
         parser = configparser.ConfigParser()
         try:
-            parser.read(eptxtp)
+            if six.PY3:
+                parser.read_string(src.read_text(eptxtp))
+            else:
+                parser.readfp(StringIO(src.read_text(eptxtp)))
         except configparser.MissingSectionHeaderError:
             # print message and return
             if self.verbose:
@@ -235,10 +523,9 @@ class ConsoleScriptsHandler(BaseHandler):
 
         files_installed = []
 
-        mdp = os.path.join(src, self.distinfo_name, "metadata.json")
-        if os.path.exists(mdp):
-            with open(mdp, "r") as fin:
-                desc = json.load(fin).get("summary", "???")
+        mdp = self.distinfo_name + "/metadata.json"
+        if src.exists(mdp):
+            desc = json.loads(src.read_text(mdp)).get("summary", "???")
         else:
             desc = "???"
 
@@ -271,26 +558,24 @@ class WheelInfoHandler(BaseHandler):
     supported_versions = ["1.0"]
 
     def handle_install(self, src, dest):
-        wtxtp = os.path.join(src, self.distinfo_name, "WHEEL")
-        with open(wtxtp, "r") as fin:
-            for line in fin:
-                line = line.replace("\r", "").replace("\n", "")
-                ki = line.find(":")
-                key = line[:ki]
-                value = line[ki + 2 :]
-
-                if key.lower() == "wheel-version":
-                    major, minor = value.split(".")
-                    major, minor = int(major), int(minor)
-                    if major not in self.supported_major_versions:
-                        raise WheelError("Wheel major version is incompatible!")
-                    if value not in self.supported_versions:
-                        print("WARNING: unsupported minor version: " + str(value))
-                    self.wheel.version = (major, minor)
-
-                elif key.lower() == "generator":
-                    if self.verbose:
-                        print("Wheel generated by: " + value)
+        wtxtp = self.distinfo_name + "/WHEEL"
+        for line in src.read_text(wtxtp).splitlines():
+            ki = line.find(":")
+            key = line[:ki]
+            value = line[ki + 2 :]
+
+            if key.lower() == "wheel-version":
+                major, minor = value.split(".")
+                major, minor = int(major), int(minor)
+                if major not in self.supported_major_versions:
+                    raise WheelError("Wheel major version is incompatible!")
+                if value not in self.supported_versions:
+                    print("WARNING: unsupported minor version: " + str(value))
+                self.wheel.version = (major, minor)
+
+            elif key.lower() == "generator":
+                if self.verbose:
+                    print("Wheel generated by: " + value)
         return []
 
 
@@ -302,13 +587,15 @@ class DependencyHandler(BaseHandler):
     name = "dependency handler"
 
     def handle_install(self, src, dest):
-        metajsonp = os.path.join(src, self.distinfo_name, "metadata.json")
-        metadatap = os.path.join(src, self.distinfo_name, "METADATA")
-        if not os.path.exists(metajsonp):
-            if os.path.exists(metadatap):
+        metajsonp = self.distinfo_name + "/metadata.json"
+        metadatap = self.distinfo_name + "/METADATA"
+        if not src.exists(metajsonp):
+            if src.exists(metadatap):
                 if self.verbose:
                     print("Reading 'METADATA' file...")
-                dependencies = self.read_dependencies_from_METADATA(metadatap)
+                dependencies = self.read_dependencies_from_METADATA(
+                    src.read_text(metadatap)
+                )
             else:
                 if self.verbose:
                     print(
@@ -318,8 +605,7 @@ class DependencyHandler(BaseHandler):
         else:
             if self.verbose:
                 print("Reading 'metadata.json' file...")
-            with open(metajsonp, "r") as fin:
-                content = json.load(fin)
+            content = json.loads(src.read_text(metajsonp))
             dependencies = []
             for ds in content.get("run_requires", []):
                 ex = ds.get("extra", None)
@@ -336,74 +622,15 @@ class DependencyHandler(BaseHandler):
                     dependencies += dep
         self.wheel.dependencies += dependencies
 
-    def read_dependencies_from_METADATA(self, p):
-        """read dependencies from distinfo/METADATA"""
-        dependencies = []
-        with open(p, "r", encoding="utf-8") as fin:
-            for line in fin:
-                line = line.replace("\n", "")
-                if line.startswith("Requires-Dist: "):
-                    t = line[len("Requires-Dist: ") :]
-                    if ";" in t:
-                        es = t[t.find(";") + 1 :].replace('"', "").replace("'", "")
-                        t = t[: t.find(";")].strip()
-                        for sub_es in es.split(" and "):
-                            if VersionSpecifier is None:
-                                # libversion not found
-                                print(
-                                    "Warning: could not import libversion.VersionSpecifier! Ignoring version and extra dependencies."
-                                )
-                                rq, v, extras = "<libversion not found>", "???", []
-                            else:
-                                rq, v, extras = VersionSpecifier.parse_requirement(
-                                    sub_es
-                                )
-
-                            if rq == "python_version":
-                                # handle python version dependencies
-                                if not v.match(platform.python_version()):
-                                    # dependency NOT required
-                                    break
-                            elif rq == "extra":
-                                # handle extra dependencies
-                                matched = any([v.match(e) for e in self.wheel.extras])
-                                if not matched:
-                                    # dependency NOT required
-                                    break
-                                else:
-                                    if self.verbose:
-                                        print("Adding dependencies for extras...")
-                            elif rq == "platform_python_implementation":
-                                if not v.match(platform.python_implementation()):
-                                    break
-                            elif rq == "platform_system":
-                                if v.match(platform.system()):
-                                    break
-                            elif rq == "sys_platform":
-                                if not v.match(sys.platform):
-                                    break
-                            else:
-                                # unknown requirement for dependency
-                                # warn user and register the dependency
-                                print(
-                                    "Warning: unknown dependency requirement: '{}'".format(
-                                        rq
-                                    )
-                                )
-                                print(
-                                    "Warning: Adding dependency '{}', ignoring requirements for dependency.".format(
-                                        t
-                                    )
-                                )
-                                # do not do anything here- As long as we dont use 'continue', 'break', ... the dependency will be added.
-                        else:
-                            # no 'break' happens
-                            continue
-                        # a 'break' happens, don't add dependencies and go to next 'line'
-                        break
-
-                    dependencies.append(t)
-        return dependencies
+    def read_dependencies_from_METADATA(self, content):
+        """read dependencies from the content of distinfo/METADATA"""
+        requirements = []
+        for line in content.splitlines():
+            if line.startswith("Requires-Dist: "):
+                requirements.append(line[len("Requires-Dist: ") :])
+        if self.wheel.extras and self.verbose:
+            print("Adding dependencies for extras...")
+        return filter_requirements(requirements, self.wheel.extras, self.verbose)
 
 
 # list of default handlers
@@ -418,10 +645,13 @@ DEFAULT_HANDLERS = [
 class Wheel(object):
     """class for installing python wheels."""
 
-    def __init__(self, path, handlers=DEFAULT_HANDLERS, extras=[], verbose=False):
+    def __init__(
+        self, path, handlers=DEFAULT_HANDLERS, extras=[], verbose=False, jobs=1
+    ):
         self.path = path
         self.extras = extras
         self.verbose = verbose
+        self.jobs = jobs
         self.filename = os.path.basename(self.path)
         self.handlers = [handler(self, self.verbose) for handler in handlers]
         self.version = None  # to be set by handler
@@ -433,47 +663,41 @@ class Wheel(object):
     def install(self, targetdir):
         """
         Install the wheel into the target directory.
+        The files are written from the wheel beside where they are installed
+        and checked against the RECORD of the wheel. They are installed only
+        once all of them are, else the former install is left as it is.
         Return (files_installed, dependencies)
         """
         if self.verbose:
-            print("Extracting wheel..")
-        tp = self.extract_into_temppath()
-        if self.verbose:
-            print("Extraction finished, running handlers...")
-        try:
+            print("Reading wheel..")
+        with WheelArchive(self.path, jobs=self.jobs) as archive:
+            data = parse_wheel_name(self.filename)
+            archive.read_record(
+                "{pkg}-{v}.dist-info".format(
+                    pkg=data["distribution"], v=data["version"]
+                )
+            )
+            if self.verbose:
+                print("Running handlers...")
             files_installed = []
-            for handler in self.handlers:
-                if hasattr(handler, "handle_install"):
-                    if self.verbose:
-                        print(
-                            "Running handler '{h}'...".format(
-                                h=getattr(handler, "name", "<unknown>")
+            try:
+                for handler in self.handlers:
+                    if hasattr(handler, "handle_install"):
+                        if self.verbose:
+                            print(
+                                "Running handler '{h}'...".format(
+                                    h=getattr(handler, "name", "<unknown>")
+                                )
                             )
-                        )
-                    tfi = handler.handle_install(tp, targetdir)
-                    if tfi is not None:
-                        files_installed += tfi
-        finally:
-            if self.verbose:
-                print("Cleaning up...")
-            if os.path.exists(tp):
-                shutil.rmtree(tp)
+                        tfi = handler.handle_install(archive, targetdir)
+                        if tfi is not None:
+                            files_installed += tfi
+                # every file is there and checked, now they are installed
+                archive.commit()
+            finally:
+                archive.discard()
         return (files_installed, self.dependencies)
 
-    def extract_into_temppath(self):
-        """
-        Extract the wheel into a temporary directory.
-        Return the path of the temporary directory.
-        """
-        p = os.path.join(tempfile.gettempdir(), "wheel_tmp", self.filename)
-        if not os.path.exists(p):
-            os.makedirs(p)
-
-        with zipfile.ZipFile(self.path, mode="r") as zf:
-            zf.extractall(p)
-
-        return p
-
 
 if __name__ == "__main__":
     # test script
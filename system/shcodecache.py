@@ -0,0 +1,185 @@
+# coding: utf-8
+"""
+Cache of compiled code objects for python scripts run by the runtime.
+
+Compiled scripts are kept in a small in-memory LRU and persisted as
+marshal files (like __pycache__), keyed on the path, mtime and size of
+the script. A script run over and over again, e.g. from a shell loop or
+xargs, is only parsed and compiled once. The marshal files are bounded in
+size as well, the least recently used being removed first.
+"""
+
+import hashlib
+import marshal
+import os
+import struct
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    from importlib.util import MAGIC_NUMBER
+except ImportError:
+    import imp
+
+    MAGIC_NUMBER = imp.get_magic()
+
+# magic, mtime and size of the script
+_HEADER = struct.Struct("<4sdq")
+
+# A script modified less than this many seconds ago may change again without
+# its mtime changing (coarse timestamps), so its code is not cached yet.
+_RACY_INTERVAL = 1.0
+
+
+class ShCodeCache(object):
+    """
+    Compile python scripts with an in-memory and on-disk cache.
+
+    :param cache_dir: directory for the marshal files, None for memory only
+    :type cache_dir: str or None
+    :param maxsize: number of code objects kept in memory
+    :type maxsize: int
+    :param max_disk_size: most bytes the marshal files may use
+    :type max_disk_size: int
+    """
+
+    suffix = ".pyc"
+
+    def __init__(self, cache_dir=None, maxsize=64, max_disk_size=16 << 20):
+        self.cache_dir = cache_dir
+        self.maxsize = maxsize
+        self.max_disk_size = max_disk_size
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def cache_file(self, path):
+        """
+        Path of the marshal file of a script.
+        :param path: absolute path of the script
+        :type path: str
+        :rtype: str
+        """
+        digest = hashlib.sha1(path.encode("utf-8")).hexdigest()
+        tag = getattr(sys, "implementation", None)
+        tag = tag.cache_tag if tag is not None else "py%d%d" % sys.version_info[:2]
+        return os.path.join(self.cache_dir, "%s.%s%s" % (digest, tag, self.suffix))
+
+    def get_code(self, filename):
+        """
+        Get the compiled code of a script.
+        :param filename: path of the script
+        :type filename: str
+        :return: the code object
+        :rtype: code
+        """
+        path = os.path.abspath(filename)
+        st = os.stat(path)
+        key = (st.st_mtime, st.st_size)
+
+        with self._lock:
+            entry = self._memory.pop(path, None)
+            if entry is not None and entry[0] == key:
+                self._memory[path] = entry  # most recently used
+                self.hits += 1
+                return entry[1]
+
+        cacheable = time.time() - st.st_mtime > _RACY_INTERVAL
+        code = self._load(path, key) if cacheable else None
+        if code is None:
+            self.misses += 1
+            with open(path, "rb") as ins:
+                code = compile(ins.read(), path, "exec", dont_inherit=True)
+            if cacheable:
+                self._dump(path, key, code)
+        else:
+            self.hits += 1
+
+        if cacheable:
+            with self._lock:
+                self._memory[path] = (key, code)
+                while len(self._memory) > self.maxsize:
+                    self._memory.popitem(last=False)
+        return code
+
+    def _load(self, path, key):
+        if self.cache_dir is None:
+            return None
+        cache_file = self.cache_file(path)
+        try:
+            with open(cache_file, "rb") as ins:
+                data = ins.read()
+            magic, mtime, size = _HEADER.unpack_from(data)
+            if magic != MAGIC_NUMBER or (mtime, size) != key:
+                return None
+            code = marshal.loads(data[_HEADER.size :])
+            # mark the file as used, so that it is evicted last
+            os.utime(cache_file, None)
+            return code
+        except (IOError, OSError, ValueError, EOFError, TypeError, struct.error):
+            return None
+
+    def _dump(self, path, key, code):
+        if self.cache_dir is None:
+            return
+        cache_file = self.cache_file(path)
+        tmp_file = "%s.%d.%d.tmp" % (
+            cache_file,
+            os.getpid(),
+            threading.current_thread().ident,
+        )
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            with open(tmp_file, "wb") as outs:
+                outs.write(_HEADER.pack(MAGIC_NUMBER, key[0], key[1]))
+                marshal.dump(code, outs)
+            # rename is atomic, a concurrent reader never sees a partial file
+            if hasattr(os, "replace"):
+                os.replace(tmp_file, cache_file)
+            else:
+                if os.path.exists(cache_file):
+                    os.remove(cache_file)
+                os.rename(tmp_file, cache_file)
+            self._evict()
+        except (IOError, OSError):
+            # The cache is an optimisation only
+            try:
+                os.remove(tmp_file)
+            except OSError:
+                pass
+
+    def _evict(self):
+        """
+        Remove the least recently used marshal files, as told by their
+        modification times, until they are at most max_disk_size bytes.
+        """
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(self.suffix):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_disk_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        """Clear the in-memory cache."""
+        with self._lock:
+            self._memory.clear()
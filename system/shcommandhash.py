@@ -0,0 +1,194 @@
+# coding: utf-8
+"""
+The command hash table, which saves scanning BIN_PATH for every command.
+
+Like the hash table of bash, it remembers the script found for a command
+name and counts how often it was used, and a remembered script is used
+without searching as long as it exists. As with bash, a script of the same
+name added to an earlier directory of BIN_PATH is only found after
+'hash -r'. The current directory, which comes first, is always looked at.
+
+The listing of every searched directory is cached and only rebuilt when
+the modification time of the directory changes.
+"""
+
+import os
+import threading
+import time
+
+# Suffixes tried, in order, when looking up a command name
+_SCRIPT_SUFFIXES = ("", ".py", ".sh")
+
+# A directory modified less than this many seconds before it was listed
+# may change again without its mtime changing (coarse timestamps), so
+# such a listing is not trusted.
+_RACY_INTERVAL = 1.0
+
+
+class ShDirListing(object):
+    """
+    Cached listing of a single directory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.mtime = None
+        self.listed_at = 0
+        self.names = frozenset()
+
+    def is_valid(self, mtime):
+        return mtime == self.mtime and self.listed_at - mtime > _RACY_INTERVAL
+
+    def refresh(self, mtime):
+        self.listed_at = time.time()
+        self.names = frozenset(os.listdir(self.path))
+        self.mtime = mtime
+
+
+class ShCommandHash(object):
+    """
+    Maps command names to script files found in the current directory and
+    BIN_PATH.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._listings = {}
+        # command name -> [script file, hits]
+        self.table = {}
+        self.bin_path = None
+
+    def get_listing(self, path):
+        """
+        Get the names in a directory, listing it only if it changed.
+        :param path: absolute path of the directory
+        :type path: str
+        :return: the names in the directory or None if it does not exist
+        :rtype: frozenset of str or None
+        """
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            self._listings.pop(path, None)
+            return None
+        listing = self._listings.get(path)
+        if listing is None or not listing.is_valid(mtime):
+            with self._lock:
+                listing = ShDirListing(path)
+                try:
+                    listing.refresh(mtime)
+                except OSError:
+                    return None
+                self._listings[path] = listing
+        return listing.names
+
+    @staticmethod
+    def search_dirs(bin_path):
+        """
+        The directories searched for commands. Effectively, current dir is
+        always the first in BIN_PATH.
+        :param bin_path: value of BIN_PATH
+        :type bin_path: str
+        :rtype: list of str
+        """
+        return [
+            os.path.abspath(os.path.expanduser(path))
+            for path in ["."] + bin_path.split(":")
+        ]
+
+    def find(self, name, bin_path):
+        """
+        Find the script file for a command name.
+        :param name: the command name
+        :type name: str
+        :param bin_path: value of BIN_PATH
+        :type bin_path: str
+        :return: (script file or None, whether a directory matched)
+        :rtype: (str or None, bool)
+        """
+        if bin_path != self.bin_path:
+            # Directory listings stay valid, only the remembered names go
+            self.table.clear()
+            self.bin_path = bin_path
+
+        search_dirs = self.search_dirs(bin_path)
+        entry = self.table.get(name)
+        if entry is not None:
+            fname = entry[0]
+            cwd_names = self.get_listing(search_dirs[0]) or ()
+            if (
+                not any(name + suffix in cwd_names for suffix in _SCRIPT_SUFFIXES)
+                and os.path.dirname(fname) in search_dirs[1:]
+                and os.path.isfile(fname)
+            ):
+                self.remember(name, fname)
+                return fname, False
+
+        dir_match_found = False
+        for path in search_dirs:
+            names = self.get_listing(path)
+            if not names:
+                continue
+            for suffix in _SCRIPT_SUFFIXES:
+                if name + suffix in names:
+                    fname = os.path.join(path, name + suffix)
+                    if os.path.isdir(fname):
+                        dir_match_found = True
+                    else:
+                        self.remember(name, fname)
+                        return fname, dir_match_found
+        return None, dir_match_found
+
+    def remember(self, name, fname):
+        entry = self.table.get(name)
+        if entry is None or entry[0] != fname:
+            self.table[name] = [fname, 1]
+        else:
+            entry[1] += 1
+
+    def forget(self, name):
+        """
+        Remove a command name from the table.
+        :return: whether the name was in the table
+        :rtype: bool
+        """
+        return self.table.pop(name, None) is not None
+
+    def reset(self):
+        """Forget all remembered commands and cached directory listings."""
+        self.table.clear()
+        self._listings.clear()
+
+    def all_script_names(self, bin_path):
+        """
+        All script names (with extension) in the current directory and
+        BIN_PATH.
+        :rtype: list of str
+        """
+        all_names = []
+        for path in self.search_dirs(bin_path):
+            for f in self.get_listing(path) or ():
+                if f.endswith(".py") or f.endswith(".sh"):
+                    if not os.path.isdir(os.path.join(path, f)):
+                        all_names.append(f)
+        return all_names
+
+    def warm(self, bin_path):
+        """
+        Pre-fill the table with every command found in BIN_PATH.
+        :return: number of commands in the table
+        :rtype: int
+        """
+        if bin_path != self.bin_path:
+            # Directory listings stay valid, only the remembered names go
+            self.table.clear()
+            self.bin_path = bin_path
+        for path in reversed(self.search_dirs(bin_path)[1:]):
+            # Reversed, so that earlier directories and .py scripts win
+            for f in sorted(self.get_listing(path) or (), reverse=True):
+                name, ext = os.path.splitext(f)
+                if ext in (".py", ".sh"):
+                    fname = os.path.join(path, f)
+                    if not os.path.isdir(fname):
+                        self.table[name] = [fname, 0]
+        return len(self.table)
@@ -5,9 +5,12 @@ The Control, Escape and Graphics are taken from pyte (https://github.com/selecte
 
 import os
 import sys
+import errno
 import platform
 import functools
+import importlib
 import threading
+import types
 import ctypes
 from itertools import chain
 
@@ -55,7 +58,8 @@ platform_string = platform.platform()
 
 ON_IPAD = platform_string.find("iPad") >= 0
 ON_IOS_8 = platform_string.split("-")[1].startswith("14")
-M_64 = platform_string.find("64bit") != -1
+# "64bit" is only in the platform string on iOS, x86_64 and the like elsewhere
+M_64 = platform_string.find("64bit") != -1 or sys.maxsize > 2**32
 
 CTRL_KEY_FLAG = 1 << 18  # Control key for keyCommands
 CMD_KEY_FLAG = 1 << 20  # Command key
@@ -66,6 +70,9 @@ _STASH_ROOT = os.path.realpath(
 )
 _STASH_CONFIG_FILES = (".stash_config", "stash.cfg")
 _STASH_HISTORY_FILE = ".stash_history"
+# default directory for compiled scripts, outside of STASH_ROOT so that
+# neither updates nor read-only installs find stray files there
+_STASH_CODE_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "stash", "code")
 
 # directory for stash extensions
 _STASH_EXTENSION_PATH = os.path.abspath(
@@ -218,6 +225,66 @@ def sh_background(name=None):
     return wrap
 
 
+class ShLazyModule(types.ModuleType):
+    """
+    Stands in for a module that is only loaded on first attribute access.
+    A module which fails to load is not tried again, the ImportError it
+    failed with is raised on every access instead.
+    :param name: name of the module
+    :param loader: callable taking no arguments and returning the module
+    """
+
+    def __init__(self, name, loader):
+        super(ShLazyModule, self).__init__(name)
+        self._sh_loader = loader
+        self._sh_module = None
+        self._sh_error = None
+        self._sh_lock = threading.Lock()
+
+    def sh_load(self):
+        """
+        Load the module if it is not loaded yet.
+        :return: the loaded module
+        :rtype: module
+        :raises ImportError: if the module failed to load
+        """
+        with self._sh_lock:
+            if self._sh_error is not None:
+                raise self._sh_error
+            if self._sh_module is None:
+                try:
+                    self._sh_module = self._sh_loader()
+                except ImportError as e:
+                    self._sh_error = e
+                    raise
+        return self._sh_module
+
+    @property
+    def sh_loaded(self):
+        return self._sh_module is not None
+
+    def __getattr__(self, item):
+        if item.startswith("_sh_"):
+            raise AttributeError(item)
+        return getattr(self.sh_load(), item)
+
+    def __dir__(self):
+        return dir(self.sh_load())
+
+    def __repr__(self):
+        return "<lazy module {!r}>".format(self.__name__)
+
+
+def lazy_import(name):
+    """
+    Import a module on first attribute access.
+    :param name: the absolute name of the module
+    :type name: str
+    :rtype: ShLazyModule
+    """
+    return ShLazyModule(name, lambda: importlib.import_module(name))
+
+
 class ShFileNotFound(Exception):
     pass
 
@@ -251,6 +318,13 @@ class ShInternalError(Exception):
     pass
 
 
+class ShBrokenPipe(IOError):
+    """Raised when writing to a pipe whose reader end has been closed."""
+
+    def __init__(self):
+        super(ShBrokenPipe, self).__init__(errno.EPIPE, "Broken pipe")
+
+
 class Control(object):
     """
     pyte.control
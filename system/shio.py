@@ -1,8 +1,14 @@
 # coding: utf-8
 import logging
+import threading
 import time
 from collections import deque
 
+from .shthreads import thread_local
+
+# Marks a timeout argument that is not given, None means blocking
+_DEFAULT = object()
+
 
 class ShIO(object):
     """
@@ -18,16 +24,48 @@ class ShIO(object):
         self.tell_pos = 0
         # The input buffer, push from the Left end, read from the right end
         self._buffer = deque()
+        # Readers wait on this for input to be pushed
+        self._cond = threading.Condition()
         self.chunk_size = 4096
-        # When buffer is empty, hold back for certain before read again
-        # This is to lower the cpu usage of the reading thread so it does
-        # not affect the UI thread by noticeable amount
+        # Readers are notified as soon as input arrives. When waiting, they
+        # still wake up at this interval, so that a kill of the reading
+        # thread (an asynchronous exception) is delivered promptly.
         self.holdback = 0.2
+        # Timeout of reads outside the workers, None blocks and 0 means
+        # non-blocking. Each worker keeps its own in its state.
+        self.timeout = None
 
         self.encoding = "utf8"
 
     def push(self, s):
-        self._buffer.extendleft(s)
+        with self._cond:
+            self._buffer.extendleft(s)
+            self._cond.notify_all()
+
+    def settimeout(self, timeout):
+        """
+        Set the timeout of reads, like socket.settimeout. In a worker, this
+        is the timeout of the reads of the worker only, so that it ends with
+        the script.
+        :param float timeout: None to block, 0 for non-blocking mode, or the
+            seconds a read waits for input at most.
+        """
+        state = thread_local.state
+        if state is None:
+            self.timeout = timeout
+        else:
+            state.stdin_timeout = timeout
+
+    def gettimeout(self):
+        state = thread_local.state
+        return self.timeout if state is None else state.stdin_timeout
+
+    def setblocking(self, flag):
+        """
+        Set blocking or non-blocking mode of reads, like socket.setblocking.
+        :param bool flag: False for non-blocking mode
+        """
+        self.settimeout(None if flag else 0.0)
 
     # Following methods to provide file like object interface
     @property
@@ -58,32 +96,79 @@ class ShIO(object):
     def truncate(self, size=None):
         """do nothing"""
 
-    def read(self, size=-1):
-        size = size if size != 0 else 1
-
-        if size == -1:
-            return "".join(self._buffer.pop() for _ in len(self._buffer))
-
-        else:
-            ret = []
-            while len(ret) < size:
-                try:
-                    ret.append(self._buffer.pop())
-                except IndexError:
-                    # Wait briefly when the buffer is empty to avoid taxing the CPU
-                    time.sleep(self.holdback)
+    def _wait_for(self, predicate, timeout):
+        """
+        Wait until the buffer satisfies the predicate. Must be called with
+        the condition acquired.
+        :param callable predicate: Condition on the buffer
+        :param float timeout: None to block, otherwise seconds to wait at most
+        :return: Whether the predicate is satisfied
+        :rtype: bool
+        """
+        if timeout is _DEFAULT:
+            timeout = self.gettimeout()
+        deadline = None if timeout is None else time.time() + timeout
+        while not predicate():
+            if deadline is None:
+                wait = self.holdback
+            else:
+                wait = deadline - time.time()
+                if wait <= 0:
+                    return False
+                wait = min(wait, self.holdback)
+            self._cond.wait(wait)
+        return True
 
-            return "".join(ret)
+    def _has_eol(self, eol_chars=("\n", "\0")):
+        return any(c in self._buffer for c in eol_chars)
 
-    def readline(self, size=-1):
+    def _pop_through(self, eol_chars):
+        """
+        Pop characters up to and including the first of the given ones.
+        :rtype: [str]
+        """
         ret = []
         while True:
-            try:
-                ret.append(self._buffer.pop())
-                if ret[-1] in ["\n", "\0"]:
-                    break
-            except IndexError:
-                time.sleep(self.holdback)
+            ret.append(self._buffer.pop())
+            if ret[-1] in eol_chars:
+                return ret
+
+    def read(self, size=-1, timeout=_DEFAULT):
+        """
+        Read up to size characters, or till EOF if size is negative.
+        :param int size: Number of characters to read
+        :param float timeout: Overrides the timeout set for the object
+        :return: The characters, fewer than size or None if not enough input
+            arrived before the timeout.
+        :rtype: str
+        """
+        size = size if size != 0 else 1
+
+        with self._cond:
+            if size < 0:
+                if not self._wait_for(lambda: "\0" in self._buffer, timeout):
+                    return None
+                return "".join(self._pop_through(("\0",))[:-1])
+
+            self._wait_for(lambda: len(self._buffer) >= size, timeout)
+            if not self._buffer:
+                return None
+            return "".join(
+                self._buffer.pop() for _ in range(min(size, len(self._buffer)))
+            )
+
+    def readline(self, size=-1, timeout=_DEFAULT):
+        """
+        Read a line.
+        :param float timeout: Overrides the timeout set for the object
+        :return: The line or None if no complete line arrived before the
+            timeout.
+        :rtype: str
+        """
+        with self._cond:
+            if not self._wait_for(self._has_eol, timeout):
+                return None
+            ret = self._pop_through(("\n", "\0"))
 
         if ret[-1] == "\0":
             del ret[-1]
@@ -95,15 +180,17 @@ class ShIO(object):
 
         return line
 
-    def readlines(self, size=-1):
-        ret = []
-        while True:
-            try:
-                ret.append(self._buffer.pop())
-                if ret[-1] == "\0":
-                    break
-            except IndexError:
-                time.sleep(self.holdback)
+    def readlines(self, size=-1, timeout=_DEFAULT):
+        """
+        Read lines till EOF.
+        :param float timeout: Overrides the timeout set for the object
+        :return: The lines or None if EOF did not arrive before the timeout.
+        :rtype: [str]
+        """
+        with self._cond:
+            if not self._wait_for(lambda: "\0" in self._buffer, timeout):
+                return None
+            ret = self._pop_through(("\0",))
 
         ret = "".join(ret[:-1])  # do not include the EOF
 
@@ -127,10 +214,10 @@ class ShIO(object):
         try:
             self.stash.mini_buffer.cbreak = True
             while True:
-                try:
-                    yield self._buffer.pop()
-                except IndexError:
-                    time.sleep(self.holdback)
+                with self._cond:
+                    self._wait_for(lambda: len(self._buffer) > 0, None)
+                    c = self._buffer.pop()
+                yield c
 
         finally:
             self.stash.mini_buffer.cbreak = False
@@ -144,16 +231,12 @@ class ShIO(object):
         user command when a program is running at the same time.
         :return: str:
         """
-        ret = []
         while True:
-            try:
-                ret.append(self._buffer.pop())
-                if ret[-1] == "\n":
-                    yield "".join(ret)
-                    ret = []
-            except IndexError:
-                self._buffer.extend(ret)
-                break
+            with self._cond:
+                if "\n" not in self._buffer:
+                    return
+                line = "".join(self._pop_through(("\n",)))
+            yield line
 
     def write(self, s, no_wait=False):
         if len(s) == 0:  # skip empty string
@@ -3,44 +3,177 @@
 The wrappers dispatch io requests based on current thread.
 
 If the thread is an instance of ShBaseThread, the io should be dispatched to ShIO.
-Otherwise, it should be dispatched to regular sys io.
+Otherwise, it should be dispatched to regular sys io. The same goes for sys.argv.
+The state of a worker thread is found through the thread-local binding made
+when the worker starts running.
 """
 
+import copy
 import sys
-import threading
 
 from .shcommon import _SYS_STDIN, _SYS_STDOUT, _SYS_STDERR
-from .shthreads import ShBaseThread
+from .shthreads import thread_local
 
 
-class ShStdinWrapper(object):
-    def __getattribute__(self, item):
-        thread = threading.currentThread()
+def _forward(name):
+    """
+    A property giving the bound method of the stream of the current thread,
+    which callers then invoke directly.
+    """
 
-        if isinstance(thread, ShBaseThread):
-            return getattr(thread.state.sys_stdin, item)
-        else:
-            return getattr(_SYS_STDIN, item)
+    def getter(self):
+        return getattr(self._target(), name)
 
+    return property(getter)
 
-class ShStdoutWrapper(object):
-    def __getattribute__(self, item):
-        thread = threading.currentThread()
 
-        if isinstance(thread, ShBaseThread):
-            return getattr(thread.state.sys_stdout, item)
-        else:
-            return getattr(_SYS_STDOUT, item)
+class _ShStreamWrapper(object):
+    """
+    Dispatch to the stream of the current thread. The methods called most,
+    e.g. write, are looked up with a single thread-local lookup. Everything
+    else is forwarded by __getattr__.
+    :param default: the stream of threads which are not workers
+    :param name: the attribute of the worker state holding its stream
+    :type name: str
+    """
 
+    __slots__ = ("_default", "_name")
 
-class ShStderrWrapper(object):
-    def __getattribute__(self, item):
-        thread = threading.currentThread()
+    def __init__(self, default, name):
+        self._default = default
+        self._name = name
 
-        if isinstance(thread, ShBaseThread):
-            return getattr(thread.state.sys_stderr, item)
-        else:
-            return getattr(_SYS_STDERR, item)
+    def _target(self):
+        state = thread_local.state
+        return self._default if state is None else getattr(state, self._name)
+
+    @property
+    def __class__(self):
+        # Keep type checks on sys.stdout and friends working on the stream
+        return self._target().__class__
+
+    def __getattr__(self, item):
+        return getattr(self._target(), item)
+
+    def __iter__(self):
+        return iter(self._target())
+
+    def __next__(self):
+        return next(self._target())
+
+    next = __next__
+
+    writelines = _forward("writelines")
+    flush = _forward("flush")
+    read = _forward("read")
+    readline = _forward("readline")
+    readlines = _forward("readlines")
+    isatty = _forward("isatty")
+
+
+class ShStdinWrapper(_ShStreamWrapper):
+    __slots__ = ()
+
+    def __init__(self):
+        super(ShStdinWrapper, self).__init__(_SYS_STDIN, "sys_stdin")
+
+
+class ShStdoutWrapper(_ShStreamWrapper):
+    __slots__ = ()
+
+    def __init__(self):
+        super(ShStdoutWrapper, self).__init__(_SYS_STDOUT, "sys_stdout")
+
+    # print looks up write for every argument and separator, so it is
+    # resolved without any further calls
+    @property
+    def write(self):
+        state = thread_local.state
+        return (_SYS_STDOUT if state is None else state.sys_stdout).write
+
+
+class ShStderrWrapper(_ShStreamWrapper):
+    __slots__ = ()
+
+    def __init__(self):
+        super(ShStderrWrapper, self).__init__(_SYS_STDERR, "sys_stderr")
+
+    @property
+    def write(self):
+        state = thread_local.state
+        return (_SYS_STDERR if state is None else state.sys_stderr).write
+
+
+class ShArgvWrapper(list):
+    """
+    Dispatch sys.argv to the arguments of the script run by current thread.
+
+    The stages of a pipe sequence run their scripts concurrently, so a
+    single global sys.argv would be overwritten by whichever stage started
+    last. A worker thread with its own arguments sees those, any other
+    thread sees the original sys.argv.
+    """
+
+    def __init__(self, argv):
+        super(ShArgvWrapper, self).__init__()
+        self.argv = argv
+
+    def _target(self):
+        state = thread_local.state
+        if state is None or state.sys_argv is None:
+            return self.argv
+        return state.sys_argv
+
+    def __iadd__(self, other):
+        self._target().extend(other)
+        return self
+
+    # a copy, or a pickle, is a plain list of the arguments of the script
+    def __copy__(self):
+        return list(self._target())
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(list(self._target()), memo)
+
+    def __reduce_ex__(self, protocol):
+        return (list, (list(self._target()),))
+
+
+def _dispatch(name):
+    def method(self, *args, **kwargs):
+        return getattr(self._target(), name)(*args, **kwargs)
+
+    method.__name__ = name
+    return method
+
+
+for _name in (
+    "__getitem__",
+    "__setitem__",
+    "__delitem__",
+    "__getslice__",
+    "__len__",
+    "__iter__",
+    "__reversed__",
+    "__contains__",
+    "__eq__",
+    "__ne__",
+    "__add__",
+    "__mul__",
+    "__repr__",
+    "__str__",
+    "append",
+    "extend",
+    "insert",
+    "pop",
+    "remove",
+    "index",
+    "count",
+    "reverse",
+    "sort",
+):
+    if hasattr(list, _name):
+        setattr(ShArgvWrapper, _name, _dispatch(_name))
 
 
 stdinWrapper = ShStdinWrapper()
@@ -52,9 +185,13 @@ def enable():
     sys.stdin = stdinWrapper
     sys.stdout = stdoutWrapper
     sys.stderr = stderrWrapper
+    if not isinstance(sys.argv, ShArgvWrapper):
+        sys.argv = ShArgvWrapper(sys.argv)
 
 
 def disable():
     sys.stdin = _SYS_STDIN
     sys.stdout = _SYS_STDOUT
     sys.stderr = _SYS_STDERR
+    if isinstance(sys.argv, ShArgvWrapper):
+        sys.argv = sys.argv.argv
@@ -1,16 +1,27 @@
 # coding: utf-8
 
+import copy
+import io
 import os
 import string
 import glob
 import logging
+import re
 import threading
+import time
+from collections import OrderedDict
 
 from six import StringIO
 
-import pyparsing as pp
+from .shcommon import (
+    ShSingleExpansionRequired,
+    ShBadSubstitution,
+    ShInternalError,
+    lazy_import,
+)
 
-from .shcommon import ShSingleExpansionRequired, ShBadSubstitution, ShInternalError
+# only needed by the fallback grammar
+pp = lazy_import("pyparsing")
 
 _GRAMMAR = r"""
 -----------------------------------------------------------------------------
@@ -44,8 +55,13 @@ uq_word          : (WORD_CHARS)+ | '&3'
 
 """
 
+# Scripts modified less than this many seconds ago are not cached
+_RACY_INTERVAL = 1.0
+
 _WORD_CHARS = string.digits + string.ascii_letters + r"""!#$%()*+,-./:=?@[]^_{}~"""
 
+_PRINTABLES = "".join(chr(c) for c in range(33, 127))
+
 
 class ShAssignment(object):
     def __init__(self, identifier, value):
@@ -156,6 +172,267 @@ class ShToken(object):
         return ret
 
 
+class _ShLexerFallback(Exception):
+    """The line is left to the pyparsing grammar of ShParser"""
+
+
+class ShParsedCommand(list):
+    """
+    Parse result of a simple command by ShLexer. It has the same named
+    results as the pyparsing grammar, which are empty strings when absent.
+    """
+
+    def __init__(self):
+        super(ShParsedCommand, self).__init__()
+        self.cmd_prefix = ""
+        self.cmd_word = ""
+        self.args = ""
+        self.io_redirect = ""
+
+
+# noinspection PyProtectedMember
+class ShLexer(object):
+    """
+    A hand-written single pass parser for the grammar of ShParser. It gives
+    the same tokens and parse results as the pyparsing grammar, but is much
+    faster to create and to run. Anything it does not handle exactly like
+    the grammar, including all syntax errors, raises _ShLexerFallback so
+    that the line is parsed by the grammar instead.
+    """
+
+    _WHITESPACE = " \t\n\r"
+    _WORD_CHARS = frozenset(_WORD_CHARS)
+    # characters that may follow a backslash
+    _ESCAPABLE = frozenset(_PRINTABLES + " ")
+    # characters of unquoted words within double quotes
+    _DQ_CHARS = frozenset(_PRINTABLES.replace("`", " ").replace("\\", ""))
+
+    _pattern_identifier_assign = re.compile(r"[A-Za-z_][A-Za-z0-9_]*=")
+    _pattern_escaped_oct = re.compile(r"\\[0-7]{1,3}")
+    _pattern_escaped_hex = re.compile(r"\\x[0-9a-fA-F]{2}")
+    _pattern_quoted = {
+        q: re.compile(r"%s(?:\\.|[^%s\n\r\\])*%s" % (q, q, q)) for q in "`\"'"
+    }
+    _quoted_ttypes = {
+        "`": ShToken._BQ_WORD,
+        '"': ShToken._DQ_WORD,
+        "'": ShToken._SQ_WORD,
+    }
+
+    def parse(self, line):
+        """
+        :param str line: The line to parse
+        :return: The tokens and the parse results
+        :rtype: ([ShToken], list)
+        """
+        tokens = []
+        parsed = []
+        n = len(line)
+        pos = self._skip(line, 0)
+        while pos < n:
+            pipe_sequence, pos = self._pipe_sequence(line, pos, tokens)
+            parsed.append(pipe_sequence)
+            pos = self._skip(line, pos)
+            if pos == n:
+                break
+            if line[pos] not in ";&":
+                raise _ShLexerFallback()
+            tokens.append(ShToken(line[pos], pos, ShToken._PUNCTUATOR))
+            parsed.append(line[pos])
+            pos = self._skip(line, pos + 1)
+        return tokens, parsed
+
+    def parse_within_dq(self, s):
+        """
+        Take the input string as if it is inside a pair of double quotes.
+        :rtype: ([ShToken], list)
+        """
+        # the grammar parses the contents of double quotes with the tabs
+        # expanded to spaces, unlike whole lines
+        s = s.expandtabs()
+        parts = []
+        n = len(s)
+        pos = 0
+        if n == 0:
+            raise _ShLexerFallback()
+        while pos < n:
+            c = s[pos]
+            if c == "\\":
+                end = self._escaped(s, pos, parts)
+            elif c == "`":
+                end = self._quoted(s, pos, c, parts)
+            else:
+                end = pos
+                while end < n and s[end] in self._DQ_CHARS:
+                    end += 1
+                if end > pos:
+                    parts.append(ShToken(s[pos:end], pos, ShToken._UQ_WORD))
+            if end == pos:
+                raise _ShLexerFallback()
+            pos = end
+        return parts, [s]
+
+    def _skip(self, line, pos):
+        """Skip whitespace and comments"""
+        n = len(line)
+        while pos < n:
+            c = line[pos]
+            if c in self._WHITESPACE:
+                pos += 1
+            elif c == "#":
+                pos = line.find("\n", pos)
+                if pos == -1:
+                    return n
+            else:
+                break
+        return pos
+
+    def _pipe_sequence(self, line, pos, tokens):
+        pipe_sequence = []
+        while True:
+            simple_command, pos = self._simple_command(line, pos, tokens)
+            pipe_sequence.append(simple_command)
+            pos_op = self._skip(line, pos)
+            if not line.startswith("|", pos_op):
+                return pipe_sequence, pos
+            tokens.append(ShToken("|", pos_op, ShToken._PIPE_OP))
+            pipe_sequence.append("|")
+            pos = self._skip(line, pos_op + 1)
+
+    def _simple_command(self, line, pos, tokens):
+        simple_command = ShParsedCommand()
+
+        # cmd_prefix
+        cmd_prefix = []
+        while True:
+            m = self._pattern_identifier_assign.match(line, pos)
+            if m is None:
+                break
+            end, parts = self._word(line, m.end())
+            if end == m.end():
+                # The grammar sees a broken assignment differently
+                raise _ShLexerFallback()
+            value = ShToken(line[m.end() : end], m.end(), ShToken._WORD, parts)
+            tokens.append(ShToken(line[pos:end], pos, ShToken._ASSIGN_WORD, value))
+            cmd_prefix.append(line[pos:end])
+            pos = self._skip(line, end)
+        if cmd_prefix:
+            simple_command.cmd_prefix = cmd_prefix
+            simple_command.extend(cmd_prefix)
+
+        # cmd_word, with the longer of modifier + word and word
+        end, parts = self._word(line, pos)
+        if pos < len(line) and line[pos] in "!\\":
+            end_modified, parts_modified = self._word(line, pos + 1)
+            if end_modified > pos + 1 and end_modified >= end:
+                end, parts = end_modified, parts_modified
+        if end > pos:
+            tokens.append(ShToken(line[pos:end], pos, ShToken._CMD, parts))
+            simple_command.cmd_word = line[pos:end]
+            simple_command.append(line[pos:end])
+            pos = end
+        elif not cmd_prefix:
+            raise _ShLexerFallback()
+
+        # cmd_suffix
+        args = []
+        while True:
+            pos_word = self._skip(line, pos)
+            end, parts = self._word(line, pos_word)
+            if end == pos_word:
+                break
+            tokens.append(ShToken(line[pos_word:end], pos_word, ShToken._WORD, parts))
+            args.append(line[pos_word:end])
+            pos = end
+        if args:
+            simple_command.args = args
+            simple_command.extend(args)
+
+        pos_op = self._skip(line, pos)
+        if line.startswith(">", pos_op):
+            op = ">>" if line.startswith(">>", pos_op) else ">"
+            tokens.append(ShToken(op, pos_op, ShToken._IO_REDIRECT_OP))
+            pos_word = self._skip(line, pos_op + len(op))
+            end, parts = self._word(line, pos_word)
+            if end == pos_word:
+                raise _ShLexerFallback()
+            tokens.append(ShToken(line[pos_word:end], pos_word, ShToken._FILE, parts))
+            simple_command.io_redirect = [op, line[pos_word:end]]
+            simple_command.extend(simple_command.io_redirect)
+            pos = end
+
+        return simple_command, pos
+
+    def _word(self, line, pos):
+        """
+        Scan a word made of adjacent parts.
+        :return: The end of the word, which is pos if there is none, and its
+            parts
+        :rtype: (int, [ShToken])
+        """
+        parts = []
+        n = len(line)
+        while pos < n:
+            c = line[pos]
+            if c in self._WORD_CHARS:
+                end = pos + 1
+                while end < n and line[end] in self._WORD_CHARS:
+                    end += 1
+                parts.append(ShToken(line[pos:end], pos, ShToken._UQ_WORD))
+            elif c == "\\":
+                end = self._escaped(line, pos, parts)
+            elif c in self._quoted_ttypes:
+                end = self._quoted(line, pos, c, parts)
+            elif line.startswith("&3", pos):
+                end = pos + 2
+                parts.append(ShToken("&3", pos, ShToken._UQ_WORD))
+            else:
+                break
+            if end == pos:
+                break
+            pos = end
+        return pos, parts
+
+    def _escaped(self, s, pos, parts):
+        """
+        Scan the longest escape at pos, on a tie the first of plain, octal
+        and hex escape.
+        :return: The end of the escape, pos if there is none
+        :rtype: int
+        """
+        ttype, end = None, pos
+        if pos + 1 < len(s) and s[pos + 1] in self._ESCAPABLE:
+            ttype, end = ShToken._ESCAPED, pos + 2
+        m = self._pattern_escaped_oct.match(s, pos)
+        if m is not None and m.end() > end:
+            ttype, end = ShToken._ESCAPED_OCT, m.end()
+        m = self._pattern_escaped_hex.match(s, pos)
+        if m is not None and m.end() > end:
+            ttype, end = ShToken._ESCAPED_HEX, m.end()
+        if ttype is not None:
+            parts.append(ShToken(s[pos:end], pos, ttype))
+        return end
+
+    def _quoted(self, s, pos, quote, parts):
+        m = self._pattern_quoted[quote].match(s, pos)
+        if m is None:
+            return pos
+        parts.append(ShToken(m.group(), pos, self._quoted_ttypes[quote]))
+        return m.end()
+
+
+class ShParsedScript(list):
+    """
+    The lines of a shell script along with the parse results of the lines
+    parsed so far, so that running the script again skips the parsing.
+    """
+
+    def __init__(self, lines, key):
+        super(ShParsedScript, self).__init__(lines)
+        self.key = key  # mtime and size of the file
+        self.results = {}  # line -> (tokens, parsed)
+
+
 # noinspection PyProtectedMember
 class ShParser(object):
     """
@@ -167,10 +444,31 @@ class ShParser(object):
     _NEXT_WORD_VAL = "_NEXT_WORD_VAL"  # rhs of assignment
     _NEXT_WORD_FILE = "_NEXT_WORD_FILE"
 
-    def __init__(self, debug=False):
+    def __init__(
+        self, debug=False, cache_size=256, script_cache_size=16, use_lexer=True
+    ):
         self.debug = debug
         self.logger = logging.getLogger("StaSh.Parser")
 
+        # The grammar keeps the state of the line being parsed
+        self._lock = threading.RLock()
+        # line -> (tokens, parsed), least recently used first
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        # script path -> ShParsedScript, least recently used first
+        self.script_cache_size = script_cache_size
+        self._scripts = OrderedDict()
+
+        # Lines are parsed by the lexer, the grammar is only built once a
+        # line needs it
+        self.use_lexer = use_lexer
+        self.lexer = ShLexer()
+        self.parser = self.parser_within_dq = None
+        self.next_word_type = ShParser._NEXT_WORD_CMD
+        self.tokens = []
+        self.parts = []
+
+    def _build_grammar(self):
         escaped = pp.Combine(
             "\\" + pp.Word(pp.printables + " ", exact=1)
         ).setParseAction(self.escaped_action)
@@ -257,24 +555,96 @@ class ShParser(object):
 
         self.parser = complete_command.parseWithTabs().ignore(pp.pythonStyleComment)
         self.parser_within_dq = word_in_dq.leaveWhitespace()
-        self.next_word_type = ShParser._NEXT_WORD_CMD
-        self.tokens = []
-        self.parts = []
 
-    def parse(self, line):
+    def parse(self, line, script=None):
+        """
+        Parse a line. Results are cached by the line, expansion is left to
+        the caller.
+        :param str line: The line to parse
+        :param ShParsedScript script: The script the line comes from, which
+            holds on to the results of all its lines.
+        :return: The tokens and the parsed results
+        :rtype: ([ShToken], pp.ParseResults)
+        """
+        results = script.results if script is not None else None
+        with self._lock:
+            if results is not None and line in results:
+                tokens, parsed = results[line]
+            else:
+                entry = self._cache.pop(line, None)
+                if entry is None:
+                    entry = self._parse(line)
+                self._cache[line] = entry  # most recently used
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+                if results is not None:
+                    results[line] = entry
+                tokens, parsed = entry
+        # Callers substitute history and aliases in the tokens
+        return [copy.copy(t) for t in tokens], parsed
+
+    def _parse(self, line):
         if self.debug:
             self.logger.debug("line: %s" % repr(line))
+        if self.use_lexer:
+            try:
+                return self.lexer.parse(line)
+            except _ShLexerFallback:
+                pass
+        return self._parse_grammar(line)
+
+    def _parse_grammar(self, line):
+        if self.parser is None:
+            self._build_grammar()
         self.next_word_type = ShParser._NEXT_WORD_CMD
         self.tokens = []
         self.parts = []
         parsed = self.parser.parseString(line, parseAll=True)
         return self.tokens, parsed
 
+    def parse_script(self, filename):
+        """
+        Read the lines of a shell script. The script is only read again once
+        it changed, and the lines keep their parse results between runs.
+        :param str filename: Path of the script
+        :rtype: ShParsedScript
+        """
+        path = os.path.abspath(filename)
+        st = os.stat(path)
+        key = (st.st_mtime, st.st_size)
+        with self._lock:
+            script = self._scripts.pop(path, None)
+        if script is None or script.key != key:
+            # read the file in textmode.
+            with io.open(path, "r", newline=None) as fins:
+                script = ShParsedScript(fins.readlines(), key)
+        # A script modified just now may change again without its mtime
+        # changing (coarse timestamps), so it is not cached yet.
+        if time.time() - st.st_mtime > _RACY_INTERVAL:
+            with self._lock:
+                self._scripts[path] = script
+                while len(self._scripts) > self.script_cache_size:
+                    self._scripts.popitem(last=False)
+        return script
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+            self._scripts.clear()
+
     def parse_within_dq(self, s):
         """Take the input string as if it is inside a pair of double quotes"""
-        self.parts = []
-        parsed = self.parser_within_dq.parseString(s, parseAll=True)
-        return self.parts, parsed
+        with self._lock:
+            if self.use_lexer:
+                try:
+                    return self.lexer.parse_within_dq(s)
+                except _ShLexerFallback:
+                    pass
+            if self.parser_within_dq is None:
+                self._build_grammar()
+            self.parts = []
+            parsed = self.parser_within_dq.parseString(s, parseAll=True)
+            return self.parts, parsed
 
     def identifier_action(self, s, pos, toks):
         """This function is only needed for debug"""
@@ -396,12 +766,12 @@ class ShExpander(object):
         self.debug = debug
         self.logger = logging.getLogger("StaSh.Expander")
 
-    def expand(self, line):
+    def expand(self, line, script=None):
         if self.debug:
             self.logger.debug("line: %s" % repr(line))
 
         # Parse the line
-        tokens, parsed = self.stash.runtime.parser.parse(line)
+        tokens, parsed = self.stash.runtime.parser.parse(line, script=script)
 
         # History (bang) check
         tokens, parsed = self.history_subs(tokens, parsed)
@@ -0,0 +1,246 @@
+# coding: utf-8
+"""
+In-memory pipes connecting the stages of a pipe sequence.
+
+Each stage of ``a | b | c`` runs in its own worker thread. Neighbouring
+stages are connected by a ShPipe, a bounded buffer with a file like
+writer end and a file like reader end:
+
+- A writer blocks when the buffer is full (backpressure), so memory
+  stays bounded no matter how much the producer writes.
+- Closing the writer end signals EOF to the reader.
+- Closing the reader end (e.g. ``head`` has seen enough lines) makes any
+  further write raise ShBrokenPipe, which stops the producer.
+"""
+
+import threading
+from collections import deque
+
+from six import binary_type
+
+from .shcommon import ShBrokenPipe
+
+
+class ShPipe(object):
+    """
+    A bounded, blocking, thread safe text pipe.
+
+    :param capacity: number of characters buffered before writers block
+    :type capacity: int
+    """
+
+    # Blocking waits wake up periodically so that a killed worker (the
+    # KeyboardInterrupt is raised asynchronously) does not hang forever.
+    wait_interval = 0.2
+
+    def __init__(self, capacity=65536):
+        self.capacity = capacity
+        self._chunks = deque()
+        self._size = 0
+        self._cond = threading.Condition(threading.Lock())
+        self.write_closed = False
+        self.read_closed = False
+        self.reader = ShPipeReader(self)
+        self.writer = ShPipeWriter(self)
+
+    def __repr__(self):
+        return "<ShPipe buffered=%d write_closed=%s read_closed=%s>" % (
+            self._size,
+            self.write_closed,
+            self.read_closed,
+        )
+
+    def put(self, s):
+        """
+        Put a string into the pipe. Block while the pipe is full.
+        :param s: the string to write
+        :type s: str
+        """
+        idx = 0
+        while idx < len(s):
+            with self._cond:
+                while self._size >= self.capacity and not self.read_closed:
+                    self._cond.wait(self.wait_interval)
+                if self.read_closed:
+                    raise ShBrokenPipe()
+                if self.write_closed:
+                    raise ValueError("I/O operation on closed pipe")
+                # Never buffer more than capacity so memory stays bounded
+                # even for a single huge write
+                chunk = s[idx : idx + self.capacity - self._size]
+                self._chunks.append(chunk)
+                self._size += len(chunk)
+                idx += len(chunk)
+                self._cond.notify_all()
+
+    def get(self):
+        """
+        Get the next chunk of data. Block until data is available.
+        :return: the next chunk or an empty string on EOF
+        :rtype: str
+        """
+        with self._cond:
+            while not self._chunks and not self.write_closed:
+                self._cond.wait(self.wait_interval)
+            if not self._chunks:
+                return ""
+            chunk = self._chunks.popleft()
+            self._size -= len(chunk)
+            self._cond.notify_all()
+            return chunk
+
+    def close_write(self):
+        """Close the writer end, which signals EOF to the reader."""
+        with self._cond:
+            self.write_closed = True
+            self._cond.notify_all()
+
+    def close_read(self):
+        """Close the reader end and discard any pending data."""
+        with self._cond:
+            self.read_closed = True
+            self._chunks.clear()
+            self._size = 0
+            self._cond.notify_all()
+
+    def close(self):
+        """Close both ends of the pipe."""
+        self.close_write()
+        self.close_read()
+
+
+class ShPipeWriter(object):
+    """
+    The file like writer end of a ShPipe.
+    """
+
+    encoding = "utf8"
+
+    def __init__(self, pipe):
+        self.pipe = pipe
+
+    @property
+    def closed(self):
+        return self.pipe.write_closed
+
+    def isatty(self):
+        return False
+
+    def writable(self):
+        return True
+
+    def readable(self):
+        return False
+
+    def write(self, s):
+        if isinstance(s, binary_type) and not isinstance(s, str):
+            s = s.decode(self.encoding, "replace")
+        self.pipe.put(s)
+        return len(s)
+
+    def writelines(self, s_list):
+        self.write("".join(s_list))
+
+    def flush(self):
+        if self.pipe.read_closed:
+            raise ShBrokenPipe()
+
+    def close(self):
+        self.pipe.close_write()
+
+
+class ShPipeReader(object):
+    """
+    The file like reader end of a ShPipe.
+    A reader is meant to be used by a single thread.
+    """
+
+    encoding = "utf8"
+
+    def __init__(self, pipe):
+        self.pipe = pipe
+        # Data taken from the pipe but not yet returned to the caller
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    @property
+    def closed(self):
+        return self.pipe.read_closed
+
+    def isatty(self):
+        return False
+
+    def writable(self):
+        return False
+
+    def readable(self):
+        return True
+
+    def _fill(self):
+        """
+        Append the next chunk of the pipe to the internal buffer.
+        :return: False if EOF is reached
+        :rtype: bool
+        """
+        if self._eof:
+            return False
+        chunk = self.pipe.get()
+        if chunk == "":
+            self._eof = True
+            return False
+        if self._pos >= len(self._buf):
+            self._buf = chunk
+        else:
+            self._buf = self._buf[self._pos :] + chunk
+        self._pos = 0
+        return True
+
+    def _take(self, end):
+        ret = self._buf[self._pos : end]
+        self._pos = end
+        return ret
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            while self._fill():
+                pass
+            return self._take(len(self._buf))
+
+        while len(self._buf) - self._pos < size and self._fill():
+            pass
+        return self._take(min(self._pos + size, len(self._buf)))
+
+    def readline(self, size=-1):
+        start = self._pos
+        while True:
+            idx = self._buf.find("\n", start)
+            if idx != -1:
+                end = idx + 1
+                break
+            # _fill keeps the unread data at the front of the buffer, so
+            # only the newly appended chunk needs to be searched next
+            start = len(self._buf) - self._pos
+            if not self._fill():
+                end = len(self._buf)
+                break
+        if size is not None and 0 <= size < end - self._pos:
+            end = self._pos + size
+        return self._take(end)
+
+    def readlines(self, size=-1):
+        return self.read().splitlines(True)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.readline()
+        if line == "":
+            raise StopIteration
+        return line
+
+    next = __next__
+
+    def close(self):
+        self.pipe.close_read()
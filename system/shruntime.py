@@ -16,7 +16,6 @@ try:
 except NameError:
     from io import IOBase as file
 
-import pyparsing as pp
 
 # Detecting environments
 try:
@@ -31,12 +30,18 @@ from .shcommon import (
     ShFileNotFound,
     ShEventNotFound,
     ShNotExecutable,
+    ShBrokenPipe,
 )
 
 # noinspection PyProtectedMember
 from .shcommon import _STASH_ROOT, _STASH_HISTORY_FILE, _SYS_STDOUT, _SYS_STDERR
+from .shcommon import _STASH_CODE_CACHE_DIR
 from .shcommon import is_binary_file, _STASH_EXTENSION_BIN_PATH
-from .shparsers import ShPipeSequence
+from .shcommandhash import ShCommandHash
+from .shcodecache import ShCodeCache
+from .shiowrapper import ShArgvWrapper
+from .shparsers import ShParsedScript, ShPipeSequence, pp
+from .shpipes import ShPipe, ShPipeReader, ShPipeWriter
 from .shthreads import (
     ShBaseThread,
     ShTracedThread,
@@ -92,6 +97,7 @@ class ShRuntime(object):
         )
         self.child_thread = None
         self.worker_registry = ShWorkerRegistry()
+        self.command_hash = ShCommandHash()
 
         config = stash.config
         self.rcfile = os.path.join(_STASH_ROOT, config.get("system", "rcfile"))
@@ -100,6 +106,15 @@ class ShRuntime(object):
         self.py_traceback = config.getint("system", "py_traceback")
         self.py_pdb = config.getint("system", "py_pdb")
         self.input_encoding_utf8 = config.getint("system", "input_encoding_utf8")
+        self.py_code_cache = config.getint("system", "py_code_cache")
+        # relative to STASH_ROOT, like the rcfile
+        cache_dir = os.path.expanduser(
+            config.get("system", "py_code_cache_dir") or _STASH_CODE_CACHE_DIR
+        )
+        self.code_cache = ShCodeCache(
+            cache_dir=os.path.join(_STASH_ROOT, cache_dir),
+            max_disk_size=config.getint("system", "py_code_cache_size") << 20,
+        )
         self.ShThread = {"traced": ShTracedThread, "ctypes": ShCtypesThread}.get(
             config.get("system", "thread_type"), ShCtypesThread
         )
@@ -178,17 +193,12 @@ class ShRuntime(object):
                     return fname
 
         # Match for commands in current dir and BIN_PATH
-        # Effectively, current dir is always the first in BIN_PATH
-        for path in ["."] + current_state.environ_get("BIN_PATH").split(":"):
-            path = os.path.abspath(os.path.expanduser(path))
-            if os.path.exists(path):
-                for f in os.listdir(path):
-                    if f == filename or f == filename + ".py" or f == filename + ".sh":
-                        if os.path.isdir(f):
-                            dir_match_found = True
-                        else:
-                            return os.path.join(path, f)
-        if dir_match_found:
+        fname, bin_dir_match_found = self.command_hash.find(
+            filename, current_state.environ_get("BIN_PATH")
+        )
+        if fname is not None:
+            return fname
+        if dir_match_found or bin_dir_match_found:
             raise ShIsDirectory("%s: is a directory" % filename)
         else:
             raise ShFileNotFound("%s: command not found" % filename)
@@ -196,16 +206,12 @@ class ShRuntime(object):
     def get_all_script_names(self):
         """This function used for completer, whitespaces in names are escaped"""
         _, current_state = self.get_current_worker_and_state()
-        all_names = []
-        for path in ["."] + current_state.environ_get("BIN_PATH").split(":"):
-            path = os.path.expanduser(path)
-            if os.path.exists(path):
-                for f in os.listdir(path):
-                    if not os.path.isdir(f) and (
-                        f.endswith(".py") or f.endswith(".sh")
-                    ):
-                        all_names.append(f.replace(" ", "\\ "))
-        return all_names
+        return [
+            f.replace(" ", "\\ ")
+            for f in self.command_hash.all_script_names(
+                current_state.environ_get("BIN_PATH")
+            )
+        ]
 
     def run(
         self,
@@ -266,20 +272,23 @@ class ShRuntime(object):
                     )
 
                 else:
-                    if type(input_) is list:
+                    if isinstance(input_, list):
                         lines = input_
                     elif input_ == self.stash.io:
                         lines = self.stash.io.readline_no_block()
                     else:
                         lines = input_.splitlines()
 
+                    # Lines of a script keep their parse results between runs
+                    script = input_ if isinstance(input_, ShParsedScript) else None
+
                     for line in lines:
                         # Ignore empty lines
                         if line.strip() == "":
                             continue
 
                         # Parse and expand the line (note this function returns a generator object)
-                        expanded = self.expander.expand(line)
+                        expanded = self.expander.expand(line, script=script)
                         # The first member is the history expanded form and number of pipe_sequence
                         newline, n_pipe_sequences = next(expanded)
                         # Only add history entry if:
@@ -354,8 +363,11 @@ class ShRuntime(object):
                 self.write_error_message(final_errs, msg)
 
             except KeyboardInterrupt as e:
-                msg = "^C\nKeyboardInterrupt: %s\n" % e.args[0]
-                self.write_error_message(final_errs, msg)
+                # a kill of the worker raises the bare exception
+                msg = "^C\nKeyboardInterrupt"
+                if e.args:
+                    msg += ": %s" % e.args[0]
+                self.write_error_message(final_errs, msg + "\n")
 
             # This catch all exception handler is to handle errors outside of
             # run_pipe_sequence. The traceback print is mainly for debugging
@@ -429,131 +441,216 @@ class ShRuntime(object):
         environ={},
         cwd=None,
     ):
+        """
+        Run the simple commands of a pipe sequence.
+
+        A lone simple command runs directly in the current worker. For
+        ``a | b | c`` all commands run concurrently: every command but the
+        last runs in its own pipe stage thread and writes into a bounded
+        ShPipe read by the next command. The last command runs in the
+        current worker, so its exit status is the status of the sequence.
+        """
         if self.debug:
             self.logger.debug(str(pipe_sequence))
 
-        _, current_state = self.get_current_worker_and_state()
+        current_worker, current_state = self.get_current_worker_and_state()
 
         n_simple_commands = len(pipe_sequence.lst)
 
-        prev_outs = None
-        for idx, simple_command in enumerate(pipe_sequence.lst):
-            # The temporary_environ needs to be reset for each simple command
-            # i.e. A=42 script1 | script2
-            # The value of A should not be carried to script2
-            current_state.temporary_environ = {}
-            for assignment in simple_command.assignments:
-                current_state.temporary_environ[assignment.identifier] = (
-                    assignment.value
-                )
+        # The scripts of all stages share sys.path and os.environ (and
+        # sys.argv without the io wrapper) and may finish in any order.
+        # Restore them once all stages are done.
+        saved_sys_argv = sys.argv
+        saved_sys_path = sys.path
+        saved_os_environ = os.environ
 
-            # Only update the worker's env for pure assignments
-            if simple_command.cmd_word == "" and idx == 0 and n_simple_commands == 1:
-                current_state.environ.update(current_state.temporary_environ)
+        stages = []
+        pipes = []
+        next_ins = None
+        try:
+            for idx, simple_command in enumerate(pipe_sequence.lst):
+                # The temporary_environ needs to be reset for each simple command
+                # i.e. A=42 script1 | script2
+                # The value of A should not be carried to script2
                 current_state.temporary_environ = {}
+                for assignment in simple_command.assignments:
+                    current_state.temporary_environ[assignment.identifier] = (
+                        assignment.value
+                    )
 
-            if prev_outs:
-                # If previous output has gone to a file, we use a dummy empty string as ins
-                ins = StringIO() if type(prev_outs) == file else prev_outs
-            else:
-                ins = final_ins or current_state.sys_stdin__
-
-            outs = current_state.sys_stdout__
-            errs = current_state.sys_stderr__
-
-            if simple_command.io_redirect:
-                # Truncate file or append to file
-                mode = "w" if simple_command.io_redirect.operator == ">" else "a"
-                # For simplicity, stdout redirect works for stderr as well.
-                # Note this is different from a real shell.
-                if simple_command.io_redirect.filename == "&3":
-                    outs = _SYS_STDOUT
-                    errs = _SYS_STDERR
+                # Only update the worker's env for pure assignments
+                if (
+                    simple_command.cmd_word == ""
+                    and idx == 0
+                    and n_simple_commands == 1
+                ):
+                    current_state.environ.update(current_state.temporary_environ)
+                    current_state.temporary_environ = {}
+
+                if idx > 0:
+                    ins = next_ins
                 else:
-                    errs = outs = open(simple_command.io_redirect.filename, mode)
-
-            elif idx < n_simple_commands - 1:  # before the last piped command
-                outs = StringIO()
+                    ins = final_ins or current_state.sys_stdin__
 
-            else:
-                if final_outs:
-                    outs = final_outs
-                if final_errs:
-                    errs = final_errs
+                outs = current_state.sys_stdout__
+                errs = current_state.sys_stderr__
 
-            if self.debug:
-                self.logger.debug("io %s %s\n" % (ins, outs))
+                is_last = idx == n_simple_commands - 1
 
-            try:
-                if simple_command.cmd_word != "":
-                    script_file = self.find_script_file(simple_command.cmd_word)
-
-                    if self.debug:
-                        self.logger.debug("script is %s\n" % script_file)
-
-                    if self.input_encoding_utf8:
-                        # Python 2 is not fully unicode compatible. Some modules (e.g. runpy)
-                        # insist for ASCII arguments. The encoding here helps eliminates possible
-                        # errors caused by unicode arguments.
-                        simple_command_args = [
-                            arg.encode("utf-8") for arg in simple_command.args
-                        ]
+                if simple_command.io_redirect:
+                    # Truncate file or append to file
+                    mode = "w" if simple_command.io_redirect.operator == ">" else "a"
+                    # For simplicity, stdout redirect works for stderr as well.
+                    # Note this is different from a real shell.
+                    if simple_command.io_redirect.filename == "&3":
+                        outs = _SYS_STDOUT
+                        errs = _SYS_STDERR
                     else:
-                        simple_command_args = simple_command.args
+                        errs = outs = open(simple_command.io_redirect.filename, mode)
+                    # Output has gone to a file, the next command reads nothing
+                    next_ins = StringIO()
 
-                    if script_file.endswith(".py"):
-                        self.exec_py_file(
-                            script_file, simple_command_args, ins, outs, errs
-                        )
+                elif not is_last:  # before the last piped command
+                    pipe = ShPipe()
+                    pipes.append(pipe)
+                    outs = pipe.writer
+                    next_ins = pipe.reader
 
-                    elif is_binary_file(script_file):
-                        raise ShNotExecutable(script_file)
+                else:
+                    if final_outs:
+                        outs = final_outs
+                    if final_errs:
+                        errs = final_errs
 
-                    else:
-                        self.exec_sh_file(
-                            script_file, simple_command_args, ins, outs, errs
-                        )
+                if self.debug:
+                    self.logger.debug("io %s %s\n" % (ins, outs))
 
+                if is_last:
+                    self.run_simple_command(
+                        simple_command, ins, outs, errs, final_errs=final_errs
+                    )
                 else:
-                    current_state.return_value = 0
+                    stage = self.ShThread(
+                        self.worker_registry,
+                        current_worker or self,
+                        simple_command,
+                        target=functools.partial(
+                            self.run_pipe_stage,
+                            simple_command,
+                            ins,
+                            outs,
+                            errs,
+                            final_errs=final_errs,
+                        ),
+                        is_pipe_stage=True,
+                    )
+                    stage.state.temporary_environ = dict(
+                        current_state.temporary_environ
+                    )
+                    stages.append(stage)
+                    stage.start()
+
+            for stage in stages:
+                # Join in short steps so a kill of this worker is not blocked
+                while stage.is_alive():
+                    stage.join(ShPipe.wait_interval)
+
+        except BaseException:
+            # Killed or failed, so take down the remaining stages as well
+            for pipe in pipes:
+                pipe.close()
+            for stage in stages:
+                if stage.is_alive():
+                    stage.kill()
+            raise
 
-                if current_state.return_value != 0:
-                    break  # break out of the pipe_sequence, but NOT pipe_sequence list
+        finally:
+            if stages:
+                sys.argv = saved_sys_argv
+                sys.path = saved_sys_path
+                os.environ = saved_os_environ
 
-                if isinstance(outs, StringIO):
-                    outs.seek(0)  # rewind for next command in the pipe sequence
+    def run_pipe_stage(self, simple_command, ins, outs, errs, final_errs=None):
+        """
+        Target of a pipe stage thread. Run the simple command and clean up.
+        """
+        current_worker, _ = self.get_current_worker_and_state()
+        try:
+            self.run_simple_command(
+                simple_command, ins, outs, errs, final_errs=final_errs
+            )
+        except KeyboardInterrupt:
+            # The stage was killed along with its pipe sequence, which
+            # reports the interrupt.
+            pass
+        finally:
+            current_worker.cleanup()
+
+    def run_simple_command(self, simple_command, ins, outs, errs, final_errs=None):
+        """
+        Run a single simple command in the current worker with the given
+        IO. The IO is closed afterwards unless it belongs to the terminal.
+        """
+        _, current_state = self.get_current_worker_and_state()
 
-                prev_outs = outs
+        try:
+            if simple_command.cmd_word != "":
+                script_file = self.find_script_file(simple_command.cmd_word)
 
-            # This catch all exception is for when the exception is raised
-            # outside of the actual command execution, i.e. exec_py_file
-            # exec_sh_file, e.g. command not found, not executable etc.
-            except ShFileNotFound as e:
-                err_msg = "%s\n" % e.args[0]
                 if self.debug:
-                    self.logger.debug(err_msg)
+                    self.logger.debug("script is %s\n" % script_file)
+
+                if self.input_encoding_utf8:
+                    # Python 2 is not fully unicode compatible. Some modules (e.g. runpy)
+                    # insist for ASCII arguments. The encoding here helps eliminates possible
+                    # errors caused by unicode arguments.
+                    simple_command_args = [
+                        arg.encode("utf-8") for arg in simple_command.args
+                    ]
+                else:
+                    simple_command_args = simple_command.args
 
-                self.write_error_message(final_errs, err_msg)
-                # set exit code to 127
-                current_state.return_value = 127
-                break  # break out of the pipe_sequence, but NOT pipe_sequence list
+                if script_file.endswith(".py"):
+                    self.exec_py_file(script_file, simple_command_args, ins, outs, errs)
 
-            except Exception as e:
-                err_msg = "%s\n" % e.args[0]
-                if self.debug:
-                    self.logger.debug(err_msg)
-                self.write_error_message(final_errs, err_msg)
-                break  # break out of the pipe_sequence, but NOT pipe_sequence list
+                elif is_binary_file(script_file):
+                    raise ShNotExecutable(script_file)
 
-            finally:
-                if isinstance(outs, file) and not isinstance(outs, StringIO):
-                    # StringIO is subclass of IOBase in py3 but not in py2
-                    outs.close()
-                if isinstance(ins, StringIO):  # release the string buffer
-                    ins.close()
+                else:
+                    self.exec_sh_file(script_file, simple_command_args, ins, outs, errs)
+
+            else:
+                current_state.return_value = 0
+
+        # This catch all exception is for when the exception is raised
+        # outside of the actual command execution, i.e. exec_py_file
+        # exec_sh_file, e.g. command not found, not executable etc.
+        except ShFileNotFound as e:
+            err_msg = "%s\n" % e.args[0]
+            if self.debug:
+                self.logger.debug(err_msg)
+
+            self.write_error_message(final_errs, err_msg)
+            # set exit code to 127
+            current_state.return_value = 127
+
+        except Exception as e:
+            err_msg = "%s\n" % e.args[0]
+            if self.debug:
+                self.logger.debug(err_msg)
+            self.write_error_message(final_errs, err_msg)
+
+        finally:
+            if isinstance(outs, ShPipeWriter):  # signal EOF to the next stage
+                outs.close()
+            elif isinstance(outs, file) and not isinstance(outs, StringIO):
+                # StringIO is subclass of IOBase in py3 but not in py2
+                outs.close()
+            if isinstance(ins, (StringIO, ShPipeReader)):  # release the buffer
+                ins.close()
 
     def exec_py_file(self, filename, args=None, ins=None, outs=None, errs=None):
-        _, current_state = self.get_current_worker_and_state()
+        current_worker, current_state = self.get_current_worker_and_state()
 
         if ins:
             current_state.sys_stdin = ins
@@ -570,12 +667,18 @@ class ShRuntime(object):
         namespace["__file__"] = os.path.abspath(file_path)
         namespace["_stash"] = self.stash
 
-        saved_sys_argv = sys.argv[:]
         # First argument is the script name
         argv = [os.path.basename(filename)] + (args or [])
 
         argv = self.encode_argv(argv)
-        sys.argv = argv
+        saved_state_argv = current_state.sys_argv
+        if isinstance(sys.argv, ShArgvWrapper) and current_worker is not None:
+            # Scripts running concurrently each see their own arguments
+            saved_sys_argv = sys.argv
+            current_state.sys_argv = argv
+        else:
+            saved_sys_argv = sys.argv[:]
+            sys.argv = argv
 
         # Set current os environ to the threading environ
         saved_os_environ = os.environ
@@ -589,16 +692,24 @@ class ShRuntime(object):
         self.handle_PYTHONPATH()  # Make sure PYTHONPATH is honored
 
         try:
-            with io.open(file_path, "rb", newline=None) as f:
-                content = f.read()
-                code = compile(content, file_path, "exec", dont_inherit=True)
-                exec(code, namespace, namespace)
+            if self.py_code_cache:
+                code = self.code_cache.get_code(file_path)
+            else:
+                with io.open(file_path, "rb", newline=None) as f:
+                    content = f.read()
+                    code = compile(content, file_path, "exec", dont_inherit=True)
+            exec(code, namespace, namespace)
 
             current_state.return_value = 0
 
         except SystemExit as e:
             current_state.return_value = e.code
 
+        except ShBrokenPipe:
+            # The next stage of the pipe sequence stopped reading. Like a
+            # process killed by SIGPIPE, end quietly.
+            current_state.return_value = 141
+
         except Exception as e:
             current_state.return_value = 1
 
@@ -618,6 +729,7 @@ class ShRuntime(object):
             # Thread specific vars are not modified, e.g. current_state.environ is unchanged.
             # This means the vars cannot be changed inside a python script. It can only be
             # done through shell command, e.g. NEW_VAR=42
+            current_state.sys_argv = saved_state_argv
             sys.argv = saved_sys_argv
             sys.path = saved_sys_path
             os.environ = saved_os_environ
@@ -638,18 +750,16 @@ class ShRuntime(object):
 
         # Enclosing variables will be merged to environ when creating new thread
         try:
-            # read the file in textmode.
-            with io.open(filename, "r", newline=None) as fins:
-                child_worker = self.run(
-                    fins.readlines(),
-                    final_ins=ins,
-                    final_outs=outs,
-                    final_errs=errs,
-                    add_to_history=add_to_history,
-                    add_new_inp_line=False,
-                    persistent_level=0,
-                )
-                child_worker.join()
+            child_worker = self.run(
+                self.parser.parse_script(filename),
+                final_ins=ins,
+                final_outs=outs,
+                final_errs=errs,
+                add_to_history=add_to_history,
+                add_new_inp_line=False,
+                persistent_level=0,
+            )
+            child_worker.join()
 
             current_state.return_value = child_worker.state.return_value
 
@@ -3,10 +3,10 @@
 In-memory screen related code.
 """
 
-import itertools
+import bisect
 import logging
 import threading
-from collections import deque, namedtuple
+from collections import namedtuple
 from contextlib import contextmanager
 
 from six.moves import xrange
@@ -89,11 +89,299 @@ class ShChar(_Char):
 
 
 DEFAULT_CHAR = ShChar(data=" ", fg="default", bg="default")
-DEFAULT_LINE = itertools.repeat(DEFAULT_CHAR)
 
 
-def take(n, iterable):
-    return list(itertools.islice(iterable, n))
+def _slice_runs(runs, a, b):
+    """
+    Get the style runs covering the characters from a to b of a line.
+    :param [[ShChar, int]] runs: Style runs of the line
+    :rtype: [[ShChar, int]]
+    """
+    ret = []
+    pos = 0
+    for attrs, n in runs:
+        if pos >= b:
+            break
+        s, e = max(a, pos), min(b, pos + n)
+        if s < e:
+            ret.append([attrs, e - s])
+        pos += n
+    return ret
+
+
+def _extend_runs(runs, more):
+    """
+    Append style runs, merging neighbouring runs of the same style.
+    """
+    for attrs, n in more:
+        if n <= 0:
+            continue
+        if runs and runs[-1][0] == attrs:
+            runs[-1][1] += n
+        else:
+            runs.append([attrs, n])
+
+
+class ShLine(object):
+    """
+    A single line of the screen buffer, including its trailing newline if it
+    has one. Styles are stored as runs of [attributes, length] instead of an
+    attributed character each.
+    """
+
+    __slots__ = ("text", "runs")
+
+    def __init__(self, text, runs):
+        self.text = text
+        self.runs = runs
+
+    def __repr__(self):
+        return "ShLine(%r, %r)" % (self.text, self.runs)
+
+
+class ShLineBuffer(object):
+    """
+    Storage of the sequential screen, a list of lines indexed by their
+    offsets.
+
+    All lines but the last end with a newline. Offsets of lines are kept as
+    absolute values, i.e. counted from the first character ever stored, so
+    that dropping the top line does not need to touch any other line.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._lines = []
+        self._starts = []  # absolute offset of each line
+        self._head = 0  # index of the first line still in the buffer
+        self._origin = 0  # absolute offset of the buffer start
+        self.length = 0
+
+    @property
+    def nlines(self):
+        """
+        Number of newline characters in the buffer.
+        :rtype: int
+        """
+        n = len(self._lines) - self._head
+        if n > 0 and not self._lines[-1].text.endswith("\n"):
+            n -= 1
+        return n
+
+    @property
+    def text(self):
+        """
+        :rtype: str
+        """
+        return "".join(line.text for line in self._lines[self._head :])
+
+    def _index(self, x):
+        """
+        Index of the line holding the character at offset x.
+        :param int x: Offset in the buffer, 0 <= x < length
+        :rtype: int
+        """
+        return bisect.bisect_right(self._starts, x + self._origin, self._head) - 1
+
+    def _is_open(self):
+        """Whether the last line has no newline yet"""
+        return len(self._lines) > self._head and not self._lines[-1].text.endswith("\n")
+
+    def char_at(self, x):
+        """
+        :param int x: Offset in the buffer
+        :rtype: str
+        """
+        idx = self._index(x)
+        return self._lines[idx].text[x + self._origin - self._starts[idx]]
+
+    def line_start(self, x):
+        """
+        Offset of the start of the line holding offset x.
+        :rtype: int
+        """
+        if x >= self.length:
+            if self._is_open():
+                return self._starts[-1] - self._origin
+            return self.length
+        return self._starts[self._index(x)] - self._origin
+
+    def line_end(self, x):
+        """
+        Offset of the newline ending the line holding offset x, or the buffer
+        length if the line has no newline.
+        :rtype: int
+        """
+        if x >= self.length:
+            return self.length
+        idx = self._index(x)
+        line = self._lines[idx]
+        if line.text.endswith("\n"):
+            return self._starts[idx] - self._origin + len(line.text) - 1
+        return self.length
+
+    def last_newline(self):
+        """
+        Offset of the last newline in the buffer or -1 if there is none.
+        :rtype: int
+        """
+        if len(self._lines) == self._head:
+            return -1
+        if not self._is_open():
+            return self.length - 1
+        return self._starts[-1] - self._origin - 1
+
+    def _iter_lines(self, a, b):
+        """
+        Iterate over (line, offset of line) of lines overlapping a to b.
+        """
+        if a >= b or a >= self.length:
+            return
+        for idx in xrange(self._index(a), len(self._lines)):
+            start = self._starts[idx] - self._origin
+            if start >= b:
+                break
+            yield self._lines[idx], start
+
+    def text_range(self, a, b):
+        """
+        :rtype: str
+        """
+        return "".join(
+            line.text[max(a - start, 0) : b - start]
+            for line, start in self._iter_lines(a, b)
+        )
+
+    def chars(self, a, b):
+        """
+        Attributed characters from offset a to b.
+        :rtype: [ShChar]
+        """
+        ret = []
+        for line, start in self._iter_lines(a, b):
+            pos = start
+            for attrs, n in line.runs:
+                s, e = max(a, pos), min(b, pos + n)
+                if s < e:
+                    ret.extend(
+                        attrs._replace(data=c) for c in line.text[s - start : e - start]
+                    )
+                pos += n
+        return ret
+
+    def append(self, s, attrs):
+        """
+        Append a string with the given attributes to the end of the buffer.
+        :param str s: The string
+        :param ShChar attrs: The attributes of the string
+        """
+        if not s:
+            return
+        lines, starts = self._lines, self._starts
+        pos = 0
+        if self._is_open():
+            # Fill up the open last line first
+            idx = s.find("\n") + 1 or len(s)
+            line = lines[-1]
+            line.text += s[:idx]
+            _extend_runs(line.runs, [[attrs, idx]])
+            pos = idx
+        end = self._origin + self.length + pos
+        while pos < len(s):
+            idx = s.find("\n", pos) + 1 or len(s)
+            lines.append(ShLine(s[pos:idx], [[attrs, idx - pos]]))
+            starts.append(end)
+            end += idx - pos
+            pos = idx
+        self.length += len(s)
+
+    def pop_top(self):
+        """
+        Drop the top line.
+        :return: Number of characters dropped
+        :rtype: int
+        """
+        n = len(self._lines[self._head].text)
+        self._head += 1
+        self._origin += n
+        self.length -= n
+        if self._head == len(self._lines):
+            self._lines, self._starts, self._head = [], [], 0
+        elif self._head > 64 and self._head * 2 > len(self._lines):
+            # Compact the lists once most of their entries are dropped
+            del self._lines[: self._head]
+            del self._starts[: self._head]
+            self._head = 0
+        return n
+
+    def splice(self, a, b, s, attrs):
+        """
+        Replace characters from offset a to b with a string. Only the lines
+        covering the range are rebuilt.
+        :param int a: Start of the range
+        :param int b: End of the range
+        :param str s: The new string
+        :param ShChar attrs: The attributes of the new string
+        """
+        b = min(b, self.length)
+        a = min(a, b)
+        if a == self.length:
+            self.append(s, attrs)
+            return
+
+        lines, starts = self._lines, self._starts
+        i0 = self._index(a)
+        i1 = self._index(max(a, b - 1))
+        line0, start0 = lines[i0], starts[i0] - self._origin
+        line1, start1 = lines[i1], starts[i1] - self._origin
+
+        text = line0.text[: a - start0] + s + line1.text[b - start1 :]
+        runs = _slice_runs(line0.runs, 0, a - start0)
+        _extend_runs(runs, [[attrs, len(s)]])
+        _extend_runs(runs, _slice_runs(line1.runs, b - start1, len(line1.text)))
+        old_length = starts[i1] + len(line1.text) - starts[i0]
+
+        # Only the last line may miss a newline, join with the next line
+        while not text.endswith("\n") and i1 + 1 < len(lines):
+            i1 += 1
+            text += lines[i1].text
+            _extend_runs(runs, lines[i1].runs)
+            old_length += len(lines[i1].text)
+
+        new_lines = []
+        new_starts = []
+        end = starts[i0]
+        pos = 0
+        run_iter = iter(runs)
+        run = None
+        while pos < len(text):
+            idx = text.find("\n", pos) + 1 or len(text)
+            # distribute the style runs over the new lines
+            line_runs = []
+            need = idx - pos
+            while need > 0:
+                if run is None or run[1] == 0:
+                    run = list(next(run_iter))
+                n = min(need, run[1])
+                line_runs.append([run[0], n])
+                run[1] -= n
+                need -= n
+            new_lines.append(ShLine(text[pos:idx], line_runs))
+            new_starts.append(end)
+            end += idx - pos
+            pos = idx
+
+        lines[i0 : i1 + 1] = new_lines
+        starts[i0 : i1 + 1] = new_starts
+        delta = len(text) - old_length
+        if delta:
+            for idx in xrange(i0 + len(new_lines), len(starts)):
+                starts[idx] += delta
+        self.length += delta
+        if len(lines) == self._head:
+            self.clear()
 
 
 # noinspection PyAttributeOutsideInit
@@ -111,7 +399,7 @@ class ShSequentialScreen(object):
         self.debug = debug
         self.logger = logging.getLogger("StaSh.Screen")
 
-        self._buffer = deque()  # buffer to hold chars
+        self._buffer = ShLineBuffer()  # buffer to hold lines of styled text
         self.lock = threading.Lock()
 
         self.attrs = ShChar(" ")
@@ -144,7 +432,13 @@ class ShSequentialScreen(object):
         # relative to start of the Screen's buffer.
         self.intact_right_bound = 0
 
-        self.nlines = 0
+    @property
+    def nlines(self):
+        """
+        Number of lines in the buffer.
+        :rtype: int
+        """
+        return self._buffer.nlines
 
     @property
     def cursor_x(self):
@@ -168,14 +462,14 @@ class ShSequentialScreen(object):
         """
         :rtype: str
         """
-        return "".join(c.data for c in self._buffer)
+        return self._buffer.text
 
     @property
     def text_length(self):
         """
         :rtype: int
         """
-        return len(self._buffer)
+        return self._buffer.length
 
     @property
     def renderable_chars(self):
@@ -186,7 +480,7 @@ class ShSequentialScreen(object):
         :rtype: [ShChar]
         """
         _, rbound = self.get_bounds()
-        return [self._buffer[x] for x in xrange(rbound, len(self._buffer))]
+        return self._buffer.chars(rbound, self._buffer.length)
 
     @property
     def x_modifiable(self):
@@ -197,11 +491,8 @@ class ShSequentialScreen(object):
         """
         # The position is either the x_drawend or last LF location plus one,
         # whichever is larger.
-        for idx in xrange(self.text_length - 1, self.x_drawend - 1, -1):
-            if self._buffer[idx].data == "\n":
-                return idx + 1
-        else:
-            return self.x_drawend
+        idx = self._buffer.last_newline()
+        return idx + 1 if idx >= self.x_drawend else self.x_drawend
 
     @property
     def modifiable_range(self):
@@ -218,7 +509,7 @@ class ShSequentialScreen(object):
         A string represents the characters that are in the modifiable range.
         :rtype: str
         """
-        return "".join(self._buffer[idx].data for idx in xrange(*self.modifiable_range))
+        return self._buffer.text_range(*self.modifiable_range)
 
     @modifiable_string.setter
     def modifiable_string(self, s):
@@ -242,20 +533,6 @@ class ShSequentialScreen(object):
             if locked:
                 self.lock.release()
 
-    @contextmanager
-    def buffer_rotate(self, n):
-        """
-        This method is used for when operations like replacing, insertion, deletion
-        are needed in the middle of the character buffer.
-        :param n:
-        :return:
-        """
-        self._buffer.rotate(n)
-        try:
-            yield
-        finally:
-            self._buffer.rotate(-n)
-
     def get_bounds(self):
         """
         Get the left and right intact bounds of the screen buffer.
@@ -272,7 +549,7 @@ class ShSequentialScreen(object):
         Mark everything as rendered.
         """
         self.intact_left_bound = 0
-        self.intact_right_bound = len(self._buffer)
+        self.intact_right_bound = self.text_length
 
     # noinspection PyProtectedMember
     def replace_in_range(
@@ -289,7 +566,7 @@ class ShSequentialScreen(object):
         :return:
         """
         if rng is None:
-            rng = (len(self._buffer), len(self._buffer))
+            rng = (self.text_length, self.text_length)
 
         elif relative_to_x_modifiable:  # Convert to absolute location if necessary
             rng = rng[0] + self.x_modifiable, rng[1] + self.x_modifiable
@@ -298,16 +575,10 @@ class ShSequentialScreen(object):
         if rng[0] < self.intact_right_bound:
             self.intact_right_bound = rng[0]
 
-        rotate_n = max(len(self._buffer) - rng[1], 0)
-        self._buffer.rotate(rotate_n)  # rotate buffer first so deletion is possible
-        try:
-            if rng[0] != rng[1]:  # delete chars if necessary
-                self._pop_chars(rng[1] - rng[0])
-            # The newly inserted chars are always of default properties
-            self._buffer.extend(DEFAULT_CHAR._replace(data=c) for c in s)
-
-        finally:
-            self._buffer.rotate(-rotate_n)
+        # The newly inserted chars are always of default properties
+        self._buffer.splice(rng[0], rng[1], s, DEFAULT_CHAR)
+        if self.text_length < self.intact_right_bound:
+            self.intact_right_bound = self.text_length
 
         # Update cursor to the end of this replacement
         self.cursor_x = rng[0] + len(s)
@@ -316,34 +587,17 @@ class ShSequentialScreen(object):
         if set_drawend:
             self.x_drawend = self.cursor_xs
 
-        nlf = s.count("\n")
-        if nlf > 0:  # ensure max number of lines is kept
-            self.nlines += nlf
+        if "\n" in s:  # ensure max number of lines is kept
             self._ensure_nlines_max()
 
-    def _pop_chars(self, n=1):
-        """
-        Remove number of given characters form the right END of the buffer
-        :param n:
-        :return:
-        """
-        for _ in xrange(n):
-            self._buffer.pop()
-        if self.text_length < self.intact_right_bound:
-            self.intact_right_bound = self.text_length
-
     def _ensure_nlines_max(self):
         """
         Keep number of lines under control
         """
-        char_count = line_count = 0
-        for _ in xrange(self.nlines_max, self.nlines):
+        char_count = 0
+        while self._buffer.nlines > self.nlines_max:
             # Remove the top line
-            for idx in xrange(self.text_length):
-                char_count += 1
-                if self._buffer.popleft().data == "\n":
-                    line_count += 1
-                    break
+            char_count += self._buffer.pop_top()
 
         if char_count > 0:
             self.intact_left_bound += char_count
@@ -352,37 +606,6 @@ class ShSequentialScreen(object):
             self.cursor_xe -= char_count
             self.x_drawend -= char_count
 
-        if line_count > 0:
-            self.nlines -= line_count
-
-    def _rfind_nth_nl(self, from_x=None, n=1, default=None):
-        if from_x is None:
-            from_x = self.cursor_xs
-        for idx in xrange(from_x, -1, -1):
-            try:  # try for when from_x is equal to buffer length (i.e. at the end of the buffer)
-                if self._buffer[idx].data == "\n":
-                    n -= 1
-                    if n == 0:
-                        return idx
-            except IndexError:
-                pass
-        else:
-            return default
-
-    def _find_nth_nl(self, from_x=None, n=1, default=None):
-        if from_x is None:
-            from_x = self.cursor_xs
-        for idx in xrange(from_x, self.text_length):
-            try:
-                if self._buffer[idx].data == "\n":
-                    n -= 1
-                    if n == 0:
-                        return idx
-            except IndexError:
-                pass
-        else:
-            return default
-
     # noinspection PyProtectedMember
     def draw(self, c):
         """
@@ -394,33 +617,64 @@ class ShSequentialScreen(object):
         if self.cursor_xs == self.text_length:  # cursor is at the end
             if self.text_length < self.intact_right_bound:
                 self.intact_right_bound = self.text_length
-            self._buffer.append(self.attrs._replace(data=c))
+            self._buffer.append(c, self.attrs)
             self.cursor_x = self.x_drawend = self.text_length
 
         else:  # cursor is in the middle
-            # First rotate the text is that to the right of cursor
-            with self.buffer_rotate(self.text_length - self.cursor_xs - 1):
-                # Remove the character at the cursor and append new character
-                # This is effectively character REPLACING operation
-                c_poped = self._buffer.pop()
-                self._buffer.append(self.attrs._replace(data=c))
-                # The replacing must be within a single line, so the newline
-                # character cannot be replaced and instead a new char is inserted
-                # right before the newline.
-                # Also when the new character is a newline, it is effectively an
-                # insertion NOT replacement (i.e. it pushes everything following
-                # it to the next line).
-                if c == "\n" or c_poped.data == "\n":
-                    self._buffer.append(c_poped)
-                # Update the cursor and drawing end
-                self.cursor_x = self.x_drawend = self.cursor_xs + 1
-                # Update the intact right bound
-                if self.x_drawend < self.intact_right_bound:
-                    self.intact_right_bound = self.x_drawend
+            # Replace the character at the cursor.
+            # The replacing must be within a single line, so the newline
+            # character cannot be replaced and instead a new char is inserted
+            # right before the newline.
+            # Also when the new character is a newline, it is effectively an
+            # insertion NOT replacement (i.e. it pushes everything following
+            # it to the next line).
+            if c == "\n" or self._buffer.char_at(self.cursor_xs) == "\n":
+                self._buffer.splice(self.cursor_xs, self.cursor_xs, c, self.attrs)
+            else:
+                self._buffer.splice(self.cursor_xs, self.cursor_xs + 1, c, self.attrs)
+            # Update the cursor and drawing end
+            self.cursor_x = self.x_drawend = self.cursor_xs + 1
+            # Update the intact right bound
+            if self.x_drawend < self.intact_right_bound:
+                self.intact_right_bound = self.x_drawend
 
         # Count the number of lines
         if c == "\n":
-            self.nlines += 1
+            self._ensure_nlines_max()
+
+    def draw_text(self, text):
+        """
+        Draw a run of plain characters, i.e. without any control characters
+        other than newline. It has the same effect as calling draw for each
+        character. This method should ONLY be called by ShStream.
+        :param str text: The characters to draw
+        """
+        if not text:
+            return
+
+        if self.cursor_xs == self.text_length:  # cursor is at the end
+            if self.text_length < self.intact_right_bound:
+                self.intact_right_bound = self.text_length
+            self._buffer.append(text, self.attrs)
+            self.cursor_x = self.x_drawend = self.text_length
+
+        else:  # cursor is in the middle
+            x = self.cursor_xs
+            for idx, segment in enumerate(text.split("\n")):
+                if idx > 0:  # a newline is always inserted
+                    self._buffer.splice(x, x, "\n", self.attrs)
+                    x += 1
+                if segment:
+                    # Replace the characters up to the end of the line, the
+                    # rest are inserted before the newline
+                    end = min(x + len(segment), self._buffer.line_end(x))
+                    self._buffer.splice(x, end, segment, self.attrs)
+                    x += len(segment)
+            self.cursor_x = self.x_drawend = x
+            if self.cursor_xs - len(text) < self.intact_right_bound:
+                self.intact_right_bound = self.cursor_xs - len(text)
+
+        if "\n" in text:
             self._ensure_nlines_max()
 
     def backspace(self):
@@ -428,36 +682,33 @@ class ShSequentialScreen(object):
         Move cursor back one character. Do not cross lines.
         """
         cursor_xs = self.cursor_xs - 1
-        try:
-            if self._buffer[cursor_xs] != "\n":
-                self.cursor_x = cursor_xs
-        except IndexError:
+        if cursor_xs < 0:
             self.cursor_x = 0
+        elif self._buffer.char_at(cursor_xs) != "\n":
+            self.cursor_x = cursor_xs
 
     def carriage_return(self):
         """
         Process \r to move cursor to the beginning of the current line.
         """
-        self.cursor_x = self._rfind_nth_nl(default=-1) + 1
+        self.cursor_x = self._buffer.line_start(self.cursor_xs)
 
     def delete_characters(self, count=0):
         """
         Delete n characters from cursor including cursor within the current line.
         :param count: If count is 0, delete till the next newline.
         """
-        if self.cursor_xs == self.text_length or self._buffer[self.cursor_xs] == "\n":
+        if self.cursor_xs >= self.text_length:
             return
+        line_end = self._buffer.line_end(self.cursor_xs)
         if count == 0:  # delete till the next newline
-            count = self.text_length
-        with self.buffer_rotate(-self.cursor_xs):
-            for _ in xrange(min(count, self.text_length - self.cursor_xs)):
-                c = self._buffer.popleft()
-                if c.data == "\n":  # do not delete newline
-                    self._buffer.appendleft(c)
-                    break
-            self.x_drawend = self.cursor_xs
-            if self.x_drawend < self.intact_right_bound:
-                self.intact_right_bound = self.x_drawend
+            end = line_end
+        else:  # do not delete newline
+            end = min(self.cursor_xs + count, line_end)
+        self._buffer.splice(self.cursor_xs, end, "", self.attrs)
+        self.x_drawend = self.cursor_xs
+        if self.x_drawend < self.intact_right_bound:
+            self.intact_right_bound = self.x_drawend
 
     def erase_in_line(self, mode=0):
         """
@@ -467,28 +718,18 @@ class ShSequentialScreen(object):
         """
         # Calculate the range for erase
         if mode == 0:  # erase from cursor to end of line, including cursor
-            rng = [self.cursor_xs, self._find_nth_nl(default=self.text_length)]
-            try:  # do not include the newline character
-                if self._buffer[rng[0]] == "\n":
-                    rng[0] += 1
-            except IndexError:
-                pass
+            rng = [self.cursor_xs, self._buffer.line_end(self.cursor_xs)]
 
         elif mode == 1:  # erase form beginning of line to cursor, including cursor
             rng = [
-                self._rfind_nth_nl(default=-1) + 1,
-                min(self.cursor_xs + 1, self.text_length),
+                self._buffer.line_start(self.cursor_xs),
+                min(self.cursor_xs + 1, self._buffer.line_end(self.cursor_xs)),
             ]
-            try:
-                if self._buffer[rng[1] - 1] == "\n":
-                    rng[1] -= 1
-            except IndexError:
-                pass
 
         else:  # mode == 2:  # erase the complete line
             rng = [
-                self._rfind_nth_nl(default=-1) + 1,
-                self._find_nth_nl(default=self.text_length),
+                self._buffer.line_start(self.cursor_xs),
+                self._buffer.line_end(self.cursor_xs),
             ]
 
         # fast fail when there is nothing to erase
@@ -496,14 +737,11 @@ class ShSequentialScreen(object):
             return
 
         # Erase characters in the range
-        with self.buffer_rotate(self.text_length - rng[1]):
-            for _ in xrange(*rng):
-                self._buffer.pop()
-            self._buffer.extend(take(rng[1] - rng[0], DEFAULT_LINE))
-            self.x_drawend = rng[0]
-            # update the intact right bound
-            if self.x_drawend < self.intact_right_bound:
-                self.intact_right_bound = self.x_drawend
+        self._buffer.splice(rng[0], rng[1], " " * (rng[1] - rng[0]), DEFAULT_CHAR)
+        self.x_drawend = rng[0]
+        # update the intact right bound
+        if self.x_drawend < self.intact_right_bound:
+            self.intact_right_bound = self.x_drawend
 
     # noinspection PyProtectedMember
     def select_graphic_rendition(self, *attrs):
@@ -562,48 +800,35 @@ class ShSequentialScreen(object):
 
             idx_dirty_char = (ncolumns + 1) * min_idx_dirty_line
 
-            # self.logger.info(
-            #     'min_idx_dirty_line={}, idx_dirty_char={}, nchars_pyte_screen={}, self.text_length={}'.format(
-            #         min_idx_dirty_line, idx_dirty_char, nchars_pyte_screen, self.text_length
-            #     )
-            # )
-
             if idx_dirty_char > self.text_length - 1:
                 self.intact_right_bound = self.text_length
             else:
                 self.intact_right_bound = min(self.text_length, nchars_pyte_screen)
-                for idx in xrange(idx_dirty_char, nchars_pyte_screen):
-                    # self.logger.info('idx = %s' % idx)
-                    if idx >= self.text_length:
-                        break
-                    idx_line, idx_column = idx / (ncolumns + 1), idx % (ncolumns + 1)
+                end = min(nchars_pyte_screen, self.text_length)
+                screen_chars = self._buffer.chars(idx_dirty_char, end)
+                for idx in xrange(idx_dirty_char, end):
+                    idx_line, idx_column = divmod(idx, ncolumns + 1)
                     if idx_column == ncolumns:
                         continue
                     pyte_char = pyte_screen.buffer[idx_line][idx_column]
-                    # self.logger.info('HERE = %s' % idx)
-                    if self._buffer[
-                        idx
-                    ].data != pyte_char.data or not ShChar.same_style(
-                        self._buffer[idx], pyte_char
+                    screen_char = screen_chars[idx - idx_dirty_char]
+                    if screen_char.data != pyte_char.data or not ShChar.same_style(
+                        screen_char, pyte_char
                     ):
-                        # self.logger.info('breaking %s' % idx)
                         self.intact_right_bound = idx
                         break
 
-            for _ in xrange(self.intact_right_bound, self.text_length):
-                self._buffer.pop()
+            self._buffer.splice(
+                self.intact_right_bound, self.text_length, "", DEFAULT_CHAR
+            )
 
             for idx in xrange(self.intact_right_bound, nchars_pyte_screen):
-                idx_line, idx_column = idx / (ncolumns + 1), idx % (ncolumns + 1)
+                idx_line, idx_column = divmod(idx, ncolumns + 1)
                 if idx_column != ncolumns:
                     c = pyte_screen.buffer[idx_line][idx_column]
-                    self._buffer.append(ShChar(**c._asdict()))
+                    attrs = ShChar(**c._asdict())
+                    self._buffer.append(attrs.data, attrs._replace(data=" "))
                 else:
-                    self._buffer.append(ShChar("\n"))
+                    self._buffer.append("\n", DEFAULT_CHAR)
 
             self.cursor_x = idx_cursor_pyte_screen
-
-        # self.logger.info('intact_right_bound={}, cursor={}'.format(self.intact_right_bound, self.cursor_xs))
-        # self.logger.info('|%s|' % pyte_screen.display)
-        # self.logger.info('text=|%s|' % self.text)
-        # self.logger.info('text_length=%s' % self.text_length)
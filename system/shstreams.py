@@ -377,6 +377,14 @@ class ShStream(object):
     STATE_ESCAPE = 1
     STATE_ARGUMENTS = 2
 
+    #: Characters that cannot be drawn as part of a plain text run
+    _pattern_special = re.compile(
+        "[%s]"
+        % re.escape(
+            "".join(list(basic.keys()) + [ctrl.NUL, ctrl.DEL, ctrl.ESC, ctrl.CSI])
+        )
+    )
+
     def __init__(self, stash, main_screen, debug=False):
         self.consume_handlers = (self._stream, self._escape, self._arguments)
 
@@ -405,6 +413,13 @@ class ShStream(object):
         except Exception as e:  # TODO: better error handling
             self.reset()
 
+    def draw_text(self, text):
+        """Draws a run of plain characters in the default ``"stream"`` state.
+
+        :param str text: characters without any control characters.
+        """
+        self.dispatch("draw_text", text, reset=False)
+
     def feed(self, chars, render_it=True, no_wait=False):
         """Consumes a string and advance the state as necessary.
 
@@ -415,8 +430,19 @@ class ShStream(object):
             chars = chars.decode("utf-8", errors="ignore")
 
         with self.main_screen.acquire_lock():
-            for char in chars:
-                self.consume(char)
+            pos, length = 0, len(chars)
+            while pos < length:
+                if self.state == self.STATE_STREAM:
+                    # Draw everything up to the next control character at once
+                    m = self._pattern_special.search(chars, pos)
+                    end = m.start() if m else length
+                    if end > pos:
+                        self.draw_text(chars[pos:end])
+                        pos = end
+                        continue
+                # Control characters and escape sequences
+                self.consume(chars[pos])
+                pos += 1
 
         if render_it:
             self.stash.renderer.render(no_wait=no_wait)
@@ -43,6 +43,10 @@ class ShState(object):
         self.sys_stdout__ = self.sys_stdout = sys_stdout or sys.stdout
         self.sys_stderr__ = self.sys_stderr = sys_stderr or sys.stderr
         self.sys_path = sys_path or sys.path[:]
+        # arguments of the running script, see ShArgvWrapper
+        self.sys_argv = None
+        # timeout of the reads of the terminal, see ShIO.settimeout
+        self.stdin_timeout = None
 
         self.temporary_environ = {}
 
@@ -139,6 +143,16 @@ class ShState(object):
         )
 
 
+class _ShThreadLocal(threading.local):
+    #: State of the worker thread, None in any other thread
+    state = None
+
+
+#: Bound to the state of each worker thread once it starts running, which is
+#: cheaper to look up than checking the class of the current thread.
+thread_local = _ShThreadLocal()
+
+
 class ShWorkerRegistry(object):
     """Bookkeeping for all worker threads (both foreground and background).
     This is useful to provide an overview of all running threads.
@@ -216,6 +230,7 @@ class ShBaseThread(threading.Thread):
         is_background=False,
         environ={},
         cwd=None,
+        is_pipe_stage=False,
     ):
         super(ShBaseThread, self).__init__(
             group=None, target=target, name="_shthread", args=(), kwargs=None
@@ -245,7 +260,18 @@ class ShBaseThread(threading.Thread):
         self.killer = 0
         self.child_thread = None
 
-        self.set_background(is_background)
+        # A pipe stage runs side by side with the other stages of its pipe
+        # sequence. It is owned by the worker running the sequence and is
+        # not linked as that worker's child thread.
+        self.is_pipe_stage = is_pipe_stage
+        if is_pipe_stage:
+            self.is_background = False
+        else:
+            self.set_background(is_background)
+
+    def run(self):
+        thread_local.state = self.state
+        super(ShBaseThread, self).run()
 
     def __repr__(self):
         command_str = str(self.command)
@@ -299,7 +325,7 @@ class ShBaseThread(threading.Thread):
         it self from parent if exists.
         """
         self.registry.remove_worker(self)
-        if not self.is_background:
+        if not self.is_background and not self.is_pipe_stage:
             assert self.parent.child_thread is self
             self.parent.child_thread = None
 
@@ -328,6 +354,7 @@ class ShTracedThread(ShBaseThread):
         is_background=False,
         environ={},
         cwd=None,
+        is_pipe_stage=False,
     ):
         super(ShTracedThread, self).__init__(
             registry,
@@ -337,6 +364,7 @@ class ShTracedThread(ShBaseThread):
             is_background=is_background,
             environ=environ,
             cwd=cwd,
+            is_pipe_stage=is_pipe_stage,
         )
 
     def start(self):
@@ -383,6 +411,7 @@ class ShCtypesThread(ShBaseThread):
         is_background=False,
         environ={},
         cwd=None,
+        is_pipe_stage=False,
     ):
         super(ShCtypesThread, self).__init__(
             registry,
@@ -392,6 +421,7 @@ class ShCtypesThread(ShBaseThread):
             is_background=is_background,
             environ=environ,
             cwd=cwd,
+            is_pipe_stage=is_pipe_stage,
         )
 
     def _async_raise(self):
@@ -2,6 +2,8 @@
 """tests for the 'cat' command."""
 
 import os
+import shutil
+import tempfile
 from unittest import expectedFailure
 
 from stash.tests.stashtest import StashTestCase
@@ -66,3 +68,32 @@ class CatTests(StashTestCase):
         """test 'cat <some file containing non-ascii characters.>'."""
         output = self.run_command("cat nonascii.txt", exitcode=0).replace("\n", "")
         self.assertEqual(output, "äöüß")
+
+    def test_number_and_squeeze(self):
+        """test 'cat -n' and 'cat -s'."""
+        output = self.run_command("cat -n -s blanks.txt", exitcode=0)
+        self.assertEqual(output, "     1\ta\n     2\t\n     3\tb\tc\n")
+        output = self.run_command("cat blanks.txt | cat -s", exitcode=0)
+        self.assertEqual(output, "a\n\nb\tc\n")
+
+    def test_show_all(self):
+        """test 'cat -A'."""
+        output = self.run_command("cat -A nonascii.txt", exitcode=0)
+        self.assertEqual(output, "M-CM-$M-CM-6M-CM-<M-CM-^_$\n")
+        output = self.run_command("cat -A blanks.txt", exitcode=0)
+        self.assertEqual(output, "a$\n$\n$\n$\nb^Ic$\n")
+
+    def test_binary_redirect(self):
+        """binary content is copied unchanged to a file"""
+        tempdir = tempfile.mkdtemp()
+        try:
+            src = os.path.join(tempdir, "in.bin")
+            dst = os.path.join(tempdir, "out.bin")
+            content = bytes(bytearray(range(256))) * 1000
+            with open(src, "wb") as fout:
+                fout.write(content)
+            self.run_command("cat '{}' '{}' > '{}'".format(src, src, dst), exitcode=0)
+            with open(dst, "rb") as fin:
+                self.assertEqual(fin.read(), content * 2)
+        finally:
+            shutil.rmtree(tempdir)
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""tests for the 'du' command."""
+
+import os
+import unittest
+
+from stash.tests.stashtest import StashTempDirTestCase
+
+
+class DuTests(StashTempDirTestCase):
+    """Tests for the 'du' command."""
+
+    def setUp(self):
+        StashTempDirTestCase.setUp(self)
+        for path, size in (
+            ("top/a.txt", 100),
+            ("top/big/b.bin", 2048),
+            ("top/big/deeper/c.bin", 1024),
+            ("top/small/d.txt", 10),
+            ("top/small/e.log", 5),
+        ):
+            self.write_file(path, b"x" * size)
+
+    def test_help(self):
+        """test 'du --help'."""
+        output = self.run_command("du --help", exitcode=0)
+        self.assertIn("--apparent-size", output)
+
+    def test_tree(self):
+        """subdirectories are listed before their parents"""
+        output = self.run_command("du --apparent-size top", exitcode=0)
+        self.assertEqual(
+            output,
+            "1.0KiB   top/big/deeper\n"
+            "3.0KiB   top/big\n"
+            "15.0B    top/small\n"
+            "3.1KiB   top\n",
+        )
+
+    def test_max_depth_and_summarize(self):
+        """--max-depth and -s"""
+        output = self.run_command("du --apparent-size -d 1 -j 1 top", exitcode=0)
+        self.assertEqual(output, "3.0KiB   top/big\n15.0B    top/small\n3.1KiB   top\n")
+        output = self.run_command("du --apparent-size -s top top/small", exitcode=0)
+        self.assertEqual(output, "3.1KiB   top\n15.0B    top/small\n")
+
+    def test_exclude(self):
+        """--exclude leaves out files and whole directories"""
+        output = self.run_command(
+            "du --apparent-size -s --exclude '*.bin' top/big top/small", exitcode=0
+        )
+        self.assertEqual(output, "0.0B     top/big\n15.0B    top/small\n")
+        output = self.run_command("du --apparent-size --exclude big top", exitcode=0)
+        self.assertEqual(output, "15.0B    top/small\n115.0B   top\n")
+
+    def test_top(self):
+        """--top lists the largest directories first"""
+        output = self.run_command("du --apparent-size --top 2 top", exitcode=0)
+        self.assertEqual(output, "3.1KiB   top\n3.0KiB   top/big\n")
+
+    @unittest.skipUnless(hasattr(os, "link"), "no hard links")
+    def test_hard_links(self):
+        """hard linked files are counted once"""
+        os.link(
+            os.path.join(self.tempdir, "top/big/b.bin"),
+            os.path.join(self.tempdir, "top/small/b.bin"),
+        )
+        output = self.run_command("du --apparent-size -s top", exitcode=0)
+        self.assertEqual(output, "3.1KiB   top\n")
+
+    def test_file_and_missing(self):
+        """a file argument and a missing one"""
+        output = self.run_command("du --apparent-size top/a.txt missing", exitcode=1)
+        self.assertIn("100.0B   top/a.txt\n", output)
+        self.assertIn("missing", output)
+
+    def test_deep_tree(self):
+        """a deep tree is sized the same with and without parallel jobs"""
+        path = os.path.join(self.tempdir, "deep")
+        for _ in range(41):
+            os.mkdir(path)
+            with open(os.path.join(path, "f"), "wb") as outs:
+                outs.write(b"x")
+            path = os.path.join(path, "d")
+        output = self.run_command("du --apparent-size -j 1 deep", exitcode=0)
+        lines = output.splitlines()
+        self.assertEqual(len(lines), 41)
+        self.assertEqual(lines[0], "1.0B     deep" + "/d" * 40)
+        self.assertEqual(lines[-1], "41.0B    deep")
+        parallel = self.run_command("du --apparent-size -j 4 deep", exitcode=0)
+        self.assertEqual(parallel, output)
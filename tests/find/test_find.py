@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""tests for the 'find' command."""
+
+import os
+import time
+
+from six import StringIO
+
+from stash.tests.stashtest import StashTempDirTestCase
+
+
+class FindTests(StashTempDirTestCase):
+    """Tests for the 'find' command."""
+
+    def setUp(self):
+        StashTempDirTestCase.setUp(self)
+        old = time.time() - 10 * 86400
+        for path, size in (
+            ("a.txt", 10),
+            ("b.log", 2000),
+            ("sub/c.txt", 0),
+            ("sub/deeper/d.txt", 600),
+            ("skip/e.txt", 1),
+        ):
+            fp = self.write_file(path, b"x" * size)
+            if path != "b.log":
+                os.utime(fp, (old, old))
+
+    def test_help(self):
+        """test 'find --help'."""
+        output = self.run_command("find --help", exitcode=0)
+        self.assertIn("-print0", output)
+
+    def test_files(self):
+        """files are listed by default, sorted and depth-first"""
+        output = self.run_command("find .", exitcode=0)
+        self.assertEqual(
+            output,
+            "./a.txt\n./b.log\n./skip/e.txt\n./sub/c.txt\n./sub/deeper/d.txt\n",
+        )
+
+    def test_type_and_name(self):
+        """-type and -name"""
+        output = self.run_command("find . -type d", exitcode=0)
+        self.assertEqual(output, "./skip/\n./sub/\n./sub/deeper/\n")
+        output = self.run_command("find . -name '*.txt' -type a", exitcode=0)
+        self.assertEqual(
+            output, "./a.txt\n./skip/e.txt\n./sub/c.txt\n./sub/deeper/d.txt\n"
+        )
+
+    def test_depth(self):
+        """-mindepth and -maxdepth"""
+        output = self.run_command("find . -maxdepth 0", exitcode=0)
+        self.assertEqual(output, "./a.txt\n./b.log\n")
+        output = self.run_command("find . -mindepth 1 -maxdepth 1", exitcode=0)
+        self.assertEqual(output, "./skip/e.txt\n./sub/c.txt\n")
+
+    def test_size(self):
+        """-size with units and signs"""
+        output = self.run_command("find . -size +1k", exitcode=0)
+        self.assertEqual(output, "./b.log\n")
+        output = self.run_command("find . -size -1", exitcode=0)
+        self.assertEqual(output, "./sub/c.txt\n")
+        output = self.run_command("find . -size 2", exitcode=0)
+        self.assertEqual(output, "./sub/deeper/d.txt\n")
+        output = self.run_command("find . -size 10c", exitcode=0)
+        self.assertEqual(output, "./a.txt\n")
+
+    def test_mtime_and_newer(self):
+        """-mtime and -newer"""
+        output = self.run_command("find . -mtime -1", exitcode=0)
+        self.assertEqual(output, "./b.log\n")
+        output = self.run_command("find . -newer a.txt", exitcode=0)
+        self.assertEqual(output, "./b.log\n")
+        self.run_command("find . -newer missing.txt", exitcode=1)
+
+    def test_prune(self):
+        """-prune skips directories and their content"""
+        output = self.run_command("find . -prune skip -prune deep* -type a", exitcode=0)
+        self.assertEqual(output, "./a.txt\n./b.log\n./sub/\n./sub/c.txt\n")
+
+    def test_print0(self):
+        """-print0 separates the results by null characters"""
+        output = self.run_command("find sub -print0", exitcode=0)
+        self.assertEqual(output, "sub/c.txt\0sub/deeper/d.txt\0")
+
+    def test_file_argument(self):
+        """a file argument is tested itself, a missing one is an error"""
+        output = self.run_command("find a.txt", exitcode=0)
+        self.assertEqual(output, "a.txt\n")
+        output = self.run_command("find missing a.txt", exitcode=1)
+        self.assertIn("a.txt\n", output)
+        self.assertIn("missing", output)
+
+    def test_first_result_right_away(self):
+        """the first result is written before the search goes on"""
+
+        class RecordingIO(StringIO):
+            def __init__(self):
+                StringIO.__init__(self)
+                self.writes = []
+
+            def write(self, s):
+                self.writes.append(s)
+                return StringIO.write(self, s)
+
+        outs = RecordingIO()
+        self.stash("find . -name '*.txt'", persistent_level=1, final_outs=outs)
+        self.assertEqual(outs.writes[0], "./a.txt\n")
+        self.assertEqual(
+            outs.getvalue(),
+            "./a.txt\n./skip/e.txt\n./sub/c.txt\n./sub/deeper/d.txt\n",
+        )
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""tests for the 'grep' command."""
+
+import random
+import re
+
+from stash.tests.stashtest import StashTempDirTestCase, StashTestCase
+
+
+class GrepTests(StashTestCase):
+    """Tests for the 'grep' command."""
+
+    def setUp(self):
+        """setup the tests"""
+        self.cwd = self.get_data_path()
+        StashTestCase.setUp(self)
+        self.stash("stashconf style enable_styles 0")
+
+    def test_help(self):
+        """test 'grep --help'."""
+        output = self.run_command("grep --help", exitcode=0)
+        self.assertIn("--recursive", output)
+
+    def test_literal(self):
+        """a literal pattern in a file"""
+        output = self.run_command("grep alpha tree/a.txt", exitcode=0)
+        self.assertEqual(
+            output, "tree/a.txt: 1: alpha one\ntree/a.txt: 4: alpha four\n"
+        )
+
+    def test_regex(self):
+        """a regular expression with anchors and non-ASCII text"""
+        output = self.run_command("grep '^gam|^bet' tree/a.txt", exitcode=0)
+        self.assertEqual(
+            output, "tree/a.txt: 2: beta two\ntree/a.txt: 3: gamma three\n"
+        )
+        output = self.run_command("grep 'w.rld$' tree/sub/unicode.txt", exitcode=0)
+        self.assertEqual(output, "tree/sub/unicode.txt: 1: héllo wörld\n")
+
+    def test_recursive(self):
+        """directories are only searched with -r, in a fixed order"""
+        output = self.run_command("grep -i alpha tree", exitcode=0)
+        self.assertEqual(output, "")
+        output = self.run_command("grep -r -i alpha tree", exitcode=0)
+        self.assertEqual(
+            output,
+            "tree/a.txt: 1: alpha one\n"
+            "tree/a.txt: 4: alpha four\n"
+            "tree/sub/b.txt: 2: ALPHA upper\n"
+            "tree/sub/deeper/c.txt: 1: deep alpha\n"
+            "tree/sub/deeper/c.txt: 2: last line without newline alpha\n",
+        )
+
+    def test_invert_and_count(self):
+        """-v and -c"""
+        output = self.run_command("grep -v alpha tree/sub/deeper/c.txt", exitcode=0)
+        self.assertEqual(output, "")
+        output = self.run_command("grep -v a tree/sub/b.txt tree/a.txt", exitcode=0)
+        self.assertEqual(output, "tree/sub/b.txt: 2: ALPHA upper\n")
+        output = self.run_command("grep -r -c -v alpha tree", exitcode=0)
+        self.assertEqual(
+            output,
+            "     2 tree/a.txt\n     2 tree/sub/b.txt\n     2 tree/sub/unicode.txt\n",
+        )
+
+    def test_stdin(self):
+        """lines from the standard input"""
+        output = self.run_command("cat tree/a.txt | grep 'a t'", exitcode=0)
+        self.assertEqual(output, "2: beta two\n3: gamma three\n")
+
+    def test_missing_file(self):
+        """a missing file is reported and the others are still searched"""
+        output = self.run_command("grep beta missing.txt tree/a.txt", exitcode=1)
+        self.assertIn("tree/a.txt: 2: beta two\n", output)
+        self.assertIn("missing.txt", output)
+
+    def test_highlight_parallel(self):
+        """matches are colored when files are searched in parallel"""
+        self.stash("stashconf style enable_styles 1")
+        self.stash("clear")
+        self.stash("grep -r -j 4 alpha tree", persistent_level=1)
+        screen = self.stash.main_screen
+        red = "".join(
+            c.data for c in screen._buffer.chars(0, screen.text_length) if c.fg == "red"
+        )
+        self.assertEqual(red, "alpha" * 4)
+
+    def test_many_files(self):
+        """more files than are searched ahead keep their order"""
+        output = self.run_command("grep -j 2 beta " + " tree/a.txt" * 20, exitcode=0)
+        self.assertEqual(output, "tree/a.txt: 2: beta two\n" * 20)
+
+
+class GrepChunkTests(StashTempDirTestCase):
+    """Tests for searching files larger than a chunk"""
+
+    def setUp(self):
+        StashTempDirTestCase.setUp(self)
+        self.stash("stashconf style enable_styles 0")
+
+    def test_crlf(self):
+        """'$' matches at the end of the lines of a CRLF file, as on stdin"""
+        self.write_file("crlf.txt", b"foo\r\nbar foo\r\nfoo bar\r\nold mac\rfoo")
+        output = self.run_command("grep 'foo$' crlf.txt", exitcode=0)
+        self.assertEqual(
+            output, "crlf.txt: 1: foo\ncrlf.txt: 2: bar foo\ncrlf.txt: 5: foo\n"
+        )
+        output = self.run_command("grep -c 'foo$' crlf.txt", exitcode=0)
+        self.assertEqual(output, "     3 crlf.txt\n")
+        self.write_file("crlf2.txt", b"foo\r\nbar foo\r\nfoo bar\r\n")
+        output = self.run_command("cat crlf2.txt | grep 'foo$'", exitcode=0)
+        self.assertEqual(output, "1: foo\n2: bar foo\n")
+
+    def test_same_as_line_by_line(self):
+        """the chunked search finds the same lines as a line by line search"""
+        rnd = random.Random(3)
+        words = ["foo", "bar", "baz", "qux", "quux", "corge", "fööbar", ""]
+        fnames = []
+        for i in range(2):
+            lines = [
+                " ".join(rnd.choice(words) for _ in range(rnd.randint(0, 10)))
+                for _ in range(rnd.randint(60000, 90000))
+            ]
+            fname = "file%d.txt" % i
+            self.write_file(fname, "\n".join(lines).encode("utf-8"))
+            fnames.append((fname, lines))
+        for args, pattern in [
+            ("", "bar"),
+            ("-v", "bar"),
+            ("-j 1 -v", "bar"),
+            ("", "ba[rz]$"),
+            ("-i", "FOO"),
+        ]:
+            expected = []
+            regex = re.compile(pattern, re.IGNORECASE if "-i" in args else 0)
+            for fname, lines in fnames:
+                for lineno, line in enumerate(lines, 1):
+                    if bool(regex.search(line)) != ("-v" in args):
+                        expected.append("%s: %d: %s\n" % (fname, lineno, line.rstrip()))
+            output = self.run_command(
+                "grep {} '{}' {}".format(args, pattern, " ".join(f for f, _ in fnames)),
+                exitcode=0,
+            )
+            self.assertEqual(output, "".join(expected), (args, pattern))
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""tests for the caches of pip"""
+
+import os
+import shutil
+import tempfile
+import time
+
+import requests
+
+from stash.tests.stashtest import StashTestCase
+from stash.tests.pip.test_index import FakeIndex
+
+
+class MetadataCacheTests(StashTestCase):
+    """tests for the metadata cache of pip."""
+
+    def setUp(self):
+        StashTestCase.setUp(self)
+        self.index = FakeIndex({("alpha", "1.0"): [], ("beta", "1.0"): ["alpha"]})
+        self.cache_dir = tempfile.mkdtemp()
+        self.session = requests.Session()
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.cache_dir)
+        StashTestCase.tearDown(self)
+
+    def cache(self, **kwargs):
+        from stashutils.pipcache import MetadataCache
+
+        return MetadataCache(self.cache_dir, **kwargs)
+
+    def get(self, cache, name):
+        return cache.get_json(
+            self.session, "{}/pypi/{}/json".format(self.index.url, name)
+        )
+
+    def test_fresh(self):
+        """a fresh entry is used without asking the index"""
+        cache = self.cache()
+        data = self.get(cache, "alpha")
+        self.assertEqual(data["info"]["name"], "alpha")
+        self.assertEqual(self.get(self.cache(), "alpha"), data)
+        self.assertEqual(self.index.statuses, [200])
+
+    def test_revalidate(self):
+        """a stale entry is revalidated with its ETag"""
+        cache = self.cache(ttl=0)
+        data = self.get(cache, "alpha")
+        self.assertEqual(self.get(cache, "alpha"), data)
+        self.assertEqual(self.index.statuses, [200, 304])
+
+    def test_missing(self):
+        """what the index does not have is None and is not cached"""
+        cache = self.cache()
+        self.assertIsNone(self.get(cache, "gamma"))
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+    def test_offline(self):
+        """offline, the entries are used however old, and misses raise"""
+        from stashutils.pipcache import CacheMiss
+
+        self.get(self.cache(ttl=0), "alpha")
+        cache = self.cache(ttl=0, offline=True)
+        self.assertEqual(self.get(cache, "alpha")["info"]["name"], "alpha")
+        self.assertRaises(CacheMiss, self.get, cache, "beta")
+        self.assertEqual(self.index.statuses, [200])
+
+    def test_unreachable(self):
+        """a stale entry is used if the index can not be reached"""
+        cache = self.cache(ttl=0)
+        data = self.get(cache, "alpha")
+        self.index.close()
+        self.assertEqual(self.get(cache, "alpha"), data)
+
+    def test_evict(self):
+        """the least recently used entries are evicted first"""
+        cache = self.cache()
+        self.get(cache, "alpha")
+        alpha_file = cache.cache_file("{}/pypi/alpha/json".format(self.index.url))
+        size = os.path.getsize(alpha_file)
+        past = time.time() - 100
+        os.utime(alpha_file, (past, past))
+        # room for either entry, not both
+        cache.max_size = size + size // 2
+        self.get(cache, "beta")
+        self.assertFalse(os.path.exists(alpha_file))
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+
+class ArtifactCacheTests(StashTestCase):
+    """tests for the archive cache of pip."""
+
+    def setUp(self):
+        StashTestCase.setUp(self)
+        self.index = FakeIndex({("alpha", "1.0"): [], ("beta", "1.0"): ["alpha"]})
+        self.cache_dir = tempfile.mkdtemp()
+        self.dest_dir = tempfile.mkdtemp()
+        self.session = requests.Session()
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.cache_dir)
+        shutil.rmtree(self.dest_dir)
+        StashTestCase.tearDown(self)
+
+    def cache(self, **kwargs):
+        from stashutils.pipcache import ArtifactCache
+
+        return ArtifactCache(self.cache_dir, **kwargs)
+
+    def fetch(self, cache, filename, sha256=None):
+        dest = os.path.join(self.dest_dir, filename)
+        url = "{}/files/{}".format(self.index.url, filename)
+        cached = cache.fetch(self.session, url, dest, sha256=sha256)
+        with open(dest, "rb") as f:
+            self.assertEqual(f.read(), self.index.files[filename])
+        return cached
+
+    def archives(self):
+        return [n for n in os.listdir(self.cache_dir) if n.endswith(".archive")]
+
+    def test_fetch(self):
+        """an archive is downloaded once, by its sha256 or by its URL"""
+        filename = "alpha-1.0-py2.py3-none-any.whl"
+        sha256 = self.index.digests[filename]
+        cache = self.cache()
+        self.assertFalse(self.fetch(cache, filename, sha256))
+        self.assertTrue(self.fetch(cache, filename, sha256))
+        self.assertTrue(self.fetch(cache, filename))
+        self.assertEqual(self.index.statuses, [200])
+        self.assertEqual(self.archives(), [sha256 + ".archive"])
+
+    def test_hash_mismatch(self):
+        """a download without the sha256 given is left nowhere"""
+        from stashutils.pipcache import HashMismatch
+
+        filename = "alpha-1.0-py2.py3-none-any.whl"
+        cache = self.cache()
+        self.assertRaises(HashMismatch, self.fetch, cache, filename, "0" * 64)
+        self.assertEqual(os.listdir(self.cache_dir), [])
+        self.assertEqual(os.listdir(self.dest_dir), [])
+
+    def test_offline(self):
+        """offline, only the cached archives are there"""
+        from stashutils.pipcache import CacheMiss
+
+        filename = "alpha-1.0-py2.py3-none-any.whl"
+        self.fetch(self.cache(), filename)
+        cache = self.cache(offline=True)
+        self.assertTrue(self.fetch(cache, filename))
+        self.assertRaises(CacheMiss, self.fetch, cache, "beta-1.0-py2.py3-none-any.whl")
+
+    def test_evict(self):
+        """the least recently used archives are evicted first"""
+        alpha = "alpha-1.0-py2.py3-none-any.whl"
+        beta = "beta-1.0-py2.py3-none-any.whl"
+        cache = self.cache()
+        self.fetch(cache, alpha)
+        alpha_file = cache.archive_file(self.index.digests[alpha])
+        past = time.time() - 100
+        os.utime(alpha_file, (past, past))
+        # room for either archive, not both
+        cache.max_size = os.path.getsize(alpha_file) * 3 // 2
+        self.fetch(cache, beta)
+        self.assertEqual(self.archives(), [self.index.digests[beta] + ".archive"])
+        # alpha is downloaded again
+        self.assertFalse(self.fetch(cache, alpha))
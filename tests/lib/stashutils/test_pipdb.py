@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""tests for the database of the packages pip installed"""
+
+import json
+import os
+import shutil
+import tempfile
+
+from stash.tests.stashtest import StashTestCase
+
+
+class PackageDatabaseTests(StashTestCase):
+    """tests for stashutils.pipdb.PackageDatabase"""
+
+    def setUp(self):
+        StashTestCase.setUp(self)
+        self.site_packages = tempfile.mkdtemp()
+        self.databases = []
+
+    def tearDown(self):
+        for db in self.databases:
+            db.close()
+        shutil.rmtree(self.site_packages)
+        StashTestCase.tearDown(self)
+
+    def open(self):
+        from stashutils.pipdb import PackageDatabase
+
+        db = PackageDatabase(self.site_packages)
+        self.databases.append(db)
+        return db
+
+    def test_add(self):
+        """a package added is found again, however its name is cased"""
+        db = self.open()
+        db.add("Alpha", "pypi", "1.0", "the first", ["/a/alpha"], ["beta"])
+        db.add("beta", "pypi", "2.0", "the second", ["/a/beta"], [])
+        db = self.open()
+        self.assertEqual(db.names(), ["Alpha", "beta"])
+        self.assertTrue(db.exists("alpha"))
+        self.assertFalse(db.exists("gamma"))
+        self.assertEqual(
+            db.get("ALPHA"), {"url": "pypi", "version": "1.0", "summary": "the first"}
+        )
+        self.assertEqual(db.files("alpha"), ["/a/alpha"])
+        self.assertEqual(db.dependencies("alpha"), set(["beta"]))
+        self.assertEqual(db.dependencies("beta"), set())
+        self.assertIsNone(db.get("gamma"))
+
+    def test_remove(self):
+        """a package removed leaves nothing behind"""
+        db = self.open()
+        db.add("alpha", "pypi", "1.0", "", ["/a/alpha"], ["beta"])
+        db.set_info("alpha", {"requires_dist": ["beta"]})
+        db.remove("Alpha")
+        self.assertEqual(db.names(), [])
+        self.assertEqual(db.files("alpha"), [])
+        self.assertEqual(db.dependents("beta"), set())
+        self.assertEqual(db.required_by("beta"), [])
+
+    def test_dependents(self):
+        """the packages a package was installed for are found by their index"""
+        db = self.open()
+        db.add("alpha", "pypi", "1.0", "", [], ["beta", "gamma"])
+        db.add("gamma", "pypi", "1.0", "", [], ["beta"])
+        db.add("beta", "pypi", "1.0", "", [], [])
+        self.assertEqual(db.dependents("Beta"), set(["alpha", "gamma"]))
+        self.assertEqual(db.dependents("alpha"), set())
+        self.assertEqual(db.all_dependencies(), set(["beta", "gamma"]))
+        self.assertEqual(db.all_dependencies(exclude=["alpha"]), set(["beta"]))
+
+    def test_owners(self):
+        """the packages which installed a file are known"""
+        db = self.open()
+        db.add("alpha", "pypi", "1.0", "", ["/a/shared", "/a/alpha"], [])
+        db.add("beta", "pypi", "1.0", "", ["/a/shared"], [])
+        self.assertEqual(db.owners("/a/shared"), set(["alpha", "beta"]))
+        self.assertEqual(db.owners("/a/alpha"), set(["alpha"]))
+        self.assertEqual(db.owners("/a/gamma"), set())
+
+    def test_requirements(self):
+        """the requirements are read from the info, without the markers"""
+        db = self.open()
+        db.add("alpha", "pypi", "1.0", "", [], [])
+        db.add("gamma", "pypi", "1.0", "", [], [])
+        info = {
+            "name": "alpha",
+            "requires_dist": ["beta (>=1.0)", 'delta ; extra == "more"'],
+        }
+        db.set_info("alpha", info)
+        db.set_info("gamma", {"name": "gamma", "requires_dist": None})
+        self.assertEqual(db.get_info("alpha"), info)
+        self.assertEqual(db.requirements("alpha"), ["beta"])
+        self.assertEqual(db.requirements("gamma"), [])
+        self.assertEqual(db.required_by("beta"), ["alpha"])
+        self.assertIsNone(db.get_info("beta"))
+
+    def test_migrate(self):
+        """the former package file and info files are read when it is created"""
+        with open(os.path.join(self.site_packages, ".pypi_packages"), "w") as f:
+            f.write(
+                "[Alpha]\nurl = pypi\nversion = 1.0\nsummary = 100% alpha\n"
+                "files = /a/alpha,/a/alpha.py\ndependency = beta\n\n"
+                "[beta]\nurl = pypi\nversion = 2.0\nsummary = \n"
+                "files = /a/beta\ndependency = \n\n"
+                "[manual]\nurl = https://example.com\nversion = \nsummary = \n"
+                "files = /a/manual\n"
+            )
+        info_dir = os.path.join(self.site_packages, ".package_info")
+        os.mkdir(info_dir)
+        with open(os.path.join(info_dir, "Alpha.json"), "w") as f:
+            json.dump({"name": "Alpha", "requires_dist": ["beta"]}, f)
+        db = self.open()
+        self.assertEqual(db.names(), ["Alpha", "beta", "manual"])
+        self.assertEqual(db.get("alpha")["summary"], "100% alpha")
+        self.assertEqual(db.files("alpha"), ["/a/alpha", "/a/alpha.py"])
+        self.assertEqual(db.dependencies("alpha"), set(["beta"]))
+        self.assertEqual(db.dependencies("beta"), set())
+        self.assertIsNone(db.dependencies("manual"))
+        self.assertEqual(db.required_by("beta"), ["Alpha"])
+        # the migration is done once
+        db.remove("beta")
+        self.assertEqual(self.open().names(), ["Alpha", "manual"])
+
+    def test_rebuild(self):
+        """the requirements are worked out again from the info kept"""
+        db = self.open()
+        db.add("alpha", "pypi", "1.0", "", [], [])
+        db.set_info("alpha", {"requires_dist": ["beta"]})
+        db.connection.execute("DELETE FROM requirements")
+        db.rebuild_requirements()
+        self.assertEqual(db.requirements("alpha"), ["beta"])
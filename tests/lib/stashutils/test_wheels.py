@@ -1,11 +1,55 @@
 # -*- coding: utf-8 -*-
 """tests for the wheel-support"""
 
+import base64
+import hashlib
+import os
+import shutil
+import tempfile
+import zipfile
+
 import six
 
 from stash.tests.stashtest import StashTestCase
 
 
+def write_wheel(path, members, corrupt=()):
+    """
+    Write a wheel of the package 'pkg', with a RECORD of the members.
+    :param members: the paths and contents of the members
+    :type members: list of (str, str)
+    :param corrupt: paths of the members whose RECORD hash is wrong
+    :type corrupt: list of str
+    """
+    distinfo = "pkg-1.0.dist-info"
+    members = list(members) + [
+        (
+            distinfo + "/METADATA",
+            "Metadata-Version: 2.1\nName: pkg\nVersion: 1.0\n"
+            'Requires-Dist: dep\nRequires-Dist: more ; extra == "more"\n',
+        ),
+        (distinfo + "/WHEEL", "Wheel-Version: 1.0\nGenerator: test\n"),
+        (distinfo + "/top_level.txt", "pkg\nsingle\n"),
+    ]
+    record = []
+    with zipfile.ZipFile(path, "w") as zf:
+        for name, content in members:
+            data = content.encode("utf-8")
+            if name in corrupt:
+                digest = hashlib.sha256(b"something else").digest()
+            else:
+                digest = hashlib.sha256(data).digest()
+            record.append(
+                "{},sha256={},{}\n".format(
+                    name,
+                    base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii"),
+                    len(data),
+                )
+            )
+            zf.writestr(name, data)
+        zf.writestr(distinfo + "/RECORD", "".join(record) + distinfo + "/RECORD,,\n")
+
+
 class WheelsTests(StashTestCase):
     """tests fpr the wheel-support."""
 
@@ -96,3 +140,104 @@ class WheelsTests(StashTestCase):
         expected = "somepackage-1.0.0-py27-none-any.whl"
         result = wheels.generate_filename(**data)
         self.assertEqual(result, expected)
+
+
+class WheelInstallTests(StashTestCase):
+    """tests for installing wheels."""
+
+    members = [
+        ("pkg/__init__.py", "VERSION = '1.0'\n"),
+        ("pkg/sub/__init__.py", ""),
+        ("pkg/sub/module.py", "X = 1\n"),
+        ("single.py", "Y = 2\n"),
+    ]
+
+    def setUp(self):
+        StashTestCase.setUp(self)
+        self.tempdir = tempfile.mkdtemp()
+        self.wheel_path = os.path.join(self.tempdir, "pkg-1.0-py2.py3-none-any.whl")
+        self.site_packages = os.path.join(self.tempdir, "site-packages")
+        os.mkdir(self.site_packages)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+        StashTestCase.tearDown(self)
+
+    def install(self, **kwargs):
+        from stashutils import wheels
+
+        wheel = wheels.Wheel(self.wheel_path, extras=["more"], **kwargs)
+        return wheel.install(self.site_packages)
+
+    def assertInstalled(self):
+        for name, content in self.members:
+            path = os.path.join(self.site_packages, *name.split("/"))
+            with open(path, "r") as f:
+                self.assertEqual(f.read(), content)
+
+    def test_install(self):
+        """the files are installed where top_level.txt says"""
+        write_wheel(self.wheel_path, self.members)
+        files_installed, dependencies = self.install()
+        self.assertEqual(
+            files_installed,
+            [
+                os.path.join(self.site_packages, "pkg"),
+                os.path.join(self.site_packages, "single.py"),
+            ],
+        )
+        self.assertEqual(dependencies, ["dep", "more"])
+        self.assertInstalled()
+        # nothing but what was installed, no temporary files
+        self.assertEqual(sorted(os.listdir(self.site_packages)), ["pkg", "single.py"])
+
+    def test_reinstall(self):
+        """a package installed again replaces the former one"""
+        write_wheel(self.wheel_path, self.members)
+        self.install()
+        stale = os.path.join(self.site_packages, "pkg", "stale.py")
+        with open(stale, "w") as f:
+            f.write("")
+        self.install()
+        self.assertFalse(os.path.exists(stale))
+        self.assertInstalled()
+
+    def test_hash_mismatch(self):
+        """a file without the hash its RECORD says is not installed"""
+        from stashutils import wheels
+
+        write_wheel(self.wheel_path, self.members, corrupt=["pkg/sub/module.py"])
+        self.assertRaises(wheels.WheelError, self.install)
+        for root, dirs, files in os.walk(self.site_packages):
+            self.assertEqual(files, [])
+
+    def test_hash_mismatch_upgrade(self):
+        """an upgrade with a corrupt file leaves the former install as it is"""
+        from stashutils import wheels
+
+        write_wheel(self.wheel_path, self.members)
+        self.install()
+        upgrade = [(name, "# upgraded\n") for name, _ in self.members]
+        # the packages before the corrupt file are extracted first
+        write_wheel(self.wheel_path, upgrade, corrupt=["single.py"])
+        self.assertRaises(wheels.WheelError, self.install)
+        self.assertInstalled()
+        self.assertEqual(sorted(os.listdir(self.site_packages)), ["pkg", "single.py"])
+
+    def test_parallel(self):
+        """the files of a large wheel are written by several threads"""
+        from stashutils import wheels
+
+        members = [
+            ("pkg/module{}.py".format(i), "X = {!r}\n".format("x" * 4096 * i))
+            for i in range(32)
+        ]
+        self.members = members + [("single.py", "")]
+        write_wheel(self.wheel_path, self.members)
+        old_size = wheels.PARALLEL_EXTRACT_SIZE
+        wheels.PARALLEL_EXTRACT_SIZE = 1024
+        try:
+            self.install(jobs=4)
+        finally:
+            wheels.PARALLEL_EXTRACT_SIZE = old_size
+        self.assertInstalled()
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""tests for the lazy loading of the libraries"""
+
+import sys
+import types
+
+from stash.system.shcommon import ShLazyModule
+from stash.tests.stashtest import StashTestCase
+
+
+class LibLoadingTests(StashTestCase):
+    """Tests for loading the libraries on first access"""
+
+    def test_loaded_on_access(self):
+        """a library is only loaded when it is used"""
+        placeholder = sys.modules["libversion"]
+        self.assertIsInstance(placeholder, ShLazyModule)
+        self.assertNotIn("libversion", self.stash.__dict__)
+        self.assertFalse(placeholder.sh_loaded)
+        self.assertIn("libversion", dir(self.stash))
+
+        version = self.stash.libversion.Version.parse("1.0")
+        self.assertEqual(version.versiontuple[:2], (1, 0))
+        module = self.stash.__dict__["libversion"]
+        self.assertIsInstance(module, types.ModuleType)
+        self.assertNotIsInstance(module, ShLazyModule)
+        self.assertIs(sys.modules["libversion"], module)
+        # the placeholder forwards to the loaded module
+        self.assertIs(placeholder.Version, module.Version)
+
+    def test_unknown_attribute(self):
+        """other missing attributes still raise AttributeError"""
+        self.assertFalse(hasattr(self.stash, "libnothing"))
+
+    def test_startup_times(self):
+        """the startup phases are timed"""
+        phases = [name for name, _ in self.stash.startup_times]
+        self.assertEqual(phases[:4], ["config", "screens", "ui", "runtime"])
+        self.assertIn("libs", phases)
+
+    def test_failed_import(self):
+        """a library failing to load raises its ImportError and is not retried"""
+        calls = []
+
+        def loader():
+            calls.append(1)
+            raise ImportError("libbroken: no module named 'missing'")
+
+        self.stash._libs["libbroken"] = ShLazyModule("libbroken", loader)
+        try:
+            for _ in range(2):
+                with self.assertRaises(ImportError) as cm:
+                    self.stash.libbroken
+                self.assertIn("missing", str(cm.exception))
+        finally:
+            del self.stash._libs["libbroken"]
+        self.assertEqual(len(calls), 1)
@@ -60,3 +60,37 @@ class Md5sumTests(StashTestCase):
         output = self.run_command("echo test | md5sum -", exitcode=0).replace("\n", "")
         expected = "d8e8fca2dc0f896fd7cb4cb0031ba249"
         self.assertEqual(output, expected)
+
+    def test_checkhash_tagged(self):
+        """test md5sum -c with lines of several algorithms"""
+        output = self.run_command("md5sum -c results_tagged.md5sum", exitcode=0)
+        self.assertEqual(output, "four.txt: Pass\nfive.txt: Pass\n")
+
+    def test_algorithms(self):
+        """test md5sum -a with several algorithms"""
+        output = self.run_command("md5sum -a md5,sha256 four.txt", exitcode=0)
+        self.assertEqual(
+            output,
+            "MD5 (four.txt) = 1e49137f22b369d84f0e06de47448d61\n"
+            "SHA256 (four.txt) = e93dff0d1076b537cd1bd659d14bb77d5fd47db13204a227cb3cd66e81dd454c\n",
+        )
+
+    def test_recursive(self):
+        """test md5sum -r"""
+        output = self.run_command("md5sum -r -j 2 " + self.get_data_path(), exitcode=0)
+        hashes = dict(
+            (os.path.basename(line.split(" ", 1)[1]), line.split(" ", 1)[0])
+            for line in output.splitlines()
+        )
+        self.assertEqual(hashes["four.txt"], "1e49137f22b369d84f0e06de47448d61")
+        self.assertEqual(hashes["five.txt"], "903eb40461bb012a4a51ed7ec4516516")
+        self.assertEqual(len(hashes), len(os.listdir(self.get_data_path())))
+
+    def test_shake_rejected(self):
+        """algorithms without a fixed digest length are reported"""
+        output = self.run_command(
+            "echo 'SHAKE_128 (four.txt) = abcd' | md5sum -c", exitcode=1
+        )
+        self.assertIn("unsupported algorithm: shake_128", output)
+        output = self.run_command("md5sum -a shake_256 four.txt", exitcode=2)
+        self.assertIn("unsupported algorithm: shake_256", output)
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""tests for the 'hash' command and the command hash table"""
+
+import os
+import shutil
+import tempfile
+
+from stash.tests.stashtest import StashTestCase
+
+
+class HashTests(StashTestCase):
+    """Tests for the 'hash' command."""
+
+    def test_help(self):
+        """test 'hash --help'"""
+        output = self.run_command("hash --help", exitcode=0)
+        self.assertIn("hash", output)
+        self.assertIn("-r", output)
+        self.assertIn("-t", output)
+
+    def test_remember(self):
+        """commands are remembered and counted"""
+        self.run_command("hash -r", exitcode=0)
+        output = self.run_command("hash", exitcode=0)
+        self.assertNotIn("pwd.py", output)
+        self.run_command("pwd", exitcode=0)
+        self.run_command("pwd", exitcode=0)
+        output = self.run_command("hash", exitcode=0)
+        self.assertRegex(output, r"\s+\d+\t.*pwd\.py")
+        output = self.run_command("hash -t pwd", exitcode=0)
+        self.assertEqual(
+            output.strip(),
+            os.path.join(
+                self.stash.runtime.state.environ["STASH_ROOT"], "bin", "pwd.py"
+            ),
+        )
+
+    def test_delete(self):
+        """'hash -d' forgets a command"""
+        self.run_command("hash pwd", exitcode=0)
+        self.run_command("hash -d pwd", exitcode=0)
+        self.run_command("hash -t pwd", exitcode=1)
+
+    def test_all(self):
+        """'hash -a' remembers all commands"""
+        self.run_command("hash -r -a", exitcode=0)
+        output = self.run_command("hash -t ls", exitcode=0)
+        self.assertTrue(output.strip().endswith("ls.py"))
+
+    def test_new_script_found(self):
+        """a script added to a searched directory is found"""
+        tmpdir = tempfile.mkdtemp()
+        try:
+            rt = self.stash.runtime
+            bin_path = tmpdir + ":" + rt.state.environ["BIN_PATH"]
+            self.assertEqual(rt.command_hash.find("hashtestcmd", bin_path)[0], None)
+            script = os.path.join(tmpdir, "hashtestcmd.py")
+            with open(script, "w") as f:
+                f.write("print('hi')\n")
+            self.assertEqual(rt.command_hash.find("hashtestcmd", bin_path)[0], script)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_remembered_not_searched(self):
+        """a remembered script is used without searching BIN_PATH"""
+        rt = self.stash.runtime
+        command_hash = rt.command_hash
+        bin_path = rt.state.environ["BIN_PATH"]
+        fname, _ = command_hash.find("pwd", bin_path)
+        listed = []
+        get_listing = command_hash.get_listing
+
+        def counting_get_listing(path):
+            listed.append(path)
+            return get_listing(path)
+
+        command_hash.get_listing = counting_get_listing
+        try:
+            self.assertEqual(command_hash.find("pwd", bin_path), (fname, False))
+        finally:
+            del command_hash.get_listing
+        # only the current directory is looked at
+        self.assertEqual(listed, [os.path.abspath(".")])
+
+    def test_remembered_script_removed(self):
+        """a remembered script which is gone is searched for again"""
+        tmpdirs = [tempfile.mkdtemp(), tempfile.mkdtemp()]
+        try:
+            rt = self.stash.runtime
+            bin_path = ":".join(tmpdirs)
+            scripts = [os.path.join(d, "hashtestcmd.py") for d in tmpdirs]
+            for script in scripts:
+                with open(script, "w") as f:
+                    f.write("print('hi')\n")
+            self.assertEqual(
+                rt.command_hash.find("hashtestcmd", bin_path)[0], scripts[0]
+            )
+            os.remove(scripts[0])
+            self.assertEqual(
+                rt.command_hash.find("hashtestcmd", bin_path)[0], scripts[1]
+            )
+        finally:
+            for tmpdir in tmpdirs:
+                shutil.rmtree(tmpdir)
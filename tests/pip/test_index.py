@@ -0,0 +1,426 @@
+# -*- coding: utf-8 -*-
+"""tests for the 'pip' command against a local stand-in of PyPI."""
+
+import base64
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+
+from six.moves import BaseHTTPServer, socketserver
+
+from stash.tests.stashtest import StashTestCase
+
+
+def build_wheel(name, version, requires):
+    """
+    Build a pure python wheel in memory.
+    :param requires: the Requires-Dist of the wheel
+    :type requires: list of str
+    :return: the filename and the content of the wheel
+    :rtype: (str, bytes)
+    """
+    distinfo = "{}-{}.dist-info".format(name, version)
+    members = [
+        ("{}/__init__.py".format(name), "VERSION = {!r}\n".format(version)),
+        (
+            distinfo + "/METADATA",
+            "Metadata-Version: 2.1\nName: {}\nVersion: {}\n".format(name, version)
+            + "".join("Requires-Dist: {}\n".format(r) for r in requires),
+        ),
+        (
+            distinfo + "/WHEEL",
+            "Wheel-Version: 1.0\nGenerator: test\nRoot-Is-Purelib: true\n"
+            "Tag: py2.py3-none-any\n",
+        ),
+        (distinfo + "/top_level.txt", name + "\n"),
+    ]
+    record = []
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for path, content in members:
+            data = content.encode("utf-8")
+            digest = base64.urlsafe_b64encode(hashlib.sha256(data).digest())
+            record.append(
+                "{},sha256={},{}\n".format(
+                    path, digest.rstrip(b"=").decode("ascii"), len(data)
+                )
+            )
+            zf.writestr(path, data)
+        zf.writestr(distinfo + "/RECORD", "".join(record) + distinfo + "/RECORD,,\n")
+    return "{}-{}-py2.py3-none-any.whl".format(name, version), buf.getvalue()
+
+
+class FakeIndex(object):
+    """
+    A stand-in for PyPI, serving the JSON API and the wheels of the given
+    packages on a local port. The JSON documents have an ETag, which is
+    revalidated with If-None-Match. The requests and the status of their
+    responses are recorded.
+    :param packages: the requires_dist of the packages by (name, version)
+    :type packages: dict
+    :param delay: seconds each response is held back
+    :type delay: float
+    """
+
+    def __init__(self, packages, delay=0.0):
+        self.delay = delay
+        self.requests = []
+        self.statuses = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        self.files = {}
+        # the digests listed, which stay those of the wheels built even if
+        # the files are changed
+        self.digests = {}
+        self.releases = {}
+        for (name, version), requires in packages.items():
+            filename, data = build_wheel(name, version, requires)
+            self.files[filename] = data
+            self.digests[filename] = hashlib.sha256(data).hexdigest()
+            self.releases.setdefault(name, {})[version] = (filename, requires)
+
+        index = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_GET(self):
+                index.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+            daemon_threads = True
+
+        self.server = Server(("127.0.0.1", 0), Handler)
+        self.url = "http://127.0.0.1:{}".format(self.server.server_address[1])
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def requested(self, path):
+        """how often a path was requested, whatever the case"""
+        with self.lock:
+            return [p.lower() for p in self.requests].count(path.lower())
+
+    def release_json(self, name, version):
+        filename, requires = self.releases[name][version]
+        return {
+            "info": {
+                "name": name,
+                "version": version,
+                "summary": "",
+                "requires_dist": requires or None,
+            },
+            "urls": [],
+        }
+
+    def package_json(self, name):
+        versions = sorted(self.releases[name])
+        data = self.release_json(name, versions[-1])
+        data["releases"] = {}
+        for version in versions:
+            filename = self.releases[name][version][0]
+            data["releases"][version] = [
+                {
+                    "filename": filename,
+                    "url": "{}/files/{}".format(self.url, filename),
+                    "packagetype": "bdist_wheel",
+                    "python_version": "py2.py3",
+                    "requires_python": None,
+                    "digests": {"sha256": self.digests[filename]},
+                }
+            ]
+        return data
+
+    def respond(self, request, status):
+        """start a response, which has no body unless it is a 200"""
+        with self.lock:
+            self.statuses.append(status)
+        request.send_response(status)
+        if status != 200:
+            request.send_header("Content-Length", "0")
+            request.end_headers()
+
+    def handle(self, request):
+        with self.lock:
+            self.requests.append(request.path)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.delay)
+            parts = request.path.strip("/").split("/")
+            if parts[0] == "pypi" and len(parts) > 1:
+                # names are looked up whatever their case, as PyPI does
+                parts[1] = parts[1].lower()
+            body = None
+            if parts[0] == "pypi" and parts[-1] == "json":
+                if parts[1] in self.releases:
+                    if len(parts) == 3:
+                        body = json.dumps(self.package_json(parts[1])).encode("utf-8")
+                    elif parts[2] in self.releases[parts[1]]:
+                        body = json.dumps(self.release_json(parts[1], parts[2])).encode(
+                            "utf-8"
+                        )
+            elif parts[0] == "files":
+                body = self.files.get(parts[1])
+            if body is None:
+                self.respond(request, 404)
+                return
+            etag = '"{}"'.format(hashlib.sha256(body).hexdigest())
+            if request.headers.get("If-None-Match") == etag:
+                self.respond(request, 304)
+                return
+            self.respond(request, 200)
+            request.send_header("ETag", etag)
+            request.send_header("Content-Length", str(len(body)))
+            request.end_headers()
+            request.wfile.write(body)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+class PipIndexTests(StashTestCase):
+    """tests for installing packages from a local package index."""
+
+    packages = {
+        ("alpha", "1.0"): ["beta (>=1.0)", "gamma", 'epsilon ; extra == "more"'],
+        ("beta", "1.0"): ["delta"],
+        ("beta", "2.0"): ["delta", "zeta"],
+        ("gamma", "1.0"): ["Delta"],
+        ("delta", "1.0"): [],
+        ("epsilon", "1.0"): [],
+        ("zeta", "1.0"): [],
+    }
+
+    def setUp(self):
+        StashTestCase.setUp(self)
+        self.index = FakeIndex(self.packages, delay=0.2)
+        self.site_packages = tempfile.mkdtemp()
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.site_packages)
+        shutil.rmtree(self.cache_dir)
+        StashTestCase.tearDown(self)
+
+    def pip(self, args, exitcode=0):
+        """run pip against the local index"""
+        return self.run_command(
+            "pip -i {}/pypi --cache-dir {} {}".format(
+                self.index.url, self.cache_dir, args
+            ),
+            exitcode=exitcode,
+        )
+
+    def install(self, requirement, exitcode=0):
+        """install a requirement into the temporary site-packages"""
+        return self.pip(
+            "install -d {} {}".format(self.site_packages, requirement),
+            exitcode=exitcode,
+        )
+
+    def installed_order(self, output):
+        """the packages installed, in the order they were"""
+        prefix = "Package installed: "
+        return [
+            line[len(prefix) :].strip()
+            for line in output.splitlines()
+            if line.startswith(prefix)
+        ]
+
+    def test_dependencies_first(self):
+        """dependencies are resolved from the metadata and installed first"""
+        output = self.install("alpha")
+        order = self.installed_order(output)
+        self.assertEqual(sorted(order), ["alpha", "beta", "delta", "gamma", "zeta"])
+        for dependent, dependency in [
+            ("alpha", "beta"),
+            ("alpha", "gamma"),
+            ("beta", "delta"),
+            ("beta", "zeta"),
+            ("gamma", "delta"),
+        ]:
+            self.assertLess(order.index(dependency), order.index(dependent))
+        for name in order:
+            path = os.path.join(self.site_packages, name, "__init__.py")
+            self.assertTrue(os.path.exists(path), name)
+        # the extra is not wanted
+        self.assertEqual(self.index.requested("/pypi/epsilon/json"), 0)
+
+    def test_package_database(self):
+        """the packages, what they need and their metadata are recorded"""
+        from stashutils.pipdb import PackageDatabase
+
+        self.install("alpha")
+        db = PackageDatabase(self.site_packages)
+        try:
+            self.assertEqual(
+                sorted(db.names()), ["alpha", "beta", "delta", "gamma", "zeta"]
+            )
+            self.assertEqual(db.dependents("delta"), set(["beta", "gamma"]))
+            self.assertEqual(db.requirements("alpha"), ["beta", "gamma"])
+            self.assertEqual(sorted(db.required_by("delta")), ["beta", "gamma"])
+            self.assertEqual(
+                db.owners(os.path.join(self.site_packages, "alpha")), set(["alpha"])
+            )
+            self.assertEqual(db.get_info("beta")["version"], "2.0")
+        finally:
+            db.close()
+        for name in (".pypi_packages", "pip_index.json", ".package_info"):
+            self.assertFalse(os.path.exists(os.path.join(self.site_packages, name)))
+
+    def test_parallel_requests(self):
+        """metadata and archives are fetched concurrently, each once"""
+        self.install("alpha")
+        self.assertGreater(self.index.max_in_flight, 1)
+        for name in ("alpha", "beta", "gamma", "delta", "zeta"):
+            self.assertEqual(self.index.requested("/pypi/{}/json".format(name)), 1)
+        self.assertEqual(
+            self.index.requested("/files/delta-1.0-py2.py3-none-any.whl"), 1
+        )
+
+    def test_version_specifier(self):
+        """the dependencies of the release chosen are the ones resolved"""
+        output = self.install("beta==1.0")
+        self.assertEqual(self.installed_order(output), ["delta", "beta"])
+        self.assertEqual(self.index.requested("/pypi/zeta/json"), 0)
+
+    def test_extras(self):
+        """the dependencies of the extras wanted are installed"""
+        output = self.install("alpha[more]")
+        self.assertIn("epsilon", self.installed_order(output))
+
+    def test_missing_package(self):
+        """an unknown dependency fails the install before any download"""
+        self.index.close()
+        self.index = FakeIndex({("omega", "1.0"): ["missing"]})
+        output = self.install("omega", exitcode=1)
+        self.assertIn("Error", output)
+        self.assertEqual(self.installed_order(output), [])
+        self.assertEqual(
+            self.index.requested("/files/omega-1.0-py2.py3-none-any.whl"), 0
+        )
+
+    def test_metadata_cached(self):
+        """the metadata is fetched once for all runs"""
+        self.pip("versions alpha")
+        self.assertEqual(len(self.index.requests), 1)
+        output = self.pip("versions alpha")
+        self.assertIn("alpha - 1.0", output)
+        self.assertEqual(len(self.index.requests), 1)
+
+        self.install("alpha")
+        shutil.rmtree(self.site_packages)
+        os.mkdir(self.site_packages)
+        metadata_requests = len(
+            [p for p in self.index.requests if p.startswith("/pypi/")]
+        )
+        output = self.install("alpha")
+        self.assertIn("Package installed: alpha", output)
+        self.assertEqual(
+            len([p for p in self.index.requests if p.startswith("/pypi/")]),
+            metadata_requests,
+        )
+
+    def test_no_cache_dir(self):
+        """without a cache, every run asks the index"""
+        self.pip("--no-cache-dir versions alpha")
+        self.pip("--no-cache-dir versions alpha")
+        self.assertEqual(self.index.requested("/pypi/alpha/json"), 2)
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+    def test_offline(self):
+        """offline, only the cached metadata is used"""
+        self.pip("versions alpha")
+        self.index.close()
+        output = self.pip("--offline versions alpha")
+        self.assertIn("alpha - 1.0", output)
+        output = self.pip("--offline versions beta", exitcode=1)
+        self.assertIn("offline", output)
+
+    def file_requests(self):
+        """how often the archives were requested"""
+        return [p for p in self.index.requests if p.startswith("/files/")]
+
+    def test_archives_cached(self):
+        """an archive is downloaded once, whichever install needs it"""
+        self.install("gamma")
+        self.assertEqual(len(self.file_requests()), 2)
+        other_site_packages = os.path.join(self.cache_dir, "site-packages")
+        os.mkdir(other_site_packages)
+        output = self.pip("install -d {} beta".format(other_site_packages))
+        self.assertIn("Using cached package delta-1.0-py2.py3-none-any.whl", output)
+        self.assertEqual(len(self.file_requests()), 4)
+
+        shutil.rmtree(self.site_packages)
+        os.mkdir(self.site_packages)
+        output = self.install("alpha")
+        self.assertIn("Package installed: alpha", output)
+        self.assertEqual(len(self.file_requests()), 5)
+        self.assertEqual(len(set(self.file_requests())), 5)
+
+    def test_install_cache_dir(self):
+        """install takes the cache directory as well"""
+        cache_dir = os.path.join(self.cache_dir, "other")
+        self.run_command(
+            "pip -i {}/pypi install --cache-dir {} -d {} delta".format(
+                self.index.url, cache_dir, self.site_packages
+            ),
+            exitcode=0,
+        )
+        self.assertTrue(os.listdir(os.path.join(cache_dir, "artifacts")))
+
+    def test_download_cached(self):
+        """pip download uses the cached archives"""
+        for i in range(2):
+            dest = os.path.join(self.cache_dir, "dest{}".format(i))
+            os.mkdir(dest)
+            self.run_command(
+                "pip -i {}/pypi download --cache-dir {} -d {} delta".format(
+                    self.index.url, self.cache_dir, dest
+                ),
+                exitcode=0,
+            )
+            path = os.path.join(dest, "delta-1.0-py2.py3-none-any.whl")
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), self.index.files[os.path.basename(path)])
+        self.assertEqual(len(self.file_requests()), 1)
+
+    def test_corrupted_download(self):
+        """an archive without the sha256 listed is neither cached nor installed"""
+        self.index.files["delta-1.0-py2.py3-none-any.whl"] = b"not a wheel"
+        output = self.install("gamma", exitcode=1)
+        self.assertIn("corrupted download", output)
+        self.assertEqual(self.installed_order(output), [])
+        self.assertEqual(
+            [name for name in os.listdir(self.site_packages) if name[0] != "."], []
+        )
+        # only the archive of gamma is kept
+        gamma = self.index.digests["gamma-1.0-py2.py3-none-any.whl"]
+        artifacts = os.path.join(self.cache_dir, "artifacts")
+        self.assertEqual(
+            [name for name in os.listdir(artifacts) if not name.endswith(".url")],
+            [gamma + ".archive"],
+        )
+
+    def test_offline_install(self):
+        """offline, what was installed before can be installed again"""
+        self.install("alpha")
+        shutil.rmtree(self.site_packages)
+        os.mkdir(self.site_packages)
+        self.index.close()
+        output = self.pip("--offline install -d {} alpha".format(self.site_packages))
+        self.assertIn("Package installed: alpha", output)
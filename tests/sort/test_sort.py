@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""tests for the 'sort' command."""
+
+import os
+import random
+
+from stash.tests.stashtest import StashTempDirTestCase, StashTestCase
+
+
+class SortTests(StashTestCase):
+    """Tests for the 'sort' command."""
+
+    def setUp(self):
+        """setup the tests"""
+        self.cwd = self.get_data_path()
+        StashTestCase.setUp(self)
+
+    def test_help(self):
+        """test 'sort --help'."""
+        output = self.run_command("sort --help", exitcode=0)
+        self.assertIn("--buffer-size", output)
+
+    def test_sort(self):
+        """all files are sorted together"""
+        output = self.run_command("sort fruits.txt passwd.txt", exitcode=0)
+        self.assertEqual(
+            output.splitlines(),
+            sorted(
+                open(os.path.join(self.get_data_path(), "fruits.txt"))
+                .read()
+                .splitlines()
+                + open(os.path.join(self.get_data_path(), "passwd.txt"))
+                .read()
+                .splitlines()
+            ),
+        )
+        self.assertTrue(output.endswith("x:1000:1000\n"))
+
+    def test_numeric_keys(self):
+        """-k with -n, -r and per key options"""
+        output = self.run_command("sort -k2n fruits.txt", exitcode=0)
+        self.assertEqual(
+            output,
+            "apple 1 w\nbanana 2 z\npear 3 x\napple 10 y\ncherry 10 v\n",
+        )
+        output = self.run_command("sort -k2,2nr -k1,1 fruits.txt", exitcode=0)
+        self.assertEqual(
+            output,
+            "apple 10 y\ncherry 10 v\npear 3 x\nbanana 2 z\napple 1 w\n",
+        )
+        output = self.run_command("sort -t : -k3,3 -n -r passwd.txt", exitcode=0)
+        self.assertEqual(
+            output, "user:x:1000:1000\ndaemon:x:2:2\nbin:x:1:1\nroot:x:0:0\n"
+        )
+
+    def test_unique(self):
+        """-u keeps the first of lines with equal keys"""
+        output = self.run_command("sort -u -k1,1 fruits.txt", exitcode=0)
+        self.assertEqual(output, "apple 10 y\nbanana 2 z\ncherry 10 v\npear 3 x\n")
+        output = self.run_command("cat fruits.txt fruits.txt | sort -u", exitcode=0)
+        self.assertEqual(len(output.splitlines()), 5)
+
+    def test_missing_file(self):
+        """a missing file is an error"""
+        output = self.run_command("sort missing.txt", exitcode=2)
+        self.assertIn("missing.txt", output)
+
+
+class ExternalSortTests(StashTempDirTestCase):
+    """Tests for sorting more than fits in the memory budget"""
+
+    def setUp(self):
+        StashTempDirTestCase.setUp(self)
+        rnd = random.Random(1)
+        self.lines = [
+            "%s %d" % (rnd.choice(["a", "b", "c", "é"]), rnd.randint(0, 500))
+            for _ in range(20000)
+        ]
+        self.write_file("in.txt", "\n".join(self.lines).encode("utf-8"))
+
+    def sort(self, args):
+        os.mkdir("tmp")
+        try:
+            output = self.run_command("sort -S 20K -T tmp " + args, exitcode=0)
+            # the runs are removed
+            self.assertEqual(os.listdir("tmp"), [])
+        finally:
+            os.rmdir("tmp")
+        return output.splitlines()
+
+    def test_merge(self):
+        """sorted runs are merged, also in several passes"""
+        self.assertEqual(self.sort("in.txt"), sorted(self.lines))
+        self.assertEqual(self.sort("-r -P 3 in.txt"), sorted(self.lines, reverse=True))
+
+    def test_merge_keys(self):
+        """keys, -u and mixed directions work across runs"""
+
+        def key(line):
+            word, number = line.split()
+            return (-int(number), word)
+
+        self.assertEqual(self.sort("-k2,2nr -k1,1 in.txt"), sorted(self.lines, key=key))
+        numbers = [int(line.split()[1]) for line in self.sort("-u -k2n in.txt")]
+        self.assertEqual(
+            numbers, sorted(set(int(line.split()[1]) for line in self.lines))
+        )
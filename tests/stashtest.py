@@ -2,6 +2,7 @@
 """utility StaSh testcase for common methids"""
 
 import os
+import shutil
 import sys
 import unittest
 import logging
@@ -201,3 +202,34 @@ class StashTestCase(unittest.TestCase):
                 ),
             )
         return output
+
+
+class StashTempDirTestCase(StashTestCase):
+    """A StashTestCase running in a new temporary directory, removed afterwards"""
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.cwd = self.tempdir
+        StashTestCase.setUp(self)
+
+    def tearDown(self):
+        StashTestCase.tearDown(self)
+        os.chdir(os.path.dirname(self.tempdir))
+        shutil.rmtree(self.tempdir)
+
+    def write_file(self, path, data):
+        """
+        Write a file in the temporary directory, creating its parents.
+        :param path: path of the file, relative to the temporary directory
+        :type path: str
+        :param data: content of the file
+        :type data: bytes
+        :return: the absolute path of the file
+        :rtype: str
+        """
+        fp = os.path.join(self.tempdir, path)
+        if not os.path.isdir(os.path.dirname(fp)):
+            os.makedirs(os.path.dirname(fp))
+        with open(fp, "wb") as outs:
+            outs.write(data)
+        return fp
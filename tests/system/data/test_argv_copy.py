@@ -0,0 +1,13 @@
+# coding=utf-8
+from __future__ import print_function
+import copy
+import pickle
+import sys
+
+# Copies of the arguments are plain lists of them
+for argv in (
+    copy.copy(sys.argv),
+    copy.deepcopy(sys.argv),
+    pickle.loads(pickle.dumps(sys.argv)),
+):
+    print(type(argv).__name__, " ".join(argv[1:]))
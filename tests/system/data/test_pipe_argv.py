@@ -0,0 +1,14 @@
+# coding=utf-8
+from __future__ import print_function
+import sys
+import time
+
+# Read the arguments while the other stage of the pipe is still running
+if sys.argv[1:2] == ["-w"]:
+    time.sleep(1.0)
+    print(" ".join(sys.argv[1:]))
+else:
+    time.sleep(0.5)
+    args = " ".join(sys.argv[1:])
+    print(sys.stdin.read().rstrip())
+    print(args)
@@ -0,0 +1,5 @@
+# coding=utf-8
+import sys
+
+sys.stdin.read()
+sys.exit(3)
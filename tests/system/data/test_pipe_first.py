@@ -0,0 +1,10 @@
+# coding=utf-8
+from __future__ import print_function
+import sys
+import time
+
+# Report how long it took for the first line to arrive
+start = time.time()
+line = sys.stdin.readline()
+print("{} {}".format(line.strip(), time.time() - start < 1.0))
+sys.stdin.read()
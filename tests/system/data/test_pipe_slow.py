@@ -0,0 +1,9 @@
+# coding=utf-8
+from __future__ import print_function
+import sys
+import time
+
+print("first")
+sys.stdout.flush()
+time.sleep(2)
+print("second")
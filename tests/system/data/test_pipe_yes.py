@@ -0,0 +1,8 @@
+# coding=utf-8
+from __future__ import print_function
+
+# Print lines until the reader of the pipe goes away
+i = 0
+while True:
+    print("line {}".format(i))
+    i += 1
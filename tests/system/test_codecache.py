@@ -0,0 +1,104 @@
+# coding=utf-8
+"""Tests for stash.system.shcodecache"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from stash.system.shcodecache import ShCodeCache
+
+
+class CodeCacheTests(unittest.TestCase):
+    """Tests for ShCodeCache"""
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tempdir, "cache")
+        self.script = os.path.join(self.tempdir, "script.py")
+        self.write_script("x = 1\n", age=10)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def write_script(self, content, age):
+        """write the script and date it back by age seconds"""
+        with open(self.script, "w") as f:
+            f.write(content)
+        t = time.time() - age
+        os.utime(self.script, (t, t))
+
+    def run_code(self, code):
+        namespace = {}
+        exec(code, namespace)
+        return namespace["x"]
+
+    def test_memory_cache(self):
+        """a script is compiled once"""
+        cache = ShCodeCache(cache_dir=None)
+        code = cache.get_code(self.script)
+        self.assertIs(cache.get_code(self.script), code)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_disk_cache(self):
+        """compiled code is persisted and loaded by a new cache"""
+        ShCodeCache(cache_dir=self.cache_dir).get_code(self.script)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+        cache = ShCodeCache(cache_dir=self.cache_dir)
+        self.assertEqual(self.run_code(cache.get_code(self.script)), 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+
+    def test_modified_script(self):
+        """a modified script is compiled again"""
+        cache = ShCodeCache(cache_dir=self.cache_dir)
+        cache.get_code(self.script)
+        self.write_script("x = 22\n", age=5)
+        self.assertEqual(self.run_code(cache.get_code(self.script)), 22)
+        cache = ShCodeCache(cache_dir=self.cache_dir)
+        self.assertEqual(self.run_code(cache.get_code(self.script)), 22)
+
+    def test_recent_script_not_cached(self):
+        """a script modified just now is not cached"""
+        self.write_script("x = 3\n", age=0)
+        cache = ShCodeCache(cache_dir=self.cache_dir)
+        cache.get_code(self.script)
+        cache.get_code(self.script)
+        self.assertEqual(cache.misses, 2)
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test_lru(self):
+        """the least recently used code is evicted"""
+        cache = ShCodeCache(cache_dir=None, maxsize=1)
+        other = os.path.join(self.tempdir, "other.py")
+        shutil.copy(self.script, other)
+        os.utime(other, (time.time() - 10, time.time() - 10))
+        cache.get_code(self.script)
+        cache.get_code(other)
+        cache.get_code(self.script)
+        self.assertEqual(cache.misses, 3)
+
+    def test_disk_bound(self):
+        """the least recently used marshal files are removed"""
+        scripts = []
+        for i in range(3):
+            path = os.path.join(self.tempdir, "script%d.py" % i)
+            shutil.copy(self.script, path)
+            os.utime(path, (time.time() - 10, time.time() - 10))
+            scripts.append(path)
+        cache = ShCodeCache(cache_dir=self.cache_dir)
+        cache.get_code(scripts[0])
+        cache.get_code(scripts[1])
+        size = os.path.getsize(cache.cache_file(scripts[0]))
+        # the first script is used again, the second is the oldest
+        t = time.time()
+        os.utime(cache.cache_file(scripts[0]), (t - 20, t - 20))
+        os.utime(cache.cache_file(scripts[1]), (t - 30, t - 30))
+        reader = ShCodeCache(cache_dir=self.cache_dir)
+        reader.get_code(scripts[0])
+        self.assertEqual(reader.hits, 1)
+        cache = ShCodeCache(cache_dir=self.cache_dir, max_disk_size=2 * size)
+        cache.get_code(scripts[2])
+        self.assertTrue(os.path.exists(cache.cache_file(scripts[0])))
+        self.assertFalse(os.path.exists(cache.cache_file(scripts[1])))
+        self.assertTrue(os.path.exists(cache.cache_file(scripts[2])))
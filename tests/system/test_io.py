@@ -0,0 +1,163 @@
+# coding=utf-8
+"""Tests for stash.system.shio and stash.system.shiowrapper"""
+
+import threading
+import time
+import unittest
+
+from six import StringIO
+
+from stash.system.shcommon import _SYS_STDOUT
+from stash.system.shio import ShIO
+from stash.system.shiowrapper import ShStdinWrapper, ShStdoutWrapper
+from stash.system.shthreads import thread_local
+
+
+class _History(object):
+    def __init__(self):
+        self.lines = []
+
+    def add(self, line):
+        self.lines.append(line)
+
+
+class _Runtime(object):
+    def __init__(self):
+        self.history = _History()
+
+
+class _StaSh(object):
+    def __init__(self):
+        self.runtime = _Runtime()
+
+
+class IOTests(unittest.TestCase):
+    """Tests for reading user input from ShIO"""
+
+    def setUp(self):
+        self.io = ShIO(_StaSh())
+
+    def push_later(self, s, delay=0.05):
+        t = threading.Timer(delay, self.io.push, args=(s,))
+        t.start()
+        self.addCleanup(t.join)
+
+    def test_readline_wakes_up(self):
+        """a waiting reader gets input as soon as it is pushed"""
+        self.io.holdback = 5.0
+        self.push_later("hello\n")
+        start = time.time()
+        self.assertEqual(self.io.readline(), "hello\n")
+        self.assertLess(time.time() - start, 1.0)
+        self.assertEqual(self.io.stash.runtime.history.lines, ["hello\n"])
+
+    def test_read(self):
+        """read waits for enough characters"""
+        self.push_later("abc")
+        self.assertEqual(self.io.read(2), "ab")
+        self.assertEqual(self.io.read(1), "c")
+
+    def test_read_till_eof(self):
+        """read and readlines without size read till EOF"""
+        self.io.push("a\nb\n\0c\nd\0")
+        self.assertEqual(self.io.read(), "a\nb\n")
+        self.assertEqual(self.io.readlines(), ["c\n", "d"])
+
+    def test_timeout(self):
+        """reads give up after the timeout"""
+        self.io.push("partial")
+        start = time.time()
+        self.assertIsNone(self.io.readline(timeout=0.2))
+        self.assertGreaterEqual(time.time() - start, 0.15)
+        self.assertEqual(self.io.read(10, timeout=0.1), "partial")
+        self.assertIsNone(self.io.read(1, timeout=0.1))
+
+    def test_non_blocking(self):
+        """in non-blocking mode reads return immediately"""
+        self.io.setblocking(False)
+        self.assertEqual(self.io.gettimeout(), 0.0)
+        self.assertIsNone(self.io.readline())
+        self.assertIsNone(self.io.readlines())
+        self.io.push("line\nmore")
+        self.assertEqual(self.io.readline(), "line\n")
+        self.assertEqual(self.io.read(8), "more")
+        self.io.setblocking(True)
+        self.assertIsNone(self.io.gettimeout())
+
+    def test_timeout_per_worker(self):
+        """the timeout set in a worker is its own"""
+        from stash.system.shthreads import ShState
+
+        def worker(state, blocking):
+            thread_local.state = state
+            self.io.setblocking(blocking)
+            timeouts.append(self.io.gettimeout())
+
+        timeouts = []
+        state = ShState()
+        for blocking in (False, True):
+            t = threading.Thread(target=worker, args=(state, blocking))
+            t.start()
+            t.join()
+        self.assertEqual(timeouts, [0.0, None])
+        t = threading.Thread(target=worker, args=(ShState(), False))
+        t.start()
+        t.join()
+        # neither the other workers nor the shell are non-blocking
+        self.assertIsNone(state.stdin_timeout)
+        self.assertIsNone(self.io.gettimeout())
+        self.push_later("line\n")
+        self.assertEqual(self.io.readline(), "line\n")
+
+    def test_readline_no_block(self):
+        """only complete lines are taken from the buffer"""
+        self.io.push("one\ntwo\nthr")
+        self.assertEqual(list(self.io.readline_no_block()), ["one\n", "two\n"])
+        self.io.push("ee\n")
+        self.assertEqual(list(self.io.readline_no_block()), ["three\n"])
+
+
+class _State(object):
+    def __init__(self, stdin=""):
+        self.sys_stdin = StringIO(stdin)
+        self.sys_stdout = StringIO()
+
+
+class IOWrapperTests(unittest.TestCase):
+    """Tests for the per-thread dispatch of the io wrappers"""
+
+    def run_in_thread(self, target, state):
+        def run():
+            thread_local.state = state
+            target()
+
+        t = threading.Thread(target=run)
+        t.start()
+        t.join()
+
+    def test_dispatch(self):
+        """a thread bound to a state writes to its own stream"""
+        wrapper = ShStdoutWrapper()
+        states = [_State(), _State()]
+        for i, state in enumerate(states):
+            self.run_in_thread(lambda: wrapper.write("thread %d" % i), state)
+        self.assertEqual(
+            [s.sys_stdout.getvalue() for s in states], ["thread 0", "thread 1"]
+        )
+        self.assertIs(wrapper.write.__self__, _SYS_STDOUT)
+
+    def test_forwarding(self):
+        """other attributes and iteration are forwarded to the stream"""
+        state = _State("one\ntwo\n")
+        result = {}
+
+        def target():
+            wrapper = ShStdinWrapper()
+            result["lines"] = list(wrapper)
+            result["closed"] = wrapper.closed
+            result["class"] = wrapper.__class__
+
+        self.run_in_thread(target, state)
+        self.assertEqual(result["lines"], ["one\n", "two\n"])
+        self.assertFalse(result["closed"])
+        self.assertIs(result["class"], StringIO)
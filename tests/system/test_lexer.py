@@ -0,0 +1,198 @@
+# coding=utf-8
+"""Differential tests of ShLexer against the pyparsing grammar of ShParser"""
+
+import random
+import unittest
+
+import pyparsing as pp
+
+from stash.system.shparsers import ShLexer, ShParser, _ShLexerFallback
+from stash.tests.stashtest import StashTestCase
+
+LINES = [
+    "",
+    "   ",
+    "ls",
+    "ls -l /tmp",
+    "  ls   -l\t-a  ",
+    "echo hello world\n",
+    "A=1",
+    "A=1 B=2",
+    'A=1 B=2 ls -l > out.txt; echo "a $b" | grep x &',
+    "A=1  cmd",
+    "A=x=y cmd a=b",
+    'A="quoted value"suffix cmd',
+    "_under_score9=1 env",
+    "A=1 > f",
+    "echo a | grep b | wc -l",
+    "echo a|grep b",
+    "ls>f",
+    "ls >> f",
+    "ls > &3",
+    "cmd &3",
+    "cmd a&3b",
+    "a & b ; c",
+    "a&",
+    "a ;",
+    "echo 'single $quoted'",
+    "echo 'it\\'s'",
+    'echo "double \\"quoted\\" $x"',
+    "echo `date` x`pwd`y",
+    "echo \\$HOME \\x41 \\101 \\0 \\01 \\x4 \\x4g \\\\",
+    "echo a\\ b",
+    "!ls",
+    "!!",
+    "!-2 a",
+    "\\ls",
+    "\\x41b",
+    "\\\\ls",
+    "echo a # comment",
+    "# only a comment",
+    "echo a#b",
+    "ls;#c",
+    "echo ~ ~/x $HOME/* *.py [ab]?",
+    "pip install 'requests>=2.0'",
+    'git commit -m "fix: a, b & c"',
+    # invalid lines and quirks left to the grammar
+    "> f",
+    "a;;b",
+    "x&;y",
+    "a |",
+    "a ||b",
+    'echo "unterminated',
+    "A=",
+    "A=1 B=",
+    "ls > f x",
+    "echo hé",
+    "echo 'a\nb'",
+    "echo \\\t",
+]
+
+# Fragments for random lines
+FRAGMENTS = [
+    "ls", "echo", "A=", "B=1", "x", "-l", " ", " ", "  ", "\t", "|", ";", "&",
+    "&3", ">", ">>", "#", "'", '"', "`", "\\", "\\x4", "\\0", "\\12", "!",
+    "$A", "*", "=", "'a b'", '"c d"', "`e`", "\\ ", "3", "_", "~",
+]  # fmt: skip
+
+
+def normalize_token(t):
+    if t is None:
+        return None
+    if isinstance(t, list):
+        return [normalize_token(p) for p in t]
+    return (t.tok, t.spos, t.epos, t.ttype, normalize_token(t.parts))
+
+
+def normalize_parsed(parsed):
+    ret = []
+    for i, pipe_sequence in enumerate(parsed):
+        if i % 2:  # punctuator
+            ret.append(pipe_sequence)
+            continue
+        pseq = []
+        for j, sc in enumerate(pipe_sequence):
+            if j % 2:  # pipe operator
+                pseq.append(sc)
+                continue
+            pseq.append(
+                (
+                    list(sc),
+                    list(sc.cmd_prefix) if sc.cmd_prefix else "",
+                    sc.cmd_word,
+                    list(sc.args) if sc.args else "",
+                    list(sc.io_redirect) if sc.io_redirect else "",
+                )
+            )
+        ret.append(pseq)
+    return ret
+
+
+class LexerTests(unittest.TestCase):
+    """ShLexer gives the same results as the pyparsing grammar"""
+
+    def setUp(self):
+        self.parser = ShParser(cache_size=0)
+        self.reference = ShParser(cache_size=0, use_lexer=False)
+
+    def assertSameParse(self, line):
+        try:
+            expected = self.reference.parse(line)
+        except pp.ParseException as e:
+            with self.assertRaises(pp.ParseException, msg=repr(line)) as cm:
+                self.parser.parse(line)
+            self.assertEqual(cm.exception.loc, e.loc, repr(line))
+            return
+        tokens, parsed = self.parser.parse(line)
+        self.assertEqual(
+            normalize_token(tokens), normalize_token(expected[0]), repr(line)
+        )
+        self.assertEqual(
+            normalize_parsed(parsed), normalize_parsed(expected[1]), repr(line)
+        )
+
+    def test_lines(self):
+        """a corpus of valid and invalid lines"""
+        for line in LINES:
+            self.assertSameParse(line)
+
+    def test_random_lines(self):
+        """random lines made of tricky fragments"""
+        rnd = random.Random(42)
+        for _ in range(3000):
+            line = "".join(rnd.choice(FRAGMENTS) for _ in range(rnd.randint(1, 8)))
+            self.assertSameParse(line)
+
+    def test_within_dq(self):
+        """the contents of double quotes"""
+        rnd = random.Random(7)
+        texts = ["", " ", "a b", "a`b`c", "\\x41\\101\\$x", "a\\", "é", "`x"]
+        # tabs, which the grammar expands to spaces within double quotes
+        texts += ["a\tb", "`a\tb`", "x\t`echo\t1`\ty", "\\\t", "`\\\t`"]
+        for _ in range(1000):
+            texts.append(
+                "".join(rnd.choice(FRAGMENTS) for _ in range(rnd.randint(1, 6)))
+            )
+        for s in texts:
+            try:
+                expected = self.reference.parse_within_dq(s)[0]
+            except pp.ParseException:
+                with self.assertRaises(pp.ParseException, msg=repr(s)):
+                    self.parser.parse_within_dq(s)
+                continue
+            parts = self.parser.parse_within_dq(s)[0]
+            self.assertEqual(normalize_token(parts), normalize_token(expected), repr(s))
+
+    def test_no_fallback(self):
+        """common lines are handled by the lexer alone"""
+        lexer = ShLexer()
+        for line in LINES[: LINES.index("> f")]:
+            try:
+                lexer.parse(line)
+            except _ShLexerFallback:
+                self.fail("fallback for %r" % line)
+
+
+class LexerExpansionTests(StashTestCase):
+    """Expanding the results of ShLexer gives the same pipe sequences"""
+
+    def expand_all(self, line):
+        expanded = self.stash.runtime.expander.expand(line)
+        next(expanded)
+        return [repr(pipe_sequence) for pipe_sequence in expanded]
+
+    def test_expansion(self):
+        parser = self.stash.runtime.parser
+        for line in LINES:
+            if "`" in line or "!" in line or not line.strip():
+                continue  # no commands or history during expansion
+            results = []
+            for use_lexer in (True, False):
+                parser.use_lexer = use_lexer
+                parser.clear_cache()
+                try:
+                    results.append(self.expand_all(line))
+                except Exception as e:
+                    results.append(type(e))
+            parser.use_lexer = True
+            self.assertEqual(results[0], results[1], repr(line))
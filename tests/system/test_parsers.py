@@ -0,0 +1,94 @@
+# coding=utf-8
+"""Tests for the caches of stash.system.shparsers.ShParser"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from stash.system.shparsers import ShParser
+from stash.tests.stashtest import StashTestCase
+
+
+class ParserCacheTests(unittest.TestCase):
+    """Tests for the line and script caches"""
+
+    def setUp(self):
+        self.parser = ShParser(cache_size=2)
+        self.calls = []
+        _parse = self.parser._parse
+
+        def counting_parse(line):
+            self.calls.append(line)
+            return _parse(line)
+
+        self.parser._parse = counting_parse
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_line_cache(self):
+        """a line is only parsed again once it is evicted"""
+        tokens, parsed = self.parser.parse("echo a | grep b")
+        tokens2, parsed2 = self.parser.parse("echo a | grep b")
+        self.assertEqual(self.calls, ["echo a | grep b"])
+        self.assertEqual([t.tok for t in tokens2], ["echo", "a", "|", "grep", "b"])
+        self.assertIs(parsed, parsed2)
+        self.parser.parse("ls")
+        self.parser.parse("pwd")
+        self.parser.parse("echo a | grep b")
+        self.assertEqual(len(self.calls), 4)
+
+    def test_tokens_are_copies(self):
+        """changing the returned tokens does not change the cache"""
+        tokens, _ = self.parser.parse("ll -a")
+        tokens[0].tok = "ls -l"
+        tokens, _ = self.parser.parse("ll -a")
+        self.assertEqual(tokens[0].tok, "ll")
+
+    def write_script(self, content, mtime):
+        fname = os.path.join(self.tempdir, "script.sh")
+        with open(fname, "w") as outs:
+            outs.write(content)
+        os.utime(fname, (mtime, mtime))
+        return fname
+
+    def test_script_cache(self):
+        """a script keeps the results of its lines until it changes"""
+        mtime = time.time() - 10
+        fname = self.write_script("echo 1\necho 2\necho 3\n", mtime)
+        script = self.parser.parse_script(fname)
+        self.assertEqual(script, ["echo 1\n", "echo 2\n", "echo 3\n"])
+        for line in script:
+            self.parser.parse(line, script=script)
+        # the line cache is too small to hold the script
+        self.assertIs(self.parser.parse_script(fname), script)
+        for line in script:
+            self.parser.parse(line, script=script)
+        self.assertEqual(len(self.calls), 3)
+
+        fname = self.write_script("echo 4\n", mtime + 1)
+        script = self.parser.parse_script(fname)
+        self.assertEqual(script, ["echo 4\n"])
+        self.assertEqual(script.results, {})
+
+
+class ScriptCacheTests(StashTestCase):
+    """Tests for running cached shell scripts"""
+
+    def test_rerun_script(self):
+        """running a script again gives the same output"""
+        fname = os.path.join(self.get_data_path(), "cached.sh")
+        with open(fname, "w") as outs:
+            outs.write("A=1\necho $A\nA=2 echo $A\n")
+        mtime = time.time() - 10
+        os.utime(fname, (mtime, mtime))
+        try:
+            for _ in range(2):
+                self.assertEqual(self.run_command(fname, exitcode=0), "1\n1\n")
+            script = self.stash.runtime.parser.parse_script(fname)
+            self.assertEqual(len(script.results), 3)
+        finally:
+            os.remove(fname)
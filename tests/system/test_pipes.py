@@ -0,0 +1,92 @@
+# coding=utf-8
+"""Tests for stash.system.shpipes and streaming pipe sequences"""
+
+import threading
+import unittest
+
+from stash.system.shcommon import ShBrokenPipe
+from stash.system.shpipes import ShPipe
+from stash.tests.stashtest import StashTestCase
+
+
+class PipeTests(unittest.TestCase):
+    """Tests for ShPipe"""
+
+    def test_read_write(self):
+        """data written to the writer end can be read from the reader end"""
+        pipe = ShPipe()
+        pipe.writer.write("line 1\nline")
+        pipe.writer.write(" 2\nline 3")
+        pipe.writer.close()
+        self.assertEqual(pipe.reader.readline(), "line 1\n")
+        self.assertEqual(pipe.reader.read(4), "line")
+        self.assertEqual(list(pipe.reader), [" 2\n", "line 3"])
+        self.assertEqual(pipe.reader.read(), "")
+
+    def test_backpressure(self):
+        """a writer blocks once the pipe is full"""
+        pipe = ShPipe(capacity=10)
+        written = []
+
+        def writer():
+            for i in range(10):
+                pipe.writer.write("0123456789")
+                written.append(i)
+            pipe.writer.close()
+
+        t = threading.Thread(target=writer)
+        t.start()
+        t.join(0.5)
+        self.assertTrue(t.is_alive())
+        self.assertLessEqual(len(written), 2)
+        self.assertEqual(len(pipe.reader.read()), 100)
+        t.join()
+
+    def test_broken_pipe(self):
+        """writing to a pipe without reader raises ShBrokenPipe"""
+        pipe = ShPipe()
+        pipe.reader.close()
+        with self.assertRaises(ShBrokenPipe):
+            pipe.writer.write("data")
+
+
+class PipeSequenceTests(StashTestCase):
+    """Tests for pipe sequences run by the runtime"""
+
+    setup_commands = ["BIN_PATH=$STASH_ROOT/tests/system/data:$BIN_PATH"]
+
+    def test_early_reader_exit(self):
+        """an infinite producer stops once head has enough lines"""
+        output = self.run_command("test_pipe_yes.py | head -n 3", exitcode=0)
+        self.assertEqual(output, "line 0\nline 1\nline 2\n")
+
+    def test_streaming(self):
+        """output of a stage arrives before the stage finishes"""
+        output = self.run_command("test_pipe_slow.py | test_pipe_first.py", exitcode=0)
+        self.assertEqual(output, "first True\n")
+
+    def test_three_stages(self):
+        """data flows through a longer pipe sequence"""
+        output = self.run_command("echo hello world | cat - | grep world", exitcode=0)
+        self.assertEqual(output, "1: hello world\n")
+
+    def test_last_exitcode(self):
+        """the exit status of the sequence is that of the last command"""
+        self.run_command("test_pipe_yes.py | head -n 1 | test_pipe_exit.py", exitcode=3)
+
+    def test_no_styles_in_pipe(self):
+        """text written into a pipe is not styled"""
+        output = self.run_command("echo hello world | grep world | cat -", exitcode=0)
+        self.assertEqual(output, "1: hello world\n")
+
+    def test_argv_per_stage(self):
+        """concurrent stages each see their own arguments"""
+        output = self.run_command(
+            "test_pipe_argv.py -w first | test_pipe_argv.py second", exitcode=0
+        )
+        self.assertEqual(output, "-w first\nsecond\n")
+
+    def test_argv_copy(self):
+        """copies of sys.argv are lists of the arguments of the script"""
+        output = self.run_command("test_argv_copy.py a b", exitcode=0)
+        self.assertEqual(output, "list a b\n" * 3)
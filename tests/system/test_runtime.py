@@ -42,7 +42,6 @@ la=ls -a
 ll=ls -la
 paste=pbpaste
 unmount=umount
-
 AA is{0}
 copy=pbcopy
 env=printenv
@@ -52,7 +51,6 @@ ll=ls -la
 paste=pbpaste
 unmount=umount
 
-
 --- source the file ---
 From tobesourced AA is sourced
 copy=pbcopy
@@ -63,7 +61,6 @@ la=ls -a
 ll=ls -la
 paste=pbpaste
 unmount=umount
-
 AA is sourced
 copy=pbcopy
 env=printenv
@@ -73,7 +70,6 @@ la=ls -a
 ll=ls -la
 paste=pbpaste
 unmount=umount
-
 [stash]$ """.format(" ")
         self.do_test("test06.sh", cmp_str, ensure_undefined=("A",))
 
@@ -0,0 +1,126 @@
+# coding=utf-8
+"""Tests for the screen buffer of stash.system.shscreens"""
+
+import unittest
+
+from stash.system.shscreens import DEFAULT_CHAR, ShLineBuffer, ShSequentialScreen
+from stash.system.shstreams import ShStream
+
+BOLD = DEFAULT_CHAR._replace(bold=True)
+
+
+class LineBufferTests(unittest.TestCase):
+    """Tests for ShLineBuffer"""
+
+    def setUp(self):
+        self.buffer = ShLineBuffer()
+
+    def assertRuns(self, a, b, expected):
+        """check the styles of the characters from a to b"""
+        self.assertEqual(
+            [c.bold for c in self.buffer.chars(a, b)],
+            [c == "B" for c in expected],
+        )
+
+    def test_append(self):
+        """appended text continues the open last line"""
+        self.buffer.append("ab", DEFAULT_CHAR)
+        self.buffer.append("c\nde\n", BOLD)
+        self.buffer.append("f", DEFAULT_CHAR)
+        self.assertEqual(self.buffer.text, "abc\nde\nf")
+        self.assertEqual(self.buffer.length, 8)
+        self.assertEqual(self.buffer.nlines, 2)
+        self.assertEqual(self.buffer.last_newline(), 6)
+        self.assertRuns(0, 8, "nnBBBBBn")
+        self.assertEqual([c.data for c in self.buffer.chars(2, 5)], ["c", "\n", "d"])
+
+    def test_line_bounds(self):
+        """start and end of the line holding an offset"""
+        self.buffer.append("abc\nde\nf", DEFAULT_CHAR)
+        self.assertEqual(self.buffer.line_start(5), 4)
+        self.assertEqual(self.buffer.line_end(5), 6)
+        self.assertEqual(self.buffer.line_start(8), 7)
+        self.assertEqual(self.buffer.line_end(7), 8)
+        self.assertEqual(self.buffer.char_at(3), "\n")
+        self.assertEqual(self.buffer.text_range(2, 6), "c\nde")
+
+    def test_pop_top(self):
+        """dropping top lines keeps offsets relative to the new start"""
+        for i in range(200):
+            self.buffer.append("line %d\n" % i, DEFAULT_CHAR)
+        for i in range(150):
+            self.buffer.pop_top()
+        self.assertEqual(self.buffer.nlines, 50)
+        self.assertTrue(self.buffer.text.startswith("line 150\n"))
+        self.assertEqual(self.buffer.length, len(self.buffer.text))
+        self.assertEqual(self.buffer.line_start(12), 9)
+        self.assertEqual(self.buffer.text_range(9, 17), "line 151")
+
+    def test_splice(self):
+        """replacing within a line only shifts the following lines"""
+        self.buffer.append("abc\ndef\nghi\n", DEFAULT_CHAR)
+        self.buffer.splice(5, 6, "XYZ", BOLD)
+        self.assertEqual(self.buffer.text, "abc\ndXYZf\nghi\n")
+        self.assertEqual(self.buffer.line_start(11), 10)
+        self.assertRuns(4, 10, "nBBBnn")
+
+    def test_splice_newlines(self):
+        """splicing across and into newlines re-splits the lines"""
+        self.buffer.append("abc\ndef\nghi", DEFAULT_CHAR)
+        self.buffer.splice(2, 6, "", DEFAULT_CHAR)
+        self.assertEqual(self.buffer.text, "abf\nghi")
+        self.assertEqual(self.buffer.nlines, 1)
+        self.buffer.splice(1, 1, "\n\n", BOLD)
+        self.assertEqual(self.buffer.text, "a\n\nbf\nghi")
+        self.assertEqual(self.buffer.nlines, 3)
+        self.assertEqual(self.buffer.line_start(4), 3)
+        self.assertRuns(0, 9, "nBBnnnnnn")
+        self.buffer.splice(0, 9, "", DEFAULT_CHAR)
+        self.assertEqual(self.buffer.text, "")
+        self.assertEqual(self.buffer.last_newline(), -1)
+
+
+class StreamTests(unittest.TestCase):
+    """Tests for drawing plain text runs through ShStream"""
+
+    texts = [
+        "plain text\nover two lines\n",
+        "progress 10%\rprogress 100%\n",
+        "abcdef\x08\x08XY\nend",
+        "red \x1b[31mtext\x1b[0m and \x1b[1;4mbold\x1b[0m\n",
+        "long line\rshort\nnext\rreplaced line longer\n",
+        "ab\ncd\x08\x08\x08\x08XYZ\n",
+        "\x1b[2Kerased\r\x1b[Knew\n",
+    ]
+
+    def feed(self, text, by_char):
+        screen = ShSequentialScreen(None, nlines_max=3)
+        stream = ShStream(None, screen)
+        if by_char:
+            for c in text:
+                stream.consume(c)
+        else:
+            stream.feed(text, render_it=False)
+        return screen
+
+    def test_same_as_by_char(self):
+        """drawing runs gives the same screen as drawing each character"""
+        for text in self.texts:
+            expected = self.feed(text * 2, by_char=True)
+            screen = self.feed(text * 2, by_char=False)
+            self.assertEqual(screen.text, expected.text, repr(text))
+            self.assertEqual(screen.cursor_x, expected.cursor_x, repr(text))
+            self.assertEqual(screen.x_drawend, expected.x_drawend, repr(text))
+            self.assertEqual(
+                screen.renderable_chars, expected.renderable_chars, repr(text)
+            )
+
+    def test_draw_text_calls(self):
+        """a plain text run is drawn in a single call"""
+        screen = ShSequentialScreen(None)
+        calls = []
+        screen.draw = calls.append
+        stream = ShStream(None, screen)
+        stream.feed("a line\nanother line\n", render_it=False)
+        self.assertEqual(calls, [])
+        self.assertEqual(screen.text, "a line\nanother line\n")
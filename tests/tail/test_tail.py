@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""tests for the 'tail' and 'head' commands."""
+
+import os
+import time
+
+from six import StringIO
+
+from stash.tests.stashtest import StashTempDirTestCase
+
+
+class TailTests(StashTempDirTestCase):
+    """Tests for the 'tail' and 'head' commands."""
+
+    def setUp(self):
+        StashTempDirTestCase.setUp(self)
+        # lines of several blocks of libcore.last_lines
+        self.lines = ["line {} {}\n".format(i, "x" * (i % 7000)) for i in range(50)]
+        self.write_file("log.txt", "".join(self.lines).encode("ascii"))
+        self.write_file("short.txt", b"one\ntwo\nthree")
+
+    def tearDown(self):
+        # stop the commands following files, and wait for them to be gone
+        registry = self.stash.runtime.worker_registry
+        registry.purge()
+        end = time.time() + 10
+        while len(registry) > 0 and time.time() < end:
+            time.sleep(0.05)
+        StashTempDirTestCase.tearDown(self)
+
+    def append_file(self, fname, text):
+        with open(os.path.join(self.tempdir, fname), "a") as outs:
+            outs.write(text)
+
+    def wait_for(self, outs, text, timeout=5.0):
+        """wait until a background command has written text"""
+        end = time.time() + timeout
+        while text not in outs.getvalue() and time.time() < end:
+            time.sleep(0.05)
+        self.assertIn(text, outs.getvalue())
+
+    def test_help(self):
+        """test 'tail --help'."""
+        output = self.run_command("tail --help", exitcode=0)
+        self.assertIn("--follow", output)
+
+    def test_last_lines(self):
+        """the last lines of a file, with and without a final newline"""
+        output = self.run_command("tail log.txt", exitcode=0)
+        self.assertEqual(output, "".join(self.lines[-10:]))
+        output = self.run_command("tail -n 2 short.txt", exitcode=0)
+        self.assertEqual(output, "two\nthree")
+        output = self.run_command("tail -n 5 short.txt", exitcode=0)
+        self.assertEqual(output, "one\ntwo\nthree")
+        output = self.run_command("tail -n 0 short.txt", exitcode=0)
+        self.assertEqual(output, "")
+
+    def test_from_start_and_bytes(self):
+        """-n +K and -c"""
+        output = self.run_command("tail -n +48 log.txt", exitcode=0)
+        self.assertEqual(output, "".join(self.lines[47:]))
+        output = self.run_command("tail -c 4 short.txt", exitcode=0)
+        self.assertEqual(output, "hree")
+        output = self.run_command("tail -c +5 short.txt", exitcode=0)
+        self.assertEqual(output, "two\nthree")
+
+    def test_headers_and_errors(self):
+        """headers for several files, errors for missing ones"""
+        output = self.run_command("tail -n 1 short.txt missing.txt", exitcode=1)
+        self.assertIn("==> short.txt <==\nthree", output)
+        self.assertIn("cannot open 'missing.txt'", output)
+
+    def test_stdin(self):
+        """the end of the standard input"""
+        output = self.run_command("cat short.txt | tail -n 2", exitcode=0)
+        self.assertEqual(output, "two\nthree")
+        output = self.run_command("cat short.txt | tail -c 0", exitcode=0)
+        self.assertEqual(output, "")
+        output = self.run_command("cat short.txt | tail -n 0", exitcode=0)
+        self.assertEqual(output, "")
+        output = self.run_command("cat short.txt | tail -c +0", exitcode=0)
+        self.assertEqual(output, "one\ntwo\nthree")
+
+    def test_head_negative(self):
+        """head with a negative -n prints the last lines"""
+        output = self.run_command("head -n -3 log.txt", exitcode=0)
+        self.assertEqual(output, "".join(self.lines[-3:]))
+        output = self.run_command("head -n 2 log.txt", exitcode=0)
+        self.assertEqual(output, "".join(self.lines[:2]))
+
+    def test_follow_name(self):
+        """tail -F follows appended lines, truncation and replaced files"""
+        outs = StringIO()
+        self.stash(
+            "tail -F -n 1 -s 0.2 short.txt &",
+            persistent_level=1,
+            final_outs=outs,
+            final_errs=outs,
+        )
+        self.wait_for(outs, "three")
+        self.append_file("short.txt", "\nfour\n")
+        self.wait_for(outs, "three\nfour\n")
+        self.write_file("short.txt", b"new\n")
+        self.wait_for(outs, "file truncated")
+        self.wait_for(outs, "new\n")
+        os.rename(
+            os.path.join(self.tempdir, "short.txt"),
+            os.path.join(self.tempdir, "short.txt.1"),
+        )
+        self.write_file("short.txt", b"rotated\n")
+        # the file may be seen missing between the rename and the write
+        self.wait_for(outs, "following new file")
+        self.wait_for(outs, "rotated\n")
+
+    def test_follow_several(self):
+        """tail -f follows several files, with headers"""
+        outs = StringIO()
+        self.stash(
+            "tail -f -n 0 -s 0.2 short.txt log.txt &",
+            persistent_level=1,
+            final_outs=outs,
+            final_errs=outs,
+        )
+        self.wait_for(outs, "==> log.txt <==\n")
+        self.append_file("log.txt", "appended\n")
+        self.wait_for(outs, "==> log.txt <==\nappended\n")
+        self.append_file("short.txt", "\nappended too\n")
+        self.wait_for(outs, "\n==> short.txt <==\n\nappended too\n")
@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+"""Print the lines of stdin with whether they came early or late"""
+
+from __future__ import print_function
+
+import sys
+import time
+
+start = time.time()
+while True:
+    line = sys.stdin.readline()
+    if not line:
+        break
+    print(line.rstrip(), "early" if time.time() - start < 0.5 else "late")
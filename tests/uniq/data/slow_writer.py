@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+"""Write some lines, wait, then write more"""
+
+from __future__ import print_function
+
+import sys
+import time
+
+print("x\nx\ny")
+sys.stdout.flush()
+time.sleep(1.0)
+print("y\nz")
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""tests for the 'uniq' command."""
+
+from stash.tests.stashtest import StashTestCase
+
+
+class UniqTests(StashTestCase):
+    """Tests for the 'uniq' command."""
+
+    def setUp(self):
+        """setup the tests"""
+        self.cwd = self.get_data_path()
+        StashTestCase.setUp(self)
+
+    def test_help(self):
+        """test 'uniq --help'."""
+        output = self.run_command("uniq --help", exitcode=0)
+        self.assertIn("--count", output)
+
+    def test_adjacent(self):
+        """only adjacent repeated lines are removed"""
+        output = self.run_command("uniq sorted.txt", exitcode=0)
+        self.assertEqual(output, "a\nb\nc\na\n")
+
+    def test_count(self):
+        """-c, -d and -u"""
+        output = self.run_command("uniq -c sorted.txt", exitcode=0)
+        self.assertEqual(output, "      2 a\n      1 b\n      3 c\n      1 a\n")
+        output = self.run_command("uniq -d sorted.txt", exitcode=0)
+        self.assertEqual(output, "a\nc\n")
+        output = self.run_command("uniq -u -c sorted.txt", exitcode=0)
+        self.assertEqual(output, "      1 b\n      1 a\n")
+
+    def test_sort_pipe(self):
+        """sort | uniq -c counts every line"""
+        output = self.run_command("sort sorted.txt | uniq -c", exitcode=0)
+        self.assertEqual(output, "      3 a\n      1 b\n      3 c\n")
+
+    def test_hash(self):
+        """--hash removes repeated lines of unsorted input"""
+        output = self.run_command("uniq --hash sorted.txt", exitcode=0)
+        self.assertEqual(output, "a\nb\nc\n")
+        output = self.run_command("uniq -H -c sorted.txt", exitcode=0)
+        self.assertEqual(output, "      3 a\n      1 b\n      3 c\n")
+        output = self.run_command("uniq -H -d sorted.txt", exitcode=0)
+        self.assertEqual(output, "a\nc\n")
+        output = self.run_command("uniq -H -u sorted.txt", exitcode=0)
+        self.assertEqual(output, "b\n")
+
+    def test_approximate(self):
+        """--approximate gives the same result while the filter is big enough"""
+        output = self.run_command("uniq -H -a 1K sorted.txt", exitcode=0)
+        self.assertEqual(output, "a\nb\nc\n")
+        output = self.run_command("uniq -H -d -a 1K sorted.txt", exitcode=0)
+        self.assertEqual(output, "a\nc\n")
+        output = self.run_command("uniq -a 1K sorted.txt", exitcode=2)
+        self.assertIn("--hash", output)
+
+    def test_streaming(self):
+        """lines are printed as soon as they are known to be distinct"""
+        for args in ("", "-H"):
+            output = self.run_command(
+                "slow_writer.py | uniq {} | arrival.py".format(args), exitcode=0
+            )
+            self.assertEqual(output, "x early\ny early\nz late\n", args)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""tests for the 'wc' command."""
+
+from stash.tests.stashtest import StashTempDirTestCase, StashTestCase
+
+
+class WcTests(StashTestCase):
+    """Tests for the 'wc' command."""
+
+    def setUp(self):
+        """setup the tests"""
+        self.cwd = self.get_data_path()
+        StashTestCase.setUp(self)
+
+    def test_help(self):
+        """test 'wc --help'."""
+        output = self.run_command("wc --help", exitcode=0)
+        self.assertIn("--chars", output)
+
+    def test_default(self):
+        """newlines, words and bytes of several files and their total"""
+        output = self.run_command("wc text.txt small.txt", exitcode=0)
+        self.assertEqual(
+            output,
+            "     4       11       70 text.txt\n"
+            "     1        2        8 small.txt\n"
+            "     5       13       78 total\n",
+        )
+
+    def test_options(self):
+        """-l, -w, -m and -c"""
+        self.assertEqual(self.run_command("wc -l text.txt"), "     4 text.txt\n")
+        self.assertEqual(self.run_command("wc -w text.txt"), "    11 text.txt\n")
+        self.assertEqual(
+            self.run_command("wc -m -c text.txt"), "    68       70 text.txt\n"
+        )
+        self.assertEqual(self.run_command("wc -c small.txt"), "     8 small.txt\n")
+
+    def test_stdin(self):
+        """the standard input is counted as well"""
+        output = self.run_command("cat text.txt | wc -m -l", exitcode=0)
+        self.assertEqual(output, "     4       68 \n")
+
+    def test_missing_file(self):
+        """a missing file is reported, the others are still counted"""
+        output = self.run_command("wc -l missing.txt small.txt", exitcode=1)
+        self.assertIn("missing.txt", output)
+        self.assertIn("     1 small.txt\n", output)
+
+
+class WcLargeFileTests(StashTempDirTestCase):
+    """Tests for counting files larger than the read buffer"""
+
+    def test_across_buffers(self):
+        """words and characters split by the end of a buffer count once"""
+        # 7 bytes and 6 characters per word, the words do not line up with
+        # the buffer
+        data = "wörds " * 400000 + "end"
+        self.write_file("big.txt", data.encode("utf-8"))
+        output = self.run_command("wc -l -w -m -c big.txt", exitcode=0)
+        self.assertEqual(
+            output.split(),
+            ["0", "400001", str(len(data)), str(len(data.encode("utf-8"))), "big.txt"],
+        )
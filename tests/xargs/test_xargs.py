@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""tests for the 'xargs' command."""
+
+from stash.tests.stashtest import StashTempDirTestCase
+
+
+class XargsTests(StashTempDirTestCase):
+    """Tests for the 'xargs' command."""
+
+    def setUp(self):
+        StashTempDirTestCase.setUp(self)
+        for name in ("one", "two words", "three"):
+            self.write_file("files/" + name, (name + "\n").encode("ascii"))
+        self.write_file(
+            "items.txt",
+            "".join("item{}\n".format(i) for i in range(20)).encode("ascii"),
+        )
+
+    def test_help(self):
+        """test 'xargs --help'."""
+        output = self.run_command("xargs --help", exitcode=0)
+        self.assertIn("--max-procs", output)
+
+    def test_batches(self):
+        """all items in one command, or -n of them"""
+        output = self.run_command("echo a b  c | xargs echo x", exitcode=0)
+        self.assertEqual(output, "x a b c\n")
+        output = self.run_command("echo a b c | xargs -n 2 echo", exitcode=0)
+        self.assertEqual(output, "a b\nc\n")
+
+    def test_quotes(self):
+        """quotes and backslashes keep blanks in the items"""
+        self.write_file("quoted.txt", b"a \"b c\"\n'd  e' f\\ g\n")
+        output = self.run_command("cat quoted.txt | xargs -n 1 echo", exitcode=0)
+        self.assertEqual(output, "a\nb c\nd  e\nf g\n")
+        output = self.run_command("cat quoted.txt | xargs -I % echo [%]", exitcode=0)
+        self.assertEqual(output, "[a b c]\n[d  e f g]\n")
+        self.write_file("unclosed.txt", b'a "b\nc"\n')
+        output = self.run_command("cat unclosed.txt | xargs echo", exitcode=1)
+        self.assertIn("No closing quotation", output)
+
+    def test_max_chars(self):
+        """-s limits the length of the command lines"""
+        output = self.run_command("echo a b c d | xargs -s 8 echo", exitcode=0)
+        self.assertEqual(output, "a\nb\nc\nd\n")
+        output = self.run_command("echo abcdef | xargs -s 8 echo", exitcode=1)
+        self.assertIn("argument line too long", output)
+
+    def test_replace(self):
+        """-I runs a command for every line"""
+        output = self.run_command("cat items.txt | xargs -I % echo [%]", exitcode=0)
+        self.assertEqual(output, "".join("[item{}]\n".format(i) for i in range(20)))
+
+    def test_null(self):
+        """-0 keeps the spaces in the items"""
+        output = self.run_command("find files -print0 | xargs -0 -n 1 cat", exitcode=0)
+        self.assertEqual(sorted(output.splitlines()), ["one", "three", "two words"])
+
+    def test_parallel(self):
+        """-P runs the commands side by side, their outputs not mixed"""
+        output = self.run_command("cat items.txt | xargs -n 2 -P 4 echo", exitcode=0)
+        self.assertEqual(
+            sorted(output.splitlines()),
+            sorted("item{} item{}".format(i, i + 1) for i in range(0, 20, 2)),
+        )
+
+    def test_failure(self):
+        """a failing command makes xargs exit with 123"""
+        output = self.run_command("echo missing | xargs -P 2 cat", exitcode=123)
+        self.assertIn("missing", output)
+
+    def test_several_commands_into_pipe(self):
+        """the output of every command goes into the pipe"""
+        output = self.run_command("echo a b c | xargs -n 1 echo | cat", exitcode=0)
+        self.assertEqual(output, "a\nb\nc\n")
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark of the per-thread io dispatch of print.
+
+A worker thread prints many short lines through the sys.stdout wrapper
+into a StringIO, once with the thread-local dispatch of shiowrapper and
+once with the old dispatch, which looked up the current thread, checked
+its class and forwarded every attribute access by __getattribute__.
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+try:
+    from .common import get_stash_dir
+except (ImportError, ValueError):
+    from common import get_stash_dir
+
+sys.path.insert(0, os.path.dirname(get_stash_dir()))
+
+from six import StringIO  # noqa: E402
+
+from stash.system.shiowrapper import ShStdoutWrapper  # noqa: E402
+from stash.system.shthreads import thread_local  # noqa: E402
+
+
+class _Worker(threading.Thread):
+    """Stands in for a ShBaseThread"""
+
+    def __init__(self, target, state):
+        super(_Worker, self).__init__(target=target)
+        self.state = state
+
+    def run(self):
+        thread_local.state = self.state
+        super(_Worker, self).run()
+
+
+class _State(object):
+    def __init__(self):
+        self.sys_stdout = StringIO()
+
+
+class LegacyStdoutWrapper(object):
+    """The dispatch used before the thread-local binding"""
+
+    def __getattribute__(self, item):
+        thread = threading.current_thread()
+
+        if isinstance(thread, _Worker):
+            return getattr(thread.state.sys_stdout, item)
+        else:
+            return getattr(sys.__stdout__, item)
+
+
+def run(wrapper, nlines):
+    """
+    Print nlines in a worker thread through the given wrapper, or directly
+    to the stream of the worker if it is None.
+    :return: the seconds taken
+    :rtype: float
+    """
+    result = {}
+
+    def target():
+        outs = wrapper if wrapper is not None else thread_local.state.sys_stdout
+        start = time.time()
+        for i in range(nlines):
+            print("line", i, file=outs)
+        result["time"] = time.time() - start
+
+    worker = _Worker(target, _State())
+    worker.start()
+    worker.join()
+    assert worker.state.sys_stdout.getvalue().count("\n") == nlines
+    return result["time"]
+
+
+def main():
+    """
+    The main function.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "-n", "--lines", type=int, default=200000, help="lines printed per run"
+    )
+    parser.add_argument(
+        "-r", "--repeat", type=int, default=5, help="runs, the best is reported"
+    )
+    ns = parser.parse_args()
+
+    direct = min(run(None, ns.lines) for _ in range(ns.repeat))
+    legacy = min(run(LegacyStdoutWrapper(), ns.lines) for _ in range(ns.repeat))
+    current = min(run(ShStdoutWrapper(), ns.lines) for _ in range(ns.repeat))
+    print("direct to the stream:  {:.3f}s".format(direct))
+    print("legacy dispatch:       {:.3f}s".format(legacy))
+    print("thread-local dispatch: {:.3f}s".format(current))
+    print("speedup:               {:.2f}x".format(legacy / current))
+    print(
+        "dispatch overhead:     {:.2f}x less".format(
+            (legacy - direct) / max(current - direct, 1e-9)
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()